@@ -0,0 +1,122 @@
+"""
+Benchmark of route generation and subnet filtering of the announce_routes module.
+
+Generates the routes of the given topologies with action "generate" and reports the time taken. With --reference,
+the routes are also generated by another version of announce_routes.py (e.g. extracted by
+"git show HEAD~1:ansible/library/announce_routes.py") and both outputs are compared.
+
+The subnet filtering used by topologies with aggregate routes is benchmarked separately against the legacy
+implementation, checking each candidate route against each aggregate route.
+
+Usage, from the ansible directory:
+    python devutil/announce_routes_benchmark.py [-t t1-isolated-d510u2,t2] [--reference /tmp/announce_routes.py]
+"""
+import argparse
+import importlib.util
+import ipaddress
+import os
+import random
+import sys
+import time
+
+ANSIBLE_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+DEFAULT_TOPOLOGIES = "t1-isolated-d510u2,t1-isolated-d448u16,t1-64-lag,t2_single_node_max,t2"
+
+
+def load_module(name, path):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_announce_routes(name, path):
+    # announce_routes is an ansible module, its module_utils are not importable from the ansible package
+    for util in ("debug_utils", "multi_servers_utils"):
+        if "ansible.module_utils." + util not in sys.modules:
+            load_module("ansible.module_utils." + util, os.path.join(ANSIBLE_DIR, "module_utils", util + ".py"))
+    return load_module(name, path)
+
+
+def generate(announce_routes, topo_name, seed):
+    topo = announce_routes.read_topo(topo_name, ANSIBLE_DIR + "/")
+    topo_routes = {}
+    random.seed(seed)
+    start = time.time()
+    if topo_name.startswith("t2"):
+        announce_routes.fib_t2_lag(topo, "127.0.0.1", action="generate", topo_routes=topo_routes)
+    else:
+        announce_routes.fib_t1_lag(topo, "127.0.0.1", topo_name, action="generate", topo_routes=topo_routes)
+    return topo_routes, time.time() - start
+
+
+def legacy_filterout_subnet(aggregate_routes, candidate_routes):
+    subnets = []
+    for ar in aggregate_routes:
+        ar_net = ipaddress.ip_network(ar[0])
+        for cr in candidate_routes:
+            if ipaddress.ip_network(cr[0]).subnet_of(ar_net):
+                subnets.append(cr)
+    return list(set(candidate_routes) - set(subnets))
+
+
+def benchmark_filter(announce_routes, candidate_routes, aggregate_number):
+    # Aggregate every other /16 of the candidates, plus some prefixes covering nothing
+    aggregates = set()
+    for route in candidate_routes:
+        net = ipaddress.ip_network(route[0])
+        if len(aggregates) < aggregate_number and net.prefixlen > 16:
+            aggregates.add((str(net.supernet(new_prefix=16)), None, None))
+    aggregates = sorted(aggregates)[::2]
+    aggregates += [("10.{}.0.0/16".format(i), None, None) for i in range(aggregate_number // 2)]
+
+    start = time.time()
+    legacy = legacy_filterout_subnet(aggregates, candidate_routes)
+    legacy_time = time.time() - start
+    start = time.time()
+    new = announce_routes.filterout_subnet(aggregates, candidate_routes)
+    new_time = time.time() - start
+    print("filterout_subnet: {} aggregates, {} candidates, {} left: legacy {:.3f}s, new {:.3f}s, identical: {}"
+          .format(len(aggregates), len(candidate_routes), len(new), legacy_time, new_time,
+                  sorted(legacy) == sorted(new)))
+    return sorted(legacy) == sorted(new)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark announce_routes route generation")
+    parser.add_argument("-t", "--topologies", default=DEFAULT_TOPOLOGIES, help="Comma separated topology names")
+    parser.add_argument("--reference", help="Another version of announce_routes.py to compare with")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed, routes of some topologies are shuffled")
+    parser.add_argument("--filter_candidates", type=int, default=5000,
+                        help="Number of candidate routes for the subnet filtering benchmark, 0 to skip it")
+    parser.add_argument("--filter_aggregates", type=int, default=200,
+                        help="Number of aggregate routes for the subnet filtering benchmark")
+    args = parser.parse_args()
+
+    current = load_announce_routes("announce_routes", os.path.join(ANSIBLE_DIR, "library", "announce_routes.py"))
+    reference = load_announce_routes("announce_routes_reference", args.reference) if args.reference else None
+
+    mismatches = 0
+    ipv4_routes = []
+    for topo_name in args.topologies.split(","):
+        topo_routes, elapsed = generate(current, topo_name, args.seed)
+        count = sum(len(routes) for vm_routes in topo_routes.values() for routes in vm_routes.values())
+        line = "{}: {} VMs, {} routes, {:.3f}s".format(topo_name, len(topo_routes), count, elapsed)
+        if reference:
+            reference_routes, reference_elapsed = generate(reference, topo_name, args.seed)
+            identical = reference_routes == topo_routes
+            mismatches += not identical
+            line += ", reference {:.3f}s, identical: {}".format(reference_elapsed, identical)
+        print(line)
+        for vm_routes in topo_routes.values():
+            ipv4_routes.extend(vm_routes.get(current.IPV4, []))
+
+    if args.filter_candidates:
+        candidates = [route for route in ipv4_routes if route[0] != "0.0.0.0/0"][:args.filter_candidates]
+        mismatches += not benchmark_filter(current, candidates, args.filter_aggregates)
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,6 @@
 #!/usr/bin/python
 
+import bisect
 import itertools
 import math
 import os
@@ -12,7 +13,9 @@ import sys
 import socket
 import random
 import logging
+import threading
 import time
+from collections import OrderedDict
 from multiprocessing.pool import ThreadPool
 from ansible.module_utils.basic import AnsibleModule
 from ansible.module_utils.debug_utils import config_module_logging
@@ -84,6 +87,14 @@ BGP_SCALE_T1S = [
     't1-isolated-d510u2', 't1-isolated-d510u2s2'
 ]
 ROUTES_BATCH_SIZE = 200
+# Upper bound of the adaptive batch size of route commands sent in one request
+ROUTES_MAX_BATCH_SIZE = 20000
+# Batch size is adapted to keep the response time of each request around this number of seconds
+ROUTES_BATCH_TARGET_TIME = 1.0
+# Maximum number of peers to which routes are sent in parallel
+ROUTES_PUSH_WORKERS = 64
+# Endpoint of ExaBGP HTTP API accepting newline delimited commands
+BULK_API_PATH = "/bulk"
 
 # Describe default number of COLOs
 COLO_NUMBER = 30
@@ -122,18 +133,16 @@ def wait_for_http(host_ip, http_port, timeout=10):
     Waits for HTTP server to open.
     Tries until timeout is reached and returns whether localhost received HTTP response
     """
-    started = False
-    tries = 0
-    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    s.settimeout(2)
-    while not started and tries < timeout:
+    deadline = time.time() + timeout
+    while True:
         try:
-            s.connect((host_ip, http_port))
-            started = True
+            s = socket.create_connection((host_ip, http_port), timeout=2)
+            s.close()
+            return True
         except socket.error:
-            tries += 1
-
-    return started
+            if time.time() >= deadline:
+                return False
+            time.sleep(0.5)
 
 
 def get_change_routes_ports(vm, topo):
@@ -171,6 +180,94 @@ def read_topo(topo_name, path):
         return {}
 
 
+class RoutePushClient(object):
+    """
+    Pushes route commands to the ExaBGP HTTP APIs on PTF.
+
+    A keep-alive session is kept per HTTP API, and commands are posted as newline delimited bodies to the bulk
+    endpoint, which passes each command to ExaBGP as soon as it is received. The batch size starts at
+    ROUTES_BATCH_SIZE and is adapted to the response time of the HTTP API, so that ExaBGP is kept busy with few
+    requests. HTTP APIs without the bulk endpoint get the commands as form posts.
+    """
+
+    def __init__(self, max_batch_size=ROUTES_MAX_BATCH_SIZE, target_time=ROUTES_BATCH_TARGET_TIME):
+        self.max_batch_size = max_batch_size
+        self.target_time = target_time
+        self.sessions = {}
+        self.bulk_supported = {}
+        self.stats = {}
+        self.lock = threading.Lock()
+
+    def get_session(self, url):
+        with self.lock:
+            if url not in self.sessions:
+                self.sessions[url] = requests.Session()
+            return self.sessions[url]
+
+    def post(self, session, url, batch):
+        if self.bulk_supported.get(url, True):
+            r = post_with_retry(url + BULK_API_PATH, "\n".join(batch) + "\n", session=session,
+                                headers={"Content-Type": "text/plain"})
+            if r.status_code not in [404, 405]:
+                check_response(url + BULK_API_PATH, r)
+                return
+            logging.info("No bulk endpoint in HTTP API {}, post commands as forms".format(url))
+            self.bulk_supported[url] = False
+        data = {"commands": ";".join(batch)}
+        logging.debug("Posting to url={} data={}".format(url, json.dumps(data)))
+        check_response(url, post_with_retry(url, data, session=session), data)
+
+    def push(self, url, messages, batch_size=ROUTES_BATCH_SIZE):
+        """
+        Sends route commands to one HTTP API.
+
+        Args:
+            url (str): URL of the ExaBGP HTTP API.
+            messages (list): Route commands, e.g. "announce route 192.168.0.0/25 next-hop 10.10.246.254".
+            batch_size (int): Initial and minimum number of commands sent in one request.
+
+        Returns:
+            dict: Statistics of the HTTP API, with the total number of routes, requests and seconds.
+        """
+        session = self.get_session(url)
+        min_batch_size = batch_size
+        start = time.time()
+        requests_number = 0
+        sent = 0
+        while sent < len(messages):
+            batch = messages[sent:sent + batch_size]
+            batch_start = time.time()
+            self.post(session, url, batch)
+            elapsed = time.time() - batch_start
+            sent += len(batch)
+            requests_number += 1
+            if elapsed < self.target_time / 2:
+                batch_size = min(batch_size * 2, self.max_batch_size)
+            elif elapsed > self.target_time * 2:
+                batch_size = max(batch_size // 2, min_batch_size)
+        elapsed = time.time() - start
+
+        with self.lock:
+            stats = self.stats.setdefault(url, {"routes": 0, "requests": 0, "seconds": 0.0})
+            stats["routes"] += len(messages)
+            stats["requests"] += requests_number
+            stats["seconds"] += elapsed
+            stats = dict(stats)
+        logging.info("Sent {} routes to {} in {:.2f}s with {} requests, {:.0f} routes/s"
+                     .format(len(messages), url, elapsed, requests_number,
+                             len(messages) / elapsed if elapsed else 0))
+        return stats
+
+    def close(self):
+        with self.lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions.clear()
+
+
+route_push_client = RoutePushClient()
+
+
 def change_routes(action, ptf_ip, port, routes, routes_batch_size=ROUTES_BATCH_SIZE):
     logging.debug("action = {}, ptf_ip = {}, port = {}, routes_batch_size = {}, routes = {}"
                   .format(action, ptf_ip, port, routes_batch_size, routes))
@@ -182,16 +279,13 @@ def change_routes(action, ptf_ip, port, routes, routes_batch_size=ROUTES_BATCH_S
         else:
             messages.append(
                 "{} route {} next-hop {}".format(action, prefix, nexthop))
-    wait_for_http(ptf_ip, port, timeout=60)
     url = "http://%s:%d" % (ptf_ip, port)
-    for i in range(0, len(messages), routes_batch_size):
-        batch_messages = messages[i:i+routes_batch_size]
-        data = {"commands": ";".join(batch_messages)}
-        logging.debug("Posting to url={} data={}".format(url, json.dumps(data)))
-        post_data_to_url(url, data)
+    if url not in route_push_client.sessions:
+        wait_for_http(ptf_ip, port, timeout=60)
+    route_push_client.push(url, messages, batch_size=routes_batch_size)
 
 
-def post_data_to_url(url, data):
+def post_with_retry(url, data, session=None, headers=None):
     # nosemgrep-next-line
     # Flaky error `ConnectionResetError(104, 'Connection reset by peer')` may happen while using `requests.post`
     # To avoid this error, we add sleep time before sending request.
@@ -199,19 +293,21 @@ def post_data_to_url(url, data):
     # If one retry fails, we increase the waiting time.
     for i in range(0, 5):
         try:
-            r = requests.post(url, data=data, timeout=360, proxies={"http": None, "https": None})
-            break
+            return (session or requests).post(url, data=data, headers=headers, timeout=360,
+                                              proxies={"http": None, "https": None})
         except Exception as e:
             logging.debug("Got exception {}, will try to connect again".format(e))
             time.sleep(0.01 * (i+1))
             if i == 4:
                 raise e
 
+
+def check_response(url, r, data=None):
     if r.status_code != 200:
         raise Exception(
             "Change routes failed: url={}, data={}, r.status_code={}, r.reason={}, r.headers={}, r.text={}".format(
                 url,
-                json.dumps(data),
+                json.dumps(data) if data is not None else "<bulk>",
                 r.status_code,
                 r.reason,
                 r.headers,
@@ -220,6 +316,10 @@ def post_data_to_url(url, data):
         )
 
 
+def post_data_to_url(url, data):
+    check_response(url, post_with_retry(url, data), data)
+
+
 def send_routes_for_each_set(args):
     routes, port, action, ptf_ip = args
     change_routes(action, ptf_ip, port, routes)
@@ -235,20 +335,24 @@ def send_routes_in_parallel(route_set):
     Returns:
         None
     """
-    # Create a pool of worker processes
-    pool = ThreadPool(processes=len(route_set))
-
-    # Use the ThreadPool.map function to apply the function to each set of routes
-    results = pool.map(send_routes_for_each_set, route_set)
+    if not route_set:
+        return
 
-    # Optionally, process the results
-    for result in results:
-        # Process individual results here
-        pass
+    # Create a pool of worker threads, ExaBGP of each peer is a separate process on PTF
+    pool = ThreadPool(processes=min(len(route_set), ROUTES_PUSH_WORKERS))
+    start = time.time()
+    try:
+        # Use the ThreadPool.map function to apply the function to each set of routes
+        pool.map(send_routes_for_each_set, route_set)
+    finally:
+        # Close the pool and wait for all threads to complete
+        pool.close()
+        pool.join()
 
-    # Close the pool and wait for all processes to complete
-    pool.close()
-    pool.join()
+    elapsed = time.time() - start
+    routes_number = sum(len(routes) for routes, _, _, _ in route_set)
+    logging.info("Sent {} routes to {} peers in {:.2f}s, {:.0f} routes/s"
+                 .format(routes_number, len(route_set), elapsed, routes_number / elapsed if elapsed else 0))
 
 
 # AS path from Leaf router for T0 topology
@@ -403,67 +507,91 @@ def generate_routes(family, podset_number, tor_number, tor_subnet_number,
     # NOTE: Using large enough values (e.g., podset_number = 200,
     # us to overflow the 192.168.0.0/16 private address space here.
     # This should be fine for internal use, but may pose an issue if used otherwise
+    generate_v4 = family in ["v4", "both"]
+    generate_v6 = family in ["v6", "both"]
+    prefixlen_v4 = (32 - int(math.log(tor_subnet_size, 2)))
+    # First 3 pods are advertised from T1 - so remove 3 from the total pods being advertised by T3
+    first_third_podset_number = int(math.ceil((podset_number - 3) / 3.0))
+    second_third_podset_number = int(math.ceil(((podset_number - 3) * 2) / 3.0))
+
+    # Podsets, tors and subnets which are not advertised are skipped at the outermost loop they depend on
     suffix = 0
     for podset in range(0, podset_number):
-        for tor in range(0, tor_number):
-            for subnet in range(0, tor_subnet_number):
-                if router_type == "core":
-                    # Advertise podset 3+ to T2 DUT
-                    if podset < 3:
-                        continue
+        if router_type == "core":
+            # Advertise podset 3+ to T2 DUT
+            if podset < 3:
+                continue
 
-                    # First 3 pods are advertised from T1 - so remove 3 from the total pods being advertised by T3
-                    first_third_podset_number = int(
-                        math.ceil((podset_number - 3) / 3.0))
-                    second_third_podset_number = int(
-                        math.ceil(((podset_number - 3) * 2) / 3.0))
-
-                    if set_num is not None:
-                        # For T2, we have 3 sets - 1 set advertises first 1/3 podsets,
-                        # second set advertises second 1/3 podsets, and all VM's advertises the last 1/3 podsets
-                        if podset <= first_third_podset_number and set_num != 0:
-                            continue
-                        elif podset > first_third_podset_number and \
-                                podset < second_third_podset_number and set_num != 1:
-                            continue
-                if router_type == "spine" or router_type == "mgmtleaf":
-                    # Skip podset 0 for T2
-                    if podset == 0:
+            if set_num is not None:
+                # For T2, we have 3 sets - 1 set advertises first 1/3 podsets,
+                # second set advertises second 1/3 podsets, and all VM's advertises the last 1/3 podsets
+                if podset <= first_third_podset_number and set_num != 0:
+                    continue
+                elif podset > first_third_podset_number and \
+                        podset < second_third_podset_number and set_num != 1:
+                    continue
+        if router_type == "spine" or router_type == "mgmtleaf":
+            # Skip podset 0 for T2
+            if podset == 0:
+                continue
+        elif router_type == "leaf":
+            if topo == 't2':
+                # Send routes for podset 0-2 (first 3 pods) to the T2 DUT
+                if podset > 2:
+                    continue
+
+                if set_num is not None:
+                    # For T2, we have 3 sets - 1 set advertises podset 1,
+                    # second set advertises podset 2, and all VM's advertises podset3
+                    if podset == 0 and set_num != 0:
                         continue
-                elif router_type == "leaf":
-                    if topo == 't2':
-                        # Send routes for podset 0-2 (first 3 pods) to the T2 DUT
-                        if podset > 2:
-                            continue
-
-                        if set_num is not None:
-                            # For T2, we have 3 sets - 1 set advertises podset 1,
-                            # second set advertises podset 2, and all VM's advertises podset3
-                            if podset == 0 and set_num != 0:
-                                continue
-                            elif podset == 1 and set_num != 1:
-                                continue
-                    elif topo == 't0-mclag':
-                        if podset > 1:
-                            continue
-                        if set_num is not None:
-                            if podset == 0 and set_num != 0:
-                                continue
-                            elif podset == 1 and set_num != 1:
-                                continue
-                    else:
-                        # Skip tor 0 podset 0 for T1
-                        if podset == 0 and tor == 0:
-                            continue
-                elif router_type == "tor":
-                    # Skip non podset 0 for T0
-                    if podset != 0:
+                    elif podset == 1 and set_num != 1:
                         continue
-                    # Skip subnet 0 (vlan ip) for M0
-                    elif topo == "m0" and subnet == 0:
+            elif topo == 't0-mclag':
+                if podset > 1:
+                    continue
+                if set_num is not None:
+                    if podset == 0 and set_num != 0:
                         continue
-                    elif tor != tor_index:
+                    elif podset == 1 and set_num != 1:
                         continue
+        elif router_type == "tor":
+            # Skip non podset 0 for T0
+            if podset != 0:
+                continue
+
+        leaf_asn = leaf_asn_start + podset
+        for tor in range(0, tor_number):
+            if router_type == "leaf" and topo not in ['t2', 't0-mclag']:
+                # Skip tor 0 podset 0 for T1
+                if podset == 0 and tor == 0:
+                    continue
+            elif router_type == "tor":
+                if tor != tor_index:
+                    continue
+
+            tor_asn = tor_asn_start + tor
+            aspath = None
+            if router_type == "core":
+                aspath = "{} {}".format(leaf_asn, core_ra_asn)
+            elif router_type == "spine" or router_type == "mgmtleaf":
+                aspath = "{} {}".format(leaf_asn, tor_asn)
+            elif router_type == "leaf":
+                if topo == "t2":
+                    aspath = "{}".format(tor_asn)
+                elif topo == "t0-mclag":
+                    aspath = "{}".format(tor_asn)
+                else:
+                    if podset == 0:
+                        aspath = "{}".format(tor_asn)
+                    else:
+                        aspath = "{} {} {}".format(
+                            spine_asn, leaf_asn, tor_asn)
+
+            for subnet in range(0, tor_subnet_number):
+                # Skip subnet 0 (vlan ip) for M0
+                if router_type == "tor" and topo == "m0" and subnet == 0:
+                    continue
 
                 suffix = ((podset * tor_number * max_tor_subnet_number * tor_subnet_size) +
                           (tor * max_tor_subnet_number * tor_subnet_size) +
@@ -473,36 +601,14 @@ def generate_routes(family, podset_number, tor_number, tor_subnet_number,
                 octet2 = (octet2 % 256)
                 octet3 = (int(suffix / 256) % 256)
                 octet4 = (suffix % 256)
-                prefixlen_v4 = (32 - int(math.log(tor_subnet_size, 2)))
-
-                prefix = "{}.{}.{}.{}/{}".format(octet1,
-                                                 octet2, octet3, octet4, prefixlen_v4)
-                prefix_v6 = ipv6_address_pattern % (
-                    octet1, octet2, octet3, octet4)
 
-                leaf_asn = leaf_asn_start + podset
-                tor_asn = tor_asn_start + tor
-
-                aspath = None
-                if router_type == "core":
-                    aspath = "{} {}".format(leaf_asn, core_ra_asn)
-                elif router_type == "spine" or router_type == "mgmtleaf":
-                    aspath = "{} {}".format(leaf_asn, tor_asn)
-                elif router_type == "leaf":
-                    if topo == "t2":
-                        aspath = "{}".format(tor_asn)
-                    elif topo == "t0-mclag":
-                        aspath = "{}".format(tor_asn)
-                    else:
-                        if podset == 0:
-                            aspath = "{}".format(tor_asn)
-                        else:
-                            aspath = "{} {} {}".format(
-                                spine_asn, leaf_asn, tor_asn)
-
-                if family in ["v4", "both"]:
+                if generate_v4:
+                    prefix = "{}.{}.{}.{}/{}".format(octet1,
+                                                     octet2, octet3, octet4, prefixlen_v4)
                     routes.append((prefix, nexthop, aspath))
-                if family in ["v6", "both"]:
+                if generate_v6:
+                    prefix_v6 = ipv6_address_pattern % (
+                        octet1, octet2, octet3, octet4)
                     routes.append((prefix_v6, nexthop_v6, aspath))
 
     return routes, suffix
@@ -511,7 +617,12 @@ def generate_routes(family, podset_number, tor_number, tor_subnet_number,
 def generate_t1_to_t0_routes(family, offset, leaf_number, subnet_size, tor_asn, leaf_asn_start, nexthop, nexthop_v6,
                              podset_num=1, ipv6_address_pattern=IPV6_ADDRESS_PATTERN_DEFAULT_VALUE):
     routes = []
+    generate_v4 = family in ["v4", "both"]
+    generate_v6 = family in ["v6", "both"]
+    prefixlen_v4 = (32 - int(math.log(subnet_size, 2)))
     for podset in range(0, podset_num):
+        leaf_asn = leaf_asn_start + podset
+        aspath = "{} {}".format(leaf_asn, tor_asn)
         for leaf in range(0, leaf_number):
             suffix = offset + leaf
             octet2 = (168 + int(suffix / (256 ** 2)))
@@ -519,15 +630,12 @@ def generate_t1_to_t0_routes(family, offset, leaf_number, subnet_size, tor_asn,
             octet2 = (octet2 % 256)
             octet3 = (int(suffix / 256) % 256)
             octet4 = (suffix % 256)
-            prefixlen_v4 = (32 - int(math.log(subnet_size, 2)))
-            prefix = "{}.{}.{}.{}/{}".format(octet1, octet2, octet3, octet4, prefixlen_v4)
-            prefix_v6 = ipv6_address_pattern % (
-                octet1, octet2, octet3, octet4)
-            leaf_asn = leaf_asn_start + podset
-            aspath = "{} {}".format(leaf_asn, tor_asn)
-            if family in ["v4", "both"]:
+            if generate_v4:
+                prefix = "{}.{}.{}.{}/{}".format(octet1, octet2, octet3, octet4, prefixlen_v4)
                 routes.append((prefix, nexthop, aspath))
-            if family in ["v6", "both"]:
+            if generate_v6:
+                prefix_v6 = ipv6_address_pattern % (
+                    octet1, octet2, octet3, octet4)
                 routes.append((prefix_v6, nexthop_v6, aspath))
     return routes, suffix
 
@@ -1664,11 +1772,11 @@ def adhoc_routes(topo, ptf_ip, peers_routes_to_change, action):
 
 
 def get_ipv4_routes(routes):
-    return [r for r in routes if ipaddress.ip_network(UNICODE_TYPE(r[0])).version == 4]
+    return [r for r in routes if ':' not in r[0]]
 
 
 def get_ipv6_routes(routes):
-    return [r for r in routes if ipaddress.ip_network(UNICODE_TYPE(r[0])).version == 6]
+    return [r for r in routes if ':' in r[0]]
 
 
 def filterout_subnet_ipv4(aggregate_routes, candidate_routes):
@@ -1681,14 +1789,62 @@ def filterout_subnet_ipv6(aggregate_routes, candidate_routes):
     return filterout_subnet(ars_ipv6, candidate_routes)
 
 
-def filterout_subnet(aggregate_routes, candidate_routes):
-    subnets = []
+def prefix_to_interval(prefix):
+    """Convert a prefix to (version, first address, last address) with addresses as integers."""
+    net = ipaddress.ip_network(UNICODE_TYPE(prefix))
+    first = int(net.network_address)
+    return net.version, first, first + net.num_addresses - 1
+
+
+def build_interval_index(aggregate_routes):
+    """Build a sorted list of disjoint address intervals covered by the aggregate routes, per IP version.
+
+    Prefixes are either nested or disjoint, so merging nested intervals leaves a list sorted by both first and
+    last address, which can be searched with bisect.
+    """
+    intervals = {4: [], 6: []}
     for ar in aggregate_routes:
-        ar_net = ipaddress.ip_network(UNICODE_TYPE(ar[0]))
-        for cr in candidate_routes:
-            if ipaddress.ip_network(UNICODE_TYPE(cr[0])).subnet_of(ar_net):
-                subnets.append(cr)
-    return list(set(candidate_routes) - set(subnets))
+        version, first, last = prefix_to_interval(ar[0])
+        intervals[version].append((first, last))
+
+    index = {}
+    for version, items in intervals.items():
+        merged = []
+        for first, last in sorted(items):
+            if merged and first <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], last)
+            else:
+                merged.append([first, last])
+        index[version] = ([item[0] for item in merged], [item[1] for item in merged])
+    return index
+
+
+def is_covered(index, version, first, last):
+    starts, ends = index[version]
+    pos = bisect.bisect_right(starts, first) - 1
+    return pos >= 0 and last <= ends[pos]
+
+
+def filterout_subnet(aggregate_routes, candidate_routes):
+    """Filter out candidate routes which are subnets of any aggregate route.
+
+    Every prefix is parsed only once and looked up in a sorted interval index of the aggregate routes, instead of
+    checking each candidate against each aggregate route.
+
+    Returns:
+        list: Candidate routes not covered by any aggregate route, without duplicates, in the candidate order.
+    """
+    if not aggregate_routes:
+        return list(OrderedDict.fromkeys(candidate_routes))
+
+    index = build_interval_index(aggregate_routes)
+    routes = OrderedDict()
+    for cr in candidate_routes:
+        if cr in routes:
+            continue
+        if not is_covered(index, *prefix_to_interval(cr[0])):
+            routes[cr] = None
+    return list(routes)
 
 
 def convert_routes_to_str(topo_routes):
@@ -8,13 +8,13 @@ import traceback
 
 try:
     from ansible.module_utils.debug_utils import config_module_logging
-    from ansible.module_utils.graph_utils import LabGraph
+    from ansible.module_utils.graph_utils import LabGraphIndex
 except ImportError:
     # Add parent dir for using outside Ansible
     import sys
     sys.path.append('..')
     from module_utils.debug_utils import config_module_logging
-    from module_utils.graph_utils import LabGraph
+    from module_utils.graph_utils import LabGraphIndex
 
 config_module_logging('conn_graph_facts')
 
@@ -57,6 +57,9 @@ options:
 
     Mutually exclusive options: host, hosts, anchor
 
+    The graph of each group is cached under ~/.cache/sonic-mgmt/conn_graph, or the directory in environment
+    variable CONN_GRAPH_CACHE_DIR (empty to disable the cache), until any csv file of the group is changed.
+
 Ansible_facts:
     device_info: The device(host) type and hwsku
     device_conn: each physical connection of the device(host)
@@ -127,35 +130,23 @@ def find_graph(hostnames, part=False, forced_mgmt_routes=None):
     Returns:
         obj: Instance of LabGraph or None if no graph file is found.
     """
-    graph_group_file = os.path.join(LAB_GRAPHFILE_PATH, LAB_GRAPH_GROUPS_FILE)
-    with open(graph_group_file) as fd:
-        graph_groups = yaml.safe_load(fd)
+    graph_index = get_graph_index()
 
-    target_graph = None
-    target_group = None
-    for group in graph_groups:
-        logging.debug("Looking at graph files of group {} for hosts {}".format(group, hostnames))
-        lab_graph = LabGraph(LAB_GRAPHFILE_PATH, group, forced_mgmt_routes=forced_mgmt_routes)
-        graph_hostnames = set(lab_graph.graph_facts["devices"].keys())
-        logging.debug("For graph group {}, got hostnames {}".format(group, graph_hostnames))
-
-        if not part:
-            if set(hostnames) <= graph_hostnames:
-                target_graph = lab_graph
-                target_group = group
-                break
-        else:
-            THRESHOLD = 0.8
-            in_graph_hostnames = set(hostnames).intersection(graph_hostnames)
-            if len(in_graph_hostnames) * 1.0 / len(hostnames) >= THRESHOLD:
-                target_graph = lab_graph
-                target_group = group
-                break
+    logging.debug("Looking at graph files of groups {} for hosts {}".format(graph_index.groups, hostnames))
+    target_group = graph_index.find_group(hostnames, part=part)
+    if target_group is None:
+        return None
 
-    if target_graph is not None:
-        logging.debug("Returning lab graph of group {} for hosts {}".format(target_group, hostnames))
+    logging.debug("Returning lab graph of group {} for hosts {}".format(target_group, hostnames))
+    return graph_index.graph(target_group, forced_mgmt_routes=forced_mgmt_routes)
 
-    return target_graph
+
+def get_graph_index():
+    """Get the index of graph groups, the hostnames of each group are read from its devices CSV file only."""
+    graph_group_file = os.path.join(LAB_GRAPHFILE_PATH, LAB_GRAPH_GROUPS_FILE)
+    with open(graph_group_file) as fd:
+        graph_groups = yaml.safe_load(fd)
+    return LabGraphIndex(LAB_GRAPHFILE_PATH, graph_groups)
 
 
 def main():
@@ -191,8 +182,7 @@ def main():
             LAB_GRAPHFILE_PATH = m_args['filepath']
 
         if m_args["group"]:
-            lab_graph = LabGraph(
-                LAB_GRAPHFILE_PATH,
+            lab_graph = LabGraphIndex(LAB_GRAPHFILE_PATH, [m_args["group"]]).graph(
                 m_args["group"],
                 forced_mgmt_routes=m_args.get("forced_mgmt_routes")
             )
@@ -71,6 +71,31 @@ class route_handler(tornado.web.RequestHandler):
         sys.stdout.flush()
         self.write("OK\\n")
 
+# Accept newline delimited commands, each command is passed to ExaBGP as soon as it is received,
+# without buffering the whole body
+@tornado.web.stream_request_body
+class bulk_route_handler(tornado.web.RequestHandler):
+    def prepare(self):
+        self.pending = b""
+        self.count = 0
+
+    def data_received(self, chunk):
+        lines = (self.pending + chunk).split(b"\\n")
+        self.pending = lines.pop()
+        self.write_commands(lines)
+
+    def write_commands(self, lines):
+        for line in lines:
+            line = line.strip()
+            if line:
+                sys.stdout.write("{}\\n".format(line.decode("utf-8")))
+                self.count += 1
+        sys.stdout.flush()
+
+    def post(self):
+        self.write_commands([self.pending])
+        self.write("OK {}\\n".format(self.count))
+
 def make_app():
     return tornado.web.Application([
         (r"/upload", UploadHandler),
@@ -79,6 +104,7 @@ def make_app():
 if __name__ == "__main__":
     app = tornado.web.Application([
         ("/", route_handler),
+        ("/bulk", bulk_route_handler),
     ])
     app.listen(int(sys.argv[1]))
     tornado.ioloop.IOLoop.current().start()
@@ -1,8 +1,11 @@
 import csv
+import hashlib
 import os
 import logging
 import ipaddress
+import pickle
 import six
+import tempfile
 from operator import itemgetter
 from itertools import groupby
 from natsort import natsorted
@@ -12,6 +15,10 @@ try:
 except ImportError:
     from module_utils.port_utils import get_port_alias_to_name_map
 
+# Directory of the serialized lab graphs, empty to disable. The lab graph of a group is serialized once it is built.
+GRAPH_CACHE_DIR = os.environ.get(
+    "CONN_GRAPH_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "sonic-mgmt", "conn_graph"))
+
 
 class LabGraph(object):
 
@@ -25,7 +32,15 @@ class LabGraph(object):
         "serial_links": "sonic_{}_serial_links.csv",
     }
 
-    def __init__(self, path, group, forced_mgmt_routes=None):
+    def __init__(self, path, group, forced_mgmt_routes=None, graph_facts=None):
+        """
+        Args:
+            path (str): Directory of the CSV files.
+            group (str): Name of the graph group.
+            forced_mgmt_routes (list): Management routes added to all the devices.
+            graph_facts (dict): Graph facts already converted from the CSV files, e.g. by a LabGraph serialized in
+                the cache. The CSV files are not read if it is supplied.
+        """
         self.path = path
         self.group = group
         self.csv_files = {k: os.path.join(self.path, v.format(group)) for k, v in self.SUPPORTED_CSV_FILES.items()}
@@ -39,6 +54,9 @@ class LabGraph(object):
         self._cache_port_name_to_alias = {}
 
         self.csv_facts = {}
+        if graph_facts is not None:
+            self.graph_facts = graph_facts
+            return
         self.read_csv_files()
 
         self.graph_facts = {}
@@ -669,3 +687,123 @@ class LabGraph(object):
                     l1_cross_connects[l1_start_device][l1_port_pair[0]] = l1_port_pair[1]
 
         return l1_cross_connects
+
+
+class LabGraphIndex(object):
+    """Index of the lab graph groups, for getting the graph of some hosts without building the graph of every group.
+
+    The hostnames of a group are read from its devices CSV file only. The graph of a group is serialized to the
+    cache directory when it is built, and loaded from there until any CSV file of the group is changed. Entries of
+    the cache are invalidated on modification time or size change of the CSV files, or on change of CACHE_VERSION.
+    """
+
+    INDEX_FILE = "index.pickle"
+    # Increase on any change of the graph facts built from the CSV files, or of the format of the cache files
+    CACHE_VERSION = 1
+
+    def __init__(self, path, groups, cache_dir=GRAPH_CACHE_DIR):
+        """
+        Args:
+            path (str): Directory of the CSV files.
+            groups (list): Names of the graph groups, in the order of lookup.
+            cache_dir (str): Directory of the serialized graphs, caching is disabled if it is empty or None.
+        """
+        self.path = path
+        self.groups = groups
+        self.cache_dir = None
+        if cache_dir:
+            digest = hashlib.sha1(os.path.realpath(path).encode("utf-8")).hexdigest()[:16]
+            self.cache_dir = os.path.join(cache_dir, digest)
+        self.index = self._load(self.INDEX_FILE) or {}
+
+    def _load(self, filename):
+        if not self.cache_dir:
+            return None
+        try:
+            with open(os.path.join(self.cache_dir, filename), "rb") as f:
+                return pickle.load(f)
+        except Exception as e:
+            logging.debug("Failed to load graph cache {}: {}".format(filename, repr(e)))
+            return None
+
+    def _store(self, filename, data):
+        if not self.cache_dir:
+            return
+        try:
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir, mode=0o700)
+            # Write to a temporary file and rename, other processes never read partial files
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir)
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
+                os.rename(tmp_path, os.path.join(self.cache_dir, filename))
+            except Exception:
+                os.remove(tmp_path)
+                raise
+        except Exception as e:
+            logging.debug("Failed to store graph cache {}: {}".format(filename, repr(e)))
+
+    def _signature(self, group):
+        signature = [("version", self.CACHE_VERSION)]
+        for name, filename in sorted(LabGraph.SUPPORTED_CSV_FILES.items()):
+            try:
+                stat = os.stat(os.path.join(self.path, filename.format(group)))
+                signature.append((name, stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                signature.append((name, None, None))
+        return signature
+
+    def hostnames(self, group):
+        """Get the hostnames of the devices in a group."""
+        signature = self._signature(group)
+        entry = self.index.get(group)
+        if entry and entry["signature"] == signature:
+            return entry["hostnames"]
+
+        hostnames = set()
+        devices_file = os.path.join(self.path, LabGraph.SUPPORTED_CSV_FILES["devices"].format(group))
+        if os.path.exists(devices_file):
+            with open(devices_file) as f:
+                hostnames = set(row["Hostname"] for row in csv.DictReader(f))
+        self.index[group] = {"signature": signature, "hostnames": hostnames}
+        self._store(self.INDEX_FILE, self.index)
+        return hostnames
+
+    def find_group(self, hostnames, part=False, threshold=0.8):
+        """Find the first group containing the hosts.
+
+        Args:
+            hostnames (list): List of hostnames.
+            part (bool): Select the group if the ratio of hosts found in the group reaches threshold.
+
+        Returns:
+            str: Name of the group or None if no group is found.
+        """
+        for group in self.groups:
+            graph_hostnames = self.hostnames(group)
+            logging.debug("For graph group {}, got hostnames {}".format(group, graph_hostnames))
+            if not part:
+                if set(hostnames) <= graph_hostnames:
+                    return group
+            elif len(set(hostnames).intersection(graph_hostnames)) * 1.0 / len(hostnames) >= threshold:
+                return group
+        return None
+
+    def graph(self, group, forced_mgmt_routes=None):
+        """Get the lab graph of a group, from the cache if the CSV files are not changed.
+
+        Returns:
+            obj: Instance of LabGraph.
+        """
+        routes_digest = hashlib.sha1(repr(forced_mgmt_routes or []).encode("utf-8")).hexdigest()[:16]
+        filename = "graph_{}_{}.pickle".format(group, routes_digest)
+        signature = self._signature(group)
+        data = self._load(filename)
+        if data and data["signature"] == signature:
+            logging.debug("Loaded lab graph of group {} from cache".format(group))
+            return LabGraph(self.path, group, forced_mgmt_routes=forced_mgmt_routes, graph_facts=data["graph_facts"])
+
+        lab_graph = LabGraph(self.path, group, forced_mgmt_routes=forced_mgmt_routes)
+        self._store(filename, {"signature": signature, "graph_facts": lab_graph.graph_facts})
+        return lab_graph
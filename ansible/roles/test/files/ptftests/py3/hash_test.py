@@ -10,9 +10,11 @@ import json
 import time
 import six
 import itertools
+import struct
+import threading
 
 from collections.abc import Iterable
-from collections import defaultdict
+from collections import defaultdict, namedtuple
 from ipaddress import ip_address, ip_network
 import ptf
 import ptf.packet as scapy
@@ -34,6 +36,88 @@ import lpm
 import macsec  # noqa F401
 
 
+# ---------------------------------------------------------------------
+# Pipelined checks
+# ---------------------------------------------------------------------
+# Tag of the packets of a pipelined check: magic, id of the receiver and index of the flow
+PIPELINE_TAG = struct.Struct("!4sII")
+PIPELINE_MAGIC = b"PTFH"
+
+Flow = namedtuple('Flow', ['pkt', 'masked_exp_pkt', 'logs', 'ip_src', 'ip_dst'])
+
+
+def tag_payload(pkt, tag):
+    '''
+    @summary: Write a tag at the start of the payload of the innermost frame of a packet.
+    '''
+    payload = pkt.lastlayer()
+    # ptf.packet doesn't export the Raw layer, the payload is found by its load field
+    if not isinstance(getattr(payload, 'load', None), bytes) or len(payload.load) < len(tag):
+        raise Exception("No payload to tag in packet {}".format(pkt.summary()))
+    payload.load = tag + payload.load[len(tag):]
+
+
+class PipelinedReceiver(threading.Thread):
+    '''
+    Receive the packets of a pipelined check in the background, and match them to their flows by their tag.
+    '''
+
+    def __init__(self, dataplane, dst_ports):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.dataplane = dataplane
+        self.dst_ports = set(dst_ports)
+        # Packets left by a previous check don't match the id
+        self.receiver_id = random.randint(0, 0xffffffff)
+        self.expected = {}
+        self.received = {}
+        self.cond = threading.Condition()
+        self.stopped = threading.Event()
+
+    def tag(self, index):
+        return PIPELINE_TAG.pack(PIPELINE_MAGIC, self.receiver_id, index)
+
+    def expect(self, index, masked_exp_pkt):
+        with self.cond:
+            self.expected[index] = masked_exp_pkt
+
+    def wait(self, indexes, timeout):
+        '''
+        @summary: Wait for the packets of the flows, return {index: (rcvd_port, rcvd_pkt)} of the received ones.
+        '''
+        with self.cond:
+            self.cond.wait_for(lambda: all(index in self.received for index in indexes), timeout)
+            received = {}
+            for index in indexes:
+                if index in self.received:
+                    received[index] = self.received.pop(index)
+                    del self.expected[index]
+            return received
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def run(self):
+        while not self.stopped.is_set():
+            result = self.dataplane.poll(device_number=0, timeout=0.1)
+            if not isinstance(result, self.dataplane.PollSuccess) or result.port not in self.dst_ports:
+                continue
+            offset = result.packet.find(PIPELINE_MAGIC)
+            if offset < 0 or offset + PIPELINE_TAG.size > len(result.packet):
+                continue
+            _, receiver_id, index = PIPELINE_TAG.unpack_from(result.packet, offset)
+            if receiver_id != self.receiver_id:
+                continue
+            with self.cond:
+                masked_exp_pkt = self.expected.get(index)
+                # The first copy is counted, like verify_packet_any_port does
+                if masked_exp_pkt is None or index in self.received or not masked_exp_pkt.pkt_match(result.packet):
+                    continue
+                self.received[index] = (result.port, result.packet)
+                self.cond.notify_all()
+
+
 class HashTest(BaseTest):
     # ---------------------------------------------------------------------
     # Class variables
@@ -41,6 +125,8 @@ class HashTest(BaseTest):
     DEFAULT_BALANCING_RANGE = 0.25
     RELAXED_BALANCING_RANGE = 0.80
     BALANCING_TEST_TIMES = 250
+    PIPELINE_TIMEOUT = 10
+    PIPELINE_TRIES = 2
     DEFAULT_SWITCH_TYPE = 'voq'
     _required_params = [
         'fib_info_files',
@@ -113,6 +199,9 @@ class HashTest(BaseTest):
         self.base_mac = self.dataplane.get_mac(
             *random.choice(list(self.dataplane.ports.keys())))
         self.vxlan_dest_port = int(self.test_params.get('vxlan_dest_port', 0))
+        # Number of packets sent back-to-back by the balancing checks, 0 to send a packet after the previous one
+        # is received
+        self.pipeline_batch_size = int(self.test_params.get('pipeline_batch_size', 0))
 
     def _get_nexthops(self, src_port, dst_ip):
         active_dut_indexes = [0]
@@ -217,13 +306,18 @@ class HashTest(BaseTest):
             assert len(hit_count_map.keys()) == len(
                 self.ptf_test_port_map[str(ingress_port)]["target_dut"])
         else:
-            for _ in range(0, self.balancing_test_times * len(list(itertools.chain(*exp_port_lists)))):
-                logging.info('Checking hash key {}, src_port={}, exp_ports={}, dst_ip={}'
-                             .format(hash_key, src_port, exp_port_lists, dst_ip))
-                (matched_port, _) = self.check_ip_route(
-                    hash_key, src_port, dst_ip, exp_port_lists)
-                hit_count_map[matched_port] = hit_count_map.get(
-                    matched_port, 0) + 1
+            count = self.balancing_test_times * len(list(itertools.chain(*exp_port_lists)))
+            if self.pipeline_batch_size:
+                version = 'IP' if ip_network(six.text_type(dst_ip)).version == 4 else 'IPv6'
+                hit_count_map = self.check_routes_pipelined(hash_key, src_port, exp_port_lists, count, version)
+            else:
+                for _ in range(0, count):
+                    logging.info('Checking hash key {}, src_port={}, exp_ports={}, dst_ip={}'
+                                 .format(hash_key, src_port, exp_port_lists, dst_ip))
+                    (matched_port, _) = self.check_ip_route(
+                        hash_key, src_port, dst_ip, exp_port_lists)
+                    hit_count_map[matched_port] = hit_count_map.get(
+                        matched_port, 0) + 1
             logging.info("hash_key={}, hit count map: {}".format(
                 hash_key, hit_count_map))
             for next_hop in next_hops:
@@ -396,12 +490,11 @@ class HashTest(BaseTest):
                 pkt['IPv6'].nh = ip_proto
                 exp_pkt['IPv6'].nh = ip_proto
 
-    def check_ipv4_route(self, hash_key, src_port, dst_port_lists, outer_sport=None, outer_dst_ip=None,
-                         outer_src_ip=None):
+    def create_route_flow(self, hash_key, src_port, version='IP', outer_src_ip=None, outer_dst_ip=None, tag=None):
         '''
-        @summary: Check IPv4 route works.
+        @summary: Create the packet of a flow varying the hash key, its masked expected packet and sending logs.
+        @param tag : signature written at the start of the payload of the packets, for pipelined checks
         '''
-        class_name = self.__class__.__name__
         ip_src = self.src_ip_interval.get_random_ip(
         ) if hash_key == 'src-ip' else self.src_ip_interval.get_first_ip()
         ip_dst = self.dst_ip_interval.get_random_ip(
@@ -415,7 +508,8 @@ class HashTest(BaseTest):
             if hash_key == 'dst-mac' else self.base_mac
         router_mac = self.ptf_test_port_map[str(src_port)]['target_dest_mac']
         vlan_id = random.choice(self.vlan_ids) if hash_key == 'vlan-id' else 0
-        ip_proto = self._get_ip_proto() if hash_key == 'ip-proto' else None
+        ip_proto = self._get_ip_proto(
+            ipv6=(version == 'IPv6')) if hash_key == 'ip-proto' else None
         pkt, exp_pkt, inner_pkt = self.create_pkt(
             vlan_id=vlan_id,
             router_mac=router_mac,
@@ -430,102 +524,106 @@ class HashTest(BaseTest):
             outer_src_ipv6=outer_src_ip,
             outer_dst_ipv6=outer_dst_ip,
             outer_sport=outer_sport,
-            version='IP',
+            version=version,
             hash_key=hash_key
         )
-        self.set_packet_parameter(pkt, exp_pkt, hash_key, ip_proto, version='IP')
+        self.set_packet_parameter(pkt, exp_pkt, hash_key, ip_proto, version=version)
+        if tag is not None:
+            # The payload is not a hash key, the tag doesn't change the path of the flow
+            tag_payload(pkt, tag)
+            tag_payload(exp_pkt, tag)
         masked_exp_pkt = Mask(exp_pkt)
-        masked_exp_pkt = self.apply_mask_to_exp_pkt(masked_exp_pkt, version='IP')
+        masked_exp_pkt = self.apply_mask_to_exp_pkt(masked_exp_pkt, version=version)
         logs = self.create_packets_logs(
             src_port=src_port,
             pkt=pkt,
+            ipinip_pkt=pkt,
             vxlan_pkt=pkt,
             nvgre_pkt=pkt,
-            ipinip_pkt=pkt,
             inner_pkt=inner_pkt,
             outer_sport=outer_sport,
             sport=sport,
             dport=dport,
             ip_src=ip_src,
             ip_dst=ip_dst,
-            ip_proto=ip_proto
+            ip_proto=ip_proto,
+            version=version
         )
+        return Flow(pkt, masked_exp_pkt, logs, ip_src, ip_dst)
+
+    def check_route(self, hash_key, src_port, dst_port_lists, version='IP', outer_src_ip=None, outer_dst_ip=None):
+        class_name = self.__class__.__name__
+        flow = self.create_route_flow(hash_key, src_port, version, outer_src_ip, outer_dst_ip)
         if class_name == 'HashTest':
             rcvd_port, rcvd_pkt = retry_call(
                 self.send_and_verify_packets,
-                fargs=[src_port, pkt, masked_exp_pkt, dst_port_lists, logs],
+                fargs=[src_port, flow.pkt, flow.masked_exp_pkt, dst_port_lists, flow.logs],
                 tries=2,
                 delay=2
             )
         else:
-            rcvd_port, rcvd_pkt = self.send_and_verify_packets(src_port, pkt, masked_exp_pkt, dst_port_lists, logs=logs)
-        return self.get_validated_packet(rcvd_port, rcvd_pkt, dst_port_lists, ip_src, ip_dst, src_port)
+            rcvd_port, rcvd_pkt = self.send_and_verify_packets(src_port, flow.pkt, flow.masked_exp_pkt,
+                                                               dst_port_lists, logs=flow.logs)
+        return self.get_validated_packet(rcvd_port, rcvd_pkt, dst_port_lists, flow.ip_src, flow.ip_dst, src_port)
+
+    def check_ipv4_route(self, hash_key, src_port, dst_port_lists, outer_sport=None, outer_dst_ip=None,
+                         outer_src_ip=None):
+        '''
+        @summary: Check IPv4 route works.
+        '''
+        return self.check_route(hash_key, src_port, dst_port_lists, 'IP', outer_src_ip, outer_dst_ip)
 
     def check_ipv6_route(self, hash_key, src_port, dst_port_lists, outer_src_ip=None, outer_dst_ip=None):
         '''
         @summary: Check IPv6 route works.
         '''
-        class_name = self.__class__.__name__
-        ip_src = self.src_ip_interval.get_random_ip(
-        ) if hash_key == 'src-ip' else self.src_ip_interval.get_first_ip()
-        ip_dst = self.dst_ip_interval.get_random_ip(
-        ) if hash_key == 'dst-ip' else self.dst_ip_interval.get_first_ip()
-        sport = random.randint(0, 65535) if hash_key == 'src-port' else 1234
-        dport = random.randint(0, 65535) if hash_key == 'dst-port' else 80
-        outer_sport = self.generate_random_sport() if hash_key == 'outer-src-port' else 1234
-        src_mac = (self.base_mac[:-5] + "%02x" % random.randint(0, 255) + ":" + "%02x" % random.randint(0, 255)) \
-            if hash_key == 'src-mac' else self.base_mac
-        dst_mac = (self.base_mac[:-5] + "%02x" % random.randint(0, 255) + ":" + "%02x" % random.randint(0, 255)) \
-            if hash_key == 'dst-mac' else self.base_mac
-        router_mac = self.ptf_test_port_map[str(src_port)]['target_dest_mac']
-        vlan_id = random.choice(self.vlan_ids) if hash_key == 'vlan-id' else 0
-        ip_proto = self._get_ip_proto(
-            ipv6=True) if hash_key == "ip-proto" else None
-        pkt, exp_pkt, inner_pkt = self.create_pkt(
-            vlan_id=vlan_id,
-            router_mac=router_mac,
-            src_mac=src_mac,
-            dst_mac=dst_mac,
-            ip_src=ip_src,
-            ip_dst=ip_dst,
-            sport=sport,
-            dport=dport,
-            outer_src_ip=outer_src_ip,
-            outer_dst_ip=outer_dst_ip,
-            outer_src_ipv6=outer_src_ip,
-            outer_dst_ipv6=outer_dst_ip,
-            outer_sport=outer_sport,
-            version='IPv6',
-            hash_key=hash_key
-        )
-        self.set_packet_parameter(pkt, exp_pkt, hash_key, ip_proto, version='IPv6')
-        masked_exp_pkt = Mask(exp_pkt)
-        masked_exp_pkt = self.apply_mask_to_exp_pkt(masked_exp_pkt, version='IPv6')
-        logs = self.create_packets_logs(
-            src_port=src_port,
-            pkt=pkt,
-            ipinip_pkt=pkt,
-            vxlan_pkt=pkt,
-            nvgre_pkt=pkt,
-            inner_pkt=inner_pkt,
-            outer_sport=outer_sport,
-            sport=sport,
-            dport=dport,
-            ip_src=ip_src,
-            ip_dst=ip_dst,
-            ip_proto=ip_proto,
-            version='IPv6'
-        )
-        if class_name == 'HashTest':
-            rcvd_port, rcvd_pkt = retry_call(
-                self.send_and_verify_packets,
-                fargs=[src_port, pkt, masked_exp_pkt, dst_port_lists, logs],
-                tries=2,
-                delay=2
-            )
-        else:
-            rcvd_port, rcvd_pkt = self.send_and_verify_packets(src_port, pkt, masked_exp_pkt, dst_port_lists, logs=logs)
-        return self.get_validated_packet(rcvd_port, rcvd_pkt, dst_port_lists, ip_src, ip_dst, src_port)
+        return self.check_route(hash_key, src_port, dst_port_lists, 'IPv6', outer_src_ip, outer_dst_ip)
+
+    def check_routes_pipelined(self, hash_key, src_port, dst_port_lists, count, version='IP', outer_src_ip=None,
+                               outer_dst_ip=None):
+        '''
+        @summary: Send count flows varying the hash key in batches of pipeline_batch_size packets, without waiting
+                  for each packet. The packets are tagged with the index of their flow, and matched to it by a
+                  background receiver.
+        @return : a dict that records the number of packets each port received
+        '''
+        receiver = PipelinedReceiver(self.dataplane, list(itertools.chain(*dst_port_lists)))
+        self.dataplane.flush()
+        receiver.start()
+        hit_count_map = {}
+        try:
+            for start in range(0, count, self.pipeline_batch_size):
+                flows = {}
+                for index in range(start, min(count, start + self.pipeline_batch_size)):
+                    flows[index] = self.create_route_flow(hash_key, src_port, version, outer_src_ip, outer_dst_ip,
+                                                          tag=receiver.tag(index))
+                    receiver.expect(index, flows[index].masked_exp_pkt)
+                received = {}
+                pending = sorted(flows)
+                # Lost packets are sent again, like the retry of the sequential check
+                for _ in range(self.PIPELINE_TRIES):
+                    for index in pending:
+                        send_packet(self, src_port, flows[index].pkt)
+                    received.update(receiver.wait(pending, self.PIPELINE_TIMEOUT))
+                    pending = [index for index in pending if index not in received]
+                    if not pending:
+                        break
+                if pending:
+                    for index in pending:
+                        for log in flows[index].logs:
+                            logging.error(log)
+                    raise AssertionError("{} of {} packets were not received on the expected ports {}".format(
+                        len(pending), len(flows), dst_port_lists))
+                for index, (rcvd_port, rcvd_pkt) in received.items():
+                    flow = flows[index]
+                    self.get_validated_packet(rcvd_port, rcvd_pkt, dst_port_lists, flow.ip_src, flow.ip_dst,
+                                              src_port)
+                    hit_count_map[rcvd_port] = hit_count_map.get(rcvd_port, 0) + 1
+                logging.info("Received {} packets of hash key {}, hit count map: {}".format(
+                    min(count, start + self.pipeline_batch_size), hash_key, hit_count_map))
+        finally:
+            receiver.stop()
+        return hit_count_map
 
     def check_within_expected_range(self, actual, expected, hash_key):
         '''
@@ -808,23 +906,35 @@ class IPinIPHashTest(HashTest):
             # The length of inner_frame is not used as hash key for IPinIP packet.
             # The test generates IPinIP packets with random inner_frame_length, and then verify the egress path.
             # The egress port should never change
-            for _ in range(0, self.balancing_test_times * len(list(itertools.chain(*exp_port_lists)))):
-                logging.info('Checking hash key {}, exp_ports={}, outer_src_ip={}, outer_dst_ip={}'
-                             .format(hash_key, exp_port_lists, outer_src_ip, outer_dst_ip))
-                (matched_index, _) = self.check_ip_route(hash_key,
-                                                         src_port, exp_port_lists, outer_src_ip, outer_dst_ip)
-                hit_count_map[matched_index] = hit_count_map.get(
-                    matched_index, 0) + 1
+            count = self.balancing_test_times * len(list(itertools.chain(*exp_port_lists)))
+            if self.pipeline_batch_size:
+                version = 'IP' if self.ipver == 'ipv4' else 'IPv6'
+                hit_count_map = self.check_routes_pipelined(hash_key, src_port, exp_port_lists, count, version,
+                                                            outer_src_ip, outer_dst_ip)
+            else:
+                for _ in range(0, count):
+                    logging.info('Checking hash key {}, exp_ports={}, outer_src_ip={}, outer_dst_ip={}'
+                                 .format(hash_key, exp_port_lists, outer_src_ip, outer_dst_ip))
+                    (matched_index, _) = self.check_ip_route(hash_key,
+                                                             src_port, exp_port_lists, outer_src_ip, outer_dst_ip)
+                    hit_count_map[matched_index] = hit_count_map.get(
+                        matched_index, 0) + 1
             logging.info("hit count map: {}".format(hit_count_map))
             assert True if len(hit_count_map.keys()) == 1 else False
         else:
-            for _ in range(0, self.balancing_test_times * len(list(itertools.chain(*exp_port_lists)))):
-                logging.info('Checking hash key {}, src_port={}, exp_ports={}, outer_src_ip={}, outer_dst_ip={}'
-                             .format(hash_key, src_port, exp_port_lists, outer_src_ip, outer_dst_ip))
-                (matched_index, _) = self.check_ip_route(hash_key,
-                                                         src_port, exp_port_lists, outer_src_ip, outer_dst_ip)
-                hit_count_map[matched_index] = hit_count_map.get(
-                    matched_index, 0) + 1
+            count = self.balancing_test_times * len(list(itertools.chain(*exp_port_lists)))
+            if self.pipeline_batch_size:
+                version = 'IP' if self.ipver == 'ipv4' else 'IPv6'
+                hit_count_map = self.check_routes_pipelined(hash_key, src_port, exp_port_lists, count, version,
+                                                            outer_src_ip, outer_dst_ip)
+            else:
+                for _ in range(0, count):
+                    logging.info('Checking hash key {}, src_port={}, exp_ports={}, outer_src_ip={}, outer_dst_ip={}'
+                                 .format(hash_key, src_port, exp_port_lists, outer_src_ip, outer_dst_ip))
+                    (matched_index, _) = self.check_ip_route(hash_key,
+                                                             src_port, exp_port_lists, outer_src_ip, outer_dst_ip)
+                    hit_count_map[matched_index] = hit_count_map.get(
+                        matched_index, 0) + 1
             logging.info("hash_key={}, hit count map: {}".format(
                 hash_key, hit_count_map))
             for next_hop in next_hops:
@@ -1004,13 +1114,19 @@ class VxlanHashTest(HashTest):
                     outer_dst_ip, exp_port_list))
                 assert False
         hit_count_map = {}
-        for _ in range(0, self.balancing_test_times * len(list(itertools.chain(*exp_port_lists)))):
-            logging.info('Checking hash key {}, src_port={}, exp_ports={}, outer_src_ip={}, outer_dst_ip={}'
-                         .format(hash_key, src_port, exp_port_lists, outer_src_ip, outer_dst_ip))
-            (matched_index, _) = self.check_ip_route(hash_key,
-                                                     src_port, exp_port_lists, outer_src_ip, outer_dst_ip)
-            hit_count_map[matched_index] = hit_count_map.get(
-                matched_index, 0) + 1
+        count = self.balancing_test_times * len(list(itertools.chain(*exp_port_lists)))
+        if self.pipeline_batch_size:
+            version = 'IP' if self.ipver == 'ipv4-ipv4' or self.ipver == 'ipv4-ipv6' else 'IPv6'
+            hit_count_map = self.check_routes_pipelined(hash_key, src_port, exp_port_lists, count, version,
+                                                        outer_src_ip, outer_dst_ip)
+        else:
+            for _ in range(0, count):
+                logging.info('Checking hash key {}, src_port={}, exp_ports={}, outer_src_ip={}, outer_dst_ip={}'
+                             .format(hash_key, src_port, exp_port_lists, outer_src_ip, outer_dst_ip))
+                (matched_index, _) = self.check_ip_route(hash_key,
+                                                         src_port, exp_port_lists, outer_src_ip, outer_dst_ip)
+                hit_count_map[matched_index] = hit_count_map.get(
+                    matched_index, 0) + 1
         logging.info("hash_key={}, hit count map: {}".format(
             hash_key, hit_count_map))
         for next_hop in next_hops:
@@ -1215,14 +1331,23 @@ class NvgreHashTest(HashTest):
                     outer_dst_ip, exp_port_list))
                 assert False
         hit_count_map = {}
-        for _ in range(0, self.balancing_test_times * len(list(itertools.chain(*exp_port_lists)))):
-            logging.info('Checking hash key {}, src_port={}, exp_ports={}, outer_src_ip={}, outer_dst_ip={}'
-                         .format(hash_key, src_port, exp_port_lists, outer_src_ip, outer_dst_ip))
-            (matched_index, _) = self.check_ip_route(hash_key,
-                                                     src_port, exp_port_lists, outer_src_ip, outer_dst_ip,
-                                                     outer_src_ipv6, outer_dst_ipv6)
-            hit_count_map[matched_index] = hit_count_map.get(
-                matched_index, 0) + 1
+        count = self.balancing_test_times * len(list(itertools.chain(*exp_port_lists)))
+        if self.pipeline_batch_size:
+            if self.ipver == 'ipv4-ipv4' or self.ipver == 'ipv4-ipv6':
+                hit_count_map = self.check_routes_pipelined(hash_key, src_port, exp_port_lists, count, 'IP',
+                                                            outer_src_ip, outer_dst_ip)
+            else:
+                hit_count_map = self.check_routes_pipelined(hash_key, src_port, exp_port_lists, count, 'IPv6',
+                                                            outer_src_ipv6, outer_dst_ipv6)
+        else:
+            for _ in range(0, count):
+                logging.info('Checking hash key {}, src_port={}, exp_ports={}, outer_src_ip={}, outer_dst_ip={}'
+                             .format(hash_key, src_port, exp_port_lists, outer_src_ip, outer_dst_ip))
+                (matched_index, _) = self.check_ip_route(hash_key,
+                                                         src_port, exp_port_lists, outer_src_ip, outer_dst_ip,
+                                                         outer_src_ipv6, outer_dst_ipv6)
+                hit_count_map[matched_index] = hit_count_map.get(
+                    matched_index, 0) + 1
         logging.info("hash_key={}, hit count map: {}".format(
             hash_key, hit_count_map))
         for next_hop in next_hops:
@@ -29,11 +29,21 @@ import re
 import os
 import os.path
 import csv
+import gzip
+import json
 import time
 import logging
 import logging.handlers
+import mmap
+import multiprocessing
+from contextlib import redirect_stdout
 from datetime import datetime
 
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+
 # ---------------------------------------------------------------------
 # Global variables
 # ---------------------------------------------------------------------
@@ -56,6 +66,252 @@ err_start_ignore_marker = -8
 # will not be picked up by the analyzer.
 MAX_LOG_MESSAGE_LENGTH = 1000
 
+# -- Minimal length of a literal required by a regex to use it for prefiltering log lines.
+# Shorter literals appear in almost every line and don't filter anything out.
+MIN_PREFILTER_LITERAL_LENGTH = 3
+
+# -- Max number of compiled matchers kept in cache
+MATCHER_CACHE_SIZE = 32
+
+
+def reverse_readlines(file_path):
+    '''
+    @summary: Yield lines of a file starting from the last one.
+
+    The file is memory mapped and scanned backward for line separators, so only
+    the pages holding the lines actually consumed by the caller are read from disk.
+    When the caller stops iterating (e.g. on the start marker), the rest of the file
+    is never touched. Memory usage does not depend on the file size.
+
+    @param file_path: Path to the file to read.
+    '''
+    with open(file_path, 'rb') as log_file:
+        try:
+            buf = mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            # -- Empty files and special files (pipes, /proc) can't be mapped
+            for line in reversed(log_file.read().decode('utf-8', 'replace').splitlines(True)):
+                yield line
+            return
+
+        with buf:
+            end = len(buf)
+            while end > 0:
+                # -- Skip the new line terminating the current line
+                start = buf.rfind(b'\n', 0, end - 1) + 1
+                line = buf[start:end].decode('utf-8', 'replace')
+                if line.endswith('\r\n'):
+                    line = line[:-2] + '\n'
+                yield line
+                end = start
+
+
+def list_rotated_files(log_file_path):
+    '''
+    @summary: Get the log file and its rotated copies (e.g. syslog, syslog.1, syslog.2.gz),
+              sorted from the newest to the oldest one.
+
+    @param log_file_path: Path to the log file.
+    '''
+    directory, prefix = os.path.split(log_file_path)
+
+    def rotation_key(file_name):
+        # -- The log file, then the numbered copies, then the copies without a number, by name
+        if file_name == prefix:
+            return (0, 0, file_name)
+        index = re.match(r'\.(\d+)(\.gz)?$', file_name[len(prefix):])
+        if index:
+            return (1, int(index.group(1)), file_name)
+        return (2, 0, file_name)
+
+    file_names = [file_name for file_name in os.listdir(directory or '.')
+                  if file_name == prefix or file_name.startswith(prefix + '.')]
+    return [os.path.join(directory, file_name) for file_name in sorted(file_names, key=rotation_key)]
+
+
+def reverse_readlines_rotated(log_file_path):
+    '''
+    @summary: Yield lines of a log file and its rotated copies starting from the last line
+              of the newest file.
+
+    @param log_file_path: Path to the log file.
+    '''
+    for file_path in list_rotated_files(log_file_path):
+        if file_path.endswith('.gz'):
+            # -- Rotated files are small and compressed, they can't be scanned in place
+            with gzip.open(file_path, 'rt', errors='replace') as log_file:
+                lines = log_file.readlines()
+            for line in reversed(lines):
+                yield line
+        else:
+            for line in reverse_readlines(file_path):
+                yield line
+
+
+def _is_any_repeat(item):
+    '''
+    @summary: Check whether parsed regex item is '.*' or '.*?'.
+    '''
+    op, av = item
+    if op not in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT):
+        return False
+    min_repeat, max_repeat, sub_items = av
+    return min_repeat == 0 and max_repeat == sre_parse.MAXREPEAT and list(sub_items) == [(sre_parse.ANY, None)]
+
+
+def _has_group_reference(items):
+    '''
+    @summary: Check whether parsed regex refers to a group by number or name.
+    '''
+    for op, av in items:
+        if op in (sre_parse.GROUPREF, sre_parse.GROUPREF_EXISTS):
+            return True
+        for sub in (av if isinstance(av, (list, tuple)) else [av]):
+            # -- Branch alternatives are stored as a list of sub patterns
+            sub_patterns = sub if isinstance(sub, list) else [sub]
+            if any(isinstance(i, sre_parse.SubPattern) and _has_group_reference(i) for i in sub_patterns):
+                return True
+    return False
+
+
+def _longest_literal(items):
+    '''
+    @summary: Find the longest run of literal characters in a sequence of parsed regex items.
+              Every string matching the sequence contains that run.
+    '''
+    longest = ''
+    current = []
+    for op, av in list(items) + [(None, None)]:
+        if op is sre_parse.LITERAL:
+            current.append(chr(av))
+            continue
+        if len(current) > len(longest):
+            longest = ''.join(current)
+        current = []
+    return longest
+
+
+def required_literals(regex):
+    '''
+    @summary: Get literals, one of which is contained in any string matching the regex.
+
+    @param regex: Regular expression string.
+
+    @return: List of literals or None if the regex doesn't require a literal long enough
+             to be used as a prefilter.
+    '''
+    items = sre_parse.parse(regex)
+    if len(items) == 1 and items[0][0] is sre_parse.BRANCH:
+        literals = [_longest_literal(branch) for branch in items[0][1][1]]
+    else:
+        literals = [_longest_literal(items)]
+
+    if all(len(literal) >= MIN_PREFILTER_LITERAL_LENGTH for literal in literals):
+        return literals
+    return None
+
+
+def strip_unanchored_wildcards(regex):
+    '''
+    @summary: Remove leading '.*' from the regex.
+
+    The result finds a match in exactly the same lines as the original regex, since '.*' can
+    match an empty string, but search() doesn't have to try to expand it at every position.
+    '''
+    items = sre_parse.parse(regex)
+    if len(items) and _is_any_repeat(items[0]) and regex.startswith('.*'):
+        return regex[3:] if regex.startswith('.*?') else regex[2:]
+    return regex
+
+
+class MessagesMatcher:
+    '''
+    @summary: Matcher of a log line against a set of regular expressions.
+
+    It gives the same verdict as searching the line with a single alternation of all the
+    regular expressions, but avoids running the regex engine on lines which can't match.
+    Regular expressions are split into two groups:
+      - regexes which require a literal to be present in a line. Each regex is compiled
+        separately and searched only in lines containing its required literal.
+      - the rest regexes, compiled into a single alternation.
+
+    The combined alternation of all the regexes is kept in "regex" and exposed via
+    "pattern", "match" and "findall", so the matcher can be used wherever a compiled
+    regex was used before.
+    '''
+
+    def __init__(self, messages_regex):
+        self.messages_regex = list(messages_regex)
+        self.regex = re.compile('|'.join(self.messages_regex))
+        self.pattern = self.regex.pattern
+        # -- literal -> list of compiled regexes requiring that literal
+        self.literal_index = {}
+        self.generic_regex = None
+
+        # -- Global inline flags and group references have effect on the whole alternation,
+        # -- so such regexes can't be matched separately without changing the verdict.
+        if (self.regex.flags & ~re.UNICODE) or _has_group_reference(sre_parse.parse(self.pattern)):
+            self.generic_regex = self.regex
+            return
+
+        generic = []
+        for regex in self.messages_regex:
+            literals = required_literals(regex)
+            if literals is None:
+                generic.append(strip_unanchored_wildcards(regex))
+                continue
+            compiled = re.compile(strip_unanchored_wildcards(regex))
+            for literal in set(literals):
+                self.literal_index.setdefault(literal, []).append(compiled)
+
+        if generic:
+            self.generic_regex = re.compile('|'.join(generic))
+
+    def search(self, line):
+        '''
+        @summary: Check whether any of the regexes matches the line.
+
+        @return: True if there is a match, otherwise False.
+        '''
+        for literal, regexes in self.literal_index.items():
+            if literal in line:
+                for regex in regexes:
+                    if regex.search(line):
+                        return True
+
+        return self.generic_regex is not None and self.generic_regex.search(line) is not None
+
+    def match(self, line):
+        return self.regex.match(line)
+
+    def findall(self, line):
+        return self.regex.findall(line)
+
+
+_matchers_cache = {}
+
+
+def compile_messages_matcher(messages_regex):
+    '''
+    @summary: Build a MessagesMatcher for a list of regexes, reusing a previously built one
+              for the same list.
+
+    @param messages_regex: List of regular expression strings.
+
+    @return: MessagesMatcher instance or None if the list is empty.
+    '''
+    if not messages_regex:
+        return None
+
+    key = tuple(messages_regex)
+    matcher = _matchers_cache.get(key)
+    if matcher is None:
+        if len(_matchers_cache) >= MATCHER_CACHE_SIZE:
+            _matchers_cache.pop(next(iter(_matchers_cache)))
+        matcher = MessagesMatcher(messages_regex)
+        _matchers_cache[key] = matcher
+    return matcher
+
 
 class AnsibleLogAnalyzer:
     '''
@@ -89,6 +345,8 @@ class AnsibleLogAnalyzer:
     end_marker_prefix = "end-LogAnalyzer"
     start_ignore_marker_prefix = "start-ignore-LogAnalyzer"
     end_ignore_marker_prefix = "end-ignore-LogAnalyzer"
+    # -- Ansible logs the arguments of the loganalyzer invocations, which contain the markers
+    invocation_actions = ("extract_log", "analyze_parallel")
 
     def init_sys_logger(self):
         logger = logging.getLogger('LogAnalyzer')
@@ -138,6 +396,15 @@ class AnsibleLogAnalyzer:
 
     # ---------------------------------------------------------------------
 
+    def is_invocation(self, line):
+        '''
+        @summary: Check if the line is the log of a loganalyzer invocation, which contains the markers
+            but isn't the marker itself.
+        '''
+        return any(action in line for action in self.invocation_actions)
+
+    # ---------------------------------------------------------------------
+
     def create_end_marker(self):
         return self.end_marker_prefix + "-" + self.run_id
     # ---------------------------------------------------------------------
@@ -308,7 +575,7 @@ class AnsibleLogAnalyzer:
 
         @param file_list : List of file paths, contains search expressions.
 
-        @return: A regex class instance, corresponding to loaded regex expressions.
+        @return: A MessagesMatcher instance, corresponding to loaded regex expressions.
             Will be used for matching operations by callers.
         '''
         messages_regex = []
@@ -360,11 +627,7 @@ class AnsibleLogAnalyzer:
                         print((repr(e)))
                         sys.exit(err_invalid_string_format)
 
-        if (len(messages_regex)):
-            regex = re.compile('|'.join(messages_regex))
-        else:
-            regex = None
-        return regex, messages_regex
+        return compile_messages_matcher(messages_regex), messages_regex
     # ---------------------------------------------------------------------
 
     def line_matches(self, str, match_messages_regex, ignore_messages_regex):
@@ -378,21 +641,21 @@ class AnsibleLogAnalyzer:
             'ignore' set - will not be reported (will be ignored)
 
         @param match_messages_regex:
-            regex class instance containing messages to match against.
+            MessagesMatcher or regex class instance containing messages to match against.
 
         @param ignore_messages_regex:
-            regex class instance containing messages to ignore match against.
+            MessagesMatcher or regex class instance containing messages to ignore match against.
 
         @return: True is str matches regex criteria, otherwise False.
         '''
 
         ret_code = False
 
-        if ((match_messages_regex is not None) and (match_messages_regex.findall(str))):
+        if ((match_messages_regex is not None) and (match_messages_regex.search(str))):
             if (ignore_messages_regex is None):
                 ret_code = True
 
-            elif (not ignore_messages_regex.findall(str)):
+            elif (not ignore_messages_regex.search(str)):
                 self.print_diagnostic_message('matching line: %s' % str)
                 ret_code = True
 
@@ -413,13 +676,13 @@ class AnsibleLogAnalyzer:
             if (expect_messages_regex is not None) and (expect_messages_regex.match(str)):
                 ret_code = True
         else:
-            if (expect_messages_regex is not None) and (expect_messages_regex.findall(str)):
+            if (expect_messages_regex is not None) and (expect_messages_regex.search(str)):
                 ret_code = True
 
         return ret_code
 
     def analyze_file(self, log_file_path, match_messages_regex, ignore_messages_regex, expect_messages_regex,
-                     maximum_log_length=None):
+                     maximum_log_length=None, start_string=None, follow_rotation=False):
         '''
         @summary: Analyze input file content for messages matching input regex
                   expressions. See line_matches() for details on matching criteria.
@@ -439,6 +702,12 @@ class AnsibleLogAnalyzer:
 
         @param maximum_log_length - The long log message (length > maximum_log_length) will be dropped by LogAnalyzer.
 
+        @param start_string - For files which don't require start/end markers, the analysis stops at
+            the latest line containing this string.
+
+        @param follow_rotation - Continue the analysis in the rotated copies of the file (file.1, file.2.gz, ...)
+            until the start marker or start_string is found.
+
         @return: List of strings match search criteria.
         '''
 
@@ -454,15 +723,19 @@ class AnsibleLogAnalyzer:
         found_start_marker = False
         found_end_marker = False
         if stdin_as_input:
-            log_file = sys.stdin
+            rev_lines = reversed(sys.stdin.readlines())
+        elif follow_rotation:
+            rev_lines = reverse_readlines_rotated(log_file_path)
         else:
-            log_file = open(log_file_path, 'r')
+            # -- Stream the file backward, so the analysis stops reading at the start marker
+            # -- and only the content logged after it is loaded.
+            rev_lines = reverse_readlines(log_file_path)
 
         start_marker = self.create_start_marker()
         end_marker = self.create_end_marker()
 
         ignore_marker_run_ids = []
-        for rev_line in reversed(log_file.readlines()):
+        for rev_line in rev_lines:
             if stdin_as_input:
                 in_analysis_range = True
             else:
@@ -498,7 +771,7 @@ class AnsibleLogAnalyzer:
                     continue
 
             if not stdin_as_input:
-                if rev_line.find(start_marker) != -1 and 'extract_log' not in rev_line:
+                if rev_line.find(start_marker) != -1 and not self.is_invocation(rev_line):
                     self.print_diagnostic_message(
                         'found start marker: %s' % start_marker)
                     if (found_start_marker):
@@ -530,6 +803,14 @@ class AnsibleLogAnalyzer:
                 elif self.line_matches(rev_line, match_messages_regex, ignore_messages_regex):
                     matching_lines.append(rev_line)
 
+            if not check_marker and start_string and start_string in rev_line and not self.is_invocation(rev_line):
+                self.print_diagnostic_message('found start string: %s' % start_string)
+                break
+
+        if not stdin_as_input:
+            # -- Release the mapped file, the loop may have stopped in the middle of it
+            rev_lines.close()
+
         # care about the markers only if input is not stdin or no need to check start marker
         if not stdin_as_input and check_marker:
             if (not found_start_marker):
@@ -581,6 +862,89 @@ class AnsibleLogAnalyzer:
         return res
     # ---------------------------------------------------------------------
 
+    def analyze_sources(self, sources, messages_regex_m, messages_regex_i, messages_regex_e,
+                        maximum_log_length=None, workers=None):
+        '''
+        @summary: Analyze log files in parallel worker processes, one file with its rotated
+            copies per worker. See line_matches() for details on matching criteria.
+
+        @param sources: List of dicts describing log files to analyze:
+            "path" - path to the log file,
+            "start_string" - optional string to start analysis from if the file doesn't have markers.
+
+        @param messages_regex_m: List of regexes of messages to match against.
+
+        @param messages_regex_i: List of regexes of messages to ignore.
+
+        @param messages_regex_e: List of regexes of messages that are expected to appear in log files.
+
+        @param maximum_log_length: See analyze_file().
+
+        @param workers: Max number of worker processes. Defaults to the number of CPUs.
+
+        @return: Returns map <file_name, [list_of_matching_strings, list_of_expected_strings]>.
+            Exits with the error code if analysis of any file failed.
+        '''
+        tasks = [(self.run_id, self.start_marker, source, messages_regex_m, messages_regex_i, messages_regex_e,
+                  maximum_log_length) for source in sources if source.get('path')]
+
+        # -- Compile matchers before forking, so workers inherit them from the cache
+        for messages_regex in (messages_regex_m, messages_regex_i, messages_regex_e):
+            compile_messages_matcher(messages_regex)
+
+        workers = min(len(tasks), workers or multiprocessing.cpu_count())
+        if workers > 1:
+            pool = multiprocessing.Pool(workers)
+            try:
+                results = pool.map(analyze_source, tasks, chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [analyze_source(task) for task in tasks]
+
+        res = {}
+        for log_file, error_code, match_strings, expect_strings in results:
+            if error_code:
+                sys.stderr.write('ERROR: analysis of %s failed with code %s\n' % (log_file, error_code))
+                sys.exit(error_code)
+            res[log_file] = [match_strings, expect_strings]
+
+        return res
+    # ---------------------------------------------------------------------
+
+
+def analyze_source(task):
+    '''
+    @summary: Worker of AnsibleLogAnalyzer.analyze_sources(). Analyze one log file with its rotated copies.
+
+    @param task: Tuple of (run_id, start_marker, source, messages_regex_m, messages_regex_i, messages_regex_e,
+        maximum_log_length).
+
+    @return: Tuple of (log file path, error code, list of matching strings, list of expected strings).
+    '''
+    run_id, start_marker, source, messages_regex_m, messages_regex_i, messages_regex_e, maximum_log_length = task
+    analyzer = AnsibleLogAnalyzer(run_id, False, start_marker)
+
+    # -- stdout of the analysis is reserved for the results
+    with redirect_stdout(sys.stderr):
+        try:
+            match_strings, expect_strings = analyzer.analyze_file(
+                source['path'],
+                compile_messages_matcher(messages_regex_m),
+                compile_messages_matcher(messages_regex_i),
+                compile_messages_matcher(messages_regex_e),
+                maximum_log_length=maximum_log_length,
+                start_string=source.get('start_string'),
+                follow_rotation=True)
+        except SystemExit as e:
+            return source['path'], e.code or err_invalid_input, [], []
+
+    match_strings.reverse()
+    expect_strings.reverse()
+    return source['path'], 0, match_strings, expect_strings
+# ---------------------------------------------------------------------
+
 
 def usage():
     print('loganalyzer input parameters:')
@@ -591,6 +955,8 @@ def usage():
     print('                                 to all log files specified in --logs parameter.')
     print('                                 analyze - perform log analysis of files specified in --logs parameter.')
     print('                                 add_end_marker - add end marker to all log files specified in --logs parameter.')           # noqa: E501
+    print('                                 analyze_parallel - add end marker and analyze log files described in --job_file')           # noqa: E501
+    print('                                 in parallel processes, print results in JSON to stdout.')
     print('--out_dir path                   Directory path where to place output files, ')
     print('                                 must be present when --action == analyze')
     print('--logs path{,path}               List of full paths to log files to be analyzed.')
@@ -609,6 +975,9 @@ def usage():
     print('                                 All the strings from these files will be expected to present')
     print('                                 in one of specified log files during the analysis. Must be present')
     print('                                 when action == analyze.')
+    print('--job_file path                  JSON file describing analyze_parallel job, "-" to read it from stdin.')
+    print('                                 Keys: "sources", "match", "ignore", "expect", "end_marker_logs",')
+    print('                                 "start_marker", "maximum_log_length", "workers".')
 
 # ---------------------------------------------------------------------
 
@@ -623,7 +992,7 @@ def check_action(action, log_files_in, out_dir, match_files_in, ignore_files_in,
 
     ret_code = True
 
-    if action in ['init', 'add_end_marker', 'add_start_ignore_mark', 'add_end_ignore_mark']:
+    if action in ['init', 'add_end_marker', 'add_start_ignore_mark', 'add_end_ignore_mark', 'analyze_parallel']:
         ret_code = True
     elif action == 'analyze':
         if out_dir is None or len(out_dir) == 0:
@@ -773,13 +1142,14 @@ def main(argv):
     match_files_in = None
     ignore_files_in = None
     expect_files_in = None
+    job_file = None
     verbose = False
 
     try:
-        opts, args = getopt.getopt(argv, "a:r:s:l:o:m:i:e:vh",
+        opts, args = getopt.getopt(argv, "a:r:s:l:o:m:i:e:j:vh",
                                    ["action=", "run_id=", "start_marker=", "logs=",
                                     "out_dir=", "match_files_in=", "ignore_files_in=",
-                                    "expect_files_in=", "verbose", "help"])
+                                    "expect_files_in=", "job_file=", "verbose", "help"])
 
     except getopt.GetoptError:
         print("Invalid option specified")
@@ -815,6 +1185,9 @@ def main(argv):
         elif (opt in ("-e", "--expect_files_in")):
             expect_files_in = arg
 
+        elif (opt in ("-j", "--job_file")):
+            job_file = arg
+
         elif (opt in ("-v", "--verbose")):
             verbose = True
 
@@ -856,6 +1229,26 @@ def main(argv):
         write_result_file(run_id, out_dir, result,
                           messages_regex_e, unused_regex_messages)
         write_summary_file(run_id, out_dir, result, unused_regex_messages)
+    elif action == "analyze_parallel":
+        if job_file is None or analyzer.is_filename_stdin(job_file):
+            job = json.load(sys.stdin)
+        else:
+            with open(job_file) as fp:
+                job = json.load(fp)
+
+        if job.get("start_marker"):
+            analyzer.start_marker = job["start_marker"]
+
+        analyzer.place_marker(
+            job.get("end_marker_logs", []), analyzer.create_end_marker(), wait_for_marker=True)
+
+        sources = job.get("sources") or [{"path": system_log_file}]
+        result = analyzer.analyze_sources(sources, job.get("match", []), job.get("ignore", []),
+                                          job.get("expect", []),
+                                          maximum_log_length=job.get("maximum_log_length"),
+                                          workers=job.get("workers"))
+        sys.stdout.write(json.dumps(result))
+        return 0
     elif action == "add_end_marker":
         analyzer.place_marker(
             log_file_list, analyzer.create_end_marker(), wait_for_marker=True)
@@ -1,17 +1,20 @@
 """
-AF_PACKET receive support
+AF_PACKET receive and batched send support
 
 When VLAN offload is enabled on the NIC Linux will not deliver the VLAN tag
 in the data returned by recv. Instead, it delivers the VLAN TCI in a control
 message. Python 2.x doesn't have built-in support for recvmsg, so we have to
 use ctypes to call it. The recv function exported by this module reconstructs
 the VLAN tag if it was offloaded.
+
+The BatchSender class sends lists of frames with one sendmmsg call.
 """
 
 import struct
 from ctypes import sizeof
 from ctypes import get_errno
 from ctypes import byref
+from ctypes import addressof
 from ctypes import c_void_p
 from ctypes import cast
 from ctypes import pointer
@@ -131,3 +134,65 @@ def recv(sk, bufsize):
         return buf.raw[:12] + tag + buf.raw[12:rv]
     else:
         return buf.raw[:rv]
+
+
+class struct_mmsghdr(Structure):
+    _fields_ = [
+        ("msg_hdr", struct_msghdr),
+        ("msg_len", c_uint),
+    ]
+
+
+try:
+    sendmmsg = libc.sendmmsg
+    sendmmsg.argtypes = [c_int, POINTER(struct_mmsghdr), c_uint, c_int]
+    sendmmsg.restype = c_int
+except AttributeError:
+    sendmmsg = None
+
+
+class BatchSender(object):
+    """
+    Send batches of frames on a bound AF_PACKET socket with sendmmsg
+
+    The message headers are allocated once, the frames of a batch are copied
+    in one buffer. Falls back to one send per frame when libc has no sendmmsg.
+    """
+
+    def __init__(self, sk, size):
+        self.sk = sk
+        self.size = size
+        self.iovs = (struct_iovec * size)()
+        self.msgs = (struct_mmsghdr * size)()
+        for index in range(size):
+            self.msgs[index].msg_hdr.msg_iov = pointer(self.iovs[index])
+            self.msgs[index].msg_hdr.msg_iovlen = 1
+
+    def send(self, frames):
+        """
+        Send frames, at most size of them
+        @frames List of frames, as bytes
+        """
+        if not sendmmsg:
+            for frame in frames:
+                self.sk.send(frame)
+            return
+
+        count = len(frames)
+        buf = create_string_buffer(b"".join(frames))
+        offset = addressof(buf)
+        iovs = self.iovs
+        for index, frame in enumerate(frames):
+            iov = iovs[index]
+            iov.iov_base = offset
+            iov.iov_len = len(frame)
+            offset = offset + len(frame)
+
+        sent = 0
+        while sent < count:
+            # the kernel may send only the first frames
+            first = cast(addressof(self.msgs) + sent * sizeof(struct_mmsghdr), POINTER(struct_mmsghdr))
+            rv = sendmmsg(self.sk.fileno(), first, count - sent, 0)
+            if rv <= 0:
+                raise RuntimeError("sendmmsg failed: rv=%d errno=%d sent=%d/%d" % (rv, get_errno(), sent, count))
+            sent = sent + rv
@@ -407,42 +407,53 @@ class ScapyDriver(object):
             for pwa in pwa_list:
                 if not pwa.stream.enable or not pwa.stream.enable2:
                     continue
-                self.pwa_wait(pwa)
-                try:
-                    send_start_time = self.utils.clock()
-                    pkt = self.send_packet(pwa, pwa.stream.stream_id)
-                    bytesSent = len(pkt)
-                    send_time = self.utils.clock() - send_start_time
-
-                    # increment port counters
-                    framesSent = self.port.incrStat('framesSent')
-                    self.port.incrStat('bytesSent', bytesSent)
-                    if self.dbg > 2:
-                        self.logger.debug("{} framesSent: {}".format(self.iface, framesSent))
-                    pwa.stream.incrStat('framesSent')
-                    pwa.stream.incrStat('bytesSent', bytesSent)
-                    tx_count = tx_count + 1
-
-                    # increment stream counters
-                    stream_tx = self.stream_pkts[pwa.stream.stream_id] + 1
-                    self.stream_pkts[pwa.stream.stream_id] = stream_tx
-                    if self.dbg > 2 or (self.dbg > 1 and stream_tx % 100 == 99):
-                        self.logger.debug("{}/{} framesSent: {}".format(self.iface,
-                                          pwa.stream.stream_id, stream_tx))
-                except Exception as e:
-                    self.logger.log_exception(e, traceback.format_exc())
-                    pwa.stream.enable2 = False
-                else:
+                batch_count = 0
+                while pwa:
+                    self.pwa_wait(pwa)
+                    try:
+                        send_start_time = self.utils.clock()
+                        pkt = self.send_packet(pwa, pwa.stream.stream_id)
+                        bytesSent = len(pkt)
+                        send_time = self.utils.clock() - send_start_time
+
+                        # increment port counters
+                        framesSent = self.port.incrStat('framesSent')
+                        self.port.incrStat('bytesSent', bytesSent)
+                        if self.dbg > 2:
+                            self.logger.debug("{} framesSent: {}".format(self.iface, framesSent))
+                        pwa.stream.incrStat('framesSent')
+                        pwa.stream.incrStat('bytesSent', bytesSent)
+                        tx_count = tx_count + 1
+
+                        # increment stream counters
+                        stream_tx = self.stream_pkts[pwa.stream.stream_id] + 1
+                        self.stream_pkts[pwa.stream.stream_id] = stream_tx
+                        if self.dbg > 2 or (self.dbg > 1 and stream_tx % 100 == 99):
+                            self.logger.debug("{}/{} framesSent: {}".format(self.iface,
+                                              pwa.stream.stream_id, stream_tx))
+                    except Exception as e:
+                        self.logger.log_exception(e, traceback.format_exc())
+                        pwa.stream.enable2 = False
+                        break
                     build_start_time = self.utils.clock()
                     pwa_next = self.packet.build_next(pwa)
                     if not pwa_next:
                         pwa.stream.enable2 = False
                         self.logger.debug("{} {} Completed Stream {}".format(func, self.iface, pwa.stream.stream_id))
-                        continue
+                        break
                     build_time = self.utils.clock() - build_start_time
                     ipg = self.packet.build_ipg(pwa_next)
                     pwa_next.tx_time = self.utils.clock() + ipg - build_time - send_time
-                    pwa_next_list.append(pwa_next)
+
+                    # send the next packets of a compiled stream in the same batch when they are due
+                    batch_count = batch_count + 1
+                    pwa = None
+                    if self.packet.is_batched(pwa_next) and batch_count < self.packet.tx_batch_size \
+                            and pwa_next.tx_time <= self.utils.clock():
+                        pwa = pwa_next
+                    else:
+                        pwa_next_list.append(pwa_next)
+            self.packet.flush(self.iface)
             pwa_list = pwa_next_list
         self.logger.debug("{} {} Completed {}".format(func, self.iface, tx_count))
 
@@ -454,6 +465,9 @@ class ScapyDriver(object):
         if self.dbg > 2 or (self.dbg > 1 and pwa.left != 0):
             self.logger.debug("stream: {} delay: {} pps: {}".format(pwa.stream.stream_id, delay, pwa.rate_pps))
         delay = 0 if delay < 0 else delay
+        if delay > 0:
+            # the batched packets are sent before waiting
+            self.packet.flush(self.iface)
         if delay > 1.0 / 10:
             self.utils.msleep(delay * 1000, 10)
         elif delay > 1.0 / 100:
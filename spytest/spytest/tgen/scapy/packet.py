@@ -7,6 +7,7 @@ import binascii
 import socket
 import afpacket
 import traceback
+import template
 
 from scapy.all import hexdump, sendp
 try:
@@ -151,6 +152,11 @@ class ScapyPacket(object):
         self.rx_sock = None
         self.tx_sock = None
         self.tx_sock_failed = False
+        self.use_template = bool(os.getenv("SPYTEST_SCAPY_TEMPLATE", "1") != "0")
+        self.tx_batch_size = self.utils.get_env_int("SPYTEST_SCAPY_TX_BATCH", 64)
+        self.tx_batch = []
+        self.tx_batch_sock = None
+        self.tx_batch_sender = None
         self.finished = False
         self.mtu = 9194
         self.use_bridge = bool(os.getenv("SPYTEST_SCAPY_USE_BRIDGE", "1") != "0")
@@ -264,6 +270,9 @@ class ScapyPacket(object):
         self.rx_sock = self.close_sock(self.rx_sock)
         self.tx_sock = self.close_sock(self.tx_sock)
         self.tx_sock_failed = False
+        self.tx_batch_sock = self.close_sock(self.tx_batch_sock)
+        self.tx_batch_sender = None
+        self.tx_batch = []
         self.init_bridge(self.iface)
         self.finished = False
 
@@ -321,22 +330,57 @@ class ScapyPacket(object):
 
         return packet
 
-    def sendp(self, pkt, data, iface, stream_name, left):
+    def sendp(self, data, iface, stream_name, left, batch=False):
         self.stats_lock.acquire()
         self.tx_count = self.tx_count + 1
         self.stats_lock.release()
         self.trace_stats()
 
         if self.dbg > 2 or (self.dbg > 1 and left != 0):
-            cmd = "" if not self.show_summary else pkt.command()
+            cmd = "" if not self.show_summary else self.mkcmd(data)
             msg = "sendp:{}:{} len:{} count:{} {}".format
             self.logger.debug(msg(iface, stream_name, len(data), self.tx_count, cmd))
 
         if self.dbg > 3:
-            self.trace_packet(pkt, self.hex)
+            self.trace_packet(Ether(data), self.hex)
+
+        if batch:
+            self.tx_batch.append(data)
+            if len(self.tx_batch) >= self.tx_batch_size:
+                self.flush(iface)
+            return None
 
         return self.send(data, iface)
 
+    def flush(self, iface):
+        frames, self.tx_batch = self.tx_batch, []
+        if not frames or self.dry:
+            return
+
+        if not self.tx_batch_sock:
+            try:
+                self.tx_batch_sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW)
+                self.tx_batch_sock.bind((iface, 0))
+                self.tx_batch_sender = afpacket.BatchSender(self.tx_batch_sock, self.tx_batch_size)
+            except Exception as exp:
+                self.logger.debug("Failed to create batch socket {} {}".format(iface, exp))
+                self.tx_batch_sock = self.close_sock(self.tx_batch_sock)
+
+        # try sending all the frames with one system call
+        if self.tx_batch_sock:
+            try:
+                self.tx_batch_sender.send(frames)
+                return
+            except Exception as exp:
+                self.logger.debug("Failed to send batch {} {}".format(iface, exp))
+                self.tx_batch_sock = self.close_sock(self.tx_batch_sock)
+
+        for data in frames:
+            self.send(data, iface)
+
+    def is_batched(self, pwa):
+        return bool(pwa.template) and self.tx_batch_size > 1
+
     def mkcmd(self, data):
         try:
             pkt = Ether(data)
@@ -414,6 +458,11 @@ class ScapyPacket(object):
             self.logger.debug(hexdump(pkt, dump=True))
 
     def send_packet(self, pwa, iface, stream_name, left):
+        if pwa.template:
+            bstr = pwa.template.tobytes()
+            self.sendp(bstr, iface, stream_name, left, self.is_batched(pwa))
+            return bstr
+
         if pwa.padding:
             strpkt = self.utils.tobytes(pwa.pkt / pwa.padding)
         else:
@@ -433,7 +482,7 @@ class ScapyPacket(object):
         except Exception:
             crc = binascii.unhexlify('00' * 4)
         bstr = strpkt + self.utils.tobytes(crc)
-        self.sendp(Ether(bstr), bstr, iface, stream_name, left)
+        self.sendp(bstr, iface, stream_name, left)
         return bstr
 
     def check(self, pkt):
@@ -915,9 +964,65 @@ class ScapyPacket(object):
         pwa.frame_size_max = frame_size_max
         pwa.frame_size_step = frame_size_step
         self.add_padding(pwa, True)
+        pwa.template = self.build_template(pwa)
 
         return pwa
 
+    def build_template(self, pwa):
+        # frames of varying length are built by scapy
+        if not self.use_template or pwa.length_mode != "fixed":
+            return None
+
+        kws = pwa.stream.kws
+        sid = None
+        if pwa.add_signature:
+            sid = binascii.unhexlify(pwa.stream.get_sid() or "DeadBeef")
+
+        # template field and prefix of its stream options, default step, value parser
+        fields = [
+            ("mac_src", "00:00:00:00:00:01", template.mac2int),
+            ("mac_dst", "00:00:00:00:00:01", template.mac2int),
+            ("arp_src_hw", "00:00:00:00:00:01", template.mac2int),
+            ("arp_dst_hw", "00:00:00:00:00:01", template.mac2int),
+            ("ip_src", "0.0.0.1", template.ipv42int),
+            ("ip_dst", "0.0.0.1", template.ipv42int),
+            ("ipv6_src", "::1", template.ipv62int),
+            ("ipv6_dst", "::1", template.ipv62int),
+            ("vlan_id", 1, int),
+            ("tcp_src_port", 1, int),
+            ("tcp_dst_port", 1, int),
+            ("udp_src_port", 1, int),
+            ("udp_dst_port", 1, int),
+        ]
+
+        try:
+            tmpl = template.FrameTemplate(pwa.pkt, sid)
+            for prefix, step, parse in fields:
+                mode = kws.get("{}_mode".format(prefix), "fixed").strip()
+                if mode == "fixed":
+                    continue
+                count = self.utils.intval(kws, "{}_count".format(prefix), 0)
+                modes = ["increment", "decrement"]
+                if prefix.endswith("_port"):
+                    modes.extend(["incr", "decr"])
+                if mode == "list" and prefix in ["mac_src", "mac_dst"]:
+                    values = [parse(value) for value in kws[prefix]]
+                    tmpl.add_field(prefix, mode, values=values)
+                elif mode in modes:
+                    if parse == int:
+                        step = self.utils.intval(kws, "{}_step".format(prefix), step)
+                    else:
+                        step = parse(kws.get("{}_step".format(prefix), step))
+                    tmpl.add_field(prefix, mode, step, count)
+                else:
+                    # unhandled options are reported by build_next_dma
+                    return None
+        except Exception as exp:
+            self.logger.debug("stream {} is built by scapy: {}".format(pwa.stream.stream_id, exp))
+            return None
+
+        return tmpl
+
     def add_padding(self, pwa, first):
         pwa.padding = None
         if pwa.length_mode == "random":
@@ -944,6 +1049,11 @@ class ScapyPacket(object):
 
     def build_next_dma(self, pwa):
 
+        # Change the fields of the compiled frame
+        if pwa.template:
+            pwa.template.next()
+            return pwa
+
         # Change Ether SRC MAC
         mac_src_mode = pwa.stream.kws.get("mac_src_mode", "fixed").strip()
         mac_src_step = pwa.stream.kws.get("mac_src_step", "00:00:00:00:00:01")
@@ -1133,9 +1243,9 @@ class ScapyPacket(object):
             tcp_dst_port_count = self.utils.intval(pwa.stream.kws, "tcp_dst_port_count", 0)
             if tcp_dst_port_mode in ["increment", "decrement", "incr", "decr"]:
                 if tcp_dst_port_mode in ["increment", "incr"]:
-                    pwa.pkt[TCP].dport = pwa.pkt[TCP].sport + tcp_dst_port_step
+                    pwa.pkt[TCP].dport = pwa.pkt[TCP].dport + tcp_dst_port_step
                 else:
-                    pwa.pkt[TCP].dport = pwa.pkt[TCP].sport - tcp_dst_port_step
+                    pwa.pkt[TCP].dport = pwa.pkt[TCP].dport - tcp_dst_port_step
                 pwa.tcp_dst_port_count = pwa.tcp_dst_port_count + 1
                 if tcp_dst_port_count > 0 and pwa.tcp_dst_port_count >= tcp_dst_port_count:
                     pwa.pkt[TCP].dport = self.utils.intval(pwa.stream.kws, "tcp_dst_port", 0)
@@ -1167,9 +1277,9 @@ class ScapyPacket(object):
             udp_dst_port_count = self.utils.intval(pwa.stream.kws, "udp_dst_port_count", 0)
             if udp_dst_port_mode in ["increment", "decrement", "incr", "decr"]:
                 if udp_dst_port_mode in ["increment", "incr"]:
-                    pwa.pkt[UDP].dport = pwa.pkt[UDP].sport + udp_dst_port_step
+                    pwa.pkt[UDP].dport = pwa.pkt[UDP].dport + udp_dst_port_step
                 else:
-                    pwa.pkt[UDP].dport = pwa.pkt[UDP].sport - udp_dst_port_step
+                    pwa.pkt[UDP].dport = pwa.pkt[UDP].dport - udp_dst_port_step
                 pwa.udp_dst_port_count = pwa.udp_dst_port_count + 1
                 if udp_dst_port_count > 0 and pwa.udp_dst_port_count >= udp_dst_port_count:
                     pwa.pkt[UDP].dport = self.utils.intval(pwa.stream.kws, "udp_dst_port", 0)
@@ -0,0 +1,187 @@
+"""
+Compiled frames of the scapy TG streams
+
+The frame of a stream is built once by scapy. The fields which change for
+every packet (MAC/IP addresses, VLAN id, L4 ports) are then patched in place
+at their byte offsets, and the checksums covering them are updated
+incrementally (RFC 1624), instead of changing the scapy layers and building
+the frame again for every packet.
+"""
+
+import socket
+import struct
+import zlib
+import binascii
+
+from scapy.layers.l2 import Ether, Dot1Q, ARP
+from scapy.layers.inet import IP, UDP, TCP
+from scapy.layers.inet6 import IPv6, ICMPv6ND_NA
+
+# name: (layer, offset in the layer, size, mask of the bits of the value)
+FIELDS = {
+    "mac_dst": (Ether, 0, 6, (1 << 48) - 1),
+    "mac_src": (Ether, 6, 6, (1 << 48) - 1),
+    "vlan_id": (Dot1Q, 0, 2, 0x0fff),
+    "arp_src_hw": (ARP, 8, 6, (1 << 48) - 1),
+    "arp_dst_hw": (ARP, 18, 6, (1 << 48) - 1),
+    "ip_src": (IP, 12, 4, (1 << 32) - 1),
+    "ip_dst": (IP, 16, 4, (1 << 32) - 1),
+    "ipv6_src": (IPv6, 8, 16, (1 << 128) - 1),
+    "ipv6_dst": (IPv6, 24, 16, (1 << 128) - 1),
+    "tcp_src_port": (TCP, 0, 2, 0xffff),
+    "tcp_dst_port": (TCP, 2, 2, 0xffff),
+    "udp_src_port": (UDP, 0, 2, 0xffff),
+    "udp_dst_port": (UDP, 2, 2, 0xffff),
+}
+
+# offset of the checksum in the L4 layers including the IP pseudo header
+L4_CHECKSUMS = {TCP: 16, UDP: 6, ICMPv6ND_NA: 2}
+
+
+def mac2int(mac):
+    return int(mac.replace(":", "").replace(".", ""), 16)
+
+
+def ipv42int(ip):
+    return struct.unpack("!I", socket.inet_aton(ip))[0]
+
+
+def ipv62int(ip):
+    high, low = struct.unpack("!QQ", socket.inet_pton(socket.AF_INET6, ip))
+    return (high << 64) | low
+
+
+def int2bytes(value, size):
+    return bytearray(binascii.unhexlify("%0*x" % (size * 2, value)))
+
+
+def update_checksum(frame, offset, old, new):
+    """
+    Update the 16 bit one's complement checksum at offset for a change of
+    covered bytes from old to new, HC' = ~(~HC + ~m + m') of RFC 1624
+    """
+    total = ~((frame[offset] << 8) | frame[offset + 1]) & 0xffff
+    for i in range(0, len(old), 2):
+        total += ~((old[i] << 8) | old[i + 1]) & 0xffff
+        total += (new[i] << 8) | new[i + 1]
+    while total >> 16:
+        total = (total & 0xffff) + (total >> 16)
+    total = ~total & 0xffff
+    frame[offset] = total >> 8
+    frame[offset + 1] = total & 0xff
+
+
+class TemplateField(object):
+    """
+    Field of a frame template, stepped for every packet like
+    ScapyPacket.build_next_dma changes the scapy layers
+    """
+
+    def __init__(self, offset, size, mask, checksums, mode, start, step, count, values):
+        self.offset = offset
+        self.size = size
+        self.mask = mask
+        self.checksums = checksums
+        self.mode = mode
+        self.start = start
+        self.step = step
+        self.count = count
+        self.values = values
+        self.value = start
+        self.counter = 0
+
+    def next_value(self):
+        if self.mode == "list":
+            self.counter = self.counter + 1
+            if self.counter >= len(self.values):
+                self.counter = 0
+            return self.values[self.counter]
+        if self.mode in ["increment", "incr"]:
+            self.value = (self.value + self.step) & self.mask
+        else:
+            self.value = (self.value - self.step) & self.mask
+        self.counter = self.counter + 1
+        if self.count > 0 and self.counter >= self.count:
+            self.value = self.start
+            self.counter = 0
+        return self.value
+
+
+class FrameTemplate(object):
+    """
+    Frame of a stream, with the fields changing for every packet
+    """
+
+    def __init__(self, pkt, signature=None):
+        self.pkt = pkt
+        self.frame = bytearray(bytes(pkt))
+        if signature:
+            self.frame[-len(signature):] = signature
+        self.fields = []
+
+    def offset(self, layer):
+        # the frame ends with the layer and its payloads
+        return len(self.frame) - len(self.pkt[layer])
+
+    def checksums(self, layer):
+        """Offsets of the checksums covering the fields of a layer, with whether it is a UDP checksum"""
+        if layer not in [IP, IPv6]:
+            if layer in L4_CHECKSUMS:
+                return [(self.offset(layer) + L4_CHECKSUMS[layer], layer == UDP)]
+            return []
+        checksums = []
+        if layer == IP:
+            checksums.append((self.offset(IP) + 10, False))
+        # the payload of the IP header includes its addresses in the pseudo header
+        l4 = type(self.pkt[layer].payload)
+        if l4 in L4_CHECKSUMS and (l4 != ICMPv6ND_NA or layer == IPv6):
+            checksums.append((self.offset(l4) + L4_CHECKSUMS[l4], l4 == UDP))
+        return checksums
+
+    def add_field(self, name, mode, step=0, count=0, values=None):
+        """
+        Add a field changing for every packet, from its value in the frame
+        @name key of FIELDS
+        @mode increment, decrement or list
+        @values integer values of the field for list mode
+        Returns False if the frame doesn't have the layer of the field.
+        """
+        layer, offset, size, mask = FIELDS[name]
+        if layer not in self.pkt:
+            return False
+        offset = self.offset(layer) + offset
+        start = int(binascii.hexlify(self.frame[offset:offset + size]), 16) & mask
+        field = TemplateField(offset, size, mask, self.checksums(layer), mode, start, step, count, values)
+        self.fields.append(field)
+        return True
+
+    def patch(self, field, value):
+        offset, size = field.offset, field.size
+        old = self.frame[offset:offset + size]
+        if field.mask == (1 << (8 * size)) - 1:
+            new = int2bytes(value, size)
+        else:
+            keep = int(binascii.hexlify(old), 16) & ~field.mask
+            new = int2bytes(keep | (value & field.mask), size)
+        if old == new:
+            return
+        self.frame[offset:offset + size] = new
+        for checksum, udp in field.checksums:
+            if udp and self.frame[checksum] == 0 and self.frame[checksum + 1] == 0:
+                # UDP over IPv4 without checksum
+                continue
+            update_checksum(self.frame, checksum, old, new)
+            if udp and self.frame[checksum] == 0 and self.frame[checksum + 1] == 0:
+                # 0 is sent as 0xffff, it means no checksum
+                self.frame[checksum] = self.frame[checksum + 1] = 0xff
+
+    def next(self):
+        """Change the fields for the next packet"""
+        for field in self.fields:
+            self.patch(field, field.next_value())
+
+    def tobytes(self):
+        """Frame with the CRC appended like ScapyPacket.send_packet does"""
+        data = bytes(self.frame)
+        crc = socket.htonl(zlib.crc32(data) & 0xFFFFFFFF)
+        return data + struct.pack("!I", crc)
@@ -0,0 +1,120 @@
+"""
+Scapy TG transmit benchmark
+
+Builds the frames of sample streams with scapy, as ScapyPacket does without
+compiled frames, and with the compiled frame templates, checks that both give
+the same frames and reports the packets per second of each.
+
+With --iface, the frames are also sent on a veth pair (created if needed,
+requires root): one send per frame with scapy L2Socket, and batches of frames
+with afpacket.BatchSender. The received packets are counted on the peer.
+
+Usage:
+    python3 tx_bench.py [--count 20000] [--iface tgbench0 --peer tgbench1]
+"""
+
+import os
+import time
+import socket
+import argparse
+
+from scapy.arch.linux import L2Socket
+
+import afpacket
+from packet import ScapyPacket
+from port import ScapyStream
+
+STREAMS = {
+    "ipv4-udp": dict(l3_protocol="ipv4", l4_protocol="udp", ip_src_addr="11.1.1.1", ip_dst_addr="12.1.1.1",
+                     ip_src_mode="increment", ip_src_count=100, ip_dst_mode="decrement",
+                     udp_src_port=1000, udp_src_port_mode="incr", udp_src_port_count=50,
+                     udp_dst_port=2000, udp_dst_port_mode="increment",
+                     mac_src="00.00.00.00.00.01", mac_src_mode="increment", mac_src_count=20),
+    "ipv4-tcp-vlan": dict(l3_protocol="ipv4", l4_protocol="tcp", vlan_id=10, vlan_id_mode="increment",
+                          vlan_id_count=10, vlan_id_step=3, ip_src_addr="11.1.1.1", ip_src_mode="increment",
+                          tcp_src_port=1000, tcp_src_port_mode="decrement", tcp_src_port_count=500,
+                          tcp_dst_port=80, tcp_dst_port_mode="increment", tcp_dst_port_count=7, frame_size=128),
+    "ipv6-udp": dict(l3_protocol="ipv6", l4_protocol="udp", ipv6_src_addr="2001::1", ipv6_dst_addr="2002::1",
+                     ipv6_src_mode="increment", ipv6_dst_mode="increment", ipv6_dst_step="::100",
+                     udp_dst_port=4791, udp_dst_port_mode="incr", mac_dst="00.00.00.00.00.02 00.00.00.00.00.03",
+                     mac_dst_mode="list"),
+    "arp": dict(l3_protocol="arp", arp_src_hw_addr="00.00.01.00.00.02", arp_src_hw_mode="increment",
+                arp_src_hw_count=10, ip_src_addr="10.0.0.1", ip_dst_addr="10.0.0.2"),
+}
+
+
+def build_frames(packet, kws, count):
+    stream = ScapyStream(1, 1, "bench", None, **kws)
+    pwa = packet.build_first(stream)
+    frames = []
+    start = time.time()
+    for _ in range(count):
+        frames.append(packet.send_packet(pwa, "", stream.stream_id, 0))
+        packet.build_next_dma(pwa)
+    return frames, time.time() - start, bool(pwa.template)
+
+
+def compare(count):
+    legacy = ScapyPacket("", dry=True)
+    legacy.use_template = False
+    compiled = ScapyPacket("", dry=True)
+    for name, kws in STREAMS.items():
+        expected, legacy_time, _ = build_frames(legacy, kws, count)
+        frames, compiled_time, is_compiled = build_frames(compiled, kws, count)
+        assert is_compiled, "{} is not compiled".format(name)
+        for index, (frame, exp) in enumerate(zip(frames, expected)):
+            assert frame == exp, "{} frame {} differs:\n{}\n{}".format(name, index, exp.hex(), frame.hex())
+        print("{:15} build: scapy {:9.0f} pps compiled {:9.0f} pps".format(
+            name, count / legacy_time, count / compiled_time))
+
+
+def rx_packets(iface):
+    with open("/sys/class/net/{}/statistics/rx_packets".format(iface)) as f:
+        return int(f.read())
+
+
+def send_veth(iface, peer, count, batch_size):
+    if not os.path.exists("/sys/class/net/{}".format(iface)):
+        os.system("ip link add {} type veth peer name {}".format(iface, peer))
+    os.system("ip link set {} up && ip link set {} up".format(iface, peer))
+
+    packet = ScapyPacket("", dry=True)
+    packet.use_template = False
+    for name, kws in STREAMS.items():
+        frames, _, _ = build_frames(packet, kws, count)
+
+        # one send per frame, like ScapyPacket.send
+        sock = L2Socket(iface)
+        rx_start = rx_packets(peer)
+        start = time.time()
+        for frame in frames:
+            sock.send(frame)
+        single_time = time.time() - start
+        sock.close()
+        single_rx = rx_packets(peer) - rx_start
+
+        sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW)
+        sock.bind((iface, 0))
+        sender = afpacket.BatchSender(sock, batch_size)
+        rx_start = rx_packets(peer)
+        start = time.time()
+        for index in range(0, count, batch_size):
+            sender.send(frames[index:index + batch_size])
+        batch_time = time.time() - start
+        sock.close()
+        batch_rx = rx_packets(peer) - rx_start
+
+        print("{:15} send: single {:9.0f} pps ({} rx) batch {:9.0f} pps ({} rx)".format(
+            name, count / single_time, single_rx, count / batch_time, batch_rx))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scapy TG transmit benchmark")
+    parser.add_argument("--count", type=int, default=20000, help="frames per stream")
+    parser.add_argument("--batch", type=int, default=64, help="frames per sendmmsg")
+    parser.add_argument("--iface", default=None, help="veth interface to send the frames on")
+    parser.add_argument("--peer", default=None, help="peer of the veth interface")
+    args = parser.parse_args()
+    compare(args.count)
+    if args.iface:
+        send_veth(args.iface, args.peer or args.iface + "-peer", args.count, args.batch)
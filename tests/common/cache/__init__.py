@@ -1,4 +1,6 @@
 from .facts_cache import FactsCache
 from .facts_cache import cached
+from .result_cache import ttl_cached
+from .result_cache import invalidates_cache
 
-__all__ = [FactsCache, cached]
+__all__ = [FactsCache, cached, ttl_cached, invalidates_cache]
@@ -1,15 +1,16 @@
 
 
+import fcntl
 import inspect
 import logging
 import os
 import pickle
-import random
 import shutil
 import sys
-import time
+import tempfile
 
 from collections import defaultdict
+from contextlib import contextmanager
 from pickle import UnpicklingError
 from threading import Lock
 from six import with_metaclass
@@ -23,6 +24,10 @@ CACHE_LOCATION = os.path.join(CURRENT_PATH, '../../../_cache')
 SIZE_LIMIT = 1000000000  # 1G bytes, max disk usage allowed by cache
 ENTRY_LIMIT = 1000000    # Max number of pickle files allowed in cache.
 DISABLE_CACHE_PARAM = "disable_cache"
+LRU_EVICTION = False     # Evict least recently used pickle files instead of failing when the limits are exceeded.
+
+INDEX_FILE = '.index'    # Append-only journal of "<size> <zone>/<key>.pickle" records, size -1 means removed.
+LOCK_FILE = '.lock'      # Advisory lock file serializing cache updates of all processes.
 
 
 class Singleton(type):
@@ -49,32 +54,180 @@ class FactsCache(with_metaclass(Singleton, object)):
 
     NOTEXIST = object()
 
-    def __init__(self, cache_location=CACHE_LOCATION):
+    def __init__(self, cache_location=CACHE_LOCATION, lru_eviction=None):
         self._cache_location = os.path.abspath(cache_location)
         self._cache = defaultdict(dict)
         self._write_lock = Lock()
-
-    def _check_usage(self):
-        """Check cache usage, raise exception if usage exceeds the limitations.
-        """
-        total_size = 0
-        total_entries = 0
+        self._lru_eviction = LRU_EVICTION if lru_eviction is None else lru_eviction
+
+        # Running usage index, synchronized with other processes through the journal file
+        self._index = {}
+        self._index_size = 0
+        self._journal_id = None
+        self._journal_offset = 0
+        self._journal_records = 0
+
+    def _facts_file(self, zone, key):
+        return os.path.join(self._cache_location, '{}/{}.pickle'.format(zone, key))
+
+    @contextmanager
+    def _locked(self):
+        """Hold the cross-process advisory lock of the cache folder."""
+        os.makedirs(self._cache_location, exist_ok=True)
+        with open(os.path.join(self._cache_location, LOCK_FILE), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _apply_record(self, entry, size):
+        self._index_size -= self._index.pop(entry, 0)
+        if size >= 0:
+            self._index[entry] = size
+            self._index_size += size
+        self._journal_records += 1
+
+    def _scan_cache_files(self):
+        """Walk the cache folder and get size of every cached pickle file."""
+        entries = {}
         for root, _, files in os.walk(self._cache_location):
             for f in files:
+                if f.startswith('.'):
+                    continue
                 fp = os.path.join(root, f)
-                total_size += os.path.getsize(fp)
-                total_entries += 1
+                try:
+                    entries[os.path.relpath(fp, self._cache_location)] = os.path.getsize(fp)
+                except OSError:
+                    pass
+        return entries
+
+    def _rewrite_journal(self, entries):
+        """Replace the journal with a compact one describing the entries. Must be called with the lock held."""
+        self._index = {}
+        self._index_size = 0
+        self._journal_records = 0
+        fd, tmp_file = tempfile.mkstemp(dir=self._cache_location, prefix=INDEX_FILE, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            for entry, size in entries.items():
+                f.write('{} {}\n'.format(size, entry))
+                self._apply_record(entry, size)
+            f.flush()
+            self._journal_offset = f.tell()
+        journal_file = os.path.join(self._cache_location, INDEX_FILE)
+        os.replace(tmp_file, journal_file)
+        self._journal_id = os.stat(journal_file).st_ino
+
+    def _sync_index(self):
+        """Replay journal records appended by other processes. Must be called with the lock held.
+
+        Only new records are read, so the cost doesn't depend on the number of cached files. The folder is walked
+        only once, when there is no journal yet, e.g. for a cache created by an older version of this module.
+        """
+        journal_file = os.path.join(self._cache_location, INDEX_FILE)
+        try:
+            stat = os.stat(journal_file)
+        except OSError:
+            self._rewrite_journal(self._scan_cache_files())
+            return
+
+        if stat.st_ino != self._journal_id or stat.st_size < self._journal_offset:
+            # Journal was compacted or recreated by another process, replay it from the beginning
+            self._index = {}
+            self._index_size = 0
+            self._journal_records = 0
+            self._journal_id = stat.st_ino
+            self._journal_offset = 0
+
+        if stat.st_size == self._journal_offset:
+            return
+
+        with open(journal_file, 'r') as f:
+            f.seek(self._journal_offset)
+            for line in f:
+                if not line.endswith('\n'):
+                    # Records are appended with the lock held, so a partial record was left by a process which
+                    # crashed while appending it. Rebuild the journal, appending to it would corrupt the next record.
+                    logger.warning('[Cache] Rebuild cache journal with partial record "{}"'.format(line))
+                    self._rewrite_journal(self._scan_cache_files())
+                    return
+                size, entry = line.rstrip('\n').split(' ', 1)
+                self._apply_record(entry, int(size))
+                self._journal_offset += len(line.encode())
+
+    def _append_records(self, records):
+        """Record size changes of cache entries. Must be called with the lock held and index in sync."""
+        data = ''.join('{} {}\n'.format(size, entry) for entry, size in records)
+        with open(os.path.join(self._cache_location, INDEX_FILE), 'a') as f:
+            f.write(data)
+        self._journal_offset += len(data.encode())
+        for entry, size in records:
+            self._apply_record(entry, size)
+
+        # Compact the journal when it is mostly made of overwritten records
+        if self._journal_records > 2 * len(self._index) + 1000:
+            self._rewrite_journal(dict(self._index))
+
+    def _evict(self, needed_size, keep_entry):
+        """Remove least recently used pickle files until one more entry of needed_size fits into the limits.
+        Must be called with the lock held and index in sync.
+        """
+        candidates = []
+        for entry in self._index:
+            if entry == keep_entry:
+                continue
+            try:
+                candidates.append((os.path.getmtime(os.path.join(self._cache_location, entry)), entry))
+            except OSError:
+                candidates.append((0, entry))
+        candidates.sort()
+
+        removed = []
+        size = self._index_size - self._index.get(keep_entry, 0)
+        entries = len(self._index) - (1 if keep_entry in self._index else 0)
+        for _, entry in candidates:
+            if size + needed_size <= SIZE_LIMIT and entries + 1 <= ENTRY_LIMIT:
+                break
+            zone, key = os.path.split(entry)
+            try:
+                os.remove(os.path.join(self._cache_location, entry))
+            except OSError:
+                pass
+            self._cache.get(zone, {}).pop(key[:-len('.pickle')], None)
+            size -= self._index[entry]
+            entries -= 1
+            removed.append((entry, -1))
+            logger.info('[Cache] Evicted least recently used cache file "{}"'.format(entry))
+        self._append_records(removed)
+
+    def _check_usage(self, entry, size):
+        """Check cache usage after storing size bytes to entry, raise exception or evict least recently used
+        entries if usage exceeds the limitations. Must be called with the lock held and index in sync.
+        """
+        total_size = self._index_size - self._index.get(entry, 0) + size
+        total_entries = len(self._index) + (0 if entry in self._index else 1)
+        if total_size <= SIZE_LIMIT and total_entries <= ENTRY_LIMIT:
+            return
+
+        if self._lru_eviction:
+            self._evict(size, entry)
+            return
 
-        if total_size > SIZE_LIMIT or total_entries > ENTRY_LIMIT:
-            msg = 'Cache usage exceeds limitations. total_size={}, SIZE_LIMIT={}, total_entries={}, ENTRY_LIMIT={}' \
-                .format(total_size, SIZE_LIMIT, total_entries, ENTRY_LIMIT)
-            raise Exception(msg)
+        msg = 'Cache usage exceeds limitations. total_size={}, SIZE_LIMIT={}, total_entries={}, ENTRY_LIMIT={}' \
+            .format(total_size, SIZE_LIMIT, total_entries, ENTRY_LIMIT)
+        raise Exception(msg)
 
     def _read_facts_file(self, facts_file, z, k):
         with open(facts_file, 'rb') as f:
             self._cache[z][k] = pickle.load(f)
             logger.debug('[Cache] Loaded cached facts "{}.{}" from {}'.format(z, k, facts_file))
-            return self._cache[z][k]
+        if self._lru_eviction:
+            # Modification time of cache files is used as their last access time for LRU eviction
+            try:
+                os.utime(facts_file)
+            except OSError:
+                pass
+        return self._cache[z][k]
 
     def read(self, zone, key):
         """Read cached facts.
@@ -92,7 +245,7 @@ class FactsCache(with_metaclass(Singleton, object)):
             logger.debug('[Cache] Read cached facts "{}.{}"'.format(zone, key))
             return self._cache[zone][key]
         else:
-            facts_file = os.path.join(self._cache_location, '{}/{}.pickle'.format(zone, key))
+            facts_file = self._facts_file(zone, key)
             try:
                 return self._read_facts_file(facts_file, zone, key)
             except (IOError, ValueError) as e:
@@ -100,22 +253,9 @@ class FactsCache(with_metaclass(Singleton, object)):
                             .format(os.path.abspath(facts_file), repr(e)))
                 return self.NOTEXIST
             except (EOFError, UnpicklingError) as e:
-                # When parallel run is enabled, multiple processes may try to read/write the same cache file,
-                # so there will be a chance that
-                #   - a file is being written by process1 while process2 is reading it, causing EOFError in process2
-                #   - a file is being read by multiple processes at the same time, causing UnpicklingError in some of
-                #     the processes
-                # In these cases, we will retry to read the file after a short random sleep. If we still get the same
-                # error after retrying, we will return NOTEXIST to overwrite the file.
-                retry_attempts = 3
-                for attempt in range(retry_attempts):
-                    time.sleep(random.randint(3, 6))
-                    try:
-                        return self._read_facts_file(facts_file, zone, key)
-                    except (EOFError, UnpicklingError):
-                        logger.warning('[Cache] Retry {}/{} failed for file "{}"'
-                                       .format(attempt + 1, retry_attempts, facts_file))
-
+                # Cache files are replaced atomically, so a reader never sees a partially written file.
+                # A truncated file can only be left by an interrupted write of an older version of this module,
+                # return NOTEXIST to overwrite it.
                 logger.error('[Cache] Load cache file "{}" failed with EOFError or UnpicklingError: {}'
                              .format(facts_file, repr(e)))
                 return self.NOTEXIST
@@ -136,23 +276,41 @@ class FactsCache(with_metaclass(Singleton, object)):
         Returns:
             boolean: Caching facts is successful or not.
         """
-        with self._write_lock:
-            self._check_usage()
-            facts_file = os.path.join(self._cache_location, '{}/{}.pickle'.format(zone, key))
-            try:
+        facts_file = self._facts_file(zone, key)
+        entry = os.path.relpath(facts_file, self._cache_location)
+        tmp_file = None
+        try:
+            data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            with self._write_lock, self._locked():
+                self._sync_index()
+                self._check_usage(entry, len(data))
+
                 cache_subfolder = os.path.join(self._cache_location, zone)
                 if not os.path.exists(cache_subfolder):
                     logger.info('[Cache] Create cache dir {}'.format(cache_subfolder))
                     os.makedirs(cache_subfolder)
 
-                with open(facts_file, 'wb') as f:
-                    pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
-                    self._cache[zone][key] = value
-                    logger.info('[Cache] Cached facts "{}.{}" to {}'.format(zone, key, facts_file))
-                    return True
-            except (IOError, ValueError) as e:
-                logger.error('[Cache] Dump cache file "{}" failed with exception: {}'.format(facts_file, repr(e)))
-                return False
+                # Write to a temporary file and rename it, so readers of other processes see
+                # either the old or the new content of the cache file, never a partial one
+                fd, tmp_file = tempfile.mkstemp(dir=cache_subfolder, prefix='.{}.'.format(key), suffix='.tmp')
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_file, facts_file)
+                tmp_file = None
+                self._append_records([(entry, len(data))])
+
+                self._cache[zone][key] = value
+                logger.info('[Cache] Cached facts "{}.{}" to {}'.format(zone, key, facts_file))
+                return True
+        except (IOError, ValueError) as e:
+            logger.error('[Cache] Dump cache file "{}" failed with exception: {}'.format(facts_file, repr(e)))
+            return False
+        finally:
+            if tmp_file:
+                try:
+                    os.remove(tmp_file)
+                except OSError:
+                    pass
 
     def cleanup(self, zone=None, key=None):
         """Cleanup cached files.
@@ -169,8 +327,11 @@ class FactsCache(with_metaclass(Singleton, object)):
                     del self._cache[zone][key]
                     logger.debug('[Cache] Removed "{}.{}" from cache.'.format(zone, key))
                 try:
-                    cache_file = os.path.join(self._cache_location, zone, '{}.pickle'.format(key))
-                    os.remove(cache_file)
+                    cache_file = self._facts_file(zone, key)
+                    with self._write_lock, self._locked():
+                        self._sync_index()
+                        os.remove(cache_file)
+                        self._append_records([(os.path.relpath(cache_file, self._cache_location), -1)])
                     logger.debug('[Cache] Removed cache file "{}.pickle"'.format(cache_file))
                 except OSError as e:
                     logger.error('[Cache] Cleanup cache {}.{}.pickle failed with exception: {}'
@@ -181,12 +342,21 @@ class FactsCache(with_metaclass(Singleton, object)):
                     logger.debug('[Cache] Removed zone "{}" from cache'.format(zone))
                 try:
                     cache_subfolder = os.path.join(self._cache_location, zone)
-                    shutil.rmtree(cache_subfolder)
+                    with self._write_lock, self._locked():
+                        self._sync_index()
+                        shutil.rmtree(cache_subfolder)
+                        self._append_records([(entry, -1) for entry in self._index
+                                              if os.path.dirname(entry) == zone])
                     logger.debug('[Cache] Removed cache subfolder "{}"'.format(cache_subfolder))
                 except OSError as e:
                     logger.error('[Cache] Remove cache subfolder "{}" failed with exception: {}'.format(zone, repr(e)))
         else:
             self._cache = defaultdict(dict)
+            self._index = {}
+            self._index_size = 0
+            self._journal_id = None
+            self._journal_offset = 0
+            self._journal_records = 0
             try:
                 shutil.rmtree(self._cache_location)
                 logger.debug('[Cache] Removed all cache files under "{}"'.format(self._cache_location))
@@ -0,0 +1,197 @@
+import copy
+import functools
+import inspect
+import logging
+import re
+import threading
+import time
+import weakref
+
+from contextlib import contextmanager
+
+
+logger = logging.getLogger(__name__)
+
+# Default time to live of cached results in seconds, 0 disables the cache.
+# Set by pytest option --host_result_cache_ttl.
+DEFAULT_TTL = 0
+
+# Commands which may change the state of the host. Running any of them through the shell or command
+# modules drops all the cached results of the host. Case-insensitive, redis commands are often written in uppercase.
+MUTATING_COMMAND_PATTERN = re.compile(
+    r"\b((config|configure|counterpoll|reboot|kill|pkill|killall|ifconfig|hostnamectl)\b|"
+    r"systemctl\s+(start|stop|restart|reset-failed|reload|enable|disable|mask|unmask)|"
+    r"service\s+\S+\s+(start|stop|restart)|"
+    r"docker\s+(start|stop|restart|rm|kill|pause|unpause)|"
+    r"supervisorctl\s+(start|stop|restart)|"
+    r"ip\s+(-\S+\s+)*(link|addr|address|route|neigh)\s+(add|del|set|change|replace|flush)|"
+    r"sonic-cfggen\s.*--write-to-db|"
+    r"(redis-cli|sonic-db-cli)\s.*\b(hset|hdel|del|set|flushdb|flushall|hmset)\b)",
+    re.IGNORECASE
+)
+
+# Result caches of the host objects, for the statistics logged at the end of the session
+_host_caches = weakref.WeakValueDictionary()
+
+# Calls made in a bypassed() block of the thread run the methods and refresh their cached results
+_bypass = threading.local()
+
+# Ansible modules which may change the state of the host
+MUTATING_MODULES = {"copy", "template", "file", "lineinfile", "blockinfile", "replace", "service", "systemd",
+                    "reboot", "apt", "config_facts_update"}
+
+
+class HostResultCache(object):
+    """In-memory cache of results of commands run on a host, like parsed outputs of show commands.
+
+    Unlike FactsCache, cached results are not persisted and expire after their time to live. The whole cache of a
+    host is dropped when anything that may change the state of the host is executed on it.
+    """
+
+    def __init__(self, hostname):
+        self.hostname = hostname
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.time():
+                self.hits += 1
+                return True, entry[1]
+            self._entries.pop(key, None)
+            self.misses += 1
+            return False, None
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+
+    def invalidate(self, reason=None):
+        with self._lock:
+            if self._entries:
+                logger.debug("[ResultCache] Invalidated {} cached results of {}: {}"
+                             .format(len(self._entries), self.hostname, reason))
+                self._entries.clear()
+                self.invalidations += 1
+
+    def stats(self):
+        """Get hit/miss statistics of the cache.
+
+        Returns:
+            dict: {"hits": int, "misses": int, "invalidations": int, "entries": int}
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "invalidations": self.invalidations,
+                    "entries": len(self._entries)}
+
+
+def get_result_cache(host):
+    """Get the result cache of a host object, create it on first use."""
+    # Don't use getattr(), AnsibleHostBase treats unknown attributes as ansible modules
+    cache = host.__dict__.get("_result_cache")
+    if cache is None:
+        cache = host.__dict__.setdefault("_result_cache", HostResultCache(getattr(host, "hostname", None)))
+        _host_caches[id(cache)] = cache
+    return cache
+
+
+@contextmanager
+def bypassed():
+    """Don't use cached results in this block of the current thread, e.g. when polling for a state change.
+
+    Used by wait_until(), the results are still cached for the calls made after the block.
+    """
+    _bypass.depth = getattr(_bypass, "depth", 0) + 1
+    try:
+        yield
+    finally:
+        _bypass.depth -= 1
+
+
+def log_stats():
+    """Log the hit/miss statistics of the result caches of all the hosts."""
+    for cache in list(_host_caches.values()):
+        logger.info("[ResultCache] Statistics of {}: {}".format(cache.hostname, cache.stats()))
+
+
+def invalidate_on_module_run(host, module_name, module_args, complex_args):
+    """Drop cached results of the host if the ansible module about to run may change the host state.
+
+    Called by AnsibleHostBase._run for every ansible module executed on the host.
+    """
+    cache = host.__dict__.get("_result_cache")
+    if cache is None:
+        return
+
+    if module_name in MUTATING_MODULES:
+        cache.invalidate("module {}".format(module_name))
+    elif module_name in ("shell", "command"):
+        cmd = module_args[0] if module_args else complex_args.get("cmd", complex_args.get("argv", ""))
+        cmd = " ".join(cmd) if isinstance(cmd, (list, tuple)) else str(cmd)
+        if MUTATING_COMMAND_PATTERN.search(cmd):
+            cache.invalidate(cmd)
+    elif module_name == "shell_cmds":
+        for cmd in complex_args.get("cmds", []):
+            if MUTATING_COMMAND_PATTERN.search(cmd):
+                cache.invalidate(cmd)
+                break
+
+
+def ttl_cached(ttl=None, condition=None):
+    """Decorator for caching results of a host method in memory for a short time.
+
+    The result is cached per host object and keyed on the method name and its arguments, so calls with different
+    commands or namespaces are cached separately. A copy of the cached result is returned, so callers can modify it.
+
+    Args:
+        ttl (int): Time to live of cached results in seconds. Defaults to DEFAULT_TTL at the call time.
+        condition (function): Optional function called with the method arguments, the result is cached only if it
+            returns True.
+    Returns:
+        [function]: Decorator function.
+    """
+    def decorator(target):
+        @functools.wraps(target)
+        def wrapper(self, *args, **kwargs):
+            _ttl = DEFAULT_TTL if ttl is None else ttl
+            if _ttl <= 0 or (condition and not condition(self, *args, **kwargs)):
+                return target(self, *args, **kwargs)
+
+            cache = get_result_cache(self)
+            key = (target.__name__, repr(args), repr(sorted(kwargs.items())))
+            found, value = (False, None) if getattr(_bypass, "depth", 0) else cache.get(key)
+            if found:
+                logger.debug("[ResultCache] Use cached result of {}{} on {}"
+                             .format(target.__name__, args, cache.hostname))
+                return copy.deepcopy(value)
+
+            result = target(self, *args, **kwargs)
+            cache.set(key, copy.deepcopy(result), _ttl)
+            return result
+        return wrapper
+    return decorator
+
+
+def invalidates_cache(target):
+    """Decorator for host methods changing the host state, drops cached results of the host after the call.
+
+    Can also decorate functions taking the host as first argument, like config_reload(). The results of a
+    MultiAsicSonicHost are cached by its SonicHost.
+    """
+    host_arg = next(iter(inspect.signature(target).parameters))
+
+    @functools.wraps(target)
+    def wrapper(*args, **kwargs):
+        try:
+            return target(*args, **kwargs)
+        finally:
+            host = args[0] if args else kwargs[host_arg]
+            host = host.__dict__.get("sonichost", host)
+            cache = host.__dict__.get("_result_cache")
+            if cache is not None:
+                cache.invalidate(target.__name__)
+    return wrapper
@@ -2,6 +2,7 @@ import time
 import logging
 import os
 
+from tests.common.cache import invalidates_cache
 from tests.common.helpers.assertions import pytest_assert
 from tests.common.helpers.parallel_utils import synchronized_config_reload
 from tests.common.plugins.loganalyzer.utils import support_ignore_loganalyzer
@@ -192,6 +193,7 @@ def pfcwd_feature_enabled(duthost):
 
 @support_ignore_loganalyzer
 @synchronized_config_reload
+@invalidates_cache
 def config_reload(sonic_host, config_source='config_db', wait=120, start_bgp=True, start_dynamic_buffer=True,
                   safe_reload=False, wait_before_force_reload=0, wait_for_bgp=False, wait_for_ibgp=True,
                   check_intf_up_ports=False, traffic_shift_away=False, override_config=False,
@@ -0,0 +1,212 @@
+"""
+Persistent command channel to a SONiC device.
+
+Running a command through the ansible shell or command module creates a new ansible task each time, which costs
+hundreds of milliseconds for task setup, module packaging and a new SSH exec. PersistentChannel keeps one SSH
+connection open with a small executor running on the device. The executor reads JSON encoded command requests
+from its stdin, runs them in order and writes JSON encoded results to its stdout, so that several commands can be
+sent in one round trip.
+"""
+import json
+import logging
+import os
+import shlex
+import threading
+
+import paramiko
+
+logger = logging.getLogger(__name__)
+
+# Executor running on the device, it must only use the python standard library.
+EXECUTOR = r'''
+import json, os, shlex, signal, subprocess, sys
+from datetime import datetime
+failed = False
+for line in iter(sys.stdin.readline, ""):
+    req = json.loads(line)
+    if failed and req.get("skip_if_failed"):
+        sys.stdout.write(json.dumps({"cmd": req["cmd"], "skipped": True}) + "\n")
+        sys.stdout.flush()
+        continue
+    start = datetime.now()
+    res = {"cmd": req["cmd"], "start": str(start)}
+    try:
+        args = req["cmd"] if req["shell"] else shlex.split(req["cmd"])
+        proc = subprocess.Popen(args, shell=req["shell"], executable=req.get("executable") if req["shell"] else None,
+                                cwd=req.get("chdir"), stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE, start_new_session=True)
+        try:
+            out, err = proc.communicate(timeout=req.get("timeout") or None)
+        except subprocess.TimeoutExpired:
+            # Terminate the whole process group, children of the shell would keep the output pipes open
+            os.killpg(proc.pid, signal.SIGTERM)
+            out, err = proc.communicate()
+        res.update(rc=proc.returncode, stdout=out.decode("utf-8", "replace").rstrip("\r\n"),
+                   stderr=err.decode("utf-8", "replace").rstrip("\r\n"))
+    except Exception as e:
+        res.update(rc=2 if isinstance(e, OSError) else 1, stdout="", stderr="", msg=str(e))
+    failed = res["rc"] != 0
+    end = datetime.now()
+    res.update(end=str(end), delta=str(end - start))
+    sys.stdout.write(json.dumps(res) + "\n")
+    sys.stdout.flush()
+'''
+
+
+class ChannelError(Exception):
+    """Raised when the persistent channel is not usable.
+
+    Attributes:
+        sent (bool): Whether any request had been sent to the executor before the error. Requests must not be
+            retried in another way if they may have been executed already.
+    """
+
+    def __init__(self, msg, sent=False):
+        super(ChannelError, self).__init__(msg)
+        self.sent = sent
+
+
+class PersistentChannel(object):
+    """Long-lived command channel to a device.
+
+    The channel is opened on first use and reopened after an error. All the methods are thread safe, requests
+    from different threads are serialized. A process forked after the channel was opened, e.g. by parallel_run,
+    opens its own channel on first use.
+    """
+
+    def __init__(self, hostname, username, passwords, port=22, become=True, connect_timeout=10, read_timeout=1800):
+        """
+        Args:
+            hostname (str): IP address or name of the device.
+            username (str): Login user.
+            passwords (str or list): Candidate passwords, tried in order.
+            port (int): SSH port.
+            become (bool): Run the executor as root through sudo, like ansible become.
+            connect_timeout (int): Timeout in seconds of the SSH connection.
+            read_timeout (int): Seconds to wait for the result of a request without a timeout before the channel is
+                considered lost.
+        """
+        self.hostname = hostname
+        self.username = username
+        self.passwords = [passwords] if isinstance(passwords, str) else list(passwords)
+        self.port = port
+        self.become = become
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self._client = None
+        self._stdin = None
+        self._stdout = None
+        self._lock = threading.Lock()
+        # Process which opened the channel
+        self._pid = None
+        # Channels inherited from the parent process. They must not be closed, nor garbage collected which closes
+        # them, that would close the channel of the parent process.
+        self._inherited = []
+
+    def executor_command(self):
+        cmd = "python3 -u -c {}".format(shlex.quote(EXECUTOR))
+        return "sudo -n " + cmd if self.become else cmd
+
+    def _open(self):
+        """Start the executor, set self._stdin and self._stdout to its standard input and output."""
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        for password in self.passwords:
+            try:
+                client.connect(self.hostname, port=self.port, username=self.username, password=password,
+                               allow_agent=False, look_for_keys=False, timeout=self.connect_timeout)
+                break
+            except paramiko.AuthenticationException:
+                continue
+        else:
+            raise ChannelError("Authentication to {} failed".format(self.hostname))
+        client.get_transport().set_keepalive(30)
+        self._client = client
+        self._stdin, self._stdout, _ = client.exec_command(self.executor_command())
+        self._pid = os.getpid()
+
+    def _set_read_timeout(self, timeout):
+        self._stdout.channel.settimeout(timeout)
+
+    def _close(self):
+        if self._client is not None:
+            self._client.close()
+        self._client = self._stdin = self._stdout = None
+
+    def _after_fork(self):
+        """Drop the channel and the lock inherited from the parent process.
+
+        The SSH transport thread of the parent doesn't exist in a forked process, reading from the inherited channel
+        would block forever, and the lock may have been held by another thread of the parent when it forked.
+        """
+        if self._pid is not None and self._pid != os.getpid():
+            self._inherited.append((self._client, self._stdin, self._stdout))
+            self._client = self._stdin = self._stdout = None
+            self._pid = None
+            self._lock = threading.Lock()
+
+    def close(self):
+        self._after_fork()
+        with self._lock:
+            self._close()
+
+    def _alive(self):
+        """Check whether the executor is still running, e.g. the connection is closed after a reboot."""
+        return self._client.get_transport().is_active() and not self._stdout.channel.exit_status_ready()
+
+    @property
+    def is_open(self):
+        return self._stdin is not None and self._alive()
+
+    def execute(self, requests):
+        """Run commands on the device in one round trip.
+
+        Args:
+            requests (list): List of dicts with keys "cmd" (str), "shell" (bool), optional "chdir", "executable",
+                "timeout" (int, seconds before the command is terminated) and "skip_if_failed" (bool, don't run the
+                command if the previous one failed or was skipped).
+        Returns:
+            list: Results in the order of requests, dicts with keys cmd, rc, stdout, stderr, start, end and delta,
+                or with keys cmd and skipped for skipped commands.
+        Raises:
+            ChannelError: if the channel cannot be opened or is lost, it is closed and reopened on next call.
+        """
+        payload = "".join(json.dumps(req) + "\n" for req in requests)
+        # A hung executor raises a timeout instead of blocking the caller forever
+        read_timeout = self.read_timeout + sum(req.get("timeout") or 0 for req in requests)
+        self._after_fork()
+        with self._lock:
+            sent = False
+            try:
+                if not self.is_open:
+                    self._close()
+                    self._open()
+                self._set_read_timeout(read_timeout)
+                self._stdin.write(payload)
+                self._stdin.flush()
+                sent = True
+                results = []
+                for _ in requests:
+                    line = self._stdout.readline()
+                    if not line:
+                        raise ChannelError("Executor on {} exited".format(self.hostname), sent=True)
+                    results.append(json.loads(line))
+                return results
+            except ChannelError:
+                self._close()
+                raise
+            except Exception as e:
+                logger.warning("Persistent channel to {} failed: {}".format(self.hostname, repr(e)))
+                self._close()
+                raise ChannelError(repr(e), sent=sent)
+
+
+def to_module_result(result):
+    """Convert an executor result to the result format of the ansible shell and command modules."""
+    result["stdout_lines"] = result["stdout"].splitlines()
+    result["stderr_lines"] = result["stderr"].splitlines()
+    result["changed"] = True
+    result["failed"] = result["rc"] != 0
+    if result["failed"] and "msg" not in result:
+        result["msg"] = "non-zero return code"
+    return result
@@ -6,8 +6,8 @@ and compare them to identify differences. It supports various SONiC database typ
 including APPL_DB, CONFIG_DB, and STATE_DB.
 
 Main features:
-- Take snapshots of Redis databases
-- Compare snapshots and generate detailed diffs
+- Take snapshots of Redis databases, stored as compressed per-key records with content hashes computed on the DUT
+- Compare snapshots and generate detailed diffs, decoding only the keys whose content hashes differ
 - Filter out volatile/transient data that changes frequently
 - Provide metrics on database differences
 """
@@ -18,11 +18,16 @@ import logging
 import os
 import re
 import copy
-from typing import Dict, List, Tuple
+import shlex
+from typing import Dict, List
 from collections import Counter
 from dataclasses import dataclass
 
+from tests.common import redis_snapshot
+from tests.common.helpers import redis_bulk
 from tests.common.helpers.custom_msg_utils import add_custom_msg
+from tests.common.helpers.remote_script import RemoteScript
+from tests.common.redis_snapshot import DictSnapshot, SnapshotFile, merge_entries
 
 logger = logging.getLogger(__name__)
 
@@ -81,6 +86,9 @@ def dut_dump(redis_cmd, duthost, data_dir, fname):
     return db_read
 
 
+SNAPSHOT_FILE_EXTENSION = ".snap"
+
+
 class DBType(Enum):
     """Supported Redis database types in SONiC. Value is their numeric DB index."""
     APPL = 0
@@ -292,32 +300,25 @@ class DbComparisonMetrics:
 class SnapshotDiff:
     """Container for differing values and metrics of a snapshot comparison for a singleDB supporting metric tracking
     """
-    def __init__(self, db_type: DBType, snapshot_a: dict, snapshot_b: dict, label_a: str = "a", label_b: str = "b"):
+    def __init__(self, db_type: DBType, snapshot_a, snapshot_b, label_a: str = "a", label_b: str = "b"):
+        """
+        Args:
+            db_type (DBType): Type of the compared DB
+            snapshot_a, snapshot_b: DB dumps as dicts, or snapshots with the entries() and record() methods of
+                                    redis_snapshot.SnapshotFile
+            label_a (str): Label of snapshot_a in the diff
+            label_b (str): Label of snapshot_b in the diff
+        """
         self._db_type = db_type
-        self._snapshot_a = snapshot_a
-        self._snapshot_b = snapshot_b
+        volatile = VOLATILE_VALUES.get(db_type, [])
+        self._snapshot_a = DictSnapshot(snapshot_a, volatile) if isinstance(snapshot_a, dict) else snapshot_a
+        self._snapshot_b = DictSnapshot(snapshot_b, volatile) if isinstance(snapshot_b, dict) else snapshot_b
         self._label_a = label_a
         self._label_b = label_b
 
-        # Start building metrics on snapshot
+        # Metrics on snapshots are built while building the diff
         self._metrics = DbComparisonMetrics()
-        self._metrics.total_a_keys = len(self._snapshot_a)
-        self._metrics.total_a_values_incl_volatile, self._metrics.total_a_values_excl_volatile = \
-            _sum_total_values(db_type, self._snapshot_a)
-        self._metrics.total_b_keys = len(self._snapshot_b)
-        self._metrics.total_b_values_incl_volatile, self._metrics.total_b_values_excl_volatile = \
-            _sum_total_values(db_type, self._snapshot_b)
-
-        # Build the diff
-        if db_type == DBType.STATE:
-            state_db_diff = self._diff_state_db_process_stats(self._snapshot_a, self._snapshot_b)
-            # Remove all 'PROCESS_STATS|*' keys from the dbs since they've already been diffed
-            self._snapshot_a = {k: v for k, v in self._snapshot_a.items() if not k.startswith("PROCESS_STATS|")}
-            self._snapshot_b = {k: v for k, v in self._snapshot_b.items() if not k.startswith("PROCESS_STATS|")}
-            remaining_diff = self._diff_dict(db_type, self._snapshot_a, self._snapshot_b)
-            self._diff = {**state_db_diff, **remaining_diff}
-        else:
-            self._diff = self._diff_dict(db_type, self._snapshot_a, self._snapshot_b)
+        self._diff = self._diff_snapshots(db_type, self._snapshot_a, self._snapshot_b)
 
         # Now that diff has been built, get metrics on the diff components
         self._metrics.populate_diff_metrics_from_diff(self._diff, label_a=self._label_a, label_b=self._label_b)
@@ -330,27 +331,89 @@ class SnapshotDiff:
     def metrics(self) -> DbComparisonMetrics:
         return self._metrics
 
-    def _diff_state_db_process_stats(self, state_db_a: dict, state_db_b: dict) -> dict:
+    def _diff_snapshots(self, db_type: DBType, snapshot_a, snapshot_b) -> dict:
+        """Diff two snapshots key by key in sorted key order.
+
+        Keys present in both snapshots with the same content hash have no differences except volatile values,
+        only the records of the other keys are decoded and diffed.
+        """
+        always_ignore_keys = set(VOLATILE_VALUES.get(db_type, []))
+        a_only_diff = {}
+        b_only_diff = {}
+        both_diff = {}
+        processes_a = []
+        processes_b = []
+
+        for entry_a, entry_b in merge_entries(snapshot_a.entries(), snapshot_b.entries()):
+            if entry_a is not None:
+                self._metrics.total_a_keys += 1
+                self._metrics.total_a_values_incl_volatile += entry_a.values
+                self._metrics.total_a_values_excl_volatile += entry_a.values_excl_volatile
+            if entry_b is not None:
+                self._metrics.total_b_keys += 1
+                self._metrics.total_b_values_incl_volatile += entry_b.values
+                self._metrics.total_b_values_excl_volatile += entry_b.values_excl_volatile
+            key = entry_a.key if entry_a is not None else entry_b.key
+
+            if db_type == DBType.STATE and key.startswith("PROCESS_STATS|"):
+                # 'PROCESS_STATS|*' keys are diffed by their running process instead of key
+                if re.match(r"^PROCESS_STATS\|\d+", key):
+                    for processes, snapshot, entry in [(processes_a, snapshot_a, entry_a),
+                                                       (processes_b, snapshot_b, entry_b)]:
+                        if entry is not None:
+                            content = snapshot.record(entry)
+                            assert "value" in content and "CMD" in content["value"], \
+                                f"Unexpected PROCESS_STATS entry: {key} : {content}"
+                            processes.append(content["value"]["CMD"])
+                continue
+
+            if key in always_ignore_keys:
+                continue
+            if entry_b is None:
+                a_only_diff[key] = {
+                    self._label_a: self._strip_volatile(snapshot_a.record(entry_a), always_ignore_keys),
+                    self._label_b: None
+                }
+            elif entry_a is None:
+                b_only_diff[key] = {
+                    self._label_a: None,
+                    self._label_b: self._strip_volatile(snapshot_b.record(entry_b), always_ignore_keys)
+                }
+            elif entry_a.hash != entry_b.hash:
+                value_a = snapshot_a.record(entry_a)
+                value_b = snapshot_b.record(entry_b)
+                if isinstance(value_a, dict) and isinstance(value_b, dict):
+                    nested_diff = self._diff_dict(db_type, value_a, value_b)
+                    if nested_diff:
+                        both_diff[key] = nested_diff
+                elif value_a != value_b:
+                    both_diff[key] = {
+                        self._label_a: value_a,
+                        self._label_b: value_b
+                    }
+
+        process_stats_diff = self._diff_state_db_process_stats(processes_a, processes_b) \
+            if db_type == DBType.STATE else {}
+        return {**process_stats_diff, **a_only_diff, **b_only_diff, **both_diff}
+
+    @staticmethod
+    def _strip_volatile(value, always_ignore_keys):
+        if isinstance(value, dict):
+            # Remove always ignore keys
+            value = copy.deepcopy(value)
+            _recursively_remove_keys_matching_pattern(value, always_ignore_keys)
+        return value
+
+    def _diff_state_db_process_stats(self, db_a_processes: list, db_b_processes: list) -> dict:
         """Between reboots or process restarts the PID can change but there is an
-        equivalent process running. This pairs up the PROCESS_STATS entries and diffs
-        based on the process running vs not.
+        equivalent process running. This pairs up the CMD of the PROCESS_STATS entries
+        and diffs based on the process running vs not.
 
         NOTE: That some PROCESS_STATS entries have a CMD: "" i.e. empty but there is still
               a non-zero PPID. In reality these entries form a tree and should be assembled
               into a tree structure and the trees of each compared. For now, this is simply
               a count of process matches. So far this has been adequate.
         """
-
-        # Extract all the CMD entries out of the DB's
-        db_a_processes = []
-        db_b_processes = []
-        for extracted_cmd_store, state_db in [(db_a_processes, state_db_a), (db_b_processes, state_db_b)]:
-            for key, content in state_db.items():
-                if re.match(r"^PROCESS_STATS\|\d+", key):
-                    assert "value" in content and "CMD" in content["value"], \
-                        f"Unexpected PROCESS_STATS entry: {key} : {content}"
-                    extracted_cmd_store.append(content["value"]["CMD"])
-
         db_a_processes_counter = Counter(db_a_processes)
         db_b_processes_counter = Counter(db_b_processes)
         db_a_only_processes = list((db_a_processes_counter - db_b_processes_counter).elements())
@@ -520,21 +583,6 @@ def _recursively_remove_keys_matching_pattern(d_for_removal, patterns):
             _recursively_remove_keys_matching_pattern(v, patterns)
 
 
-def _sum_total_values(db_type: DBType, db_dump: dict) -> Tuple[int, int]:
-    """Summarize the number of total values in the DB dump."""
-    total_incl_volatile = 0
-    total_excl_volatile = 0
-    always_ignore_keys = VOLATILE_VALUES.get(db_type, [])
-    for tl_key, content in db_dump.items():
-        assert "value" in content, f"Unexpected entry in {db_type.name} DB: {tl_key} : {content}"
-        value_dict = content["value"]
-        for key in value_dict:
-            total_incl_volatile += 1
-            if key not in always_ignore_keys:
-                total_excl_volatile += 1
-    return total_incl_volatile, total_excl_volatile
-
-
 class SonicRedisDBSnapshotter:
     """
     Class for taking and comparing Redis database snapshots on SONiC devices.
@@ -566,22 +614,29 @@ class SonicRedisDBSnapshotter:
         """
         Take a snapshot of specified Redis databases on the DUT.
 
-        This method captures the current state of the specified Redis databases
-        and stores them as JSON files in a snapshot directory.
+        Each database is dumped on the DUT into a snapshot file of compressed per-key records and content
+        hashes, see redis_snapshot. The files are fetched to a snapshot directory.
 
         Args:
             snapshot_name (str): Name identifier for this snapshot
             snapshot_dbs (List[DBType]): List of database types to snapshot
         """
         logger.info(f"Taking snapshot: {snapshot_name} for {self._duthost.hostname}")
-        # NOTE: Need trailing slash below to avoid additional dir nesting
-        snapshot_dir = f"{self._snapshot_base_dir}/{snapshot_name}/"
+        snapshot_dir = f"{self._snapshot_base_dir}/{snapshot_name}"
         os.makedirs(snapshot_dir, exist_ok=True)
+        # Copied to the DUT once per session with the redis client it imports, and run by path
+        script = RemoteScript(redis_snapshot.__file__, modules=[redis_bulk.__file__])
         for db in snapshot_dbs:
-            cmd = f"redis-dump -d {db.value} --pretty"
-            dump = dut_dump(cmd, self._duthost, snapshot_dir, db.name)
-            with open(f"{snapshot_dir}/{db.name}.json", "w") as f:
-                f.write(json.dumps(dump, indent=4, default=str))
+            dump_file = f"/tmp/{db.name}{SNAPSHOT_FILE_EXTENSION}"
+            volatile = sorted(VOLATILE_VALUES.get(db, []))
+            args = "{}_DB {} {}".format(db.name, dump_file, shlex.quote(json.dumps(volatile)))
+            # sudo, like redis_bulk the redis unix socket is used
+            ret = script.run(self._duthost, args, sudo=True)
+            assert ret["rc"] == 0, "Failed to snapshot {} DB: {}".format(db.name, ret.get("stderr"))
+            local_file = f"{snapshot_dir}/{db.name}{SNAPSHOT_FILE_EXTENSION}"
+            self._duthost.fetch(src=dump_file, dest=local_file, flat=True)
+            assert os.path.exists(local_file), "Fetched file not exist: {}".format(local_file)
+            self._duthost.shell(f"rm -f {dump_file}", module_ignore_errors=True)
 
         logger.info(f"Snapshot {snapshot_name} taken for {self._duthost.hostname} at {snapshot_dir}")
 
@@ -591,7 +646,8 @@ class SonicRedisDBSnapshotter:
 
         This method loads two previously taken snapshots and compares them,
         generating SnapshotDiff objects for each database type that contains
-        the differences and metrics.
+        the differences and metrics. Snapshots in the JSON format of "redis-dump"
+        are supported as well.
 
         Args:
             snapshot_a (str): Name of the first snapshot to compare
@@ -605,25 +661,41 @@ class SonicRedisDBSnapshotter:
             AssertionError: If the snapshots don't contain the same database types
         """
         snapshot_a_dir = f"{self._snapshot_base_dir}/{snapshot_a}"
-        snapshot_a_dbs = [f for f in os.listdir(snapshot_a_dir) if f.endswith(".json")]
+        snapshot_a_dbs = _snapshot_db_files(snapshot_a_dir)
 
         snapshot_b_dir = f"{self._snapshot_base_dir}/{snapshot_b}"
-        snapshot_b_dbs = [f for f in os.listdir(snapshot_b_dir) if f.endswith(".json")]
+        snapshot_b_dbs = _snapshot_db_files(snapshot_b_dir)
 
         assert set(snapshot_a_dbs) == set(snapshot_b_dbs), "Snapshotted dbs do not match. Cannot compare"
 
         result = {}
 
-        for db_file in snapshot_a_dbs:
-            db_name = db_file.replace(".json", "")
+        for db_name in snapshot_a_dbs:
             db_type = DBType[db_name]
             if db_type == DBType.ASIC:
                 # NOTE: ASIC DB diffing not currently supported
                 continue
-            db_dump_a = json.load(open(os.path.join(snapshot_a_dir, db_file), 'r'))
-            db_dump_b = json.load(open(os.path.join(snapshot_b_dir, db_file), 'r'))
-            snapshot_diff = SnapshotDiff(db_type, db_dump_a, db_dump_b, label_a=snapshot_a, label_b=snapshot_b)
+            with _open_snapshot(db_type, os.path.join(snapshot_a_dir, snapshot_a_dbs[db_name])) as db_dump_a, \
+                    _open_snapshot(db_type, os.path.join(snapshot_b_dir, snapshot_b_dbs[db_name])) as db_dump_b:
+                snapshot_diff = SnapshotDiff(db_type, db_dump_a, db_dump_b, label_a=snapshot_a, label_b=snapshot_b)
 
             result[db_type] = snapshot_diff
 
         return result
+
+
+def _snapshot_db_files(snapshot_dir: str) -> Dict[str, str]:
+    """Map the DB names of a snapshot directory to their snapshot files, snapshot files are preferred to JSON"""
+    db_files = {}
+    for f in sorted(os.listdir(snapshot_dir)):
+        db_name, ext = os.path.splitext(f)
+        if ext == SNAPSHOT_FILE_EXTENSION or (ext == ".json" and db_name not in db_files):
+            db_files[db_name] = f
+    return db_files
+
+
+def _open_snapshot(db_type: DBType, path: str):
+    if path.endswith(".json"):
+        with open(path, "r") as f:
+            return DictSnapshot(json.load(f), VOLATILE_VALUES.get(db_type, []))
+    return SnapshotFile(path)
@@ -1,14 +1,16 @@
-import inspect
 import json
 import logging
 import collections
+import functools
 import signal
+import sys
 import threading
 from contextlib import contextmanager
 from multiprocessing.pool import ThreadPool
 import ansible
 from pytest_ansible.results import AdHocResult, ModuleResult
 
+from tests.common.cache.result_cache import invalidate_on_module_run
 from tests.common.errors import RunAnsibleModuleFail
 
 
@@ -30,6 +32,7 @@ _avm.load_extra_vars = _safe_load_extra_vars
 logger = logging.getLogger(__name__)
 
 
+@functools.lru_cache(maxsize=None)
 def ansible_tqm_has_signal_registration():
     version = getattr(ansible, "__version__", "0.0.0")
     try:
@@ -89,6 +92,23 @@ except Exception as e:
     logger.error("Hack for https://github.com/ansible/pytest-ansible/issues/47 failed: {}".format(repr(e)))
 
 
+_JSON_SCALAR_TYPES = (str, int, float, bool, type(None))
+
+
+def is_json_native(obj):
+    """Check whether an object is made of JSON types only, so that a JSON round trip would not change it.
+
+    Tuples are accepted, they are passed to ansible as lists anyway.
+    """
+    if isinstance(obj, _JSON_SCALAR_TYPES):
+        return True
+    if type(obj) in (list, tuple):
+        return all(is_json_native(item) for item in obj)
+    if type(obj) is dict:
+        return all(isinstance(key, str) and is_json_native(value) for key, value in obj.items())
+    return False
+
+
 class AnsibleHostBase(object):
     """
     @summary: The base class for various objects.
@@ -168,12 +188,17 @@ class AnsibleHostBase(object):
 
     def _run(self, module_name, *module_args, **complex_args):
 
-        previous_frame = inspect.currentframe().f_back
-        filename, line_number, function_name, lines, index = inspect.getframeinfo(previous_frame)
+        debug = logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            # Frame attributes are enough for logging, inspect.getframeinfo() reads source lines from disk
+            previous_frame = sys._getframe(1)
+            filename = previous_frame.f_code.co_filename
+            line_number = previous_frame.f_lineno
+            function_name = previous_frame.f_code.co_name
 
         verbose = complex_args.pop('verbose', True)
         module = getattr(self.host, module_name)
-        if verbose:
+        if debug and verbose:
             logger.debug(
                 "{}::{}#{}: [{}] AnsibleModule::{}, args={}, kwargs={}".format(
                     filename,
@@ -185,7 +210,7 @@ class AnsibleHostBase(object):
                     json.dumps(complex_args, cls=AnsibleHostBase.CustomEncoder)
                 )
             )
-        else:
+        elif debug:
             logger.debug(
                 "{}::{}#{}: [{}] AnsibleModule::{} executing...".format(
                     filename,
@@ -199,6 +224,8 @@ class AnsibleHostBase(object):
         module_ignore_errors = complex_args.pop('module_ignore_errors', False)
         module_async = complex_args.pop('module_async', False)
 
+        invalidate_on_module_run(self, module_name, module_args, complex_args)
+
         if module_async:
             def run_module(module_args, complex_args):
                 with suppress_signal_registration_for_non_main_thread():
@@ -207,8 +234,10 @@ class AnsibleHostBase(object):
             result = pool.apply_async(run_module, (module_args, complex_args))
             return pool, result
 
-        module_args = json.loads(json.dumps(module_args, cls=AnsibleHostBase.CustomEncoder))
-        complex_args = json.loads(json.dumps(complex_args, cls=AnsibleHostBase.CustomEncoder))
+        if not is_json_native(module_args):
+            module_args = json.loads(json.dumps(module_args, cls=AnsibleHostBase.CustomEncoder))
+        if not is_json_native(complex_args):
+            complex_args = json.loads(json.dumps(complex_args, cls=AnsibleHostBase.CustomEncoder))
 
         with suppress_signal_registration_for_non_main_thread():
             adhoc_res: AdHocResult = module(*module_args, **complex_args)
@@ -221,7 +250,7 @@ class AnsibleHostBase(object):
         hostname_res: ModuleResult = adhoc_res[self.hostname]
         hostname_res.encoder = AnsibleHostBase.CustomEncoder
 
-        if verbose:
+        if debug and verbose:
             logger.debug(
                 "{}::{}#{}: [{}] AnsibleModule::{} Result => {}".format(
                     filename,
@@ -231,7 +260,7 @@ class AnsibleHostBase(object):
                     module_name, json.dumps(hostname_res, cls=AnsibleHostBase.CustomEncoder)
                 )
             )
-        else:
+        elif debug:
             logger.debug(
                 "{}::{}#{}: [{}] AnsibleModule::{} done, is_failed={}, rc={}".format(
                     filename,
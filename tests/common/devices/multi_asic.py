@@ -3,6 +3,7 @@ from functools import lru_cache
 import ipaddress
 import json
 import logging
+import shlex
 
 from tests.common.errors import RunAnsibleModuleFail
 from tests.common.devices.sonic import SonicHost
@@ -557,6 +558,7 @@ class MultiAsicSonicHost(object):
                 if service_name in self.sonichost.critical_services:
                     services.append(service_name)
 
+        cmds = []
         for docker in services:
             # This is to avoid gbsyncd check fo VS test_disable_rsyslog_rate_limit
             # we are still getting whatever enabled feature in test_disable_rsyslog_rate_limit
@@ -574,14 +576,13 @@ class MultiAsicSonicHost(object):
                 r"/etc/rsyslog.conf"
             )
             cmd_reload = r"docker exec -i {} supervisorctl restart rsyslogd"
-            cmds = []
 
             if rl_option == 'disable':
                 cmds.append(cmd_disable_rate_limit.format(docker))
             else:
                 cmds.append(cmd_enable_rate_limit.format(docker))
             cmds.append(cmd_reload.format(docker))
-            self.sonichost.shell_cmds(cmds=cmds)
+        self.sonichost.shell_batch(cmds)
 
     def get_bgp_neighbors(self, namespace=None):
         """
@@ -825,21 +826,21 @@ class MultiAsicSonicHost(object):
         """This function iterate for ALL asics and execute cmds"""
         duthost = self.sonichost
         if duthost.is_multi_asic:
-            for a_asic in self.asics:
-                container = a_asic.get_docker_name(container_name)
-                self.shell(argv=["docker", "exec", container, "bash", "-c", cmd])
+            containers = [a_asic.get_docker_name(container_name) for a_asic in self.asics]
         else:
-            self.shell(argv=["docker", "exec", container_name, "bash", "-c", cmd])
+            containers = [container_name]
+        duthost.shell_batch(["docker exec {} bash -c {}".format(container, shlex.quote(cmd))
+                             for container in containers], continue_on_fail=False)
 
     def docker_copy_to_all_asics(self, container_name, src, dst):
         """This function copy from host to ALL asics"""
         duthost = self.sonichost
         if duthost.is_multi_asic:
-            for a_asic in self.asics:
-                container = a_asic.get_docker_name(container_name)
-                self.shell("sudo docker cp {} {}:{}".format(src, container, dst))
+            containers = [a_asic.get_docker_name(container_name) for a_asic in self.asics]
         else:
-            self.shell("sudo docker cp {} {}:{}".format(src, container_name, dst))
+            containers = [container_name]
+        duthost.shell_batch(["sudo docker cp {} {}:{}".format(src, container, dst) for container in containers],
+                            continue_on_fail=False)
 
     def docker_copy_from_asic(self, container_name, src, dst, asic_id=0):
         """This function copy from one asic to host"""
@@ -863,13 +864,13 @@ class MultiAsicSonicHost(object):
         """This function tell if service is fully started base on multi-asic/single-asic"""
         duthost = self.sonichost
         if duthost.is_multi_asic:
-            for asic in self.asics:
-                docker_name = asic.get_docker_name(service)
-                if not duthost.is_service_fully_started(docker_name):
-                    return False
-            return True
+            docker_names = [asic.get_docker_name(service) for asic in self.asics]
         else:
-            return duthost.is_service_fully_started(service)
+            docker_names = [service]
+        results = duthost.shell_batch([r"docker inspect -f \{\{.State.Running\}\} %s" % docker_name
+                                       for docker_name in docker_names],
+                                      continue_on_fail=False, module_ignore_errors=True)
+        return len(results) == len(docker_names) and all(res["stdout"].strip() == "true" for res in results)
 
     def restart_service_on_asic(self, service, asic_index=DEFAULT_ASIC_ID):
         """Restart service on an asic passed or None(DEFAULT_ASIC_ID)"""
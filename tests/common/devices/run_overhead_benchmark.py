@@ -0,0 +1,82 @@
+"""
+Microbenchmark of the per call overhead of AnsibleHostBase._run.
+
+The ansible module is replaced by a function returning a canned result immediately, so the measured time is the
+overhead added by _run itself. The legacy overhead (inspect.getframeinfo and JSON round trip of arguments on every
+call) is measured for comparison.
+
+Usage:
+    python -m tests.common.devices.run_overhead_benchmark [--calls N] [--debug]
+"""
+import argparse
+import inspect
+import json
+import logging
+import sys
+import time
+
+from pytest_ansible.results import AdHocResult, ModuleResult
+
+from tests.common.devices.base import AnsibleHostBase
+
+HOSTNAME = "benchmark-dut"
+RESULT = {"rc": 0, "stdout": "Ethernet0 up", "stdout_lines": ["Ethernet0 up"], "failed": False}
+
+
+class FakeAdhocHost(object):
+    """Replacement of the pytest_ansible host manager, every module returns RESULT immediately."""
+
+    def has_module(self, module_name):
+        return True
+
+    def __getattr__(self, module_name):
+        def module(*module_args, **complex_args):
+            return AdHocResult(contacted={HOSTNAME: ModuleResult(RESULT)})
+        return module
+
+
+def create_host():
+    host = AnsibleHostBase.__new__(AnsibleHostBase)
+    host.host = FakeAdhocHost()
+    host.hostname = HOSTNAME
+    return host
+
+
+def legacy_overhead(module_args, complex_args):
+    previous_frame = inspect.currentframe().f_back
+    inspect.getframeinfo(previous_frame)
+    json.loads(json.dumps(module_args, cls=AnsibleHostBase.CustomEncoder))
+    json.loads(json.dumps(complex_args, cls=AnsibleHostBase.CustomEncoder))
+
+
+def measure(calls, func):
+    start = time.time()
+    for _ in range(calls):
+        func()
+    return (time.time() - start) / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per call overhead of AnsibleHostBase._run")
+    parser.add_argument("--calls", type=int, default=20000, help="Number of calls to measure")
+    parser.add_argument("--debug", action="store_true", help="Enable debug logging to a null handler")
+    args = parser.parse_args()
+
+    if args.debug:
+        logging.getLogger("tests.common.devices.base").addHandler(logging.NullHandler())
+        logging.getLogger("tests.common.devices.base").setLevel(logging.DEBUG)
+
+    host = create_host()
+    cmd = "show interfaces status"
+    complex_args = {"module_ignore_errors": True}
+
+    noop = measure(args.calls, lambda: None)
+    run = measure(args.calls, lambda: host.shell(cmd, **complex_args)) - noop
+    legacy = measure(args.calls, lambda: legacy_overhead((cmd,), complex_args)) - noop
+    print("AnsibleHostBase._run: {:.2f}us per call".format(run))
+    print("Legacy frame info and JSON round trip alone: {:.2f}us per call".format(legacy))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -12,12 +12,17 @@ from datetime import datetime, timedelta
 
 from ansible import constants as ansible_constants
 from ansible.plugins.loader import connection_loader
+from pytest_ansible.results import ModuleResult
 
+from tests.common.cache.result_cache import invalidate_on_module_run
+from tests.common.connections.persistent_channel import ChannelError, PersistentChannel, to_module_result
 from tests.common.devices.base import AnsibleHostBase
 from tests.common.devices.constants import ACL_COUNTERS_UPDATE_INTERVAL_IN_SEC
-from tests.common.helpers.dut_utils import is_supervisor_node, is_macsec_capable_node
+from tests.common.helpers.dut_utils import is_supervisor_node, is_macsec_capable_node, creds_on_dut
 from tests.common.utilities import get_host_visible_vars
 from tests.common.cache import cached
+from tests.common.cache import invalidates_cache
+from tests.common.cache import ttl_cached
 from tests.common.helpers.constants import DEFAULT_ASIC_ID, DEFAULT_NAMESPACE
 from tests.common.helpers.platform_api.chassis import is_inband_port
 from tests.common.errors import RunAnsibleModuleFail
@@ -48,6 +53,15 @@ PROCESS_TO_CONTAINER_MAP = {
     "syncd": "syncd"
 }
 UNKNOWN_ASIC = "unknown"
+# Outputs of show commands matching this pattern change without any command run on the DUT, don't cache them
+VOLATILE_SHOW_CMD_PATTERN = re.compile(
+    r"counter|stat(s|istics)?\b|watermark|aclshow|nbrshow|"
+    r"\b(mac|arp|ndp|neigh\w*|route|bgp|lldp|uptime|clock|logging|crm|queue|pfc|sfp\w*|transceiver|environment|"
+    r"temperature|fan|psu|processes|memory|redis-cli|sonic-db-cli)\b")
+
+
+def _is_static_show_cmd(host, show_cmd, *args, **kwargs):
+    return not VOLATILE_SHOW_CMD_PATTERN.search(show_cmd)
 
 
 class SonicHost(AnsibleHostBase):
@@ -59,6 +73,20 @@ class SonicHost(AnsibleHostBase):
     """
     DEFAULT_ASIC_SERVICES = ["bgp", "database", "lldp", "swss", "syncd", "teamd"]
 
+    # Run shell and command modules through a persistent channel on all DUTs.
+    # Set by pytest option --dut_persistent_channel
+    persistent_channel_enabled = False
+
+    # Arguments of shell and command modules supported by the persistent channel
+    CHANNEL_MODULE_ARGS = {"chdir", "executable", "module_ignore_errors", "verbose"}
+
+    # Seconds to use ansible after the persistent channel failed to open, before trying to open it again.
+    # Every failed attempt waits for the connection timeout of the channel.
+    CHANNEL_RETRY_INTERVAL = 300
+
+    # Time of the last failure to open the persistent channel
+    _channel_failed_at = None
+
     """
     setting either one of shell_user/shell_pw or ssh_user/ssh_passwd pair should yield the same result.
     """
@@ -92,6 +120,10 @@ class SonicHost(AnsibleHostBase):
                 if pass_var in hostvars:
                     vm.extra_vars.update({pass_var: shell_passwd})
 
+        self._ssh_user = ssh_user or shell_user
+        self._ssh_passwd = ssh_passwd or shell_passwd
+        self._persistent_channel = None
+
         if ssh_user and ssh_passwd:
             evars = {
                 'ansible_ssh_user': ssh_user,
@@ -134,6 +166,140 @@ class SonicHost(AnsibleHostBase):
     def __str__(self):
         return '<SonicHost {}>'.format(self.hostname)
 
+    def enable_persistent_channel(self):
+        """Run shell and command modules through a persistent channel instead of a new ansible task per call.
+
+        Only calls with arguments supported by the channel (CHANNEL_MODULE_ARGS) use it, other calls and calls made
+        when the channel cannot be opened fall back to ansible.
+        """
+        if self._persistent_channel is None:
+            username, passwords = self.channel_credentials()
+            self._persistent_channel = PersistentChannel(self.mgmt_ip, username, passwords)
+            self._channel_failed_at = None
+        return self._persistent_channel
+
+    def _channel_backoff(self):
+        """Whether the persistent channel failed to open recently and ansible must be used instead."""
+        return self._channel_failed_at is not None and \
+            time.time() - self._channel_failed_at < self.CHANNEL_RETRY_INTERVAL
+
+    def _channel_unusable(self, error):
+        logger.warning("[{}] Persistent channel not usable, fall back to ansible for {} seconds: {}"
+                       .format(self.hostname, self.CHANNEL_RETRY_INTERVAL, error))
+        self._channel_failed_at = time.time()
+
+    def channel_credentials(self):
+        """Return the login user and the candidate passwords of SSH channels to the DUT, like PersistentChannel."""
+        creds = creds_on_dut(self)
+        username = self._ssh_user or creds["sonicadmin_user"]
+        passwords = [self._ssh_passwd] if self._ssh_passwd else \
+            [creds["sonicadmin_password"]] + creds.get("ansible_altpasswords", [])
+        return username, passwords
+
+    def disable_persistent_channel(self):
+        if self._persistent_channel is not None:
+            self._persistent_channel.close()
+            self._persistent_channel = None
+        self._channel_failed_at = None
+
+    def _run(self, module_name, *module_args, **complex_args):
+        if module_name in ("shell", "command") and len(module_args) == 1 and \
+                set(complex_args) <= self.CHANNEL_MODULE_ARGS:
+            if self._persistent_channel is None and self.persistent_channel_enabled:
+                self.enable_persistent_channel()
+            if self._persistent_channel is not None and not self._channel_backoff():
+                result = self._run_on_channel(module_name, module_args[0], **complex_args)
+                if result is not None:
+                    return result
+        return AnsibleHostBase._run(self, module_name, *module_args, **complex_args)
+
+    def _run_on_channel(self, module_name, cmd, module_ignore_errors=False, verbose=True, **kwargs):
+        """Run a shell or command module call through the persistent channel.
+
+        Returns:
+            ModuleResult: Result in the same format as the ansible module, None if the channel is not usable and the
+                call should fall back to ansible.
+        """
+        invalidate_on_module_run(self, module_name, (cmd,), kwargs)
+        if verbose:
+            logger.debug("[{}] PersistentChannel::{}, cmd={}, kwargs={}"
+                         .format(self.hostname, module_name, cmd, kwargs))
+        request = dict(kwargs, cmd=cmd, shell=module_name == "shell")
+        try:
+            result = self._persistent_channel.execute([request])[0]
+        except ChannelError as e:
+            if not e.sent:
+                self._channel_unusable(e)
+                return None
+            result = {"cmd": cmd, "rc": -1, "stdout": "", "stderr": "", "msg": "Persistent channel lost: {}".format(e)}
+
+        result = ModuleResult(to_module_result(result))
+        if verbose:
+            logger.debug("[{}] PersistentChannel::{} Result => {}".format(self.hostname, module_name, dict(result)))
+        if result.is_failed and not module_ignore_errors:
+            raise RunAnsibleModuleFail("run module {} failed".format(module_name), result)
+        return result
+
+    def shell_batch(self, cmds, continue_on_fail=True, timeout=0, module_ignore_errors=False):
+        """Run multiple shell commands in one remote invocation instead of one round trip per command.
+
+        The commands run in sequence by /bin/sh, through the persistent channel if it is enabled, otherwise through
+        the shell_cmds module.
+
+        Args:
+            cmds (list): Commands to run.
+            continue_on_fail (bool): Whether to run the rest of the commands after a command failed.
+            timeout (int): Time limit in seconds of each command, 0 for no limit.
+            module_ignore_errors (bool): Don't raise an exception if any command failed.
+        Returns:
+            list: Results of the commands which ran, in the order of cmds. Each result is a dict with keys cmd, rc,
+                stdout, stderr, stdout_lines and stderr_lines. Only when continue_on_fail is False, the commands after
+                a failed command don't run and have no result.
+        Raises:
+            RunAnsibleModuleFail: if any command failed and module_ignore_errors is False.
+        """
+        if not cmds:
+            return []
+
+        results = None
+        if (self._persistent_channel is not None or self.persistent_channel_enabled) and not self._channel_backoff():
+            results = self._run_batch_on_channel(cmds, continue_on_fail, timeout)
+        if results is None:
+            res = self.shell_cmds(cmds=list(cmds), continue_on_fail=continue_on_fail, timeout=timeout,
+                                  module_ignore_errors=True)
+            if "results" not in res:
+                # The module itself failed, e.g. the DUT is unreachable
+                if not module_ignore_errors:
+                    raise RunAnsibleModuleFail("run module shell_cmds failed", res)
+                return [to_module_result({"cmd": cmd, "rc": -1, "stdout": "", "stderr": "", "msg": res.get("msg", "")})
+                        for cmd in cmds]
+            # Like the shell module and the persistent channel, the trailing newline of the outputs is stripped
+            results = [to_module_result(dict(result, stdout=result["stdout"].rstrip("\r\n"),
+                                             stderr=result["stderr"].rstrip("\r\n")))
+                       for result in res["results"]]
+
+        failed_cmds = [result["cmd"] for result in results if result["rc"] != 0]
+        if failed_cmds and not module_ignore_errors:
+            raise RunAnsibleModuleFail("run {} of {} commands failed".format(len(failed_cmds), len(cmds)),
+                                       {"failed_cmds": failed_cmds, "results": results})
+        return results
+
+    def _run_batch_on_channel(self, cmds, continue_on_fail, timeout):
+        channel = self.enable_persistent_channel()
+        for cmd in cmds:
+            invalidate_on_module_run(self, "shell", (cmd,), {})
+        requests = [{"cmd": cmd, "shell": True, "timeout": timeout, "skip_if_failed": not continue_on_fail}
+                    for cmd in cmds]
+        try:
+            results = channel.execute(requests)
+        except ChannelError as e:
+            if not e.sent:
+                self._channel_unusable(e)
+                return None
+            results = [{"cmd": cmd, "rc": -1, "stdout": "", "stderr": "", "msg": "Persistent channel lost: {}"
+                        .format(e)} for cmd in cmds]
+        return [to_module_result(result) for result in results if not result.get("skipped")]
+
     def __repr__(self):
         return self.__str__()
 
@@ -336,6 +502,7 @@ class SonicHost(AnsibleHostBase):
         except Exception:
             return False
 
+    @ttl_cached()
     def get_running_containers(self):
         """
         Get the running containers names
@@ -450,12 +617,25 @@ class SonicHost(AnsibleHostBase):
                   critical_processes file in the specified container
         @return: Two lists which include the critical groups and critical processes respectively
         """
+        file_content = self.shell("docker exec {} bash -c '[ -f /etc/supervisor/critical_processes ] \
+                && cat /etc/supervisor/critical_processes'".format(container_name), module_ignore_errors=True)
+        process_list = None
+        if container_name == "pmon":
+            process_list = self.shell("docker exec {} supervisorctl status"
+                                      .format(container_name), module_ignore_errors=True)
+        return self._parse_critical_group_and_process_lists(container_name, file_content, process_list)
+
+    def _parse_critical_group_and_process_lists(self, container_name, file_content, process_list):
+        """
+        @summary: Parse critical group and process lists of a container
+        @param file_content: Result of reading the critical_processes file in the container
+        @param process_list: Result of 'supervisorctl status' in the container, only used for pmon
+        @return: Two lists which include the critical groups and critical processes respectively
+        """
         critical_group_list = []
         critical_process_list = []
         succeeded = True
 
-        file_content = self.shell("docker exec {} bash -c '[ -f /etc/supervisor/critical_processes ] \
-                && cat /etc/supervisor/critical_processes'".format(container_name), module_ignore_errors=True)
         for line in file_content["stdout_lines"]:
             line_info = line.strip().split(':')
             if len(line_info) != 2:
@@ -482,8 +662,6 @@ class SonicHost(AnsibleHostBase):
         if succeeded and container_name == "pmon":
             expected_critical_group_list = []
             expected_critical_process_list = []
-            process_list = self.shell("docker exec {} supervisorctl status"
-                                      .format(container_name), module_ignore_errors=True)
             for process_info in process_list["stdout_lines"]:
                 process_name = process_info.split()[0].strip()
                 process_status = process_info.split()[1].strip()
@@ -509,13 +687,10 @@ class SonicHost(AnsibleHostBase):
                   ' && cat /etc/supervisor/critical_processes"'.format(service)
 
             cmds.append(cmd)
-        results = self.shell_cmds(cmds=cmds, continue_on_fail=True, module_ignore_errors=True, timeout=30)['results']
+        results = self.shell_batch(cmds, timeout=30, module_ignore_errors=True)
 
-        # Extract service name of each command result, transform results list to a dict keyed by service name
-        service_results = {}
-        for res in results:
-            service = res['cmd'].split()[2]
-            service_results[service] = res
+        # Transform results list to a dict keyed by service name
+        service_results = dict(zip(self.critical_services, results))
 
         # Parse critical group and service definition of all services
         group_process_results = {}
@@ -563,20 +738,26 @@ class SonicHost(AnsibleHostBase):
             'running_critical_process': []
         }
 
+        # get service state, critical processes definition and process status of the service in one batch
+        service_state, file_content, output = self.shell_batch([
+            r"docker inspect -f \{\{.State.Running\}\} %s" % service,
+            "docker exec {} bash -c '[ -f /etc/supervisor/critical_processes ] "
+            "&& cat /etc/supervisor/critical_processes'".format(service),
+            "docker exec {} supervisorctl status".format(service)
+        ], module_ignore_errors=True)
+
         # return false if the service is not started
-        service_status = self.is_service_fully_started(service)
-        if service_status is False:
+        if service_state["rc"] != 0 or service_state["stdout"].strip() != "true":
             result['status'] = False
             return result
 
         # get critical group and process lists for the service
-        critical_group_list, critical_process_list, succeeded = self.get_critical_group_and_process_lists(service)
+        critical_group_list, critical_process_list, succeeded = \
+            self._parse_critical_group_and_process_lists(service, file_content, output)
         if succeeded is False:
             result['status'] = False
             return result
 
-        # get process status for the service
-        output = self.command("docker exec {} supervisorctl status".format(service), module_ignore_errors=True)
         logging.info("====== supervisor process status for service {} ======".format(service))
 
         return self.parse_service_status_and_critical_process(
@@ -597,13 +778,10 @@ class SonicHost(AnsibleHostBase):
         for service in self.critical_services:
             cmd = 'docker exec {} supervisorctl status'.format(service)
             cmds.append(cmd)
-        results = self.shell_cmds(cmds=cmds, continue_on_fail=True, module_ignore_errors=True, timeout=60)['results']
+        results = self.shell_batch(cmds, timeout=60, module_ignore_errors=True)
 
-        # Extract service name of each command result, transform results list to a dict keyed by service name
-        service_results = {}
-        for res in results:
-            service = res['cmd'].split()[2]
-            service_results[service] = res
+        # Transform results list to a dict keyed by service name
+        service_results = dict(zip(self.critical_services, results))
 
         # Parse critical process status of all services
         all_critical_process = {}
@@ -876,17 +1054,26 @@ class SonicHost(AnsibleHostBase):
         # some services are meant to have a short life span or not part of the daemons
         exemptions = ['lm-sensors', 'start.sh', 'rsyslogd', 'start', 'dependent-startup', 'chassis_db_init', 'delay']
 
-        daemons = self.shell('docker exec pmon supervisorctl status', module_ignore_errors=True)['stdout_lines']
-
-        daemon_list = [line.strip().split()[0] for line in daemons if len(line.strip()) > 0]
-
         daemon_ctl_key_prefix = 'skip_'
         daemon_config_file_path = os.path.join('/usr/share/sonic/device',
                                                self.facts["platform"], 'pmon_daemon_control.json')
 
-        try:
-            output = self.shell('cat %s' % daemon_config_file_path)
-            json_data = json.loads(output["stdout"])
+        status_result, config_result = self.shell_batch(
+            ['docker exec pmon supervisorctl status', 'cat %s' % daemon_config_file_path], module_ignore_errors=True)
+        daemons = status_result['stdout_lines']
+
+        daemon_list = [line.strip().split()[0] for line in daemons if len(line.strip()) > 0]
+
+        json_data = None
+        if config_result['rc'] == 0:
+            try:
+                json_data = json.loads(config_result["stdout"])
+            except ValueError:
+                logging.debug("Invalid content of %s" % daemon_config_file_path)
+
+        # if pmon_daemon_control.json not exist, then it's using default setting,
+        # all the pmon daemons expected to be running after boot up.
+        if json_data is not None:
             logging.debug("Original file content is %s" % str(json_data))
             for key in daemon_list:
                 if (daemon_ctl_key_prefix + key) not in json_data:
@@ -899,10 +1086,6 @@ class SonicHost(AnsibleHostBase):
 
             if self.sonic_release in ['201911']:
                 exemptions.append('platform_api_server')
-        except Exception:
-            # if pmon_daemon_control.json not exist, then it's using default setting,
-            # all the pmon daemons expected to be running after boot up.
-            pass
 
         # Collect state of services that are not on the exemption list.
         daemon_states = {}
@@ -1035,6 +1218,7 @@ class SonicHost(AnsibleHostBase):
         ret['installed_list'] = images
         return ret
 
+    @invalidates_cache
     def shutdown(self, ifname):
         """
             Shutdown interface specified by ifname
@@ -1045,6 +1229,7 @@ class SonicHost(AnsibleHostBase):
         logging.info("Shutting down {}".format(ifname))
         return self.command("sudo config interface shutdown {}".format(ifname))
 
+    @invalidates_cache
     def shutdown_multiple(self, ifnames):
         """
             Shutdown multiple interfaces
@@ -1057,13 +1242,15 @@ class SonicHost(AnsibleHostBase):
         # Change the batch shutdown call to individual call here
         current_image = image_info.get("current")
         if "201811" in current_image or "201911" in current_image:
-            for ifname in ifnames:
-                self.shutdown(ifname)
+            logging.info("Shutting down {}".format(ifnames))
+            self.shell_batch(["sudo config interface shutdown {}".format(ifname) for ifname in ifnames],
+                             continue_on_fail=False)
             return
         else:
             intf_str = ','.join(ifnames)
             return self.shutdown(intf_str)
 
+    @invalidates_cache
     def no_shutdown(self, ifname):
         """
             Bring up interface specified by ifname
@@ -1074,6 +1261,7 @@ class SonicHost(AnsibleHostBase):
         logging.info("Starting up {}".format(ifname))
         return self.command("sudo config interface startup {}".format(ifname))
 
+    @invalidates_cache
     def no_shutdown_multiple(self, ifnames):
         """
             Bring up multiple interfaces
@@ -1086,8 +1274,9 @@ class SonicHost(AnsibleHostBase):
         # Change the batch startup call to individual call here
         current_image = image_info.get("current")
         if "201811" in current_image or "201911" in current_image:
-            for ifname in ifnames:
-                self.no_shutdown(ifname)
+            logging.info("Starting up {}".format(ifnames))
+            self.shell_batch(["sudo config interface startup {}".format(ifname) for ifname in ifnames],
+                             continue_on_fail=False)
             return
         else:
             intf_str = ','.join(ifnames)
@@ -1538,6 +1727,7 @@ Totals               6450                 6449
         return container_autorestart_states
 
     @cached(name='feature_status')
+    @ttl_cached()
     def get_feature_status(self, disable_cache=True):
         """
         Gets the list of features and states
@@ -1636,6 +1826,7 @@ Totals               6450                 6449
 
         return result
 
+    @ttl_cached(condition=_is_static_show_cmd)
     def show_and_parse(self, show_cmd, header_len=1, **kwargs):
         """Run a show command and parse the output using a generic pattern.
 
@@ -2097,18 +2288,21 @@ Totals               6450                 6449
         )
         return crm_facts
 
+    @invalidates_cache
     def start_service(self, service_name, docker_name):
         logging.debug("Starting {}".format(service_name))
         if not self.is_service_fully_started(docker_name):
             self.command("sudo systemctl start {}".format(service_name))
             logging.debug("started {}".format(service_name))
 
+    @invalidates_cache
     def stop_service(self, service_name, docker_name):
         logging.debug("Stopping {}".format(service_name))
         if self.is_service_fully_started(docker_name):
             self.command("sudo systemctl stop {}".format(service_name))
         logging.debug("Stopped {}".format(service_name))
 
+    @invalidates_cache
     def restart_service(self, service_name, docker_name):
         logging.debug("Restarting {}".format(service_name))
         if self.is_service_fully_started(docker_name):
@@ -2118,21 +2312,25 @@ Totals               6450                 6449
             self.command("sudo systemctl start {}".format(service_name))
             logging.debug("started {}".format(service_name))
 
+    @invalidates_cache
     def reset_service(self, service_name, docker_name):
         logging.debug("Stopping {}".format(service_name))
         self.command("sudo systemctl reset-failed {}".format(service_name))
         logging.debug("Resetting {}".format(service_name))
 
+    @invalidates_cache
     def delete_container(self, service):
         self.command(
             "docker rm {}".format(service), module_ignore_errors=True
         )
 
+    @invalidates_cache
     def no_shutdown_bgp(self, asn):
         command = "vtysh -c 'config' -c 'router bgp {}'".format(asn)
         logging.info('No shut BGP: {}'.format(asn))
         return self.command(command)
 
+    @invalidates_cache
     def no_shutdown_bgp_neighbors(self, asn, neighbors=[]):
         if not neighbors:
             return
@@ -2784,6 +2982,7 @@ Totals               6450                 6449
         if wait_for_new_interval:
             time.sleep(origin_interval / 1000 + 1)
 
+    @invalidates_cache
     def config(self, lines=None, parents=None, module_ignore_errors=False, asic_id=DEFAULT_ASIC_ID):
         # Convert string inputs to lists
         if isinstance(lines, str):
@@ -4,7 +4,8 @@ import logging
 
 from tests.common.dualtor.dual_tor_common import CableType
 from tests.common.helpers.assertions import pytest_assert
-from tests.common.utilities import wait_until
+from tests.common.helpers.sonic_db import SonicDbCli
+from tests.common.utilities import wait_until, wait_until_changed
 from collections.abc import Iterable
 
 logger = logging.getLogger(__name__)
@@ -19,6 +20,13 @@ DB_NAME_MAP = {
     CONFIG_DB: "CONFIG_DB"
 }
 
+# Database names of SonicDbCli
+SONIC_DB_NAME_MAP = {
+    APP_DB: "APPL_DB",
+    STATE_DB: "STATE_DB",
+    CONFIG_DB: "CONFIG_DB"
+}
+
 DB_SEPARATOR_MAP = {
     APP_DB: ":",
     STATE_DB: "|",
@@ -69,9 +77,9 @@ EXPECTED_TUNNEL_ROUTE_MAP = {
 }
 
 
-def wait_until_with_final_check(timeout, interval, delay, condition, *args, **kwargs):
+def wait_until_with_final_check(timeout, interval, delay, changes, condition, *args, **kwargs):
     """Always allow for extra check after timeout."""
-    check_result = wait_until(timeout, interval, delay, condition, *args, **kwargs)
+    check_result = wait_until_changed(timeout, interval, delay, changes, condition, *args, **kwargs)
     return check_result or condition(*args, **kwargs)
 
 
@@ -111,9 +119,13 @@ class DBChecker:
         return db_dump
 
     def verify_db(self, db):
+        # The mux tables are checked again as soon as they change, or every 10 seconds without notifications
+        patterns = [table + DB_SEPARATOR_MAP[db] + "*" for table in DB_CHECK_FIELD_MAP[db]]
+        with SonicDbCli(self.duthost, SONIC_DB_NAME_MAP[db]).watch(patterns) as changes:
+            check_result = wait_until_with_final_check(self.VERIFY_DB_TIMEOUT, 10, 0, changes,
+                                                       self.get_mismatched_ports, db)
         pytest_assert(
-            wait_until_with_final_check(self.VERIFY_DB_TIMEOUT, 10, 0,
-                                        self.get_mismatched_ports, db),
+            check_result,
             "Database states don't match expected state {state},"
             "incorrect {db_name} values {db_states}"
             .format(state=self.state, db_name=DB_NAME_MAP[db],
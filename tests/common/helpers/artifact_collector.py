@@ -0,0 +1,98 @@
+"""
+Collection of the files of a host as one compressed tar stream.
+
+This module must only use the python standard library, it is run on the DUT or the PTF host by collect_artifacts().
+All the files matching the requested paths are written as one tar stream, gzip compressed unless "compress" is false,
+so that they are collected in one round trip, or one fetch, instead of a fetch per file.
+
+Request, one JSON line on the standard input:
+    {"artifacts": [{"path": path or glob, "tail": lines, "max_size": bytes}, ...], "compress": true}
+    tail        only the last lines of the files are collected
+    max_size    files larger than max_size bytes are skipped
+Output:
+    tar stream, on the standard output or in the file given as argument. The files are stored at their absolute path
+    without the leading "/", with the index of their artifact in the "artifact" PAX header. The last member,
+    MANIFEST_NAME, is the JSON dict {"skipped": {path: reason}, "missing": [path]}.
+
+Usage on the DUT:
+    echo '{"artifacts": [{"path": "/var/log/syslog*", "tail": 1000}]}' | sudo python3 artifact_collector.py logs.tgz
+"""
+import glob
+import gzip
+import io
+import json
+import os
+import sys
+import tarfile
+
+MANIFEST_NAME = ".artifacts.json"
+COMPRESS_LEVEL = 1
+TAIL_BLOCK_SIZE = 1 << 16
+
+
+def tail(path, lines):
+    """Return the last lines of a file, read by blocks from its end."""
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        data = b""
+        # One more newline, the file usually ends with one
+        while end > 0 and data.count(b"\n") <= lines:
+            start = max(0, end - TAIL_BLOCK_SIZE)
+            f.seek(start)
+            data = f.read(end - start) + data
+            end = start
+    parts = data.split(b"\n")
+    # The last part is empty when the file ends with a newline
+    keep = lines + 1 if data.endswith(b"\n") else lines
+    return b"\n".join(parts[-keep:]) if len(parts) > keep else data
+
+
+def open_file(tar, path, index, artifact):
+    """Return the tar header and the content of a file, errors are raised before anything is written."""
+    info = tar.gettarinfo(path, arcname=os.path.abspath(path).lstrip("/"))
+    info.pax_headers = {"artifact": str(index)}
+    if artifact.get("tail"):
+        data = tail(path, int(artifact["tail"]))
+        info.size = len(data)
+        return info, io.BytesIO(data)
+    return info, open(path, "rb")
+
+
+def collect(artifacts, output, compress=True):
+    """Write the files of the artifacts as a tar stream to a binary output."""
+    manifest = {"skipped": {}, "missing": []}
+    stream = gzip.GzipFile(fileobj=output, mode="wb", compresslevel=COMPRESS_LEVEL) if compress else output
+    with tarfile.open(fileobj=stream, mode="w|", format=tarfile.PAX_FORMAT) as tar:
+        for index, artifact in enumerate(artifacts):
+            paths = sorted(path for path in glob.glob(artifact["path"]) if os.path.isfile(path))
+            if not paths:
+                manifest["missing"].append(artifact["path"])
+            for path in paths:
+                size = os.path.getsize(path)
+                if artifact.get("max_size") and size > artifact["max_size"]:
+                    manifest["skipped"][path] = "size {} larger than {}".format(size, artifact["max_size"])
+                    continue
+                try:
+                    info, content = open_file(tar, path, index, artifact)
+                except (IOError, OSError) as e:
+                    manifest["skipped"][path] = str(e)
+                    continue
+                with content:
+                    tar.addfile(info, content)
+        data = json.dumps(manifest).encode("utf-8")
+        info = tarfile.TarInfo(MANIFEST_NAME)
+        info.size = len(data)
+        tar.addfile(info, io.BytesIO(data))
+    if compress:
+        stream.close()
+
+
+if __name__ == "__main__":
+    request = json.loads(sys.stdin.readline())
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], "wb") as output:
+            collect(request["artifacts"], output, request.get("compress", True))
+    else:
+        collect(request["artifacts"], sys.stdout.buffer, request.get("compress", True))
+        sys.stdout.flush()
@@ -0,0 +1,165 @@
+"""
+Collection of the files of a host in one round trip, with artifact_collector.py run on the host.
+
+The files are sent as one tar stream, compressed on the host, and are extracted locally as the stream is received,
+instead of an ansible fetch per file, preceded by existence checks and archive tasks. Without SSH channel, the tar
+stream is written to a file on the host which is fetched.
+"""
+import gzip
+import json
+import logging
+import os
+import shlex
+import shutil
+import tarfile
+import tempfile
+import uuid
+from os.path import join, split
+
+from tests.common.connections.persistent_channel import PersistentChannel
+from tests.common.errors import RunAnsibleModuleFail
+from tests.common.helpers.artifact_collector import MANIFEST_NAME
+from tests.common.helpers.remote_script import REMOTE_SCRIPT_DIR, RemoteScript
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_COLLECTOR_FILE = join(split(__file__)[0], "artifact_collector.py")
+
+# Source of artifact_collector.py, read once
+_collector_source = None
+_collector_script = None
+
+
+def collector_source():
+    """Source of artifact_collector.py, run on the host with python3 -c."""
+    global _collector_source
+    if _collector_source is None:
+        with open(ARTIFACT_COLLECTOR_FILE) as stream:
+            _collector_source = stream.read()
+    return _collector_source
+
+
+def collector_script():
+    """artifact_collector.py, copied to the hosts without SSH channel."""
+    global _collector_script
+    if _collector_script is None:
+        _collector_script = RemoteScript(ARTIFACT_COLLECTOR_FILE)
+    return _collector_script
+
+
+def fetch_artifacts(host, request, artifacts, dest_dir):
+    """
+    Collect the files with the ansible modules, the tar stream is written to a file on the host which is fetched.
+    Large files, e.g. pcaps and techsupport dumps, are streamed to the local file like with a fetch per file.
+    """
+    remote_file = join(REMOTE_SCRIPT_DIR, "artifacts_{}.tar".format(uuid.uuid4().hex))
+    fd, local_file = tempfile.mkstemp(suffix=".tar")
+    os.close(fd)
+    try:
+        res = collector_script().run(host, shlex.quote(remote_file), stdin=json.dumps(request), verbose=False)
+        if res["rc"] != 0:
+            raise RunAnsibleModuleFail("Failed to collect artifacts of {}".format(host.hostname), res)
+        host.fetch(src=remote_file, dest=local_file, flat=True)
+        with open(local_file, "rb") as stream:
+            return extract(stream, artifacts, dest_dir)
+    finally:
+        host.shell("rm -f {}".format(shlex.quote(remote_file)), module_ignore_errors=True)
+        os.remove(local_file)
+
+
+class ArtifactChannel(PersistentChannel):
+    """SSH channel streaming the output of artifact_collector.py run on a SONiC host."""
+
+    def __init__(self, sonichost):
+        username, passwords = sonichost.channel_credentials()
+        super(ArtifactChannel, self).__init__(sonichost.mgmt_ip, username, passwords)
+
+    def executor_command(self):
+        return "sudo -n python3 -c {}".format(shlex.quote(collector_source()))
+
+    def stream(self, request):
+        """Start the collector, return its standard output."""
+        self._open()
+        self._stdin.write(json.dumps(request) + "\n")
+        self._stdin.flush()
+        self._stdin.channel.shutdown_write()
+        return self._stdout
+
+
+def extract(stream, artifacts, dest_dir):
+    """
+    Extract the files of a tar stream of artifact_collector.py as it is read.
+
+    Returns:
+        tuple: ({remote path: local path} of the extracted files, manifest of the collector)
+    """
+    collected = {}
+    manifest = {}
+    with tarfile.open(fileobj=stream, mode="r|*") as tar:
+        for member in tar:
+            if member.name == MANIFEST_NAME:
+                manifest = json.load(tar.extractfile(member))
+                continue
+            path = os.path.normpath(member.name)
+            if not member.isfile() or "artifact" not in member.pax_headers or path.startswith(".."):
+                continue
+            artifact = artifacts[int(member.pax_headers["artifact"])]
+            local_path = artifact.get("dest") or join(dest_dir, path)
+            if os.path.dirname(local_path):
+                os.makedirs(os.path.dirname(local_path), exist_ok=True)
+            with (gzip.open if artifact.get("gzip") else open)(local_path, "wb") as f:
+                shutil.copyfileobj(tar.extractfile(member), f)
+            collected["/" + path] = local_path
+    return collected, manifest
+
+
+def collect_artifacts(host, artifacts, dest_dir=".", compress=True, fail_on_missing=False):
+    """
+    Collect files of a host in one round trip.
+
+    The files are read from an SSH channel on a SONiC host. On other hosts, e.g. the PTF host, and when the channel
+    can't be opened, they are written to one tar file on the host by an ansible shell module call, which is fetched.
+
+    Args:
+        host: SonicHost, SonicAsic or other ansible host, e.g. PTFHost.
+        artifacts (list): Dicts with keys:
+            path (str): Remote path or glob.
+            dest (str): Optional local path of the file, for a path matching one file.
+            tail (int): Optional, only the last lines of the files are collected.
+            max_size (int): Optional, the files larger than max_size bytes are skipped.
+            gzip (bool): Optional, the local files are gzip compressed.
+        dest_dir (str): Local directory of the files of the artifacts without dest, stored at their remote path.
+        compress (bool): Compress the stream, False for files which are already compressed.
+        fail_on_missing (bool): Raise an error if a path doesn't match any file, like fetch.
+
+    Returns:
+        dict: {remote path: local path} of the collected files.
+
+    Raises:
+        IOError: If fail_on_missing and a path doesn't match any file.
+    """
+    request = {"artifacts": [dict((k, v) for k, v in artifact.items() if k in ["path", "tail", "max_size"])
+                             for artifact in artifacts], "compress": compress}
+    sonichost = getattr(host, "sonichost", host)
+    result = None
+    if hasattr(sonichost, "channel_credentials"):
+        channel = ArtifactChannel(sonichost)
+        try:
+            result = extract(channel.stream(request), artifacts, dest_dir)
+        except Exception as e:
+            logger.warning("Failed to collect artifacts of {} over SSH, fall back to ansible: {}".format(
+                sonichost.hostname, repr(e)))
+        finally:
+            channel.close()
+    if result is None:
+        result = fetch_artifacts(sonichost, request, artifacts, dest_dir)
+
+    collected, manifest = result
+    for path, reason in manifest.get("skipped", {}).items():
+        logger.warning("Artifact {} of {} not collected: {}".format(path, sonichost.hostname, reason))
+    if manifest.get("missing"):
+        if fail_on_missing:
+            raise IOError("Artifacts not found on {}: {}".format(sonichost.hostname, manifest["missing"]))
+        logger.debug("Artifacts not found on {}: {}".format(sonichost.hostname, manifest["missing"]))
+    logger.debug("Collected artifacts of {}: {}".format(sonichost.hostname, collected))
+    return collected
@@ -0,0 +1,486 @@
+"""
+Persistent PTF test execution server.
+
+This module must only use the python standard library and ptf, it is run in the PTF container by ptf_runner. The ptf
+CLI imports scapy and ptf, loads the modules of the test directory and opens every dataplane port for each test. The
+server does it once: the imported test modules and the dataplane are kept between the runs, the dataplane is only
+rebuilt when its options or the interfaces of the platform change.
+
+Requests are read from TCP connections, one JSON line per connection, and the tests are run one at a time in the main
+thread, the test case timeout of ptf uses SIGALRM. The server only listens on the address used by the clients, and
+every request must carry the secret of the test session, read from --secret-file which is deleted once read:
+    {"op": "run", "test_dir": dir, "test": "module.Class" or "module", "test_params": "k=repr(v);...",
+     "platform": name, "platform_dir": dir, "qlen": n, "relax": bool, "debug": level, "log_file": path,
+     "socket_recv_size": n, "device_sockets": ["0-{1,2}@addr", ...], "timeout": seconds}
+    {"op": "ping"}
+    {"op": "shutdown"}
+    with "secret": secret in each request. The options of "run" are the ones of the ptf CLI, the log file must be in
+    --log-dir, relative paths are relative to it. Replies are JSON lines: {"stdout": text} and {"stderr": text} while
+the test runs, then {"rc": rc, "start": time, "end": time, "delta": time} with the exit code of the ptf CLI. "ping" and
+"shutdown" reply {"token": token, "pid": pid}. Requests without the secret are rejected with {"error": message}.
+
+Usage in the PTF container:
+    python3 ptf_server.py --bind <mgmt ip> --port 10990 --token <token checked by the clients> \
+        --secret-file <file with the session secret> --log-dir /tmp --pid-file /tmp/ptf_server.pid
+"""
+import argparse
+import hmac
+import importlib.machinery
+import importlib.util
+import json
+import logging
+import os
+import random
+import signal
+import socket
+import sys
+import threading
+import time
+import types
+import unittest
+from datetime import datetime
+
+import ptf
+
+# Maximum size of a request, and time to receive it, so that a connection can't block the server
+MAX_REQUEST_SIZE = 1 << 20
+REQUEST_TIMEOUT = 10
+
+DEBUG_LEVELS = {
+    "debug": logging.DEBUG,
+    "verbose": logging.DEBUG,
+    "info": logging.INFO,
+    "warning": logging.WARNING,
+    "warn": logging.WARNING,
+    "error": logging.ERROR,
+    "critical": logging.CRITICAL,
+}
+
+# Default configuration of the ptf CLI
+CONFIG_DEFAULT = {
+    "list": False,
+    "list_test_names": False,
+    "allow_user": False,
+    "test_spec": "",
+    "test_file": None,
+    "test_dir": None,
+    "test_order": "default",
+    "test_order_seed": 0xABA,
+    "num_shards": 1,
+    "shard_id": 0,
+    "platform": "eth",
+    "platform_args": None,
+    "platform_dir": None,
+    "interfaces": [],
+    "port_info": {},
+    "device_sockets": [],
+    "log_file": "ptf.log",
+    "log_dir": None,
+    "debug": "verbose",
+    "profile": False,
+    "profile_file": "profile.out",
+    "xunit": False,
+    "xunit_dir": "xunit",
+    "relax": False,
+    "test_params": None,
+    "failfast": False,
+    "fail_skipped": False,
+    "default_timeout": 2.0,
+    "default_negative_timeout": 0.1,
+    "minsize": 0,
+    "random_seed": None,
+    "disable_ipv6": False,
+    "disable_vxlan": False,
+    "disable_erspan": False,
+    "disable_geneve": False,
+    "disable_mpls": False,
+    "disable_nvgre": False,
+    "disable_igmp": False,
+    "disable_rocev2": False,
+    "qlen": 100,
+    "test_case_timeout": None,
+    "socket_recv_size": 4096,
+    "port_map": None,
+    "packet_manipulation_module": os.getenv("PTF_PACKET_MANIPULATION_MODULE", "ptf.packet_scapy"),
+}
+
+
+class RunError(Exception):
+    """Test run request which can't be run, reported like the errors of the ptf CLI."""
+    pass
+
+
+def parse_device_socket(value):
+    """Parse a --device-socket option of the ptf CLI, e.g. 0-{1,2,5-8}@tcp://127.0.0.1:10900."""
+    try:
+        dev_and_ports, addr = value.split("@", 1)
+        if dev_and_ports[0] == "{":
+            dev, ports = "0", dev_and_ports
+        else:
+            dev, ports = dev_and_ports.split("-", 1)
+        port_set = set()
+        for port in ports.strip("{}").split(","):
+            first, _, last = port.partition("-")
+            port_set.update(range(int(first), int(last or first) + 1))
+        return int(dev), port_set, addr
+    except ValueError:
+        raise RunError("incorrect device-socket syntax: {}".format(value))
+
+
+def test_params_parse(test_params):
+    """Parse the --test-params option of the ptf CLI, [k=v;]*k=v with python values."""
+    if test_params is None:
+        return None
+    namespace = {}
+    try:
+        exec("class _TestParams:\n    " + test_params, namespace)
+    except Exception as e:
+        raise RunError("Error when parsing test params: {}".format(e))
+    return dict((k, v) for k, v in vars(namespace["_TestParams"]).items() if k[:2] != "__")
+
+
+def apply_test_timeout(test, default_test_case_timeout=None):
+    original_run = test.run
+
+    def run_with_timeout(self, result=None):
+        from ptf.ptfutils import Timeout
+
+        test_case_timeout = getattr(self, "_testtimeout", None)
+        if test_case_timeout is None:
+            test_case_timeout = default_test_case_timeout
+        if test_case_timeout:
+            with Timeout(test_case_timeout):
+                return original_run(result)
+        return original_run(result)
+
+    test.run = types.MethodType(run_with_timeout, test)
+    return test
+
+
+def ifindex(ifname):
+    """Index of an interface, a port of the dataplane must be reopened if its interface is recreated."""
+    try:
+        with open("/sys/class/net/{}/ifindex".format(ifname)) as f:
+            return int(f.read())
+    except (IOError, ValueError):
+        return None
+
+
+class OutputStream(object):
+    """Line buffered file object sending what is written as JSON lines on a connection, e.g. {"stdout": text}."""
+
+    def __init__(self, conn, name, lock):
+        self.conn = conn
+        self.name = name
+        self.lock = lock
+        self.buffer = ""
+
+    def write(self, data):
+        with self.lock:
+            self.buffer += data
+            end = self.buffer.rfind("\n") + 1
+            if end:
+                send(self.conn, {self.name: self.buffer[:end]})
+                self.buffer = self.buffer[end:]
+        return len(data)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        with self.lock:
+            if self.buffer:
+                send(self.conn, {self.name: self.buffer})
+                self.buffer = ""
+
+    def isatty(self):
+        return False
+
+
+def send(conn, message):
+    """Send a JSON line, errors are ignored: the client may be gone while threads of a test still log."""
+    try:
+        conn.sendall((json.dumps(message) + "\n").encode("utf-8"))
+    except (OSError, ValueError):
+        pass
+
+
+class PtfServer(object):
+    """Runs PTF tests in the server process, with the test modules and the dataplane kept between runs."""
+
+    def __init__(self, token, secret, log_dir):
+        self.token = token
+        self.secret = secret
+        self.log_dir = os.path.realpath(log_dir)
+        self.test_dir = None
+        self.platforms = {}
+        self.dataplane_key = None
+
+        # Same global configuration as the ptf CLI, the test modules keep a reference to ptf.config
+        ptf.config.update(CONFIG_DEFAULT)
+        # After the configuration, ptf.packet imports the packet manipulation module of the config (scapy)
+        importlib.import_module("ptf.testutils")
+        importlib.import_module("ptf.ptfutils")
+
+    def handle(self, conn):
+        """Handle a connection, returns False to stop the server."""
+        conn.settimeout(REQUEST_TIMEOUT)
+        request = json.loads(conn.makefile("rb").readline(MAX_REQUEST_SIZE) or "{}")
+        conn.settimeout(None)
+        if not isinstance(request, dict) or not hmac.compare_digest(str(request.get("secret")), self.secret):
+            logging.warning("Rejected a request without the secret from {}".format(conn.getpeername()))
+            send(conn, {"error": "Unauthorized request"})
+            return True
+        op = request.get("op")
+        if op == "run":
+            self.run(conn, request)
+        elif op in ["ping", "shutdown"]:
+            send(conn, {"token": self.token, "pid": os.getpid()})
+        else:
+            send(conn, {"error": "Unknown request: {}".format(op)})
+        return op != "shutdown"
+
+    def run(self, conn, request):
+        start = datetime.now()
+        lock = threading.Lock()
+        stdout, stderr = sys.stdout, sys.stderr
+        sys.stdout = OutputStream(conn, "stdout", lock)
+        sys.stderr = OutputStream(conn, "stderr", lock)
+        try:
+            rc = self.run_tests(request)
+        except RunError as e:
+            logging.critical(str(e))
+            sys.stderr.write(str(e) + "\n")
+            rc = 1
+        except Exception:
+            logging.exception("Exception while running the tests")
+            rc = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            sys.stdout, sys.stderr = stdout, stderr
+        end = datetime.now()
+        with lock:
+            send(conn, {"rc": rc, "start": str(start), "end": str(end), "delta": str(end - start)})
+
+    def configure(self, request):
+        """Reset the global configuration of ptf for a run, like the ptf CLI starting with the request options."""
+        config = dict(CONFIG_DEFAULT)
+        for key in ["test_dir", "platform", "platform_dir", "qlen", "relax", "debug", "log_file", "socket_recv_size",
+                    "test_params"]:
+            if request.get(key) is not None:
+                config[key] = request[key]
+        config["device_sockets"] = [parse_device_socket(value) for value in request.get("device_sockets") or []]
+        config["test_case_timeout"] = request.get("timeout") or None
+        if config["debug"] not in DEBUG_LEVELS:
+            raise RunError("Invalid debug level: {}".format(config["debug"]))
+        config["log_file"] = self.log_path(config["log_file"])
+        if not config["test_dir"] or not os.path.isdir(config["test_dir"]):
+            raise RunError("invalid value for --test-dir: directory {} does not exist".format(config["test_dir"]))
+        ptf.config.clear()
+        ptf.config.update(config)
+
+        logging.getLogger().setLevel(DEBUG_LEVELS[config["debug"]])
+        if os.path.exists(config["log_file"]):
+            os.remove(config["log_file"])
+        ptf.open_logfile("main")
+        logging.info("++++++++ " + time.asctime() + " ++++++++")
+
+        ptf.testutils.TEST_PARAMS = test_params_parse(config["test_params"])
+        ptf.testutils.PORT_INFO = config["port_info"]
+        ptf.testutils.skipped_test_count = 0
+        ptf.testutils.MINSIZE = config["minsize"]
+        ptf.ptfutils.default_timeout = config["default_timeout"]
+        ptf.ptfutils.default_negative_timeout = config["default_negative_timeout"]
+
+    def log_path(self, log_file):
+        """Path of a log file, which must be in the log directory: the server removes it and writes it as root."""
+        path = os.path.realpath(os.path.join(self.log_dir, log_file))
+        if not path.startswith(self.log_dir.rstrip(os.sep) + os.sep):
+            raise RunError("invalid value for --log-file: {} is not in {}".format(log_file, self.log_dir))
+        return path
+
+    def load_module(self, test_dir, modname):
+        """Import a test module once, the modules of the previous test directory are dropped when it changes."""
+        test_dir = os.path.abspath(test_dir)
+        if test_dir != self.test_dir:
+            if self.test_dir:
+                sys.path.remove(self.test_dir)
+                for name, mod in list(sys.modules.items()):
+                    if os.path.abspath(getattr(mod, "__file__", None) or "/").startswith(self.test_dir + os.sep):
+                        del sys.modules[name]
+            # Allow tests to import each other
+            sys.path.append(test_dir)
+            self.test_dir = test_dir
+        if modname not in sys.modules:
+            spec = importlib.machinery.PathFinder().find_spec(modname, [test_dir])
+            if spec is None:
+                raise RunError("test-spec element {} did not match any tests".format(modname))
+            logging.info("Importing test module {}".format(modname))
+            mod = importlib.util.module_from_spec(spec)
+            sys.modules[modname] = mod
+            try:
+                spec.loader.exec_module(mod)
+            except Exception:
+                del sys.modules[modname]
+                raise
+        return sys.modules[modname]
+
+    def load_tests(self, test_dir, test_spec):
+        """Test cases of a test spec, a test "module.Class" or all the enabled tests of a module."""
+        modname, _, testname = test_spec.partition(".")
+        mod = self.load_module(test_dir, modname)
+        tests = [v for k, v in mod.__dict__.items()
+                 if isinstance(v, type) and issubclass(v, unittest.TestCase) and hasattr(v, "runTest") and
+                 (k == testname if testname else not getattr(v, "_disabled", False))]
+        if not tests:
+            raise RunError("test-spec element {} did not match any tests".format(test_spec))
+        return tests
+
+    def setup_dataplane(self):
+        """Build the port map of the platform, reuse the dataplane if it is unchanged."""
+        config = ptf.config
+        if config["platform_dir"] is None:
+            from ptf import platforms
+            config["platform_dir"] = os.path.dirname(os.path.abspath(platforms.__file__))
+        platform_key = (os.path.abspath(config["platform_dir"]), config["platform"])
+        if platform_key not in self.platforms:
+            # Allow platforms to import each other
+            sys.path.append(platform_key[0])
+            logging.info("Importing platform: " + config["platform"])
+            spec = importlib.machinery.PathFinder().find_spec(config["platform"], [platform_key[0]])
+            if spec is None:
+                raise RunError("Failed to import {} platform module".format(config["platform"]))
+            mod = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(mod)
+            self.platforms[platform_key] = mod
+        self.platforms[platform_key].platform_config_update(config)
+        if config["port_map"] is None:
+            raise RunError("Interface port map was not defined by the platform. Exiting.")
+        logging.info("port map: " + str(config["port_map"]))
+
+        ports = sorted((port_id, ifname, ifindex(ifname)) for port_id, ifname in config["port_map"].items())
+        key = (platform_key, config["qlen"], config["socket_recv_size"], repr(config["device_sockets"]), ports)
+        dataplane = ptf.dataplane_instance
+        if dataplane is not None and key == self.dataplane_key:
+            with dataplane.cvar:
+                dataplane.config = config
+                dataplane.rx_counters.clear()
+                dataplane.tx_counters.clear()
+            dataplane.flush()
+            return
+        self.kill_dataplane()
+        if config["port_map"]:
+            importlib.import_module("ptf.dataplane")
+            logging.info("Starting the dataplane")
+            ptf.dataplane_instance = ptf.dataplane.DataPlane(config)
+            for port_id, ifname in config["port_map"].items():
+                device, port = port_id
+                ptf.dataplane_instance.port_add(ifname, device, port)
+        self.dataplane_key = key
+
+    def kill_dataplane(self):
+        if ptf.dataplane_instance is not None:
+            ptf.dataplane_instance.kill()
+            ptf.dataplane_instance = None
+        self.dataplane_key = None
+
+    def run_tests(self, request):
+        """Run the tests of a request like the ptf CLI, return its exit code."""
+        self.configure(request)
+        config = ptf.config
+        tests = self.load_tests(config["test_dir"], request["test"])
+        try:
+            self.setup_dataplane()
+        except Exception:
+            self.kill_dataplane()
+            raise
+        dataplane = ptf.dataplane_instance
+
+        seed = random.randrange(100000000)
+        logging.info("Autogen random seed: %d" % seed)
+        random.seed(seed)
+
+        if dataplane is not None:
+            dataplane.start_pcap(os.path.splitext(config["log_file"])[0] + ".pcap")
+        logging.info("*** TEST RUN START: " + time.asctime())
+        suite = unittest.TestSuite([apply_test_timeout(test(), config["test_case_timeout"]) for test in tests])
+        try:
+            result = unittest.TextTestRunner(stream=sys.stderr, verbosity=2).run(suite)
+        finally:
+            if dataplane is not None:
+                dataplane.stop_pcap()
+        timeouts = [case for case in result.errors if "raise Timeout.TimeoutError()" in case[1]]
+        if timeouts:
+            logging.info("Test case failed because of timeout")
+
+        ptf.open_logfile("main")
+        skipped = ptf.testutils.skipped_test_count
+        if skipped > 0:
+            logging.info("Skipped {} test{}".format(skipped, "s" if skipped > 1 else ""))
+            print("Skipped {} test{}".format(skipped, "s" if skipped > 1 else ""))
+        logging.info("*** TEST RUN END  : " + time.asctime())
+        if not result.failures and not result.errors:
+            return 0
+        print()
+        print("******************************************")
+        print("ATTENTION: SOME TESTS DID NOT PASS!!!")
+        for title, cases in [("failed", result.failures), ("errored", result.errors),
+                             ("errored because of a timeout", timeouts)]:
+            if cases:
+                print()
+                print("The following tests {}:".format(title))
+                print(", ".join([case[0].__class__.__name__ for case in cases]))
+        print()
+        print("******************************************")
+        return 1
+
+    def serve(self, server_sock):
+        logging.info("PTF server {} listening on port {}".format(os.getpid(), server_sock.getsockname()[1]))
+        while True:
+            conn, _ = server_sock.accept()
+            try:
+                if not self.handle(conn):
+                    break
+            except Exception:
+                logging.exception("Failed to handle a request")
+            finally:
+                conn.close()
+        # The port is free for a new server once the connections are refused
+        server_sock.close()
+        self.kill_dataplane()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Persistent PTF test execution server")
+    parser.add_argument("--bind", required=True, help="Address of the server, the one used by the clients")
+    parser.add_argument("--port", type=int, required=True, help="TCP port of the server")
+    parser.add_argument("--token", default="", help="Token returned to ping requests")
+    parser.add_argument("--secret-file", required=True, help="File with the secret of the requests, deleted once read")
+    parser.add_argument("--log-dir", default="/tmp", help="Directory of the log files of the tests")
+    parser.add_argument("--pid-file", help="File with the pid of the server, to stop it")
+    args = parser.parse_args()
+
+    with open(args.secret_file) as f:
+        secret = f.read().strip()
+    os.remove(args.secret_file)
+    if not secret:
+        sys.exit("Empty secret in {}".format(args.secret_file))
+
+    family = socket.AF_INET6 if ":" in args.bind else socket.AF_INET
+    server_sock = socket.create_server((args.bind, args.port), family=family)
+    if args.pid_file:
+        with open(args.pid_file, "w") as f:
+            f.write(str(os.getpid()))
+    # Same as the ptf CLI, exiting from KeyboardInterrupt waits for the threads of the tests
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    try:
+        PtfServer(args.token, secret, args.log_dir).serve(server_sock)
+    finally:
+        if args.pid_file and os.path.exists(args.pid_file):
+            os.remove(args.pid_file)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""
+Bulk access to a SONiC redis database in one pipelined session.
+
+This module must only use the python standard library, it is run on the DUT by SonicDbCli.bulk(). The database is
+located like sonic-db-cli does, from the database_config.json of the namespace, and all the requests are sent over
+one redis connection: the SCAN of every pattern progresses in parallel, then the HGET and HGETALL commands are
+pipelined by PIPELINE_SIZE commands.
+
+Requests, results are in the same order:
+    ["scan", pattern]                list of the keys matching pattern
+    ["hget", key, field]             value of the field, or None
+    ["hgetall", key]                 dict of the fields of the key, {} if the key doesn't exist
+    ["scan_hget", pattern, field]    {key: value of the field or None} for the keys matching pattern
+    ["scan_hgetall", pattern]        {key: dict of the fields} for the keys matching pattern
+
+With "watch" instead of "requests", the keyspace notifications of the keys matching the watched patterns are
+streamed, one JSON line per notification, until the standard input is closed.
+
+Usage on the DUT:
+    echo '{"db": "ASIC_DB", "namespace": "", "requests": [["scan", "ASIC_STATE:*"]]}' | python3 redis_bulk.py
+    echo '{"db": "STATE_DB", "namespace": "", "watch": ["PORT_TABLE|*"]}' | python3 -u redis_bulk.py
+Output:
+    JSON list of the results
+    For "watch": {"subscribed": number of patterns} once the notifications are subscribed, then {"key": key,
+    "event": event} for each notification, or {"error": str} if keyspace notifications are not enabled.
+"""
+import json
+import os
+import socket
+import sys
+import threading
+
+
+DB_CONFIG_DIR = "/var/run/redis/sonic-db"
+DB_CONFIG_FILE = "database_config.json"
+DB_GLOBAL_CONFIG_FILE = "database_global.json"
+SCAN_COUNT = 1000
+PIPELINE_SIZE = 1000
+CONNECT_TIMEOUT = 30
+
+
+class RedisError(Exception):
+    pass
+
+
+def load_db_config(namespace="", config_dir=DB_CONFIG_DIR):
+    """Return the database config of a namespace, like swsscommon SonicDBConfig."""
+    if not namespace:
+        with open(os.path.join(config_dir, DB_CONFIG_FILE)) as f:
+            return json.load(f)
+    with open(os.path.join(config_dir, DB_GLOBAL_CONFIG_FILE)) as f:
+        includes = json.load(f)["INCLUDES"]
+    for include in includes:
+        if include.get("namespace", "") == namespace:
+            with open(os.path.normpath(os.path.join(config_dir, include["include"]))) as f:
+                return json.load(f)
+    raise ValueError("Namespace {} not found in {}".format(namespace, DB_GLOBAL_CONFIG_FILE))
+
+
+def encode_command(args):
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if not isinstance(arg, bytes):
+            arg = str(arg).encode("utf-8")
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+
+def decode(value):
+    if isinstance(value, bytes):
+        return value.decode("utf-8", "replace")
+    if isinstance(value, list):
+        return [decode(item) for item in value]
+    return value
+
+
+class RedisConnection(object):
+    """Minimal redis client, sends commands in pipelines and decodes the replies."""
+
+    def __init__(self, instance):
+        path = instance.get("unix_socket_path")
+        if path and os.path.exists(path):
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._sock.settimeout(CONNECT_TIMEOUT)
+            self._sock.connect(path)
+        else:
+            self._sock = socket.create_connection((instance["hostname"], int(instance["port"])), CONNECT_TIMEOUT)
+        self._sock.settimeout(None)
+        self._reader = self._sock.makefile("rb")
+
+    def close(self):
+        self._reader.close()
+        self._sock.close()
+
+    def send(self, command):
+        self._sock.sendall(encode_command(command))
+
+    def read_reply(self):
+        """Read one reply, e.g. a message of a subscription."""
+        reply = self._read_reply()
+        if isinstance(reply, RedisError):
+            raise reply
+        return decode(reply)
+
+    def _read_reply(self):
+        line = self._reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise RedisError("Connection closed by the redis server")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload
+        if kind == b"-":
+            return RedisError(payload.decode("utf-8", "replace"))
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            return self._reader.read(length + 2)[:-2]
+        if kind == b"*":
+            length = int(payload)
+            if length < 0:
+                return None
+            return [self._read_reply() for _ in range(length)]
+        raise RedisError("Unexpected reply: {!r}".format(line))
+
+    def execute(self, commands):
+        """Run the commands in pipelines of PIPELINE_SIZE, return their decoded replies."""
+        replies = []
+        for start in range(0, len(commands), PIPELINE_SIZE):
+            batch = commands[start:start + PIPELINE_SIZE]
+            self._sock.sendall(b"".join(encode_command(command) for command in batch))
+            replies.extend(self._read_reply() for _ in batch)
+        for command, reply in zip(commands, replies):
+            if isinstance(reply, RedisError):
+                raise RedisError("{}: {}".format(" ".join(str(arg) for arg in command), reply))
+        return [decode(reply) for reply in replies]
+
+    def scan(self, patterns):
+        """Return {pattern: keys} for all the patterns, their SCAN cursors progress in the same pipelines."""
+        keys = {pattern: [] for pattern in patterns}
+        seen = {pattern: set() for pattern in patterns}
+        cursors = {pattern: "0" for pattern in patterns}
+        while cursors:
+            pending = list(cursors)
+            replies = self.execute([["SCAN", cursors[pattern], "MATCH", pattern, "COUNT", SCAN_COUNT]
+                                    for pattern in pending])
+            for pattern, (cursor, batch) in zip(pending, replies):
+                # SCAN may return a key more than once
+                for key in batch:
+                    if key not in seen[pattern]:
+                        seen[pattern].add(key)
+                        keys[pattern].append(key)
+                if cursor == "0":
+                    del cursors[pattern]
+                else:
+                    cursors[pattern] = cursor
+        return keys
+
+
+def hash_fields(reply):
+    return dict(zip(reply[0::2], reply[1::2]))
+
+
+def run(conn, requests):
+    """Run the bulk requests on a connection, return their results."""
+    scans = conn.scan(sorted(set(request[1] for request in requests if request[0].startswith("scan"))))
+
+    # Commands of each request, then the results are built from their replies
+    commands = []
+    for request in requests:
+        op = request[0]
+        if op == "hget":
+            commands.append(["HGET", request[1], request[2]])
+        elif op == "hgetall":
+            commands.append(["HGETALL", request[1]])
+        elif op == "scan_hget":
+            commands.extend(["HGET", key, request[2]] for key in scans[request[1]])
+        elif op == "scan_hgetall":
+            commands.extend(["HGETALL", key] for key in scans[request[1]])
+        elif op != "scan":
+            raise ValueError("Unknown request: {}".format(request))
+    replies = iter(conn.execute(commands))
+
+    results = []
+    for request in requests:
+        op = request[0]
+        if op == "scan":
+            results.append(scans[request[1]])
+        elif op == "hget":
+            results.append(next(replies))
+        elif op == "hgetall":
+            results.append(hash_fields(next(replies)))
+        elif op == "scan_hget":
+            results.append({key: next(replies) for key in scans[request[1]]})
+        else:
+            results.append({key: hash_fields(next(replies)) for key in scans[request[1]]})
+    return results
+
+
+def connect(db, namespace="", config_dir=DB_CONFIG_DIR):
+    """Return a connection to the redis instance of a database, and the index of the database."""
+    config = load_db_config(namespace, config_dir)
+    database = config["DATABASES"][db]
+    return RedisConnection(config["INSTANCES"][database["instance"]]), database["id"]
+
+
+def bulk(db, requests, namespace="", config_dir=DB_CONFIG_DIR):
+    """Run the bulk requests on a database of a namespace, e.g. bulk("APPL_DB", [["scan", "PORT_TABLE:*"]])."""
+    conn, db_id = connect(db, namespace, config_dir)
+    try:
+        conn.execute([["SELECT", db_id]])
+        return run(conn, requests)
+    finally:
+        conn.close()
+
+
+def keyspace_notifications_enabled(flags):
+    """Whether notify-keyspace-events flags include keyspace events of at least one class of commands."""
+    return "K" in flags and bool(set(flags) - set("KE"))
+
+
+def watch(db, patterns, output, namespace="", config_dir=DB_CONFIG_DIR):
+    """Write the keyspace notifications of the keys of a database matching patterns to output, never returns."""
+    conn, db_id = connect(db, namespace, config_dir)
+    flags = conn.execute([["CONFIG", "GET", "notify-keyspace-events"]])[0]
+    if not keyspace_notifications_enabled(flags[1] if len(flags) == 2 else ""):
+        output.write(json.dumps({"error": "Keyspace notifications are not enabled: {}".format(flags)}) + "\n")
+        output.flush()
+        return
+    prefix = "__keyspace@{}__:".format(db_id)
+    # One confirmation per pattern
+    conn.send(["PSUBSCRIBE"] + [prefix + pattern for pattern in patterns])
+    for _ in patterns:
+        conn.read_reply()
+    output.write(json.dumps({"subscribed": len(patterns)}) + "\n")
+    output.flush()
+    while True:
+        message = conn.read_reply()
+        if message[0] == "pmessage":
+            output.write(json.dumps({"key": message[2][len(prefix):], "event": message[3]}) + "\n")
+            output.flush()
+
+
+def exit_on_eof(stream):
+    """Exit when the stream is closed, e.g. when the SSH channel running the watch is closed."""
+    while stream.readline():
+        pass
+    os._exit(0)
+
+
+if __name__ == "__main__":
+    request = json.loads(sys.stdin.readline())
+    if "watch" in request:
+        threading.Thread(target=exit_on_eof, args=(sys.stdin,), daemon=True).start()
+        watch(request["db"], request["watch"], sys.stdout, request.get("namespace", ""))
+    else:
+        sys.stdout.write(json.dumps(bulk(request["db"], request["requests"], request.get("namespace", ""))))
@@ -0,0 +1,89 @@
+"""
+Python scripts of the test tree run on the DUT or the PTF host by path.
+
+A script is copied to the host once per test session, under a name with the hash of its source so that the sessions
+running other versions of the script don't overwrite it, and is then run by path. Ansible logs the arguments of the
+modules to the syslog of the host, running the scripts with "python3 -c <source>" would log the whole source on every
+call.
+"""
+import hashlib
+import logging
+import os
+import shlex
+
+logger = logging.getLogger(__name__)
+
+REMOTE_SCRIPT_DIR = "/tmp"
+
+
+class RemoteScript(object):
+    """Python script copied once per session to the hosts it is run on."""
+
+    # (hostname, remote path) of the scripts copied in this session
+    _copied = set()
+
+    def __init__(self, src, modules=()):
+        """
+        Args:
+            src (str): Local path of the script.
+            modules (list): Local paths of the python modules imported by the script. They are copied with the script
+                to a directory of their own, under their original names.
+        """
+        self.src = src
+        self.modules = list(modules)
+        sha1 = hashlib.sha1()
+        for path in [src] + self.modules:
+            with open(path, "rb") as stream:
+                sha1.update(stream.read())
+        digest = sha1.hexdigest()[:12]
+        name, ext = os.path.splitext(os.path.basename(src))
+        if self.modules:
+            self.path = os.path.join(REMOTE_SCRIPT_DIR, "{}_{}".format(name, digest), os.path.basename(src))
+        else:
+            self.path = os.path.join(REMOTE_SCRIPT_DIR, "{}_{}{}".format(name, digest, ext))
+
+    def copy(self, host):
+        """Copy the script and its modules to the host."""
+        logger.debug("Copy {} to {}:{}".format(self.src, host.hostname, self.path))
+        if self.modules:
+            # The directory is created by the copy module when dest ends with "/"
+            for src in [self.src] + self.modules:
+                host.copy(src=src, dest=os.path.dirname(self.path) + "/")
+        else:
+            host.copy(src=self.src, dest=self.path)
+        RemoteScript._copied.add((host.hostname, self.path))
+
+    def copy_once(self, host):
+        """Copy the script to the host if it was not copied in this session."""
+        if (host.hostname, self.path) not in RemoteScript._copied:
+            self.copy(host)
+
+    def command(self, args="", python="python3", sudo=False):
+        """Command running the script with the arguments, a string quoted for the shell."""
+        return "{}{} {}{}".format("sudo " if sudo else "", python, shlex.quote(self.path),
+                                  " " + args if args else "")
+
+    def run(self, host, args="", module="shell", python="python3", sudo=False, **kwargs):
+        """
+        Run the script on a host, the script is copied first if it was not copied in this session.
+
+        Args:
+            host: Ansible host, e.g. SonicHost or PTFHost.
+            args (str): Arguments of the script, quoted for the shell.
+            module (str): Ansible module running the command, "shell" or "command".
+            python (str): Python interpreter.
+            sudo (bool): Run the script with sudo.
+            kwargs: Other arguments of the module, e.g. stdin.
+
+        Returns:
+            dict: Result of the module, errors are ignored and must be checked by the caller with the "rc" of the
+                result.
+        """
+        self.copy_once(host)
+        cmd = self.command(args, python=python, sudo=sudo)
+        result = getattr(host, module)(cmd, module_ignore_errors=True, **kwargs)
+        if result.get("rc") and "can't open file" in result.get("stderr", ""):
+            # Removed from the host since it was copied, e.g. the host was rebooted
+            self.copy(host)
+            result = getattr(host, module)(cmd, module_ignore_errors=True, **kwargs)
+        return result
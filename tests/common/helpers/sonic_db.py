@@ -1,77 +1,141 @@
+import contextlib
 import logging
 import json
-import six
-import ast
+import threading
+import time
+from os.path import join, split
+from tests.common.connections.persistent_channel import PersistentChannel
 from tests.common.helpers.constants import DEFAULT_NAMESPACE
+from tests.common.helpers.remote_script import RemoteScript
 from tests.common.devices.sonic_asic import SonicAsic
 
 logger = logging.getLogger(__name__)
 
+REDIS_BULK_FILE = join(split(__file__)[0], "redis_bulk.py")
+# Seconds to wait for the subscription of keyspace notifications
+WATCH_READY_TIMEOUT = 20
+
 
 class SonicDbCli(object):
-    """Base class for interface to SonicDb using sonic-db-cli command.
+    """Base class for interface to SonicDb, with pipelined redis sessions run on the DUT (see redis_bulk.py).
 
         Attributes:
             host: a SonicHost or SonicAsic.  Commands will be run on this shell.
             database: database number.
         """
 
+    # redis_bulk.py, copied to the DUT once per session
+    _bulk_script = None
+
     def __init__(self, host, database='APPL_DB'):
         """Initializes base class with defaults"""
         self.host = host
         self.database = database
 
-    def _cli_prefix(self):
-        """Builds opening of sonic-db-cli command for other methods."""
-        return " {db} ".format(db=self.database)
+    @staticmethod
+    def bulk_script():
+        """redis_bulk.py, run on the DUT by path."""
+        if SonicDbCli._bulk_script is None:
+            SonicDbCli._bulk_script = RemoteScript(REDIS_BULK_FILE)
+        return SonicDbCli._bulk_script
+
+    def bulk_request(self):
+        """Database and namespace of a redis_bulk.py request."""
+        namespace = ""
+        if isinstance(self.host, SonicAsic) and self.host.namespace != DEFAULT_NAMESPACE:
+            namespace = self.host.namespace
+        return {"db": self.database, "namespace": namespace}
 
-    def _run_and_check(self, cmd):
+    def bulk(self, requests):
         """
-        Executes a sonic-db CLI command and checks the output for empty string.
+        Runs redis requests in one pipelined session on the DUT, instead of a sonic-db-cli command per request.
 
         Args:
-            cmd: Full CLI command to run.
+            requests: List of requests, see redis_bulk.py:
+                ("scan", pattern): list of the keys matching pattern, with SCAN instead of KEYS
+                ("hget", key, field): value of the field, or None
+                ("hgetall", key): dict of the fields of the key, {} if the key doesn't exist
+                ("scan_hget", pattern, field): {key: value of the field or None} for the keys matching pattern
+                ("scan_hgetall", pattern): {key: dict of the fields} for the keys matching pattern
 
         Returns:
-            Ansible CLI output dictionary with stdout and stdout_lines keys on success.
-            Empty dictionary on error.
+            List of the results of the requests, in the same order.
+
+        Raises:
+            SonicDbNoCommandOutput: If the requests could not be run.
 
         """
-        logger.debug("SONIC-DB-CLI: %s", cmd)
-        result = self.host.run_sonic_db_cli_cmd(cmd)
+        if not requests:
+            return []
+        request = dict(self.bulk_request(), requests=[list(r) for r in requests])
+        logger.debug("SONIC-DB-BULK: %s %s", self.database, request["requests"])
+        sonichost = getattr(self.host, "sonichost", self.host)
+        # sudo, the redis unix sockets of the namespaces are used instead of TCP in the namespace
+        result = self.bulk_script().run(sonichost, sudo=True, stdin=json.dumps(request), verbose=False)
+        if result["rc"] != 0 or not result["stdout"]:
+            raise SonicDbNoCommandOutput("Bulk requests to %s failed: %s" % (self.database, result.get("stderr")))
+        return json.loads(result["stdout"])
+
+    @contextlib.contextmanager
+    def watch(self, patterns):
+        """
+        Watches the keys matching patterns with redis keyspace notifications, for utilities.wait_until_changed.
+
+        Args:
+            patterns: List of key patterns, e.g. ["PORT_TABLE|Ethernet*"].
+
+        Yields:
+            A started KeyspaceWatcher, or None if the notifications are not available, e.g. they are not enabled
+            in redis or the DUT can't be reached over SSH. wait_until_changed then polls.
 
-        if len(result["stdout_lines"]) == 0:
-            logger.error("No command response: %s" % cmd)
-            return {}
+        """
+        try:
+            watcher = KeyspaceWatcher(self, patterns)
+        except Exception as e:
+            logger.warning("Can't watch %s %s: %s", self.database, patterns, repr(e))
+            yield None
+            return
+        try:
+            yield watcher if watcher.start() else None
+        finally:
+            watcher.close()
 
-        return result
+    def scan_keys(self, pattern):
+        """Returns the list of keys matching pattern, found with SCAN."""
+        return self.bulk([("scan", pattern)])[0]
 
-    def _run_and_raise(self, cmd):
+    def hget_bulk(self, key_fields):
         """
-        Executes a sonic-db CLI command and checks the output for empty string.
+        Gets the values of many hash fields in one pipelined session.
 
         Args:
-            cmd: Full CLI command to run.
+            key_fields: Iterable of (key, field) tuples.
 
         Returns:
-            Ansible CLI output dictionary with stdout and stdout_lines keys on success.
+            Dictionary {(key, field): value}, value is None if the key or field is not present.
 
-        Raises:
-            Exception: If the command had no output.
+        """
+        key_fields = list(key_fields)
+        values = self.bulk([("hget", key, field) for key, field in key_fields])
+        return dict(zip(key_fields, values))
 
+    def hget_all_bulk(self, keys):
         """
-        logger.debug("SONIC-DB-CLI: %s", cmd)
-        result = self.host.run_sonic_db_cli_cmd(cmd)
+        Gets all the fields of many keys in one pipelined session.
 
-        if len(result["stdout_lines"]) == 0:
-            logger.warning("No command response: %s" % cmd)
-            raise SonicDbNoCommandOutput("Command: %s returned no response." % cmd)
+        Args:
+            keys: Iterable of full key names.
 
-        return result
+        Returns:
+            Dictionary {key: {field: value}}, the fields of a key which is not present are {}.
+
+        """
+        keys = list(keys)
+        return dict(zip(keys, self.bulk([("hgetall", key) for key in keys])))
 
     def hget_key_value(self, key, field):
         """
-        Executes a sonic-db-cli hget command.
+        Gets the value of a hash field.
 
         Args:
             key: full name of the key to get.
@@ -84,19 +148,14 @@ class SonicDbCli(object):
 
 
         """
-        cmd = self._cli_prefix() + "hget {} {}".format(key, field)
-        result = self._run_and_check(cmd)
-        if result == {}:
-            raise SonicDbKeyNotFound("Key: %s, field: %s not found in sonic-db cmd: %s" % (key, field, cmd))
-        else:
-            if six.PY2:
-                return result['stdout'].decode('unicode-escape')
-            else:
-                return result['stdout']
+        value = self.hget_bulk([(key, field)])[(key, field)]
+        if not value:
+            raise SonicDbKeyNotFound("Key: %s, field: %s not found in %s" % (key, field, self.database))
+        return value
 
     def hget_all(self, key):
         """
-        Executes a sonic-db-cli HGETALL command.
+        Gets all the fields of a hash.
         Args:
             key: full name of the key to get.
         Returns:
@@ -104,20 +163,10 @@ class SonicDbCli(object):
         Raises:
             SonicDbKeyNotFound: If the key is not found.
         """
-
-        cmd = self._cli_prefix() + "HGETALL {}".format(key)
-        result = self._run_and_check(cmd)
-        if result == {}:
-            raise SonicDbKeyNotFound("Key: %s not found in sonic-db cmd: %s" % (key, cmd))
-        else:
-            v = None
-            if six.PY2:
-                v = result['stdout'].decode('unicode-escape')
-            else:
-                v = result['stdout']
-            v_sanitized = v.replace('\n', '\\n')
-            v_dict = ast.literal_eval(v_sanitized)
-            return v_dict
+        value = self.hget_all_bulk([key])[key]
+        if not value:
+            raise SonicDbKeyNotFound("Key: %s not found in %s" % (key, self.database))
+        return value
 
     def get_and_check_key_value(self, key, value, field=None):
         """
@@ -161,17 +210,26 @@ class SonicDbCli(object):
                 SonicDbKeyNotFound: If the key or field has no value or is not present.
 
         """
-        cmd = self._cli_prefix() + " keys {}".format(table)
-        result = self._run_and_check(cmd)
-        if result == {}:
+        keys = self.scan_keys(table)
+        if not keys:
             if raise_error_when_not_found:
-                raise SonicDbKeyNotFound("No keys for %s found in sonic-db cmd: %s" % (table, cmd))
+                raise SonicDbKeyNotFound("No keys for %s found in %s" % (table, self.database))
             return []
-        else:
-            if six.PY2:
-                return result['stdout'].decode('unicode-escape').splitlines()
-            else:
-                return result['stdout'].splitlines()
+        return keys
+
+    def _scan_and_raise(self, pattern):
+        """
+        Gets the keys matching pattern.
+
+        Raises:
+            SonicDbNoCommandOutput: If no key matches.
+
+        """
+        keys = self.scan_keys(pattern)
+        if not keys:
+            logger.warning("No keys for %s in %s", pattern, self.database)
+            raise SonicDbNoCommandOutput("No keys for %s found in %s" % (pattern, self.database))
+        return keys
 
     def dump(self, table):
         """
@@ -238,16 +296,14 @@ class AsicDbCli(SonicDbCli):
 
     def get_switch_key(self):
         """Returns a list of keys in the switch table"""
-        cmd = self._cli_prefix() + "KEYS %s*" % AsicDbCli.ASIC_SWITCH_TABLE
-        return self._run_and_raise(cmd)["stdout_lines"][0]
+        return self._scan_and_raise("%s*" % AsicDbCli.ASIC_SWITCH_TABLE)[0]
 
     def get_system_port_key_list(self, refresh=False):
         """Returns a list of keys in the system port table"""
         if self.system_port_key_list != [] and refresh is False:
             return self.system_port_key_list
 
-        cmd = self._cli_prefix() + "KEYS %s*" % AsicDbCli.ASIC_SYSPORT_TABLE
-        self.system_port_key_list = self._run_and_raise(cmd)["stdout_lines"]
+        self.system_port_key_list = self._scan_and_raise("%s*" % AsicDbCli.ASIC_SYSPORT_TABLE)
         return self.system_port_key_list
 
     def get_port_key_list(self, refresh=False):
@@ -256,38 +312,32 @@ class AsicDbCli(SonicDbCli):
         if self.port_key_list != [] and refresh is False:
             return self.port_key_list
 
-        cmd = self._cli_prefix() + "KEYS %s*" % AsicDbCli.ASIC_PORT_TABLE
-        self.port_key_list = self._run_and_raise(cmd)["stdout_lines"]
+        self.port_key_list = self._scan_and_raise("%s*" % AsicDbCli.ASIC_PORT_TABLE)
         return self.port_key_list
 
     def get_hostif_list(self):
         """Returns a list of keys in the host interface table"""
-        cmd = self._cli_prefix() + "KEYS %s:*" % AsicDbCli.ASIC_HOSTIF_TABLE
-        return self._run_and_raise(cmd)["stdout_lines"]
+        return self._scan_and_raise("%s:*" % AsicDbCli.ASIC_HOSTIF_TABLE)
 
     def get_asic_db_lag_list(self, refresh=False):
         """Returns a list of keys in the lag table"""
         if self.lagid_key_list != [] and refresh is False:
             return self.lagid_key_list
 
-        cmd = self._cli_prefix() + "KEYS %s:*" % AsicDbCli.ASIC_LAG_TABLE
-        self.lagid_key_list = self._run_and_raise(cmd)["stdout_lines"]
+        self.lagid_key_list = self._scan_and_raise("%s:*" % AsicDbCli.ASIC_LAG_TABLE)
         return self.lagid_key_list
 
     def get_asic_db_lag_member_list(self):
         """Returns a list of keys in the lag member table"""
-        cmd = self._cli_prefix() + "KEYS %s:*" % AsicDbCli.ASIC_LAG_MEMBER_TABLE
-        return self._run_and_raise(cmd)["stdout_lines"]
+        return self._scan_and_raise("%s:*" % AsicDbCli.ASIC_LAG_MEMBER_TABLE)
 
     def get_router_if_list(self):
         """Returns a list of keys in the router interface table"""
-        cmd = self._cli_prefix() + "KEYS %s:*" % AsicDbCli.ASIC_ROUTERINTF_TABLE
-        return self._run_and_raise(cmd)["stdout_lines"]
+        return self._scan_and_raise("%s:*" % AsicDbCli.ASIC_ROUTERINTF_TABLE)
 
     def get_neighbor_list(self):
         """Returns a list of keys in the neighbor table"""
-        cmd = self._cli_prefix() + "KEYS %s:*" % AsicDbCli.ASIC_NEIGH_ENTRY_TABLE
-        return self._run_and_raise(cmd)["stdout_lines"]
+        return self._scan_and_raise("%s:*" % AsicDbCli.ASIC_NEIGH_ENTRY_TABLE)
 
     def get_neighbor_key_by_ip(self, ipaddr):
         """Returns the key in the neighbor table that is for a specific IP neighbor
@@ -296,9 +346,9 @@ class AsicDbCli(SonicDbCli):
             ipaddr: The IP address to search for in the neighbor table.
 
         """
-        result = self._run_and_raise(self._cli_prefix() + "KEYS %s*%s*" % (AsicDbCli.ASIC_NEIGH_ENTRY_TABLE, ipaddr))
+        keys = self._scan_and_raise("%s*%s*" % (AsicDbCli.ASIC_NEIGH_ENTRY_TABLE, ipaddr))
         match_str = '"ip":"%s"' % ipaddr
-        for key in result["stdout_lines"]:
+        for key in keys:
             if match_str in key:
                 neighbor_key = key
                 break
@@ -309,20 +359,14 @@ class AsicDbCli(SonicDbCli):
 
     def get_neighbor_value(self, neighbor_key, field):
         """
-        Returns a value of a field in the neighbor table.
-
-        Note:
-            The structure of the keys in this table cause the command() method to fail, so this function uses shell() to
-            retrieve the command output.
+        Returns a value of a field in the neighbor table, or an empty string if the field is not present.
 
         Args:
             neighbor_key: The full key of the neighbor table.
             field: The field to get in the neighbor hash table.
         """
-        cmd = "%s ASIC_DB HGET '%s' %s" % (self.host.sonic_db_cli, neighbor_key, field)
-
-        result = self.host.sonichost.shell(cmd)
-        return result['stdout']
+        value = self.hget_bulk([(neighbor_key, field)])[(neighbor_key, field)]
+        return value if value is not None else ""
 
     def get_hostif_table(self, refresh=False):
         """
@@ -349,8 +393,9 @@ class AsicDbCli(SonicDbCli):
         """
         Returns a list of portids associated with the hostif entries on the asics.
 
-        Walks through the HOSTIF table getting each port ID from the cache and returns the list.  The list
-        is saved so it can be returned directly in subsequent calls.
+        Walks through the HOSTIF table getting each port ID, from the cached hostif table if any, else with one
+        pipelined SCAN and HGET of the port IDs.  The list is saved so it can be returned directly in subsequent
+        calls.
 
         Args:
             refresh: Forces the DB to be queried after the first time.
@@ -360,12 +405,11 @@ class AsicDbCli(SonicDbCli):
         if self.hostif_portidlist != [] and refresh is False:
             return self.hostif_portidlist
 
-        hostif_table = self.get_hostif_table(refresh)
-
-        return_list = []
-        for hostif_key in list(hostif_table.keys()):
-            hostif_portid = hostif_table[hostif_key]['value']['SAI_HOSTIF_ATTR_OBJ_ID']
-            return_list.append(hostif_portid)
+        if self.hostif_table != [] and refresh is False:
+            return_list = [entry['value']['SAI_HOSTIF_ATTR_OBJ_ID'] for entry in self.hostif_table.values()]
+        else:
+            return_list = list(self.bulk([
+                ("scan_hget", "%s:*" % AsicDbCli.ASIC_HOSTIF_TABLE, "SAI_HOSTIF_ATTR_OBJ_ID")])[0].values())
         self.hostif_portidlist = return_list
         return return_list
 
@@ -404,6 +448,20 @@ class AsicDbCli(SonicDbCli):
             "lag" if the portid is a portchannel.
             "other" if it is not found in any port table
         """
+        # Tables which are not cached yet are all fetched in one pipelined session
+        requests = []
+        if self.port_key_list == [] or refresh:
+            requests.append(("port_key_list", ("scan", "%s*" % AsicDbCli.ASIC_PORT_TABLE)))
+        if self.system_port_key_list == [] or refresh:
+            requests.append(("system_port_key_list", ("scan", "%s*" % AsicDbCli.ASIC_SYSPORT_TABLE)))
+        if self.lagid_key_list == [] or refresh:
+            requests.append(("lagid_key_list", ("scan", "%s:*" % AsicDbCli.ASIC_LAG_TABLE)))
+        if self.hostif_portidlist == [] and self.hostif_table == []:
+            requests.append(("hostif_portidlist", ("scan_hget", "%s:*" % AsicDbCli.ASIC_HOSTIF_TABLE,
+                                                   "SAI_HOSTIF_ATTR_OBJ_ID")))
+        for (attr, request), result in zip(requests, self.bulk([request for _, request in requests])):
+            setattr(self, attr, list(result.values()) if request[0] == "scan_hget" else result)
+        refresh = False
 
         port_key_list = self.get_port_key_list(refresh=refresh)
         system_port_keylist = self.get_system_port_key_list(refresh=refresh)
@@ -455,9 +513,9 @@ class AppDbCli(SonicDbCli):
             ipaddr: The IP address to search for in the neighbor table.
 
         """
-        result = self._run_and_raise(self._cli_prefix() + "KEYS %s:*%s" % (AppDbCli.APP_NEIGH_TABLE, ipaddr))
+        keys = self._scan_and_raise("%s:*%s" % (AppDbCli.APP_NEIGH_TABLE, ipaddr))
         neighbor_key = None
-        for key in result["stdout_lines"]:
+        for key in keys:
             if key.endswith(ipaddr):
                 neighbor_key = key
                 break
@@ -468,15 +526,13 @@ class AppDbCli(SonicDbCli):
         """
         Retuns lag list in app db
         """
-        result = self._run_and_raise(self._cli_prefix() + "KEYS *%s*" % AppDbCli.APP_LAG_TABLE)
-        return result["stdout_lines"]
+        return self._scan_and_raise("*%s*" % AppDbCli.APP_LAG_TABLE)
 
     def get_app_db_lag_member_list(self):
         """
         return lag member list in app db
         """
-        result = self._run_and_raise(self._cli_prefix() + "KEYS *{}:*".format(AppDbCli.APP_LAG_MEMBER_TABLE))
-        return result["stdout_lines"]
+        return self._scan_and_raise("*{}:*".format(AppDbCli.APP_LAG_MEMBER_TABLE))
 
     def dump_neighbor_table(self):
         """
@@ -510,10 +566,9 @@ class VoqDbCli(SonicDbCli):
             ipaddr: The IP address to search for in the neighbor table.
 
         """
-        cmd = self._cli_prefix() + 'KEYS "%s|*%s"' % (VoqDbCli.SYSTEM_NEIGHBOR_TABLE, ipaddr)
-        result = self._run_and_raise(cmd)
+        keys = self._scan_and_raise("%s|*%s" % (VoqDbCli.SYSTEM_NEIGHBOR_TABLE, ipaddr))
         neighbor_key = None
-        for key in result["stdout_lines"]:
+        for key in keys:
             if key.endswith(ipaddr):
                 neighbor_key = key
                 break
@@ -547,13 +602,11 @@ class VoqDbCli(SonicDbCli):
 
     def get_lag_list(self):
         """Returns a list of keys in the system lag table"""
-        cmd = self._cli_prefix() + "KEYS *{}*".format(VoqDbCli.SYSTEM_LAG_TABLE)
-        return self._run_and_raise(cmd)["stdout_lines"]
+        return self._scan_and_raise("*{}*".format(VoqDbCli.SYSTEM_LAG_TABLE))
 
     def get_lag_member_list(self):
         """Returns a list of keys in the ststem lag member table"""
-        cmd = self._cli_prefix() + "KEYS *{}*".format(VoqDbCli.SYSTEM_LAG_MEMBER_TABLE)
-        return self._run_and_raise(cmd)["stdout_lines"]
+        return self._scan_and_raise("*{}*".format(VoqDbCli.SYSTEM_LAG_MEMBER_TABLE))
 
     def dump_neighbor_table(self):
         """
@@ -562,6 +615,83 @@ class VoqDbCli(SonicDbCli):
         return self.dump(VoqDbCli.SYSTEM_NEIGHBOR_TABLE)
 
 
+class KeyspaceWatcher(PersistentChannel):
+    """
+    Keyspace notifications of the keys of a database matching patterns, streamed over SSH from redis_bulk.py running
+    on the DUT. Use SonicDbCli.watch() to get a started watcher.
+    """
+
+    def __init__(self, db_cli, patterns, ready_timeout=WATCH_READY_TIMEOUT):
+        sonichost = getattr(db_cli.host, "sonichost", db_cli.host)
+        username, passwords = sonichost.channel_credentials()
+        super(KeyspaceWatcher, self).__init__(sonichost.mgmt_ip, username, passwords)
+        self.sonichost = sonichost
+        self.request = dict(db_cli.bulk_request(), watch=list(patterns))
+        self.ready_timeout = ready_timeout
+        self.error = None
+        self.notifications = 0
+        self._ready = threading.Event()
+        self._changed = threading.Event()
+
+    def executor_command(self):
+        return "sudo -n " + SonicDbCli.bulk_script().command(python="python3 -u")
+
+    def start(self):
+        """Subscribe to the notifications, return False if they are not available."""
+        try:
+            SonicDbCli.bulk_script().copy_once(self.sonichost)
+            with self._lock:
+                self._open()
+                self._stdin.write(json.dumps(self.request) + "\n")
+                self._stdin.flush()
+                stdout = self._stdout
+        except Exception as e:
+            self.error = repr(e)
+        else:
+            threading.Thread(target=self._read, args=(stdout,), daemon=True).start()
+            if not self._ready.wait(self.ready_timeout):
+                self.error = "Not subscribed after {} seconds".format(self.ready_timeout)
+        if self.error is not None:
+            logger.warning("Keyspace notifications of %s %s not available on %s: %s", self.request["db"],
+                           self.request["watch"], self.hostname, self.error)
+            self.close()
+            return False
+        logger.debug("Watching %s %s on %s", self.request["db"], self.request["watch"], self.hostname)
+        return True
+
+    def _read(self, stdout):
+        try:
+            for line in iter(stdout.readline, ""):
+                message = json.loads(line)
+                if "subscribed" in message:
+                    self._ready.set()
+                elif "error" in message:
+                    self.error = message["error"]
+                    break
+                else:
+                    self.notifications += 1
+                    self._changed.set()
+        except Exception as e:
+            self.error = repr(e)
+        finally:
+            self.error = self.error or "Watch exited"
+            self._ready.set()
+            self._changed.set()
+
+    def wait(self, timeout):
+        """
+        Waits up to timeout seconds for a change of a watched key, returns True if a key changed.
+
+        Once the notifications are lost, e.g. the DUT is rebooted, it sleeps timeout seconds like polling.
+        """
+        if self.error is not None:
+            time.sleep(timeout)
+            return False
+        changed = self._changed.wait(timeout)
+        self._changed.clear()
+        return changed and self.error is None
+
+
 class SonicDbKeyNotFound(KeyError):
     """
     Raised when requested keys or fields are not found in the db.
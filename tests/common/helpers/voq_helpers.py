@@ -111,10 +111,11 @@ def check_local_neighbor_asicdb(asic, neighbor_ip, neighbor_mac):
     asicdb = AsicDbCli(asic)
     neighbor_key = asicdb.get_neighbor_key_by_ip(neighbor_ip)
     pytest_assert(neighbor_key is not None, "Did not find neighbor in asictable for IP: %s" % neighbor_ip)
-    asic_mac = asicdb.get_neighbor_value(neighbor_key, 'SAI_NEIGHBOR_ENTRY_ATTR_DST_MAC_ADDRESS')
+    neighbor = asicdb.hget_all_bulk([neighbor_key])[neighbor_key]
+    asic_mac = neighbor.get('SAI_NEIGHBOR_ENTRY_ATTR_DST_MAC_ADDRESS', "")
     pytest_assert(asic_mac.lower() == neighbor_mac.lower(),
                   "MAC does not match in asicDB, asic %s, device %s" % (asic_mac.lower(), neighbor_mac.lower()))
-    encap_idx = asicdb.get_neighbor_value(neighbor_key, 'SAI_NEIGHBOR_ENTRY_ATTR_ENCAP_INDEX')
+    encap_idx = neighbor.get('SAI_NEIGHBOR_ENTRY_ATTR_ENCAP_INDEX', "")
     return {"encap_index": encap_idx}
 
 
@@ -312,14 +313,12 @@ def check_voq_remote_neighbor(host, asic, neighbor_ip, neighbor_mac, interface,
     asicdb = AsicDbCli(asic)
     neighbor_key = asicdb.get_neighbor_key_by_ip(neighbor_ip)
     pytest_assert(neighbor_key is not None, "Did not find neighbor in asic table for IP: %s" % neighbor_ip)
-    pytest_assert(asicdb.get_neighbor_value(neighbor_key,
-                                            'SAI_NEIGHBOR_ENTRY_ATTR_DST_MAC_ADDRESS').lower() == neighbor_mac.lower(),
+    neighbor = asicdb.hget_all_bulk([neighbor_key])[neighbor_key]
+    pytest_assert(neighbor.get('SAI_NEIGHBOR_ENTRY_ATTR_DST_MAC_ADDRESS', "").lower() == neighbor_mac.lower(),
                   "MAC does not match in asicDB")
-    pytest_assert(asicdb.get_neighbor_value(neighbor_key,
-                                            'SAI_NEIGHBOR_ENTRY_ATTR_ENCAP_INDEX') == encap_idx,
+    pytest_assert(neighbor.get('SAI_NEIGHBOR_ENTRY_ATTR_ENCAP_INDEX', "") == encap_idx,
                   "Encap index does not match in asicDB")
-    pytest_assert(asicdb.get_neighbor_value(neighbor_key,
-                                            'SAI_NEIGHBOR_ENTRY_ATTR_IS_LOCAL') == "false",
+    pytest_assert(neighbor.get('SAI_NEIGHBOR_ENTRY_ATTR_IS_LOCAL', "") == "false",
                   "is local is not false in asicDB")
 
     # LC app db
@@ -22,8 +22,7 @@ def get_lag_ids_from_chassis_db(duthosts):
     for sup in duthosts.supervisor_nodes:
         voqdb = VoqDbCli(sup)
         lag_list = voqdb.get_lag_list()
-        for lag in lag_list:
-            lag_ids.append(voqdb.hget_key_value(lag, "lag_id"))
+        lag_ids.extend(voqdb.hget_bulk((lag, "lag_id") for lag in lag_list).values())
 
     logging.info("LAG IDs present in CHASSIS_DB are {}".format(lag_ids))
     return lag_ids
@@ -113,11 +112,8 @@ def verify_lag_id_in_asic_dbs(asics, lag_id, expected=True):
     for asic in asics:
         asicdb = AsicDbCli(asic)
         asic_db_lag_list = asicdb.get_asic_db_lag_list()
-        exists = False
-        for lag in asic_db_lag_list:
-            if asicdb.hget_key_value(lag, "SAI_LAG_ATTR_SYSTEM_PORT_AGGREGATE_ID") == lag_id:
-                exists = True
-                break
+        aggregate_ids = asicdb.hget_bulk((lag, "SAI_LAG_ATTR_SYSTEM_PORT_AGGREGATE_ID") for lag in asic_db_lag_list)
+        exists = lag_id in aggregate_ids.values()
 
         lag_id_exists_msg = "LAG ID {} exists in {} asic{} ASIC_DB"\
                             .format(lag_id, asic.sonichost.hostname, asic.asic_index)
@@ -185,14 +181,17 @@ def verify_lag_member_in_asic_db(asics, lag_id, expected=0):
         asic_lag_list = asicdb.get_asic_db_lag_list()
         asic_db_lag_member_list = asicdb.get_asic_db_lag_member_list()
         lag_oid = None
+        # LAG aggregate IDs and LAG IDs of the members in one pipelined session
+        values = asicdb.hget_bulk([(lag, "SAI_LAG_ATTR_SYSTEM_PORT_AGGREGATE_ID") for lag in asic_lag_list] +
+                                  [(member, "SAI_LAG_MEMBER_ATTR_LAG_ID") for member in asic_db_lag_member_list])
 
         for lag in asic_lag_list:
-            if asicdb.hget_key_value(lag, "SAI_LAG_ATTR_SYSTEM_PORT_AGGREGATE_ID") == lag_id:
+            if values[(lag, "SAI_LAG_ATTR_SYSTEM_PORT_AGGREGATE_ID")] == lag_id:
                 lag_oid = ":".join(lag for lag in lag.split(':')[-2::1])
 
         count = 0
         for lag_member in asic_db_lag_member_list:
-            if asicdb.hget_key_value(lag_member, "SAI_LAG_MEMBER_ATTR_LAG_ID") == lag_oid:
+            if values[(lag_member, "SAI_LAG_MEMBER_ATTR_LAG_ID")] == lag_oid:
                 count += 1
 
         logging.info("Found {} members of LAG in {} asic {} ASIC_DB"
@@ -246,16 +245,19 @@ def verify_lag_member_status_in_asic_db(asics, lag_id, exp_disabled=0):
         lag_oid = None
         count = 0
         disabled = 0
+        values = asicdb.hget_bulk([(lag, "SAI_LAG_ATTR_SYSTEM_PORT_AGGREGATE_ID") for lag in asic_lag_list] +
+                                  [(lag_member, field) for lag_member in asic_db_lag_member_list
+                                   for field in ("SAI_LAG_MEMBER_ATTR_LAG_ID", "SAI_LAG_MEMBER_ATTR_EGRESS_DISABLE")])
         # Find LAG members OIDs from lag id
         for lag in asic_lag_list:
-            if asicdb.hget_key_value(lag, "SAI_LAG_ATTR_SYSTEM_PORT_AGGREGATE_ID") == lag_id:
+            if values[(lag, "SAI_LAG_ATTR_SYSTEM_PORT_AGGREGATE_ID")] == lag_id:
                 lag_oid = ":".join(lag for lag in lag.split(':')[-2::1])
                 break
 
         # Find LAG members of LAG by OID, one should have disabled status
         for lag_member in asic_db_lag_member_list:
-            if asicdb.hget_key_value(lag_member, "SAI_LAG_MEMBER_ATTR_LAG_ID") == lag_oid:
-                status = asicdb.hget_key_value(lag_member, "SAI_LAG_MEMBER_ATTR_EGRESS_DISABLE")
+            if values[(lag_member, "SAI_LAG_MEMBER_ATTR_LAG_ID")] == lag_oid:
+                status = values[(lag_member, "SAI_LAG_MEMBER_ATTR_EGRESS_DISABLE")]
                 count += 1
                 if status == "true":
                     disabled += 1
@@ -8,11 +8,18 @@ import copy
 import ptf.mask as mask
 import ptf.packet as packet
 
+from tests.common.pkt_filter.packet_index import decode_frame, get_packet_index, split_match_fields
+
 if sys.version_info.major > 2:
     NATIVE_TYPE = (int, float, bool, list, dict, tuple, set, str, bytes, type(None))
 else:
     NATIVE_TYPE = (int, float, long, bool, list, dict, tuple, set, str, bytes, unicode, type(None))     # noqa: F821
 
+# Maximum time to wait for the expected packets
+DEFAULT_TIMEOUT = 3
+# Time without new packets on the ports after which all the expected packets are considered received
+SETTLE_TIME = 0.5
+
 
 def _parse_layer(layer):
     """
@@ -102,6 +109,16 @@ class FilterPktBuffer(object):
         self.masked_exp_pkt = mask.Mask(self.pkt)
         self.pkt_dict = convert_pkt_to_dict(self.pkt)
 
+        # Fields matched with the packet index of the dataplane and the fields matched on the dissected packets
+        self.index_fields, self.dict_fields = split_match_fields(self.match_fields)
+        exp_fields = decode_frame(bytes(self.pkt))
+        if exp_fields is None:
+            # Encapsulated packet, all the fields are matched on the dissected packets
+            self.index_fields, self.dict_fields = (), list(self.match_fields)
+            exp_fields = ()
+        self.index_key = tuple(exp_fields[i] for i in self.index_fields)
+        self.packet_index = get_packet_index(self.ptfadapter.dataplane)
+
         self.__ignore_fields()
 
     def __ignore_fields(self):
@@ -131,35 +148,72 @@ class FilterPktBuffer(object):
 
     def __find_pkt_in_buffer(self, dst_port_number):
         """
-        Find expected packet in buffer by using matched fields
+        Find expected packet in buffer by using matched fields, must be called with dataplane.cvar held
 
         Returns:
             Received packet
         """
-        time.sleep(3)
-        common_buffer = self.ptfadapter.dataplane.packet_queues
-        packet_buffer = common_buffer[(0, dst_port_number)][:]
         matched_index = 0
         received_pkt = None
 
-        for pkt in packet_buffer:
-            packet_dict = convert_pkt_to_dict(packet.Ether(pkt[0]))
-
-            for field, value in self.match_fields:
-                try:
-                    if packet_dict[field][value] != self.pkt_dict[field][value]:
+        if None in self.index_key:
+            # A matched field is missing in the expected packet
+            return (None, None)
+
+        port_id = (0, dst_port_number)
+        for pkt in self.packet_index.lookup(port_id, self.index_fields, self.index_key):
+            # The index fields of the encapsulated frames were not decoded
+            dict_fields = self.match_fields if self.packet_index.is_encapsulated(port_id, pkt) else self.dict_fields
+            if dict_fields:
+                packet_dict = convert_pkt_to_dict(packet.Ether(pkt[0]))
+
+                for field, value in dict_fields:
+                    try:
+                        if packet_dict[field][value] != self.pkt_dict[field][value]:
+                            break
+                    except KeyError:
                         break
-                except KeyError:
-                    break
+                else:
+                    matched_index += 1
+                    received_pkt = pkt[0]
             else:
                 matched_index += 1
-                received_pkt = packet.Ether(pkt[0])
+                received_pkt = pkt[0]
 
         if received_pkt:
-            return ({dst_port_number: matched_index}, received_pkt)
+            return ({dst_port_number: matched_index}, packet.Ether(received_pkt))
 
         return (None, None)
 
+    def __wait_for_pkts(self, timeout):
+        """
+        Wait until the expected packet is received and no more packets arrive on the ports, or until timeout
+
+        Args:
+            timeout: Maximum time to wait in seconds
+
+        Returns:
+            List of the results of __find_pkt_in_buffer for the ports
+        """
+        cvar = self.ptfadapter.dataplane.cvar
+        end = time.time() + timeout
+        last_rx = time.time()
+
+        with cvar:
+            while True:
+                now = time.time()
+                for dst_port in self.dst_port_numbers:
+                    if self.packet_index.refresh((0, dst_port)):
+                        last_rx = now
+                results = [self.__find_pkt_in_buffer(dst_port) for dst_port in self.dst_port_numbers]
+                found = any(received_pkt for _, received_pkt in results)
+
+                if (found and now - last_rx >= SETTLE_TIME) or now >= end:
+                    return results
+
+                # The dataplane thread notifies cvar when packets are queued
+                cvar.wait(min(end, last_rx + SETTLE_TIME) - now if found else end - now)
+
     def __diff_between_dict(self, rcv_pkt_dict, exp_pkt_dict, path=''):
         """
         Find the difference between received packet dictionary and expected packet dictionary
@@ -204,16 +258,17 @@ class FilterPktBuffer(object):
 
         return self.__diff_between_dict(received_pkt, masked_pkt)
 
-    def filter_pkt_in_buffer(self):
+    def filter_pkt_in_buffer(self, timeout=DEFAULT_TIMEOUT):
         """
         Filter expected packet in buffer
 
+        Args:
+            timeout: Maximum time to wait for the expected packet in seconds
+
         Returns:
             Bool value or difference between received packet and expected packet
         """
-        for dst_port in self.dst_port_numbers:
-            matched_index, received_pkt = self.__find_pkt_in_buffer(dst_port)
-
+        for matched_index, received_pkt in self.__wait_for_pkts(timeout):
             if received_pkt:
                 self.received_pkt = received_pkt
                 self.matched_index.update(matched_index)
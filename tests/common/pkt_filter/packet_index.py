@@ -0,0 +1,315 @@
+"""
+Receive side index of the packet queues of the PTF dataplane.
+
+Every frame is decoded once, when it is first seen in the queue of its port, into a tuple of the commonly matched
+header fields read at fixed offsets, see FIELDS. For each combination of match fields, the frames of a port are put in
+hash buckets keyed on the values of these fields, so that the frames matching an expected packet are found with one
+lookup instead of dissecting every frame of the queue with scapy.
+
+Encapsulated frames, e.g. QinQ, MPLS, IP-in-IP, GRE or VXLAN, are not decoded: scapy dissects their inner headers and
+convert_pkt_to_dict keeps the innermost layer of each name, so these frames are returned by every lookup and must be
+matched on the dissected packets.
+
+The index follows the queues of the dataplane incrementally: frames appended by the dataplane thread are decoded on
+the next refresh, frames dropped from the head of a queue (poll, queue overflow) are removed from the buckets, and
+flushed queues are indexed again from scratch. The index must be used with the dataplane.cvar lock held.
+"""
+import socket
+import struct
+from collections import OrderedDict
+
+# Fields of the decoded frames, named as the scapy layer and field names
+FIELDS = [
+    ("Ethernet", "dst"), ("Ethernet", "src"), ("Ethernet", "type"),
+    ("802.1Q", "vlan"), ("802.1Q", "prio"),
+    ("IP", "src"), ("IP", "dst"), ("IP", "proto"), ("IP", "ttl"), ("IP", "tos"),
+    ("IPv6", "src"), ("IPv6", "dst"), ("IPv6", "nh"), ("IPv6", "hlim"), ("IPv6", "tc"),
+    ("TCP", "sport"), ("TCP", "dport"),
+    ("UDP", "sport"), ("UDP", "dport"),
+    ("ICMP", "type"), ("ICMP", "code"), ("ICMP", "id"),
+]
+FIELD_INDEX = dict((field, index) for index, field in enumerate(FIELDS))
+
+# Scapy class names of the layers, also accepted in match fields
+LAYER_ALIASES = {"Ether": "Ethernet", "Dot1Q": "802.1Q"}
+
+ETH_TYPE_VLAN = (0x8100, 0x88a8, 0x9100)
+ETH_TYPE_IPV4 = 0x0800
+ETH_TYPE_IPV6 = 0x86dd
+ETH_TYPE_MPLS = (0x8847, 0x8848)
+IP_PROTO_ICMP = 1
+IP_PROTO_TCP = 6
+IP_PROTO_UDP = 17
+ICMP_ECHO_TYPES = (0, 8)
+# IP-in-IP, IPv6-in-IP, GRE, and the IPv6 extension headers dissected by scapy
+IP_PROTO_ENCAPSULATED = (4, 41, 47, 0, 43, 44, 51, 60)
+# VXLAN, VXLAN-GPE and Geneve
+UDP_PORTS_ENCAPSULATED = (250, 4789, 4790, 6081, 8472)
+
+
+class _Encapsulated(Exception):
+    pass
+
+
+def _mac(data, offset):
+    return ":".join("{:02x}".format(byte) for byte in bytearray(data[offset:offset + 6]))
+
+
+def decode_frame(data):
+    """
+    Decode the header fields of an Ethernet frame
+
+    Args:
+        data: Frame bytes
+
+    Returns:
+        Tuple of the values of FIELDS, None for the fields of the layers missing in the frame. MAC and IP addresses
+        are strings formatted like scapy, the other fields are integers. None for an encapsulated frame, whose
+        fields must be read from the layers dissected by scapy.
+    """
+    fields = [None] * len(FIELDS)
+    try:
+        fields[0] = _mac(data, 0)
+        fields[1] = _mac(data, 6)
+        eth_type, = struct.unpack_from("!H", data, 12)
+        fields[2] = eth_type
+        offset = 14
+        if eth_type in ETH_TYPE_VLAN:
+            tci, eth_type = struct.unpack_from("!HH", data, offset)
+            fields[3] = tci & 0xfff
+            fields[4] = tci >> 13
+            offset += 4
+        if eth_type in ETH_TYPE_VLAN or eth_type in ETH_TYPE_MPLS:
+            # QinQ or MPLS
+            raise _Encapsulated()
+
+        proto = None
+        if eth_type == ETH_TYPE_IPV4:
+            ver_ihl, tos, frag, ttl, proto = struct.unpack_from("!BB4xHBB", data, offset)
+            fields[5] = socket.inet_ntop(socket.AF_INET, bytes(data[offset + 12:offset + 16]))
+            fields[6] = socket.inet_ntop(socket.AF_INET, bytes(data[offset + 16:offset + 20]))
+            fields[7], fields[8], fields[9] = proto, ttl, tos
+            offset += (ver_ihl & 0xf) * 4
+            if frag & 0x1fff:
+                # The L4 header is only in the first fragment
+                proto = None
+        elif eth_type == ETH_TYPE_IPV6:
+            ver_tc_fl, proto, hlim = struct.unpack_from("!I2xBB", data, offset)
+            if len(data) < offset + 40:
+                raise struct.error("truncated IPv6 header")
+            fields[10] = socket.inet_ntop(socket.AF_INET6, bytes(data[offset + 8:offset + 24]))
+            fields[11] = socket.inet_ntop(socket.AF_INET6, bytes(data[offset + 24:offset + 40]))
+            fields[12], fields[13], fields[14] = proto, hlim, (ver_tc_fl >> 20) & 0xff
+            offset += 40
+
+        if proto in IP_PROTO_ENCAPSULATED:
+            raise _Encapsulated()
+        if proto == IP_PROTO_TCP:
+            fields[15], fields[16] = struct.unpack_from("!HH", data, offset)
+        elif proto == IP_PROTO_UDP:
+            fields[17], fields[18] = struct.unpack_from("!HH", data, offset)
+            if fields[17] in UDP_PORTS_ENCAPSULATED or fields[18] in UDP_PORTS_ENCAPSULATED:
+                raise _Encapsulated()
+        elif proto == IP_PROTO_ICMP:
+            fields[19], fields[20] = struct.unpack_from("!BB", data, offset)
+            if fields[19] in ICMP_ECHO_TYPES:
+                fields[21], = struct.unpack_from("!H", data, offset + 4)
+    except (struct.error, ValueError):
+        # Truncated frame, the fields decoded so far are kept
+        pass
+    except _Encapsulated:
+        return None
+    return tuple(fields)
+
+
+def split_match_fields(match_fields):
+    """
+    Split match fields into the fields decoded by decode_frame and the other fields
+
+    Args:
+        match_fields: List of (layer name, field name) tuples
+
+    Returns:
+        Tuple of the indexes of the decoded fields and the list of the other fields
+    """
+    indexes = []
+    others = []
+    for layer, field in match_fields:
+        index = FIELD_INDEX.get((LAYER_ALIASES.get(layer, layer), field))
+        if index is None:
+            others.append((layer, field))
+        elif index not in indexes:
+            indexes.append(index)
+    return tuple(indexes), others
+
+
+class PortIndex(object):
+    """
+    Index of the packet queue of one port of the dataplane
+    """
+    def __init__(self):
+        self.queue = None
+        # {id(entry): (entry, decoded fields)} in the order of the queue, entries are (frame, timestamp) tuples
+        self.frames = OrderedDict()
+        # {field indexes: {field values: {id(entry): entry}}}
+        self.tables = {}
+        # Number of encapsulated frames, which are not in the tables
+        self.encapsulated = 0
+
+    def _add(self, entry):
+        decoded = decode_frame(entry[0])
+        self.frames[id(entry)] = (entry, decoded)
+        if decoded is None:
+            self.encapsulated += 1
+            return
+        for indexes, table in self.tables.items():
+            table.setdefault(tuple(decoded[i] for i in indexes), OrderedDict())[id(entry)] = entry
+
+    def _remove_oldest(self):
+        _, (entry, decoded) = self.frames.popitem(last=False)
+        if decoded is None:
+            self.encapsulated -= 1
+            return
+        for indexes, table in self.tables.items():
+            key = tuple(decoded[i] for i in indexes)
+            bucket = table[key]
+            del bucket[id(entry)]
+            if not bucket:
+                del table[key]
+
+    def _is_indexed(self, entry):
+        frame = self.frames.get(id(entry))
+        return frame is not None and frame[0] is entry
+
+    def refresh(self, queue):
+        """
+        Update the index with the frames of the queue
+
+        Args:
+            queue: Packet queue of the port, list of (frame, timestamp) tuples
+
+        Returns:
+            Number of new frames
+        """
+        if queue is not self.queue:
+            # Flushed, the dataplane replaced the queue
+            self.queue = queue
+            self.frames.clear()
+            self.tables.clear()
+            self.encapsulated = 0
+
+        # Frames are only dropped from the head of the queue
+        if not queue or not self._is_indexed(queue[0]):
+            self.frames.clear()
+            for table in self.tables.values():
+                table.clear()
+            self.encapsulated = 0
+        else:
+            while self.frames and next(iter(self.frames)) != id(queue[0]):
+                self._remove_oldest()
+
+        # Frames are only appended to the tail of the queue
+        new = 0
+        if self.frames:
+            last = next(reversed(self.frames.values()))[0]
+            while new < len(queue) and queue[-1 - new] is not last:
+                new += 1
+        else:
+            new = len(queue)
+        for entry in queue[len(queue) - new:]:
+            self._add(entry)
+        return new
+
+    def lookup(self, indexes, key):
+        """
+        Find the frames of the queue with the given values of the decoded fields
+
+        Args:
+            indexes: Indexes of the decoded fields
+            key: Values of the fields
+
+        Returns:
+            List of the (frame, timestamp) tuples in the order of the queue, with the encapsulated frames
+        """
+        table = self.tables.get(indexes)
+        if table is None:
+            table = self.tables[indexes] = {}
+            for entry, decoded in self.frames.values():
+                if decoded is not None:
+                    table.setdefault(tuple(decoded[i] for i in indexes), OrderedDict())[id(entry)] = entry
+        bucket = table.get(key, {})
+        if not self.encapsulated:
+            return list(bucket.values())
+        return [entry for entry_id, (entry, decoded) in self.frames.items() if decoded is None or entry_id in bucket]
+
+    def is_encapsulated(self, entry):
+        """Whether the fields of a frame returned by lookup() were not decoded"""
+        return self.frames[id(entry)][1] is None
+
+
+class PacketIndex(object):
+    """
+    Index of the packet queues of the dataplane
+    """
+    def __init__(self, dataplane):
+        self.dataplane = dataplane
+        self.ports = {}
+
+    def refresh(self, port_id):
+        """
+        Update the index of a port, must be called with dataplane.cvar held
+
+        Args:
+            port_id: (device number, port number) tuple
+
+        Returns:
+            Number of new frames of the port
+        """
+        port = self.ports.get(port_id)
+        if port is None:
+            port = self.ports[port_id] = PortIndex()
+        return port.refresh(self.dataplane.packet_queues.get(port_id, []))
+
+    def lookup(self, port_id, indexes, key):
+        """
+        Find the frames of a port with the given values of the decoded fields, must be called after refresh()
+
+        Args:
+            port_id: (device number, port number) tuple
+            indexes: Indexes of the decoded fields, from split_match_fields()
+            key: Values of the fields
+
+        Returns:
+            List of the (frame, timestamp) tuples in the order of the queue, with the encapsulated frames whose fields
+            must be matched on the dissected packets, see is_encapsulated()
+        """
+        port = self.ports.get(port_id)
+        if port is None:
+            return []
+        return port.lookup(indexes, key)
+
+    def is_encapsulated(self, port_id, entry):
+        """
+        Whether the fields of a frame returned by lookup() were not decoded
+
+        Args:
+            port_id: (device number, port number) tuple
+            entry: (frame, timestamp) tuple returned by lookup()
+        """
+        return self.ports[port_id].is_encapsulated(entry)
+
+
+def get_packet_index(dataplane):
+    """
+    Get the packet index of a dataplane, created on first use
+
+    Args:
+        dataplane: PTF dataplane
+
+    Returns:
+        PacketIndex object
+    """
+    index = getattr(dataplane, "packet_index", None)
+    if index is None or index.dataplane is not dataplane:
+        index = dataplane.packet_index = PacketIndex(dataplane)
+    return index
@@ -13,7 +13,8 @@ import glob
 import pytest
 
 from tests.common.testbed import TestbedInfo
-from .issue import check_issues
+from .issue import DEFAULT_ISSUE_STATE_STALE_TTL, DEFAULT_ISSUE_STATE_TTL, ISSUE_URL_PATTERN, IssueStateResolver, \
+    extract_issues
 from tests.common.utilities import get_duts_from_host_pattern
 
 logger = logging.getLogger(__name__)
@@ -68,6 +69,23 @@ def pytest_addoption(parser):
         help="Dynamically update the skip reason based on the conditions, "
              "by default it will not use the static reason specified in the mark conditions file")
 
+    parser.addoption(
+        '--issue_state_ttl',
+        action='store',
+        dest='issue_state_ttl',
+        type=int,
+        default=DEFAULT_ISSUE_STATE_TTL,
+        help="Seconds during which the cached state of an issue in mark conditions is used without checking again")
+
+    parser.addoption(
+        '--issue_state_stale_ttl',
+        action='store',
+        dest='issue_state_stale_ttl',
+        type=int,
+        default=DEFAULT_ISSUE_STATE_STALE_TTL,
+        help="Seconds during which the cached state of an issue in mark conditions is used while it is checked "
+             "again in background")
+
 
 def load_conditions(session):
     """Load the content from mark conditions file
@@ -449,6 +467,80 @@ def load_basic_facts(dut_name, session):
     return results
 
 
+class ConditionsIndex(object):
+    """Index of the mark conditions list for finding the entries matching a test case name.
+
+    Entries matched by test case name prefix are stored in a character trie, so finding them costs the length of the
+    test case name instead of the number of entries. Regex entries are compiled once and kept in a separate list.
+    """
+
+    def __init__(self, conditions):
+        self.conditions = conditions
+        self.size = len(conditions)
+        self.trie = {}
+        self.regexes = []
+        for position, condition in enumerate(conditions):
+            # condition is a dict which has only one item, so we use condition.keys()[0] to get its key.
+            condition_entry = list(condition.keys())[0]
+            condition_items = condition[condition_entry]
+            if "regex" in condition_items.keys():
+                assert isinstance(condition_items["regex"], bool), \
+                    "The value of 'regex' in the mark conditions yaml should be bool type."
+                if condition_items["regex"] is True:
+                    self.regexes.append((position, re.compile(condition_entry)))
+                continue
+
+            use_longest = False
+            if "use_longest" in condition_items.keys():
+                assert isinstance(condition_items["use_longest"], bool), \
+                    "The value of 'use_longest' in the mark conditions yaml should be bool type."
+                use_longest = condition_items["use_longest"]
+            node = self.trie
+            for char in condition_entry:
+                node = node.setdefault(char, {})
+            # Characters are the keys of trie nodes, None is the key of entries ending at the node
+            node.setdefault(None, []).append((position, use_longest))
+
+    def find(self, nodeid):
+        """Get the entries matching a test case name, in the order of the conditions list.
+
+        Args:
+            nodeid (str): Full test case name
+
+        Returns:
+            list: Matching entries. An entry with use_longest drops the matching entries before it.
+        """
+        found = []
+        node = self.trie
+        found.extend(node.get(None, []))
+        for char in nodeid:
+            node = node.get(char)
+            if node is None:
+                break
+            found.extend(node.get(None, []))
+        found.extend((position, False) for position, regex in self.regexes if regex.search(nodeid))
+        found.sort()
+
+        all_matches = []
+        for position, use_longest in found:
+            if use_longest:
+                all_matches = []
+            all_matches.append(self.conditions[position])
+        return all_matches
+
+
+_conditions_index = None
+
+
+def get_conditions_index(conditions):
+    """Get the index of a conditions list, it is built again only if another list is used or the list is resized."""
+    global _conditions_index
+    if _conditions_index is None or _conditions_index.conditions is not conditions or \
+            _conditions_index.size != len(conditions):
+        _conditions_index = ConditionsIndex(conditions)
+    return _conditions_index
+
+
 def find_all_matches(nodeid, conditions, session, dynamic_update_skip_reason, basic_facts):
     """Find all matches of the given test case name in the conditions list.
 
@@ -459,35 +551,11 @@ def find_all_matches(nodeid, conditions, session, dynamic_update_skip_reason, ba
     Returns:
         list: All match test case name or None if not found
     """
-    all_matches = []
     max_length = -1
     conditional_marks = {}
     matches = []
 
-    for condition in conditions:
-        # condition is a dict which has only one item, so we use condition.keys()[0] to get its key.
-        condition_entry = list(condition.keys())[0]
-        condition_items = condition[condition_entry]
-        if "regex" in condition_items.keys():
-            assert isinstance(condition_items["regex"], bool), \
-                "The value of 'regex' in the mark conditions yaml should be bool type."
-            if condition_items["regex"] is True:
-                match = re.search(condition_entry, nodeid)
-            else:
-                match = None
-
-        elif "use_longest" in condition_items.keys():
-            assert isinstance(condition_items["use_longest"], bool), \
-                "The value of 'use_longest' in the mark conditions yaml should be bool type."
-            if nodeid.startswith(condition_entry) and condition_items["use_longest"] is True:
-                all_matches = []
-
-            match = nodeid.startswith(condition_entry)
-        else:
-            match = nodeid.startswith(condition_entry)
-
-        if match:
-            all_matches.append(condition)
+    all_matches = get_conditions_index(conditions).find(nodeid)
 
     for match in all_matches:
         case_starting_substring = list(match.keys())[0]
@@ -528,6 +596,18 @@ def find_all_matches(nodeid, conditions, session, dynamic_update_skip_reason, ba
     return matches
 
 
+_issue_state_resolver = None
+
+
+def get_issue_state_resolver(session):
+    """Get the issue state resolver of the session, create it with default settings if it is not created yet."""
+    global _issue_state_resolver
+    if _issue_state_resolver is None:
+        _issue_state_resolver = IssueStateResolver(session.config.cache,
+                                                   proxies=session.config.cache.get('PROXIES', {}))
+    return _issue_state_resolver
+
+
 def update_issue_status(condition_str, session):
     """Replace issue URL with 'True' or 'False' based on its active state.
 
@@ -543,34 +623,61 @@ def update_issue_status(condition_str, session):
     Returns:
         str: New condition string with issue URLs already replaced with 'True' or 'False'.
     """
-    issues = re.findall('https?://[^ )]+', condition_str)
+    issues = re.findall(ISSUE_URL_PATTERN, condition_str)
     if not issues:
         logger.debug('No issue specified in condition')
         return condition_str
 
-    issue_status_cache = session.config.cache.get('ISSUE_STATUS', {})
-    proxies = session.config.cache.get('PROXIES', {})
+    resolver = get_issue_state_resolver(session)
+    for issue_url in issues:
+        condition_str = condition_str.replace(issue_url, str(resolver.is_active(issue_url)))
+    return condition_str
 
-    unknown_issues = [issue_url for issue_url in issues if issue_url not in issue_status_cache]
-    if unknown_issues:
-        results = check_issues(unknown_issues, proxies=proxies)
-        issue_status_cache.update(results)
-        session.config.cache.set('ISSUE_STATUS', issue_status_cache)
 
-    for issue_url in issues:
-        if issue_url in issue_status_cache:
-            replace_str = str(issue_status_cache[issue_url])
-        else:
-            # Consider the issue as active anyway if unable to get issue state
-            replace_str = 'True'
+_condition_globals = None
+# Code objects of condition strings, and evaluated conditions keyed on the raw condition string and the fingerprint
+# of basic facts. Cleared for each pytest session.
+_condition_code_cache = {}
+_condition_result_cache = {}
+
+
+def get_condition_globals(basic_facts):
+    """Get the globals for evaluating condition strings and the fingerprint of basic facts.
+
+    Both are computed once per basic facts object, basic facts must not be modified after evaluating conditions.
+
+    Args:
+        basic_facts (dict): A one level dict with basic facts.
+
+    Returns:
+        tuple: (globals dict, fingerprint str)
+    """
+    global _condition_globals
+    if _condition_globals is None or _condition_globals[0] is not basic_facts:
+        safe_globals = {k: v for k, v in basic_facts.items()}
+        for var in ["asic_type", "platform", "hwsku", "asic_gen"]:
+            if var not in safe_globals:
+                logger.warning("Variable %s not found in basic_facts, defaulting to None", var)
+                safe_globals[var] = None
+        fingerprint = json.dumps(basic_facts, sort_keys=True, default=str)
+        _condition_globals = (basic_facts, safe_globals, fingerprint)
+    return _condition_globals[1], _condition_globals[2]
 
-        condition_str = condition_str.replace(issue_url, replace_str)
-    return condition_str
+
+def clear_condition_caches():
+    global _conditions_index, _condition_globals, _issue_state_resolver
+    _conditions_index = None
+    _condition_globals = None
+    _issue_state_resolver = None
+    _condition_code_cache.clear()
+    _condition_result_cache.clear()
 
 
 def evaluate_condition(dynamic_update_skip_reason, mark_details, condition, basic_facts, session):
     """Evaluate a condition string based on supplied basic facts.
 
+    Each condition string is compiled once and its result is memoized for the basic facts.
+
     Args:
         dynamic_update_skip_reason(bool): Dynamically update the skip reason based on the conditions, if it is true,
             it will update the skip reason, else will not.
@@ -587,26 +694,25 @@ def evaluate_condition(dynamic_update_skip_reason, mark_details, condition, basi
     if condition is None or condition.strip() == '':
         return True    # Empty condition item will be evaluated as True. Equivalent to be ignored.
 
-    condition_str = update_issue_status(condition, session)
-    try:
-        safe_facts = {k: v for k, v in basic_facts.items()}
-        safe_globals = {}
-        safe_globals.update(safe_facts)
-
-        for var in ["asic_type", "platform", "hwsku", "asic_gen"]:
-            if var not in safe_globals:
-                logger.warning("Variable %s not found in basic_facts, defaulting to None", var)
-                safe_globals[var] = None
-
-        condition_result = bool(eval(condition_str, safe_globals))
-
-        if condition_result and dynamic_update_skip_reason:
-            mark_details['reason'].append(condition)
-        return condition_result
-    except Exception:
-        raise RuntimeError('Failed to evaluate condition, raw_condition={}, condition_str={}'.format(
-            condition,
-            condition_str))
+    safe_globals, fingerprint = get_condition_globals(basic_facts)
+    condition_result = _condition_result_cache.get((condition, fingerprint))
+    if condition_result is None:
+        condition_str = update_issue_status(condition, session)
+        try:
+            code = _condition_code_cache.get(condition_str)
+            if code is None:
+                code = compile(condition_str, '<condition>', 'eval')
+                _condition_code_cache[condition_str] = code
+            condition_result = bool(eval(code, safe_globals))
+        except Exception:
+            raise RuntimeError('Failed to evaluate condition, raw_condition={}, condition_str={}'.format(
+                condition,
+                condition_str))
+        _condition_result_cache[(condition, fingerprint)] = condition_result
+
+    if condition_result and dynamic_update_skip_reason:
+        mark_details['reason'].append(condition)
+    return condition_result
 
 
 def evaluate_conditions(dynamic_update_skip_reason, mark_details, conditions, basic_facts,
@@ -653,9 +759,11 @@ def pytest_collection(session):
     Args:
         session (obj): Pytest session object.
     """
+    global _issue_state_resolver
 
     # Always clear cached conditions of previous run.
     session.config.cache.set('TESTS_MARK_CONDITIONS', None)
+    clear_condition_caches()
 
     if session.config.option.ignore_conditional_mark:
         logger.info('Ignore conditional mark')
@@ -668,6 +776,13 @@ def pytest_collection(session):
         # Only load basic facts if conditions are defined.
         get_basic_facts(session)
 
+        # Start checking all the issues in conditions, collection waits only for the issues it needs
+        _issue_state_resolver = IssueStateResolver(session.config.cache,
+                                                   proxies=session.config.cache.get('PROXIES', {}),
+                                                   ttl=session.config.option.issue_state_ttl,
+                                                   stale_ttl=session.config.option.issue_state_stale_ttl)
+        _issue_state_resolver.check(extract_issues(conditions))
+
 
 def pytest_collection_modifyitems(session, config, items):
     """Hook for adding marks to test cases based on conditions defined in a centralized file.
@@ -0,0 +1,132 @@
+"""
+Benchmark of finding the conditional marks of all the test cases in the tests tree.
+
+Test case names are collected by scanning the test modules for test functions and methods, without importing them.
+The marks of every test case are resolved with the mark conditions files, and compared with the marks resolved by
+another version of this plugin, e.g. extracted by
+"git show HEAD~1:tests/common/plugins/conditional_mark/__init__.py".
+
+Usage, from the repository root:
+    python -m tests.common.plugins.conditional_mark.collection_benchmark [--reference /tmp/conditional_mark.py]
+"""
+import argparse
+import ast
+import builtins
+import glob
+import importlib.util
+import os
+import sys
+import time
+from unittest.mock import MagicMock
+
+from tests.common.plugins import conditional_mark
+from tests.common.plugins.conditional_mark.issue import ISSUE_STATES_CACHE_KEY, extract_issues
+
+TESTS_DIR = os.path.realpath(os.path.join(os.path.dirname(__file__), "../../.."))
+CONDITIONS_FILES = os.path.join(os.path.dirname(__file__), "tests_mark_conditions*.yaml")
+BASIC_FACTS = {
+    "asic_type": "mellanox", "asic_gen": "spc2", "platform": "x86_64-mlnx_msn3800-r0",
+    "hwsku": "Mellanox-SN3800-D112C8",
+    "topo_type": "t0", "topo_name": "t0", "testbed": "vms-t0", "release": "master", "is_multi_asic": False,
+    "num_asic": 1, "asic_count": 1, "is_supervisor": False, "is_smartswitch": False, "macsec_en": False,
+    "build_version": "master.1-abcdef", "kernel_version": "6.1.0", "os_version": "12",
+    "constants": conditional_mark.MARK_CONDITIONS_CONSTANTS,
+}
+
+
+def collect_nodeids():
+    nodeids = []
+    for path in sorted(glob.glob(os.path.join(TESTS_DIR, "**", "test_*.py"), recursive=True)):
+        try:
+            with open(path) as f:
+                tree = ast.parse(f.read())
+        except (SyntaxError, UnicodeDecodeError):
+            continue
+        module = os.path.relpath(path, TESTS_DIR)
+        nodeids.append(module)
+        for node in tree.body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name.startswith("test"):
+                nodeids.append("{}::{}".format(module, node.name))
+            elif isinstance(node, ast.ClassDef) and node.name.startswith("Test"):
+                for item in node.body:
+                    if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)) and item.name.startswith("test"):
+                        nodeids.append("{}::{}::{}".format(module, node.name, item.name))
+    return nodeids
+
+
+def condition_names(conditions):
+    """Get the variable names used by condition strings, facts not in BASIC_FACTS are set to None."""
+    names = set()
+    for condition in conditions:
+        for mark_details in list(condition.values())[0].values():
+            if not isinstance(mark_details, dict):
+                continue
+            strings = mark_details.get("conditions") or []
+            for string in strings if isinstance(strings, list) else [strings]:
+                try:
+                    tree = ast.parse(string.strip(), mode="eval")
+                except SyntaxError:
+                    continue
+                names.update(node.id for node in ast.walk(tree) if isinstance(node, ast.Name))
+    return {name for name in names if not hasattr(builtins, name)}
+
+
+def resolve_marks(plugin, nodeids, conditions, basic_facts):
+    session = MagicMock()
+    # All issues are cached as active, without querying their state
+    issues = extract_issues(conditions)
+    cached = {
+        "ISSUE_STATUS": {issue: True for issue in issues},
+        ISSUE_STATES_CACHE_KEY: {issue: {"active": True, "checked": time.time()} for issue in issues},
+        "PROXIES": {},
+    }
+    session.config.cache.get = lambda key, default=None: cached.get(key, default)
+
+    results = []
+    start = time.time()
+    for nodeid in nodeids:
+        try:
+            matches = plugin.find_all_matches(nodeid, conditions, session, False, basic_facts)
+            results.append(sorted((list(match.keys())[0], mark) for match in matches
+                                  for mark in list(match.values())[0]))
+        except RuntimeError as e:
+            results.append("error: {}".format(e))
+    return results, time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark conditional mark resolving")
+    parser.add_argument("--reference", help="Another version of conditional_mark/__init__.py to compare with")
+    args = parser.parse_args()
+
+    session = MagicMock()
+    session.config.option.mark_conditions_files = [CONDITIONS_FILES]
+    conditions = conditional_mark.load_conditions(session)
+    basic_facts = dict(BASIC_FACTS)
+    for name in condition_names(conditions):
+        basic_facts.setdefault(name, None)
+
+    nodeids = collect_nodeids()
+    print("Test cases: {}, condition entries: {}".format(len(nodeids), len(conditions)))
+
+    results, elapsed = resolve_marks(conditional_mark, nodeids, conditions, basic_facts)
+    print("Current: {:.3f}s, test cases with marks {}, errors {}".format(
+        elapsed, sum(1 for r in results if r), sum(1 for r in results if isinstance(r, str))))
+
+    if args.reference:
+        spec = importlib.util.spec_from_file_location("tests.common.plugins.conditional_mark.reference",
+                                                      args.reference)
+        reference = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(reference)
+        reference_results, reference_elapsed = resolve_marks(reference, nodeids, conditions, basic_facts)
+        mismatches = [nodeid for nodeid, result, reference_result in zip(nodeids, results, reference_results)
+                      if result != reference_result]
+        for nodeid in mismatches[:10]:
+            print("Marks mismatch: {}".format(nodeid))
+        print("Reference: {:.3f}s, identical: {}".format(reference_elapsed, not mismatches))
+        return 1 if mismatches else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
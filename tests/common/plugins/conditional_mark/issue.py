@@ -4,14 +4,28 @@ import logging
 import multiprocessing
 import os
 import re
+import threading
+import time
 from abc import ABCMeta, abstractmethod
+from multiprocessing.pool import ThreadPool
 from urllib.parse import urlencode
 
 import requests
 import six
+from requests.adapters import HTTPAdapter
 
 logger = logging.getLogger(__name__)
 
+ISSUE_URL_PATTERN = 'https?://[^ )]+'
+# Key of issue states in the pytest cache, value is a dict of issue URL to {"active": bool, "checked": timestamp}
+ISSUE_STATES_CACHE_KEY = 'ISSUE_STATES'
+# Issue states checked within this number of seconds are used without checking again
+DEFAULT_ISSUE_STATE_TTL = 3600
+# Issue states checked within this number of seconds are used while they are checked again in background
+DEFAULT_ISSUE_STATE_STALE_TTL = 86400
+MAX_ISSUE_CHECK_WORKERS = 8
+ISSUE_CHECK_TIMEOUT = 60
+
 
 class IssueCheckerBase(six.with_metaclass(ABCMeta, object)):
     """Base class for issue checker
@@ -19,6 +33,8 @@ class IssueCheckerBase(six.with_metaclass(ABCMeta, object)):
 
     def __init__(self, url):
         self.url = url
+        # Set when the issue state could not be retrieved and is_active returned the default state
+        self.failed = False
 
     @abstractmethod
     def is_active(self):
@@ -34,10 +50,11 @@ class GitHubIssueChecker(IssueCheckerBase):
 
     NAME = 'GitHub'
 
-    def __init__(self, url, proxies):
+    def __init__(self, url, proxies, session=None):
         super(GitHubIssueChecker, self).__init__(url)
         self.api_url = url.replace('github.com', 'api.github.com/repos')
         self.proxies = proxies
+        self.session = session
 
     def is_active(self):
         """Check if the GitHub issue is still active.
@@ -50,7 +67,7 @@ class GitHubIssueChecker(IssueCheckerBase):
         """
 
         def fetch_issue(url):
-            response = requests.get(url, proxies=self.proxies, timeout=10)
+            response = (self.session or requests).get(url, proxies=self.proxies, timeout=10)
             response.raise_for_status()
             return response.json()
 
@@ -79,6 +96,7 @@ class GitHubIssueChecker(IssueCheckerBase):
             except Exception as direct_err:
                 logger.error(f"Access GitHub API directly failed for {direct_url}: {direct_err}")
                 logger.debug(f"Issue {direct_url} is considered active due to API access failure.")
+                self.failed = True
                 return True
 
         # Check issue state
@@ -95,11 +113,12 @@ class GitHubIssueChecker(IssueCheckerBase):
         return True
 
 
-def issue_checker_factory(url, proxies):
+def issue_checker_factory(url, proxies, session=None):
     """Factory function for creating issue checker object based on the domain name in the issue URL.
 
     Args:
         url (str): Issue URL.
+        session (obj): Optional requests session used by the checker.
 
     Returns:
         obj: An instance of issue checker.
@@ -108,7 +127,7 @@ def issue_checker_factory(url, proxies):
     if m and len(m.groups()) > 0:
         domain_name = m.groups()[0].lower()
         if 'github' in domain_name:
-            return GitHubIssueChecker(url, proxies)
+            return GitHubIssueChecker(url, proxies, session=session)
         else:
             logger.error('Unknown issue website: {}'.format(domain_name))
     logger.error('Creating issue checker failed. Bad issue url {}'.format(url))
@@ -147,3 +166,132 @@ def check_issues(issues, proxies=None):
         proc.join(timeout=60)
 
     return dict(check_results)
+
+
+class IssueStateResolver(object):
+    """Resolve issue states concurrently, with a persistent cache of the states.
+
+    Issue states are kept with the time they were checked in the pytest cache, which is stored on disk. States
+    checked within ttl seconds are used directly. States checked within stale_ttl seconds are used while they are
+    checked again in background. Other issues are checked by a bounded thread pool sharing one HTTP session, so
+    connections are reused per host, and the state is waited for only when it is needed.
+    """
+
+    def __init__(self, cache, proxies=None, ttl=DEFAULT_ISSUE_STATE_TTL, stale_ttl=DEFAULT_ISSUE_STATE_STALE_TTL,
+                 workers=MAX_ISSUE_CHECK_WORKERS, timeout=ISSUE_CHECK_TIMEOUT):
+        """
+        Args:
+            cache (obj): The pytest cache, or any object with the same get and set methods.
+            proxies (dict): Proxies for the HTTP requests.
+            ttl (int): Seconds during which a checked state is used without checking again.
+            stale_ttl (int): Seconds during which a checked state is used while it is checked again.
+            workers (int): Maximum number of issues checked at the same time.
+            timeout (int): Maximum seconds to wait for the state of an issue, it is considered active after that.
+        """
+        self.cache = cache
+        self.proxies = proxies
+        self.ttl = ttl
+        self.stale_ttl = max(stale_ttl, ttl)
+        self.workers = workers
+        self.timeout = timeout
+        entries = cache.get(ISSUE_STATES_CACHE_KEY, {}) or {}
+        self.entries = {url: entry for url, entry in entries.items()
+                        if isinstance(entry, dict) and "active" in entry and "checked" in entry}
+        self.pending = {}
+        self.pool = None
+        self.lock = threading.Lock()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _age(self, issue):
+        entry = self.entries.get(issue)
+        return time.time() - entry["checked"] if entry else None
+
+    def check(self, issues):
+        """Start checking states of the issues which are not cached or need to be checked again, don't wait.
+
+        Args:
+            issues (list of str): List of issue URLs.
+        """
+        for issue in issues:
+            age = self._age(issue)
+            if age is not None and age < self.ttl:
+                continue
+            with self.lock:
+                if issue in self.pending:
+                    continue
+                checker = issue_checker_factory(issue, self.proxies, session=self.session)
+                if checker is None:
+                    continue
+                if self.pool is None:
+                    # Threads of ThreadPool are daemon threads, revalidation in background doesn't delay exit
+                    self.pool = ThreadPool(processes=self.workers)
+                self.pending[issue] = self.pool.apply_async(self._check_issue, (checker,))
+
+    def _check_issue(self, checker):
+        try:
+            active = checker.is_active()
+        except Exception as e:
+            logger.error('Checking issue {} failed, exception: {}'.format(checker.url, repr(e)))
+            checker.failed = True
+            active = True
+        with self.lock:
+            self.pending.pop(checker.url, None)
+            # A failed check keeps the previous state, if any, for checking again later
+            if not checker.failed:
+                self.entries[checker.url] = {"active": active, "checked": time.time()}
+                self.cache.set(ISSUE_STATES_CACHE_KEY, self.entries)
+        return active
+
+    def is_active(self, issue):
+        """Get state of an issue. Unknown states are considered active.
+
+        Args:
+            issue (str): Issue URL.
+
+        Returns:
+            bool: False if the issue is closed else True.
+        """
+        age = self._age(issue)
+        if age is not None and age < self.stale_ttl:
+            if age >= self.ttl:
+                self.check([issue])
+            return self.entries[issue]["active"]
+
+        self.check([issue])
+        with self.lock:
+            result = self.pending.get(issue)
+        if result is not None:
+            try:
+                return result.get(self.timeout)
+            except multiprocessing.TimeoutError:
+                logger.warning('Timeout checking issue {}, consider it as active'.format(issue))
+                return True
+        # The check is already finished, or failed without previous state
+        entry = self.entries.get(issue)
+        return entry["active"] if entry else True
+
+
+def extract_issues(conditions):
+    """Get all the issue URLs in the condition strings of a mark conditions list.
+
+    Args:
+        conditions (list): List of mark conditions, as loaded from the mark conditions files.
+
+    Returns:
+        list: Issue URLs without duplicates.
+    """
+    issues = {}
+    for condition in conditions:
+        for mark_details in list(condition.values())[0].values():
+            if not isinstance(mark_details, dict):
+                continue
+            condition_strs = mark_details.get('conditions') or []
+            if not isinstance(condition_strs, list):
+                condition_strs = [condition_strs]
+            for condition_str in condition_strs:
+                for issue in re.findall(ISSUE_URL_PATTERN, str(condition_str)):
+                    issues[issue] = None
+    return list(issues)
@@ -292,6 +292,41 @@ class TestFindAllMatches(unittest.TestCase):
         self.assertEqual(len(marks_found), 1)
         self.assertIn('xfail', marks_found)
 
+    # Test case 12: Regex entries and prefix entries are matched in the order of the conditions
+    def test_regex_and_prefix_entries(self):
+        _, session_mock = load_test_conditions()
+        conditions = [
+            {"test_regex.py::test_a": {"skip": {"reason": "Skip prefix", "conditions": ["asic_type in ['vs']"]}}},
+            {"test_regex.py::test_[ab]$": {"regex": True, "xfail": {"reason": "Xfail regex"}}},
+            {"test_regex.py::test_b": {"regex": False, "skip": {"reason": "Skip no regex"}}},
+        ]
+
+        matches = find_all_matches("test_regex.py::test_a", conditions, session_mock, DYNAMIC_UPDATE_SKIP_REASON,
+                                   CUSTOM_BASIC_FACTS)
+        self.assertEqual([list(match.keys())[0] for match in matches],
+                         ["test_regex.py::test_a", "test_regex.py::test_[ab]$"])
+
+        matches = find_all_matches("test_regex.py::test_b", conditions, session_mock, DYNAMIC_UPDATE_SKIP_REASON,
+                                   CUSTOM_BASIC_FACTS)
+        self.assertEqual([list(match.keys())[0] for match in matches], ["test_regex.py::test_[ab]$"])
+
+        conditions.append({"test_regex.py": {"use_longest": True, "skip": {"reason": "Skip longest"}}})
+        matches = find_all_matches("test_regex.py::test_a", conditions, session_mock, DYNAMIC_UPDATE_SKIP_REASON,
+                                   CUSTOM_BASIC_FACTS)
+        self.assertEqual([list(match.keys())[0] for match in matches], ["test_regex.py"])
+
+    # Test case 13: Evaluated conditions are not reused for different basic facts
+    def test_conditions_with_different_facts(self):
+        conditions, session_mock = load_test_conditions()
+        nodeid = "test_conditional_mark.py::test_mark"
+
+        matches = find_all_matches(nodeid, conditions, session_mock, DYNAMIC_UPDATE_SKIP_REASON, CUSTOM_BASIC_FACTS)
+        self.assertEqual(len(matches), 1)
+
+        other_facts = {"asic_type": "vs", "topo_type": "t1"}
+        matches = find_all_matches(nodeid, conditions, session_mock, DYNAMIC_UPDATE_SKIP_REASON, other_facts)
+        self.assertNotIn(nodeid, [list(match.keys())[0] for match in matches])
+
 
 if __name__ == "__main__":
     unittest.main()
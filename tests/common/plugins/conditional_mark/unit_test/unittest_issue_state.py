@@ -0,0 +1,146 @@
+import json
+import logging
+import os
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+from urllib.parse import parse_qs, urlparse
+
+from tests.common.plugins.conditional_mark import issue
+from tests.common.plugins.conditional_mark.issue import ISSUE_STATES_CACHE_KEY, IssueStateResolver, extract_issues
+
+ISSUE_URL = "https://github.com/sonic-net/sonic-buildimage/issues/{}"
+# Issues with odd numbers are closed, issue 500 can't be retrieved
+CLOSED_ISSUES = [1, 3]
+FAILED_ISSUE = 500
+# Direct API access of failed issues fails fast, instead of trying api.github.com
+FAILED_ISSUE_URL = "https://github.invalid/sonic-net/sonic-buildimage/issues/{}".format(FAILED_ISSUE)
+
+
+class IssueProxyHandler(BaseHTTPRequestHandler):
+    """Stand-in for the GitHub issues proxy, see SONIC_AUTOMATION_PROXY_GITHUB_ISSUES_URL."""
+
+    requests = []
+    delay = 0
+
+    def do_GET(self):
+        issue_url = parse_qs(urlparse(self.path).query)["github_issue_url"][0]
+        number = int(issue_url.rsplit("/", 1)[1])
+        IssueProxyHandler.requests.append(number)
+        time.sleep(IssueProxyHandler.delay)
+        if number == FAILED_ISSUE:
+            self.send_response(500)
+            self.end_headers()
+            return
+        body = json.dumps({"state": "closed" if number in CLOSED_ISSUES else "open"}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class DiskCache(object):
+    """Stand-in for the pytest cache, values are stored as JSON like in the pytest cache directory."""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key, default):
+        return json.loads(self.data[key]) if key in self.data else default
+
+    def set(self, key, value):
+        self.data[key] = json.dumps(value)
+
+
+class TestIssueStateResolver(unittest.TestCase):
+    """Test cases for IssueStateResolver with a local HTTP server."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), IssueProxyHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.proxy_url = "http://127.0.0.1:{}/".format(cls.server.server_address[1])
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        IssueProxyHandler.requests = []
+        IssueProxyHandler.delay = 0
+        self.cache = DiskCache()
+        logger = logging.Logger("issue", logging.CRITICAL)
+        logger.addHandler(logging.NullHandler())
+        patchers = [
+            patch.dict(os.environ, {"SONIC_AUTOMATION_PROXY_GITHUB_ISSUES_URL": self.proxy_url}),
+            patch.object(issue, "logger", logger),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_check_issues_concurrently(self):
+        IssueProxyHandler.delay = 0.5
+        resolver = IssueStateResolver(self.cache, workers=4)
+        issues = [ISSUE_URL.format(number) for number in range(1, 5)]
+
+        start = time.time()
+        resolver.check(issues)
+        # check() doesn't wait for the issues
+        self.assertLess(time.time() - start, 0.5)
+        states = [resolver.is_active(url) for url in issues]
+        self.assertLess(time.time() - start, 1.5)
+        self.assertEqual(states, [False, True, False, True])
+
+        # States are persisted, fresh states are used by another resolver without checking again
+        resolver = IssueStateResolver(self.cache)
+        self.assertEqual([resolver.is_active(url) for url in issues], [False, True, False, True])
+        self.assertEqual(sorted(IssueProxyHandler.requests), [1, 2, 3, 4])
+
+    def test_stale_state_is_checked_in_background(self):
+        url = ISSUE_URL.format(1)
+        self.cache.set(ISSUE_STATES_CACHE_KEY, {url: {"active": True, "checked": time.time() - 7200}})
+        IssueProxyHandler.delay = 0.5
+        resolver = IssueStateResolver(self.cache, ttl=3600, stale_ttl=86400)
+
+        start = time.time()
+        self.assertTrue(resolver.is_active(url))
+        self.assertLess(time.time() - start, 0.5)
+
+        resolver.pending[url].wait(5)
+        self.assertFalse(resolver.is_active(url))
+        self.assertFalse(self.cache.get(ISSUE_STATES_CACHE_KEY, {})[url]["active"])
+
+    def test_expired_state_is_checked_again(self):
+        url = ISSUE_URL.format(1)
+        self.cache.set(ISSUE_STATES_CACHE_KEY, {url: {"active": True, "checked": time.time() - 100000}})
+        resolver = IssueStateResolver(self.cache, ttl=3600, stale_ttl=86400)
+
+        self.assertFalse(resolver.is_active(url))
+        self.assertEqual(IssueProxyHandler.requests, [1])
+
+    def test_failed_check_is_not_cached(self):
+        resolver = IssueStateResolver(self.cache)
+
+        self.assertTrue(resolver.is_active(FAILED_ISSUE_URL))
+        self.assertNotIn(FAILED_ISSUE_URL, self.cache.get(ISSUE_STATES_CACHE_KEY, {}))
+
+    def test_extract_issues(self):
+        conditions = [
+            {"test_a.py": {"skip": {"conditions": ["asic_type in ['vs']", ISSUE_URL.format(1)]}}},
+            {"test_b.py": {"regex": True, "xfail": {"conditions": "{} and {}".format(ISSUE_URL.format(2),
+                                                                                     ISSUE_URL.format(1))}}},
+            {"test_c.py": {"skip": {"reason": "no conditions"}}},
+        ]
+        self.assertEqual(extract_issues(conditions), [ISSUE_URL.format(1), ISSUE_URL.format(2)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,94 +1,344 @@
+"""
+Hardware resources sampler running on the DUT, it must only use the python standard library.
+
+Every MEASURE_DELAY seconds the sampler reads /proc/stat, /proc/<pid>/stat, /proc/meminfo, the CPU usage of the
+docker container cgroups and statvfs of the root filesystem, without forking any command. CPU utilization of the
+processes and containers is computed from the CPU time consumed since the previous sample, so it reflects the
+current load instead of the lifetime average reported by "ps".
+
+Samples are stored as fixed-size records in a binary ring file. The file starts with a header describing the
+layout and the number of records written so far, record N is stored in slot N % capacity. The test side reads the
+header before and after a test, and decodes only the records written in between.
+"""
 import argparse
-import time
+import glob
+import json
 import os
-
-from datetime import datetime
+import struct
+import sys
+import time
+from collections import namedtuple
 
 
-FETCH_CPU_CMD = "ps -eo pcpu,args | sort -k 1 -r | tail -n +2"
-FETCH_HDD_CMD = "df -hm /"
 MEASURE_DELAY = 2
+RING_FILE = "/tmp/dut_monitor.ring"
+RING_CAPACITY = 3600
+TOP_PROCESSES = 10
+TOP_CONTAINERS = 8
+NAME_SIZE = 48
+
+RING_MAGIC = b"DMON"
+RING_VERSION = 1
+# magic, version, top processes, top containers, capacity, interval, started, records count
+RING_HEADER = struct.Struct("<4sHHHIddQ")
+RING_COUNT = struct.Struct("<Q")
+RING_COUNT_OFFSET = RING_HEADER.size - RING_COUNT.size
+# seq, timestamp, total CPU, used RAM, used HDD
+RECORD_HEAD = "<Qdfff"
+# pid, CPU, command line
+RECORD_PROCESS = "if{}s".format(NAME_SIZE)
+# CPU, container name
+RECORD_CONTAINER = "f{}s".format(NAME_SIZE)
 
+CGROUP_CPU_USAGE = [
+    # cgroup v1, usage in nanoseconds
+    ("/sys/fs/cgroup/cpuacct/docker/", "", "cpuacct.usage", 1),
+    # cgroup v2, usage in microseconds
+    ("/sys/fs/cgroup/system.slice/docker-", ".scope", "cpu.stat", 1000),
+]
+DOCKER_CONFIG = "/var/lib/docker/containers/{}/config.v2.json"
 
-def process_cpu(log_file):
+RingHeader = namedtuple("RingHeader", ["magic", "version", "processes", "containers", "capacity", "interval",
+                                       "started", "count"])
+
+
+def record_struct(processes, containers):
+    """Struct of the records of a ring file with the given number of top processes and containers."""
+    return struct.Struct(RECORD_HEAD + RECORD_PROCESS * processes + RECORD_CONTAINER * containers)
+
+
+def read_header(fp):
     """
-    @summary: Fetch CPU utilization. Write to the file total and top 10 process CPU utilization.
-    @param log_file: Opened file object to store fetched CPU utilization.
+    @summary: Read the header of a ring file.
+    @param fp: Ring file opened in binary mode, a local file or a SFTP file.
+    @return: RingHeader tuple.
     """
-    general_template = """
-"{timestamp}":
-    total: {total}
-    top_consumer:
-"""
-    per_process_template = "        {cpu_utilization}: \"{process}\""
-    top_consumer_list = []
-    total = 0
-    top_consumer_counter = 10
+    fp.seek(0)
+    data = fp.read(RING_HEADER.size)
+    if len(data) < RING_HEADER.size:
+        raise ValueError("Truncated ring file header")
+    header = RingHeader(*RING_HEADER.unpack(data))
+    if header.magic != RING_MAGIC or header.version != RING_VERSION:
+        raise ValueError("Unsupported ring file {} version {}".format(header.magic, header.version))
+    return header
 
-    for line in os.popen(FETCH_CPU_CMD).readlines():
-        process_consumed = float(line.split()[0])
-        total += process_consumed
-        if top_consumer_counter:
-            top_consumer_list.append(per_process_template.format(cpu_utilization=process_consumed,
-                                     process=" ".join(line.split()[1:])))
-            top_consumer_counter -= 1
 
-    result = general_template.format(timestamp=datetime.now().strftime("%Y-%m-%d %H:%M:%S"), total=total) \
-        + "\n".join(top_consumer_list)
-    log_file.write(result)
+def decode_record(values, processes, containers):
+    """Convert the values of an unpacked record to a dictionary, empty process and container slots are dropped."""
+    record = dict(zip(("seq", "timestamp", "cpu", "ram", "hdd"), values[:5]))
+    offset = 5
+    record["processes"] = []
+    for _ in range(processes):
+        pid, cpu, name = values[offset:offset + 3]
+        if pid:
+            record["processes"].append((pid, cpu, name.rstrip(b"\0").decode("utf-8", "replace")))
+        offset += 3
+    record["containers"] = []
+    for _ in range(containers):
+        cpu, name = values[offset:offset + 2]
+        if name.rstrip(b"\0"):
+            record["containers"].append((name.rstrip(b"\0").decode("utf-8", "replace"), cpu))
+        offset += 2
+    return record
 
 
-def process_ram(log_file):
+def read_records(fp, header, start, end):
     """
-    @summary: Fetch RAM utilization and write it to the file.
-              Use 'MemTotal' and 'MemAvailable' from '/proc/meminfo' to obtain used RAM amount.
-    @param log_file: Opened file object to store fetched RAM utilization.
+    @summary: Read and decode the records with sequence numbers in [start, end) from a ring file.
+              Records already overwritten are skipped, as well as the oldest slot which may be overwritten
+              while being read.
+    @param fp: Ring file opened in binary mode.
+    @param header: RingHeader of the file.
+    @return: List of records as dictionaries, in order of sequence numbers.
     """
-    with open('/proc/meminfo') as stream:
-        for line in stream:
-            if 'MemAvailable' in line:
-                available_mem_in_kb = int(line.split()[1])
-            if 'MemTotal' in line:
-                total_mem_in_kb = int(line.split()[1])
+    record = record_struct(header.processes, header.containers)
+    start = max(start, header.count - header.capacity + 1, 0)
+    end = min(end, header.count)
+    records = []
+    while start < end:
+        slot = start % header.capacity
+        # Contiguous records up to the end of the ring
+        number = min(end - start, header.capacity - slot)
+        fp.seek(RING_HEADER.size + slot * record.size)
+        data = fp.read(number * record.size)
+        for values in record.iter_unpack(data[:len(data) - len(data) % record.size]):
+            records.append(decode_record(values, header.processes, header.containers))
+        start += number
+    return records
+
+
+class RingWriter(object):
+    """Append fixed-size records to a ring file."""
 
-    used = total_mem_in_kb - available_mem_in_kb
-    used_percent = used * 100 / total_mem_in_kb
-    log_file.write("\"{date}\": {used_ram}\n".format(date=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                   used_ram=used_percent))
+    def __init__(self, path, capacity=RING_CAPACITY, interval=MEASURE_DELAY, processes=TOP_PROCESSES,
+                 containers=TOP_CONTAINERS):
+        self.capacity = capacity
+        self.processes = processes
+        self.containers = containers
+        self.record = record_struct(processes, containers)
+        self.count = 0
+        # Replace any previous ring atomically, readers never see a partially written header
+        tmp_path = "{}.{}".format(path, os.getpid())
+        self.fp = open(tmp_path, "w+b")
+        self.fp.write(RING_HEADER.pack(RING_MAGIC, RING_VERSION, processes, containers, capacity, interval,
+                                       time.time(), 0))
+        self.fp.flush()
+        os.rename(tmp_path, path)
 
+    def append(self, sample):
+        """
+        @summary: Write a sample to the next slot, then publish it by updating the records count.
+        @param sample: Dictionary with keys timestamp, cpu, ram, hdd, processes and containers, as returned by
+                       Sampler.sample().
+        """
+        processes = sample["processes"][:self.processes]
+        values = [self.count, sample["timestamp"], sample["cpu"], sample["ram"], sample["hdd"]]
+        for pid, cpu, name in processes:
+            values.extend((pid, cpu, name.encode("utf-8", "replace")[:NAME_SIZE]))
+        values.extend((0, 0.0, b"") * (self.processes - len(processes)))
+        containers = sample["containers"][:self.containers]
+        for name, cpu in containers:
+            values.extend((cpu, name.encode("utf-8", "replace")[:NAME_SIZE]))
+        values.extend((0.0, b"") * (self.containers - len(containers)))
 
-def process_hdd(log_file):
+        self.fp.seek(RING_HEADER.size + (self.count % self.capacity) * self.record.size)
+        self.fp.write(self.record.pack(*values))
+        self.fp.flush()
+        self.count += 1
+        self.fp.seek(RING_COUNT_OFFSET)
+        self.fp.write(RING_COUNT.pack(self.count))
+        self.fp.flush()
+
+    def close(self):
+        self.fp.close()
+
+
+class Sampler(object):
     """
-    @summary: Fetch used amount of HDD and write it to the file. Execute command defined in FETCH_HDD_CMD.
-    @param log_file: Opened file object to store fetched HDD utilization.
+    Sample the CPU, RAM and HDD utilization. CPU utilization of processes and containers is the percentage of one
+    CPU used since the previous sample, like "top" and "docker stats". Total CPU utilization is the percentage of
+    all the CPUs.
     """
-    output_line_id = 1
-    use_value_id = 4
-    hdd_usage = os.popen(FETCH_HDD_CMD).read().split("\n")[output_line_id].split()[use_value_id].rstrip("%")
-    log_file.write("\"{date}\": {used_ram}\n".format(date=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                   used_ram=hdd_usage))
 
+    def __init__(self, hdd_path="/"):
+        self.hdd_path = hdd_path
+        self.clk_tck = float(os.sysconf("SC_CLK_TCK"))
+        self.prev_time = None
+        self.prev_total = None
+        # (pid, start time) -> CPU ticks, the start time distinguishes reused pids
+        self.prev_processes = {}
+        # container id -> CPU nanoseconds
+        self.prev_containers = {}
+        self.command_lines = {}
+        self.container_names = {}
+
+    def read_total(self):
+        """Return busy and total CPU ticks of all CPUs from /proc/stat."""
+        with open("/proc/stat") as stream:
+            fields = [int(value) for value in stream.readline().split()[1:9]]
+        # user nice system idle iowait irq softirq steal
+        return sum(fields) - fields[3] - fields[4], sum(fields)
+
+    def read_processes(self):
+        """Return CPU ticks consumed by each process, keyed by (pid, start time), and the command names."""
+        processes = {}
+        names = {}
+        for pid in os.listdir("/proc"):
+            if not pid.isdigit():
+                continue
+            try:
+                with open("/proc/{}/stat".format(pid)) as stream:
+                    data = stream.read()
+            except (IOError, OSError):
+                # The process exited
+                continue
+            # The command name is in parentheses and may contain spaces and parentheses
+            name_end = data.rfind(")")
+            fields = data[name_end + 2:].split()
+            key = (int(pid), fields[19])
+            processes[key] = int(fields[11]) + int(fields[12])
+            names[key] = data[data.find("(") + 1:name_end]
+        return processes, names
+
+    def command_line(self, key, name):
+        """Return the command line of a process like "ps -o args", kernel threads have their name in brackets."""
+        if key not in self.command_lines:
+            try:
+                with open("/proc/{}/cmdline".format(key[0]), "rb") as stream:
+                    args = stream.read(NAME_SIZE * 4).replace(b"\0", b" ").strip().decode("utf-8", "replace")
+            except (IOError, OSError):
+                args = ""
+            self.command_lines[key] = args or "[{}]".format(name)
+        return self.command_lines[key]
+
+    def container_name(self, container_id):
+        """Return the name of a docker container from its configuration, or the short id."""
+        if container_id not in self.container_names:
+            try:
+                with open(DOCKER_CONFIG.format(container_id)) as stream:
+                    name = json.load(stream)["Name"].lstrip("/")
+            except (IOError, OSError, ValueError, KeyError):
+                name = container_id[:12]
+            self.container_names[container_id] = name
+        return self.container_names[container_id]
+
+    def read_containers(self):
+        """Return CPU nanoseconds consumed by each docker container, keyed by container id."""
+        containers = {}
+        for prefix, suffix, usage_file, scale in CGROUP_CPU_USAGE:
+            for path in glob.glob("{}*{}/{}".format(prefix, suffix, usage_file)):
+                container_id = path[len(prefix):len(path) - len(suffix) - len(usage_file) - 1]
+                try:
+                    with open(path) as stream:
+                        if scale == 1:
+                            usage = int(stream.read())
+                        else:
+                            usage = next(int(line.split()[1]) for line in stream if line.startswith("usage_usec"))
+                except (IOError, OSError, ValueError, StopIteration):
+                    continue
+                containers[container_id] = usage * scale
+        return containers
 
-def main():
-    cpu_log = open("/tmp/cpu.log", "w")
-    ram_log = open("/tmp/ram.log", "w")
-    hdd_log = open("/tmp/hdd.log", "w")
+    def read_ram(self):
+        """Return used RAM in percent, using 'MemTotal' and 'MemAvailable' from '/proc/meminfo'."""
+        meminfo = {}
+        with open("/proc/meminfo") as stream:
+            for line in stream:
+                key, value = line.split(":", 1)
+                if key in ("MemTotal", "MemAvailable"):
+                    meminfo[key] = int(value.split()[0])
+                    if len(meminfo) == 2:
+                        break
+        return (meminfo["MemTotal"] - meminfo["MemAvailable"]) * 100.0 / meminfo["MemTotal"]
 
+    def read_hdd(self):
+        """Return used disk space in percent, computed like "df"."""
+        stat = os.statvfs(self.hdd_path)
+        used = stat.f_blocks - stat.f_bfree
+        return used * 100.0 / (used + stat.f_bavail) if used + stat.f_bavail else 0.0
+
+    def sample(self, top_processes=TOP_PROCESSES, top_containers=TOP_CONTAINERS):
+        """
+        @summary: Take a sample. CPU utilization is 0 in the first sample, as there is no previous sample.
+        @return: Dictionary with keys timestamp, cpu, ram, hdd, processes as a list of (pid, CPU, command line)
+                 tuples and containers as a list of (name, CPU) tuples, both sorted by decreasing CPU.
+        """
+        now = time.time()
+        busy, total = self.read_total()
+        processes, names = self.read_processes()
+        containers = self.read_containers()
+
+        cpu = 0.0
+        process_cpu = []
+        container_cpu = []
+        if self.prev_time is not None:
+            elapsed = now - self.prev_time
+            if total > self.prev_total[1]:
+                cpu = (busy - self.prev_total[0]) * 100.0 / (total - self.prev_total[1])
+            for key, ticks in processes.items():
+                # Processes started after the previous sample consumed all their CPU time during the interval
+                delta = ticks - self.prev_processes.get(key, 0)
+                if delta > 0:
+                    process_cpu.append((delta * 100.0 / self.clk_tck / elapsed, key))
+            for container_id, usage in containers.items():
+                delta = usage - self.prev_containers.get(container_id, 0)
+                container_cpu.append((max(delta, 0) * 100.0 / 1e9 / elapsed, container_id))
+
+        process_cpu.sort(reverse=True)
+        container_cpu.sort(reverse=True)
+        top = [(key[0], value, self.command_line(key, names[key])) for value, key in process_cpu[:top_processes]]
+        # Command lines of exited processes are not needed anymore
+        for key in set(self.command_lines) - set(processes):
+            del self.command_lines[key]
+
+        self.prev_time = now
+        self.prev_total = (busy, total)
+        self.prev_processes = processes
+        self.prev_containers = containers
+        return {
+            "timestamp": now,
+            "cpu": cpu,
+            "ram": self.read_ram(),
+            "hdd": self.read_hdd(),
+            "processes": top,
+            "containers": [(self.container_name(container_id), value)
+                           for value, container_id in container_cpu[:top_containers]],
+        }
+
+
+def main(args):
+    ring = RingWriter(args.ring, capacity=args.capacity, interval=args.interval)
+    sampler = Sampler()
+    # First sample is the reference for CPU utilization of the next one
+    sampler.sample()
     print("Started resources monitoring ...")
+    sys.stdout.flush()
+
+    next_sample = time.time()
     while True:
-        process_cpu(cpu_log)
-        process_ram(ram_log)
-        process_hdd(hdd_log)
-        time.sleep(MEASURE_DELAY)
-        cpu_log.flush()
-        ram_log.flush()
-        hdd_log.flush()
+        # Sample at fixed rate, sampling time doesn't delay the next samples
+        next_sample += args.interval
+        time.sleep(max(next_sample - time.time(), 0))
+        ring.append(sampler.sample())
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--start", help="device file", action="store_true", default=False)
+    parser.add_argument("--ring", default=RING_FILE, help="Path of the ring file storing the samples")
+    parser.add_argument("--interval", type=float, default=MEASURE_DELAY, help="Seconds between samples")
+    parser.add_argument("--capacity", type=int, default=RING_CAPACITY, help="Number of records in the ring file")
     args = parser.parse_args()
 
     if args.start:
-        main()
+        main(args)
@@ -8,14 +8,14 @@ import yaml
 
 from collections import OrderedDict
 from datetime import datetime
+from .dut_monitor import RING_FILE, read_header, read_records
 from .errors import HDDThresholdExceeded, RAMThresholdExceeded, CPUThresholdExceeded
 
 
 logger = logging.getLogger(__name__)
 DUT_MONITOR = "/tmp/dut_monitor.py"
-DUT_CPU_LOG = "/tmp/cpu.log"
-DUT_RAM_LOG = "/tmp/ram.log"
-DUT_HDD_LOG = "/tmp/hdd.log"
+DUT_MONITOR_RING = RING_FILE
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
 
 
 class DUTMonitorPlugin(object):
@@ -30,22 +30,25 @@ class DUTMonitorPlugin(object):
 
     @pytest.fixture(autouse=True, scope="module")
     def dut_ssh(self, duthosts, rand_one_dut_hostname, creds):
-        """Establish SSH connection with DUT"""
+        """Establish SSH connection with DUT and start monitoring on DUT"""
         duthost = duthosts[rand_one_dut_hostname]
         ssh = DUTMonitorClient(host=duthost.hostname, user=creds["sonicadmin_user"],
                                password=creds["sonicadmin_password"])
+        ssh.start()
         yield ssh
+        # Stop monitoring on DUT
+        ssh.stop()
 
     @pytest.fixture(autouse=True, scope="function")
     def dut_monitor(self, dut_ssh, localhost, duthosts, rand_one_dut_hostname):
         """
-        For each test item starts monitoring of hardware resources consumption on the DUT
+        For each test item verifies hardware resources consumption on the DUT during the test
         """
         duthost = duthosts[rand_one_dut_hostname]
         dut_thresholds = {}
         monitor_exceptions = []
-        # Start monitoring on DUT
-        dut_ssh.start()
+        # Position of the test start in the DUT samples
+        window = dut_ssh.window_start()
 
         # Read file with defined thresholds
         with open(self.thresholds) as stream:
@@ -61,10 +64,8 @@ class DUTMonitorPlugin(object):
 
         yield dut_thresholds
 
-        # Stop monitoring on DUT
-        dut_ssh.stop()
-        # Download log files with CPU, RAM and HDD measurements data
-        measurements = dut_ssh.get_log_files()
+        # Download CPU, RAM and HDD measurements made during the test
+        measurements = dut_ssh.get_measurements(window)
         # Verify hardware resources consumption does not exceed defined threshold
         if measurements["hdd"]:
             try:
@@ -144,7 +145,7 @@ class DUTMonitorPlugin(object):
         average_cpu = "\n> Average CPU consumption during test run {}; Threshold - {}\n"
         fail_msg = ""
         total_sum = 0
-        t_format = "%Y-%m-%d %H:%M:%S"
+        t_format = TIME_FORMAT
 
         def handle_process_measurements(p_name, t_first, t_last, p_average):
             """Compose fail message if process overuse CPU durig 'cpu_measure_duration' interval."""
@@ -222,7 +223,21 @@ class DUTMonitorPlugin(object):
             fail_msg += average_cpu.format(total_sum / len(cpu_meas), thresholds["cpu_total_average"])
 
         if fail_msg:
-            raise CPUThresholdExceeded(cpu_thresholds + fail_msg)
+            raise CPUThresholdExceeded(cpu_thresholds + fail_msg + self.containers_summary(cpu_meas))
+
+    def containers_summary(self, cpu_meas):
+        """
+        Compose average CPU consumption of the containers during the test, to attribute CPU overuse
+        """
+        containers = {}
+        for measurement in cpu_meas.values():
+            for name, consumption in measurement.get("containers", {}).items():
+                containers[name] = containers.get(name, 0) + consumption
+        if not containers:
+            return ""
+        averages = sorted(((total / len(cpu_meas), name) for name, total in containers.items()), reverse=True)
+        return "\n> Average CPU consumption per container\n{}\n".format(
+            "\n".join("{}: {:.1f}".format(name, average) for average, name in averages))
 
 
 class DUTMonitorClient(object):
@@ -303,7 +318,7 @@ class DUTMonitorClient(object):
     def start(self):
         """
         @summary: Start HW resources monitoring on the DUT.
-                  Write obtained values to the following files on the DUT: DUT_CPU_LOG, DUT_RAM_LOG, DUT_HDD_LOG
+                  Obtained values are written to the ring file DUT_MONITOR_RING on the DUT.
         """
         self.running = True
         self._upload_to_dut()
@@ -313,9 +328,9 @@ class DUTMonitorClient(object):
         self.run_channel.get_pty()
         self.run_channel.settimeout(5)
         # Start monitoring on DUT
-        self.run_channel.exec_command("python {} --start".format(DUT_MONITOR))
+        self.run_channel.exec_command("python3 {} --start --ring {}".format(DUT_MONITOR, DUT_MONITOR_RING))
         # Ensure monitoring started
-        output = self.run_channel.recv(1024)
+        output = self.run_channel.recv(1024).decode("utf-8", "replace")
         if "Started resources monitoring ..." not in output:
             raise Exception("Failed to start monitoring on DUT: {}".format(output))
 
@@ -328,32 +343,68 @@ class DUTMonitorClient(object):
         if not self.run_channel.closed:
             self.run_channel.close()
 
-    def read_yml(self, file_pointer):
+    def read_ring(self, window=None):
         """
-        @summary: Read yaml file content. Convert it to the ordered data.
-        @return: OrderedDict with sorted keys by timestamp, or empty dict for empty file.
+        @summary: Read the records written to the ring file on the DUT since the window start.
+                  Only the header and the records in the window are downloaded.
+        @param window: RingHeader returned by window_start(), or None to read all the available records.
+        @return: List of decoded records, in chronological order.
+        """
+        with self.ssh.open_sftp() as sftp:
+            with sftp.file(DUT_MONITOR_RING, "rb") as fp:
+                header = read_header(fp)
+                start = 0
+                # The sampler was restarted during the test if the ring file was recreated, e.g. after DUT reboot
+                if window is not None and window.started == header.started:
+                    start = window.count
+                records = read_records(fp, header, start, header.count)
+                lost = header.count - start - len(records)
+                if not records and header.count:
+                    # Test is shorter than the sampling interval, use the latest sample
+                    records = read_records(fp, header, header.count - 1, header.count)
+        if lost > 0:
+            logger.warning("Test lasted longer than the DUT monitor ring, {} samples are lost".format(lost))
+        return records
+
+    def window_start(self):
         """
-        with file_pointer as fp:
-            measurements = yaml.safe_load("".join(fp))
-        if measurements is None:
-            return {}
-        # Sort json data to process logs chronologically
-        keys = list(measurements.keys())
-        keys.sort()
-        key_value_pairs = [(item, measurements[item]) for item in keys]
-        return OrderedDict(key_value_pairs)
-
-    def get_log_files(self):
+        @summary: Get the current position in the ring file on the DUT, records written after it are measured
+                  during the following test.
+        @return: RingHeader, or None if the ring file can't be read.
         """
-        @summary: Fetch monitoring logs from device, parse, convert to dictionary with sorted order.
+        try:
+            with self.ssh.open_sftp() as sftp:
+                with sftp.file(DUT_MONITOR_RING, "rb") as fp:
+                    return read_header(fp)
+        except Exception as err:
+            logger.warning("Failed to read DUT monitor ring - {}".format(repr(err)))
+            return None
+
+    def get_measurements(self, window=None):
+        """
+        @summary: Fetch measurements made on the DUT during the test, convert to dictionaries ordered by timestamp.
+        @param window: RingHeader returned by window_start() when the test started.
         @return: Dictionary with keys "cpu", "ram", "hdd", values contains appropriate measurements made on DUT.
         """
-        logger.debug("Downloading file from the DUT...")
-        cpu_log_fp = self.ssh.open_sftp().file(DUT_CPU_LOG)
-        ram_log_fp = self.ssh.open_sftp().file(DUT_RAM_LOG)
-        hdd_log_fp = self.ssh.open_sftp().file(DUT_HDD_LOG)
-
-        cpu_meas = self.read_yml(cpu_log_fp)
-        ram_meas = self.read_yml(ram_log_fp)
-        hdd_meas = self.read_yml(hdd_log_fp)
-        return {"cpu": cpu_meas, "ram": ram_meas, "hdd": hdd_meas}
+        logger.debug("Downloading measurements from the DUT...")
+        return to_measurements(self.read_ring(window))
+
+
+def to_measurements(records):
+    """
+    @summary: Convert ring file records to the measurements verified by DUTMonitorPlugin.
+    @return: Dictionary with keys "cpu", "ram", "hdd" of OrderedDicts keyed by timestamp. CPU measurements contain
+             "total", "top_consumer" mapping CPU consumption to process command line and "containers" mapping
+             container name to CPU consumption.
+    """
+    measurements = {"cpu": OrderedDict(), "ram": OrderedDict(), "hdd": OrderedDict()}
+    for record in records:
+        timestamp = datetime.fromtimestamp(record["timestamp"]).strftime(TIME_FORMAT)
+        measurements["cpu"][timestamp] = {
+            "total": round(record["cpu"], 1),
+            "top_consumer": OrderedDict((round(cpu, 1), name) for _, cpu, name in record["processes"]),
+            "containers": OrderedDict((name, round(cpu, 1)) for name, cpu in record["containers"]),
+        }
+        measurements["ram"][timestamp] = record["ram"]
+        measurements["hdd"][timestamp] = record["hdd"]
+    return measurements
@@ -10,6 +10,7 @@ from . import system_msg_handler
 from .bug_handler_helper import get_bughandler_instance, BugHandler
 
 from .system_msg_handler import AnsibleLogAnalyzer as ansible_loganalyzer
+from tests.common.helpers.artifacts import collect_artifacts
 from os.path import join, split
 
 ANSIBLE_LOGANALYZER_MODULE = system_msg_handler.__file__.replace(r".pyc", ".py")
@@ -174,6 +175,7 @@ class LogAnalyzer:
         self._markers = []
         self.fail = True
         self.store_la_logs = False
+        self.analyze_on_dut = False
 
         self.additional_files = list(additional_files.keys())
         self.additional_start_str = list(additional_files.values())
@@ -182,6 +184,7 @@ class LogAnalyzer:
             # override the fail and store_la_logs if they are set in the request config options
             self.fail = not (self.request.config.getoption("--ignore_la_failure"))
             self.store_la_logs = self.request.config.getoption("--store_la_logs")
+            self.analyze_on_dut = self.request.config.getoption("--loganalyzer_on_dut", default=False)
 
         self._la_logs_dir = "/tmp/loganalyzer/{}".format(self.ansible_host.hostname)
         self.bughandler = bughandler
@@ -428,38 +431,58 @@ class LogAnalyzer:
         self.ansible_host.command(cmd)
         return start_marker
 
-    def analyze(self, marker, fail=None, maximum_log_length=None, store_la_logs=None):
+    def _analyze_on_dut(self, marker, start_string, maximum_log_length=None):
         """
-        @summary: Extract syslog logs based on the start/stop markers and compose one file.
-                  Download composed file, analyze file based on defined regular expressions.
+        @summary: Add end marker and analyze syslog and additional files on the DUT in one call.
+                  Files are analyzed in parallel processes on the DUT, only matched lines are returned.
 
         @param marker: Marker obtained from "init" method.
-        @param fail: Flag to enable/disable raising exception when loganalyzer find error messages.
+        @param start_string: String to start analysis of syslog from.
         @param maximum_log_length: The long message (length > maximum_log_length) will be skipped.
-        @param store_la_logs: Flag to save the match lines
-        @return: If "fail" is False - return dictionary of parsed syslog summary,
-                 if dictionary can't be parsed - return empty dictionary.
-                 If "fail" is True and if found match messages - raise exception.
+        @return: Map <file_name, [list_of_matching_strings, list_of_expected_strings]>
         """
-        fail = self.fail if fail is None else fail
-        store_la_logs = self.store_la_logs if store_la_logs is None else store_la_logs
-        logging.debug("Loganalyzer analyze")
-        analyzer_summary = {"total": {"match": 0, "expected_match": 0, "expected_missing_match": 0},
-                            "match_files": {},
-                            "match_messages": {},
-                            "expect_messages": {},
-                            "unused_expected_regexp": []
-                            }
-        timestamp = time.strftime("%Y-%m-%d-%H:%M:%S", time.gmtime())
-        tmp_folder = ".".join((SYSLOG_TMP_FOLDER, self.ansible_host.hostname, timestamp))
-        marker = marker.replace(' ', '_')
-        self.ansible_loganalyzer.run_id = marker
+        sources = [{"path": system_msg_handler.system_log_file}]
+        end_marker_logs = []
+        for idx, path in enumerate(self.additional_files):
+            if self.additional_start_str and self.additional_start_str[idx] != '':
+                sources.append({"path": path, "start_string": self.additional_start_str[idx]})
+            else:
+                sources.append({"path": path, "start_string": start_string})
+                end_marker_logs.append(path)
+
+        job = {
+            "sources": sources,
+            "end_marker_logs": end_marker_logs,
+            "start_marker": self.start_marker,
+            "match": self.match_regex,
+            "ignore": self.ignore_regex,
+            "expect": self.expect_regex,
+            "maximum_log_length": maximum_log_length,
+        }
+
+        # The job is passed in a file, ansible logs the arguments and stdin of the command into the syslog which
+        # is analyzed, the markers and regexes of the job would be found in the analysis range.
+        job_file = os.path.join(self.dut_run_dir, "loganalyzer_job.json")
+        self.ansible_host.copy(src=ANSIBLE_LOGANALYZER_MODULE, dest=os.path.join(self.dut_run_dir, "loganalyzer.py"))
+        self.ansible_host.copy(content=json.dumps(job), dest=job_file)
+        cmd = "python {run_dir}/loganalyzer.py --action analyze_parallel --run_id {marker} --job_file {job_file}"\
+            .format(run_dir=self.dut_run_dir, marker=marker, job_file=job_file)
 
-        if not self.start_marker:
-            start_string = 'start-LogAnalyzer-{}'.format(marker)
-        else:
-            start_string = self.start_marker
+        logging.debug("Analyze files {} on the DUT".format([source["path"] for source in sources]))
+        result = self.ansible_host.command(cmd)
+        return json.loads(result["stdout"])
+
+    def _extract_and_analyze(self, marker, start_string, timestamp, tmp_folder, maximum_log_length=None):
+        """
+        @summary: Add end marker, extract logs on the DUT, download and analyze them locally.
 
+        @param marker: Marker obtained from "init" method.
+        @param start_string: String to start extraction of syslog from.
+        @param timestamp: Timestamp used to name downloaded files.
+        @param tmp_folder: File path to store downloaded syslog.
+        @param maximum_log_length: The long message (length > maximum_log_length) will be skipped.
+        @return: Map <file_name, [list_of_matching_strings, list_of_expected_strings]>
+        """
         with DisableLogrotateCronContext(self.ansible_host):
             # Add end marker into DUT syslog
             self._add_end_marker(marker)
@@ -477,20 +500,18 @@ class LogAnalyzer:
                 self.ansible_host.extract_log(directory=file_dir, file_prefix=file_name, start_string=start_str,
                                               target_filename=extracted_file_name)
 
-        # Download extracted logs from the DUT to the temporal folder defined in SYSLOG_TMP_FOLDER
-        self.save_extracted_log(dest=tmp_folder)
-        file_list = [tmp_folder]
-
+        # Download extracted logs from the DUT to the temporal folder defined in SYSLOG_TMP_FOLDER, in one round trip
+        artifacts = [{"path": self.extracted_syslog, "dest": tmp_folder}]
         for path in self.additional_files:
             file_dir, file_name = split(path)
             extracted_file_name = os.path.join(self.dut_run_dir, file_name)
-            tmp_folder = ".".join((extracted_file_name, timestamp))
-            self.save_extracted_file(dest=tmp_folder, src=extracted_file_name)
-            file_list.append(tmp_folder)
+            artifacts.append({"path": extracted_file_name, "dest": ".".join((extracted_file_name, timestamp))})
+        collect_artifacts(self.ansible_host, artifacts, fail_on_missing=True)
+        file_list = [artifact["dest"] for artifact in artifacts]
 
-        match_messages_regex = re.compile('|'.join(self.match_regex)) if len(self.match_regex) else None
-        ignore_messages_regex = re.compile('|'.join(self.ignore_regex)) if len(self.ignore_regex) else None
-        expect_messages_regex = re.compile('|'.join(self.expect_regex)) if len(self.expect_regex) else None
+        match_messages_regex = system_msg_handler.compile_messages_matcher(self.match_regex)
+        ignore_messages_regex = system_msg_handler.compile_messages_matcher(self.ignore_regex)
+        expect_messages_regex = system_msg_handler.compile_messages_matcher(self.expect_regex)
 
         logging.debug("Analyze files {}".format(file_list))
         logging.debug('    match_regex="{}"'.format(match_messages_regex.pattern if match_messages_regex else ''))
@@ -504,6 +525,47 @@ class LogAnalyzer:
             with open(folder) as fo:
                 logging.debug("{} file content:\n\n{}".format(folder, fo.read()))
             os.remove(folder)
+        return analyzer_parse_result
+
+    def analyze(self, marker, fail=None, maximum_log_length=None, store_la_logs=None):
+        """
+        @summary: Extract syslog logs based on the start/stop markers and compose one file.
+                  Download composed file, analyze file based on defined regular expressions.
+
+        @param marker: Marker obtained from "init" method.
+        @param fail: Flag to enable/disable raising exception when loganalyzer find error messages.
+        @param maximum_log_length: The long message (length > maximum_log_length) will be skipped.
+        @param store_la_logs: Flag to save the match lines
+        @return: If "fail" is False - return dictionary of parsed syslog summary,
+                 if dictionary can't be parsed - return empty dictionary.
+                 If "fail" is True and if found match messages - raise exception.
+        """
+        fail = self.fail if fail is None else fail
+        store_la_logs = self.store_la_logs if store_la_logs is None else store_la_logs
+        logging.debug("Loganalyzer analyze")
+        analyzer_summary = {"total": {"match": 0, "expected_match": 0, "expected_missing_match": 0},
+                            "match_files": {},
+                            "match_messages": {},
+                            "expect_messages": {},
+                            "unused_expected_regexp": []
+                            }
+        timestamp = time.strftime("%Y-%m-%d-%H:%M:%S", time.gmtime())
+        tmp_folder = ".".join((SYSLOG_TMP_FOLDER, self.ansible_host.hostname, timestamp))
+        marker = marker.replace(' ', '_')
+        self.ansible_loganalyzer.run_id = marker
+
+        if not self.start_marker:
+            start_string = 'start-LogAnalyzer-{}'.format(marker)
+        else:
+            start_string = self.start_marker
+
+        if self.analyze_on_dut:
+            with DisableLogrotateCronContext(self.ansible_host):
+                analyzer_parse_result = self._analyze_on_dut(marker, start_string,
+                                                             maximum_log_length=maximum_log_length)
+        else:
+            analyzer_parse_result = self._extract_and_analyze(marker, start_string, timestamp, tmp_folder,
+                                                              maximum_log_length=maximum_log_length)
 
         expected_lines_total = []
         unused_regex_messages = []
@@ -551,7 +613,7 @@ class LogAnalyzer:
 
         @param dest: File path to store downloaded log file.
         """
-        self.ansible_host.fetch(dest=dest, src=self.extracted_syslog, flat="yes")
+        self.save_extracted_file(dest, self.extracted_syslog)
 
     def save_extracted_file(self, dest, src):
         """
@@ -561,4 +623,4 @@ class LogAnalyzer:
 
         @param src: Source path to store downloaded file.
         """
-        self.ansible_host.fetch(dest=dest, src=src, flat="yes")
+        collect_artifacts(self.ansible_host, [{"path": src, "dest": dest}], fail_on_missing=True)
@@ -0,0 +1,75 @@
+"""
+Benchmark of loganalyzer regex matching on a captured log file.
+
+Compares the legacy matching (single alternation of all regexes + findall) with MessagesMatcher
+and verifies that both give the same verdict for every line.
+
+Usage:
+    python matcher_benchmark.py /path/to/syslog [--max_lines N] [--ignore_files a.txt,b.txt]
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+from system_msg_handler import AnsibleLogAnalyzer, MessagesMatcher
+
+CURRENT_DIR = os.path.dirname(os.path.realpath(__file__))
+COMMON_MATCH = os.path.join(CURRENT_DIR, "loganalyzer_common_match.txt")
+COMMON_IGNORE = os.path.join(CURRENT_DIR, "loganalyzer_common_ignore.txt")
+
+
+def legacy_line_matches(line, match_regex, ignore_regex):
+    return bool(match_regex.findall(line)) and not ignore_regex.findall(line)
+
+
+def matcher_line_matches(line, match_matcher, ignore_matcher):
+    return match_matcher.search(line) and not ignore_matcher.search(line)
+
+
+def run(lines, func, *args):
+    start = time.time()
+    verdicts = [bool(func(line, *args)) for line in lines]
+    return verdicts, time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark loganalyzer regex matching")
+    parser.add_argument("log_file", help="Captured log file, e.g. /var/log/syslog")
+    parser.add_argument("--match_files", default=COMMON_MATCH, help="Comma separated match files")
+    parser.add_argument("--ignore_files", default=COMMON_IGNORE, help="Comma separated ignore files")
+    parser.add_argument("--max_lines", type=int, default=0, help="Analyze only first N lines, 0 for all")
+    args = parser.parse_args()
+
+    analyzer = AnsibleLogAnalyzer("benchmark", False)
+    match_list = analyzer.create_msg_regex(args.match_files.split(","))[1]
+    ignore_list = analyzer.create_msg_regex(args.ignore_files.split(","))[1]
+
+    with open(args.log_file, errors="replace") as log_file:
+        lines = log_file.readlines()
+    if args.max_lines:
+        lines = lines[:args.max_lines]
+    print("Lines: {}, size: {} bytes".format(len(lines), sum(len(line) for line in lines)))
+
+    start = time.time()
+    match_matcher = MessagesMatcher(match_list)
+    ignore_matcher = MessagesMatcher(ignore_list)
+    print("MessagesMatcher build time: {:.3f}s".format(time.time() - start))
+
+    legacy, legacy_time = run(lines, legacy_line_matches,
+                              re.compile("|".join(match_list)), re.compile("|".join(ignore_list)))
+    print("Legacy findall: {:.3f}s, matched lines {}".format(legacy_time, sum(legacy)))
+
+    new, new_time = run(lines, matcher_line_matches, match_matcher, ignore_matcher)
+    print("MessagesMatcher: {:.3f}s, matched lines {}".format(new_time, sum(new)))
+
+    mismatches = [line for line, old, cur in zip(lines, legacy, new) if old != cur]
+    for line in mismatches[:10]:
+        print("Verdict mismatch: {}".format(line.rstrip()))
+    print("Speedup: {:.1f}x".format(legacy_time / new_time if new_time else float("inf")))
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -52,22 +52,9 @@ def pytest_runtest_setup(item):
         if duthost.topo_type == 't2':
             continue
 
-        # Trigger monit to refresh its cache so subsequent collection reads fresh data
-        logger.info("Triggering monit refresh on {} before collecting memory data".format(duthost.hostname))
-        validate_output = memory_monitors[duthost.hostname].execute_command("sudo monit validate")
-        memory_monitors[duthost.hostname].record_monit_baseline_from_validate_output(validate_output)
-
         # Initial memory check for all registered commands
-        for name, cmd, memory_params, memory_check in memory_monitors[duthost.hostname].commands:
-            try:
-                if name == "monit":
-                    output = memory_monitors[duthost.hostname].read_monit_status_with_freshness_retry(cmd)
-                else:
-                    output = memory_monitors[duthost.hostname].execute_command(cmd)
-                memory_values["before_test"][duthost.hostname][name] = memory_check(output, memory_params)
-            except Exception as e:
-                logger.warning("Error collecting initial memory data for {}: {}".format(name, str(e)))
-                memory_values["before_test"][duthost.hostname][name] = {}
+        memory_values["before_test"][duthost.hostname].update(
+            memory_monitors[duthost.hostname].collect_memory_values())
 
     logger.info("Before test: collected memory_values {}".format(memory_values))
 
@@ -99,22 +86,9 @@ def pytest_runtest_teardown(item, nextitem):
         if duthost.topo_type == 't2':
             continue
 
-        # Trigger monit to refresh its cache so subsequent collection reads fresh data
-        logger.info("Triggering monit refresh on {} before collecting memory data".format(duthost.hostname))
-        validate_output = memory_monitors[duthost.hostname].execute_command("sudo monit validate")
-        memory_monitors[duthost.hostname].record_monit_baseline_from_validate_output(validate_output)
-
         # memory check for all registered commands
-        for name, cmd, memory_params, memory_check in memory_monitors[duthost.hostname].commands:
-            try:
-                if name == "monit":
-                    output = memory_monitors[duthost.hostname].read_monit_status_with_freshness_retry(cmd)
-                else:
-                    output = memory_monitors[duthost.hostname].execute_command(cmd)
-                memory_values["after_test"][duthost.hostname][name] = memory_check(output, memory_params)
-            except Exception as e:
-                logger.warning("Error collecting final memory data for {}: {}".format(name, str(e)))
-                memory_values["after_test"][duthost.hostname][name] = {}
+        memory_values["after_test"][duthost.hostname].update(
+            memory_monitors[duthost.hostname].collect_memory_values())
 
         # Only check thresholds if we have data to compare
         if any(memory_values["before_test"][duthost.hostname]) and any(memory_values["after_test"][duthost.hostname]):
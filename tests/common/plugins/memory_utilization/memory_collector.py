@@ -0,0 +1,176 @@
+"""
+Memory snapshot collector running on the DUT, it must only use the python standard library.
+
+MemoryMonitor sends this module with the list of registered memory items, and all of them are collected in one
+remote execution. Sources parsed by parse_top_output, parse_free_output, parse_monit_validate_output and
+parse_docker_stats_output are computed from /proc and the docker container cgroups, giving the values those parsers
+would get from the command outputs. Other registered commands are executed as is and their output is returned, to
+be parsed by their memory_check function.
+
+Usage:
+    python3 memory_collector.py '[{"name": "free", "source": "free", "items": ["used"]}]'
+Output:
+    JSON dictionary {name: {"values": {item: value}}} for computed sources, {name: {"output": str}} for executed
+    commands, or {name: {"error": str}}.
+"""
+import json
+import os
+import shlex
+import subprocess
+import sys
+
+
+COMMAND_TIMEOUT = 60
+DOCKER_CONFIG = "/var/lib/docker/containers/{}/config.v2.json"
+CGROUP_MEMORY = [
+    # cgroup v1: prefix, suffix, usage file, inactive file counter in memory.stat, limit file
+    ("/sys/fs/cgroup/memory/docker/", "", "memory.usage_in_bytes", "total_inactive_file", "memory.limit_in_bytes"),
+    # cgroup v2
+    ("/sys/fs/cgroup/system.slice/docker-", ".scope", "memory.current", "inactive_file", "memory.max"),
+]
+
+
+def read_meminfo():
+    """Return /proc/meminfo values in KiB."""
+    meminfo = {}
+    with open("/proc/meminfo") as stream:
+        for line in stream:
+            key, value = line.split(":", 1)
+            meminfo[key] = int(value.split()[0])
+    return meminfo
+
+
+def read_file(path):
+    with open(path) as stream:
+        return stream.read().strip()
+
+
+def collect_top(items, meminfo):
+    """Resident memory in MiB of the processes whose name contains each item, like RES of "top"."""
+    page_kib = os.sysconf("SC_PAGE_SIZE") / 1024.0
+    values = {}
+    for pid in os.listdir("/proc"):
+        if not pid.isdigit():
+            continue
+        try:
+            with open("/proc/{}/stat".format(pid)) as stream:
+                stat = stream.read()
+            with open("/proc/{}/statm".format(pid)) as stream:
+                resident = int(stream.read().split()[1])
+        except (IOError, OSError, IndexError, ValueError):
+            # The process exited
+            continue
+        name = stat[stat.find("(") + 1:stat.rfind(")")]
+        for item in items:
+            if item in name:
+                values[item] = values.get(item, 0) + resident * page_kib / 1024.0
+    return {item: round(value, 1) for item, value in values.items()}
+
+
+def collect_free(items, meminfo):
+    """Sum of the Mem and Swap rows of "free -m" for each column."""
+    mem = {
+        "total": meminfo["MemTotal"],
+        "used": meminfo["MemTotal"] - meminfo.get("MemAvailable", meminfo["MemFree"]),
+        "free": meminfo["MemFree"],
+        "shared": meminfo.get("Shmem", 0),
+        "buff/cache": meminfo.get("Buffers", 0) + meminfo.get("Cached", 0) + meminfo.get("SReclaimable", 0),
+        "available": meminfo.get("MemAvailable", meminfo["MemFree"]),
+    }
+    swap = {
+        "total": meminfo.get("SwapTotal", 0),
+        "used": meminfo.get("SwapTotal", 0) - meminfo.get("SwapFree", 0),
+        "free": meminfo.get("SwapFree", 0),
+    }
+    return {item: (mem.get(item, 0) // 1024) + (swap.get(item, 0) // 1024) for item in items}
+
+
+def collect_monit(items, meminfo):
+    """System memory usage in percent, like the "memory usage" of "monit status"."""
+    used = meminfo["MemTotal"] - meminfo.get("MemAvailable", meminfo["MemFree"])
+    return {"memory_usage": round(used * 100.0 / meminfo["MemTotal"], 1)}
+
+
+def container_name(container_id):
+    try:
+        with open(DOCKER_CONFIG.format(container_id)) as stream:
+            return json.load(stream)["Name"].lstrip("/")
+    except (IOError, OSError, ValueError, KeyError):
+        return container_id[:12]
+
+
+def collect_docker(items, meminfo):
+    """Memory usage of the containers in percent of their limit, like "MEM %" of "docker stats"."""
+    host_memory = meminfo["MemTotal"] * 1024
+    containers = {}
+    for prefix, suffix, usage_file, inactive_key, limit_file in CGROUP_MEMORY:
+        parent = os.path.dirname(prefix)
+        if not os.path.isdir(parent):
+            continue
+        for entry in os.listdir(parent):
+            path = os.path.join(parent, entry)
+            if not (path.startswith(prefix) and path.endswith(suffix) and os.path.isdir(path)):
+                continue
+            container_id = path[len(prefix):len(path) - len(suffix)]
+            try:
+                usage = int(read_file(os.path.join(path, usage_file)))
+                limit = read_file(os.path.join(path, limit_file))
+                with open(os.path.join(path, "memory.stat")) as stream:
+                    stat = dict(line.split() for line in stream if line.strip())
+            except (IOError, OSError, ValueError):
+                continue
+            # Page cache which can be reclaimed is not counted, like docker does
+            inactive = int(stat.get(inactive_key, 0))
+            if inactive < usage:
+                usage -= inactive
+            limit = host_memory if limit == "max" else min(int(limit), host_memory)
+            containers[container_name(container_id)] = usage * 100.0 / limit if limit else 0.0
+
+    values = {}
+    for name in sorted(containers):
+        for item in items:
+            if item in name:
+                values[item] = round(containers[name], 1)
+    return values
+
+
+def run_command(cmd):
+    """Run a command like the ansible command module, return its output without the trailing newline."""
+    proc = subprocess.Popen(shlex.split(cmd), stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE)
+    try:
+        out, _ = proc.communicate(timeout=COMMAND_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        out, _ = proc.communicate()
+    return out.decode("utf-8", "replace").rstrip("\r\n")
+
+
+SOURCES = {
+    "top": collect_top,
+    "free": collect_free,
+    "monit": collect_monit,
+    "docker": collect_docker,
+}
+
+
+def collect(spec):
+    """
+    Collect memory values of all the items in spec, a list of dicts with keys name, source (one of SOURCES, or
+    "command" to run cmd) and items (memory items of the source).
+    """
+    results = {}
+    meminfo = read_meminfo()
+    for entry in spec:
+        try:
+            if entry["source"] in SOURCES:
+                results[entry["name"]] = {"values": SOURCES[entry["source"]](entry["items"], meminfo)}
+            else:
+                results[entry["name"]] = {"output": run_command(entry["cmd"])}
+        except Exception as e:
+            results[entry["name"]] = {"error": repr(e)}
+    return results
+
+
+if __name__ == "__main__":
+    sys.stdout.write(json.dumps(collect(json.loads(sys.argv[1]))))
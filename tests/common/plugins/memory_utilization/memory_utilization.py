@@ -1,14 +1,27 @@
 import logging
 import re
+import shlex
 import time
 import json
 from os.path import join, split
 
+from tests.common.helpers.remote_script import RemoteScript
+
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 MEMORY_UTILIZATION_COMMON_JSON_FILE = join(split(__file__)[0], "memory_utilization_common.json")
 MEMORY_UTILIZATION_DEPENDENCE_JSON_FILE = join(split(__file__)[0], "memory_utilization_dependence.json")
+MEMORY_COLLECTOR_FILE = join(split(__file__)[0], "memory_collector.py")
+
+# [MemoryUtilization] memory_check functions whose values are computed by memory_collector.py from /proc and the
+# docker cgroups, instead of running and parsing their command. Other commands are run by the collector as is.
+COLLECTOR_SOURCES = {
+    "parse_top_output": "top",
+    "parse_free_output": "free",
+    "parse_monit_validate_output": "monit",
+    "parse_docker_stats_output": "docker",
+}
 
 # [MemoryUtilization] tunables: how long to sleep and how many times to retry the `sudo monit status` read.
 MONIT_STATUS_FRESHNESS_WAIT_SECONDS = 60
@@ -24,6 +37,7 @@ class MemoryMonitor:
         self.memory_errors = []
         # [MemoryUtilization] System-block 'data collected' timestamp captured from last `sudo monit validate`.
         self._monit_memory_baseline_timestamp = ""
+        self._collector_script = None
 
     def register_command(self, name, cmd, memory_params, memory_check_fn):
         """Register a command with its associated memory parameters and check function."""
@@ -49,6 +63,80 @@ class MemoryMonitor:
             logger.warning("Error executing command '{}': {}".format(cmd, str(e)))
             return ""  # Return empty string on error
 
+    def collector_script(self):
+        """memory_collector.py, copied to the DUT once per session and run by path."""
+        if self._collector_script is None:
+            self._collector_script = RemoteScript(MEMORY_COLLECTOR_FILE)
+        return self._collector_script
+
+    def collector_args(self):
+        """Arguments of memory_collector.py for all the registered commands."""
+        spec = []
+        for name, cmd, memory_params, memory_check_fn in self.commands:
+            spec.append({
+                "name": name,
+                "source": COLLECTOR_SOURCES.get(getattr(memory_check_fn, "__name__", None), "command"),
+                "cmd": cmd,
+                "items": list(memory_params.keys()),
+            })
+        return shlex.quote(json.dumps(spec))
+
+    def collect_memory_values(self):
+        """
+        Collect memory values of all the registered commands in one remote execution of memory_collector.py.
+        Falls back to running and parsing each command if the collector can't be run.
+        Returns a dictionary {name: {memory item: value}}, values of a failed command are empty.
+        """
+        try:
+            response = self.collector_script().run(self.ansible_host, self.collector_args(), module="command",
+                                                   sudo=True)
+            results = json.loads(response.get("stdout") or "null")
+            if not isinstance(results, dict):
+                raise ValueError("unexpected collector output, rc {}: {}".format(
+                    response.get("rc"), response.get("stderr", "")))
+        except Exception as e:
+            logger.warning("Memory collector failed on {}, running each command: {}".format(
+                self.ansible_host.hostname, str(e)))
+            return self.collect_memory_values_by_commands()
+
+        memory_values = {}
+        for name, cmd, memory_params, memory_check in self.commands:
+            result = results.get(name, {})
+            try:
+                if "values" in result:
+                    memory_values[name] = result["values"]
+                elif "output" in result:
+                    if not result["output"]:
+                        logger.warning("Command '{}' returned no output".format(cmd))
+                    memory_values[name] = memory_check(result["output"], memory_params)
+                else:
+                    logger.warning("Error collecting memory data for {}: {}".format(name, result.get("error")))
+                    memory_values[name] = {}
+            except Exception as e:
+                logger.warning("Error collecting memory data for {}: {}".format(name, str(e)))
+                memory_values[name] = {}
+        return memory_values
+
+    def collect_memory_values_by_commands(self):
+        """Collect memory values by running each registered command and parsing its output."""
+        # Trigger monit to refresh its cache so subsequent collection reads fresh data
+        logger.info("Triggering monit refresh on {} before collecting memory data".format(self.ansible_host.hostname))
+        validate_output = self.execute_command("sudo monit validate")
+        self.record_monit_baseline_from_validate_output(validate_output)
+
+        memory_values = {}
+        for name, cmd, memory_params, memory_check in self.commands:
+            try:
+                if name == "monit":
+                    output = self.read_monit_status_with_freshness_retry(cmd)
+                else:
+                    output = self.execute_command(cmd)
+                memory_values[name] = memory_check(output, memory_params)
+            except Exception as e:
+                logger.warning("Error collecting memory data for {}: {}".format(name, str(e)))
+                memory_values[name] = {}
+        return memory_values
+
     @staticmethod
     def _parse_monit_memory_data_collected_timestamp(output):
         """
@@ -8,6 +8,7 @@ import pytest
 from multiprocessing.pool import ThreadPool
 from collections import deque
 
+from .cache import invalidates_cache
 from .helpers.assertions import pytest_assert
 from .helpers.parallel_utils import synchronized_reboot
 from .platform.interface_utils import check_interface_status_of_up_ports
@@ -324,6 +325,7 @@ def check_dshell_ready(duthost):
 
 @support_ignore_loganalyzer
 @synchronized_reboot
+@invalidates_cache
 def reboot(duthost, localhost, reboot_type='cold', delay=10,
            timeout=0, wait=0, wait_for_ssh=True, wait_warmboot_finalizer=False, warmboot_finalizer_timeout=0,
            reboot_helper=None, reboot_kwargs=None, return_after_reconnect=False,
@@ -0,0 +1,264 @@
+"""
+Compact Redis DB snapshots with per-key content hashes.
+
+This module must only use the python standard library and redis_bulk, it is also run on the DUT by
+SonicRedisDBSnapshotter to write the snapshot file of a DB. Each key is stored as its own compressed record, with the
+hash of its content excluding the volatile fields, so that two snapshots are compared key by key by comparing
+hashes, and only the records of the differing keys are decoded.
+
+On the DUT, the keys are read with SCAN and their contents in pipelines of redis_bulk.PIPELINE_SIZE keys, in the
+format of "redis-dump". Each record is written as soon as it is read, so the memory used doesn't depend on the size
+of the DB, only the key names are kept in memory to write the records in sorted key order.
+
+Snapshot file layout:
+    - zlib compressed JSON content of every key, in sorted key order
+    - zlib compressed index, one JSON list per line:
+      [key, content hash, number of values, number of values excluding volatile, record offset, record length]
+    - footer: index offset and SNAPSHOT_MAGIC
+
+Usage on the DUT, with redis_bulk.py in the same directory:
+    python3 redis_snapshot.py <db name> <snapshot file> <JSON list of volatile fields> [<namespace>]
+"""
+import hashlib
+import json
+import shutil
+import struct
+import sys
+import tempfile
+import time
+import zlib
+from collections import namedtuple
+
+try:
+    from tests.common.helpers import redis_bulk
+except ImportError:
+    # Run on the DUT, redis_bulk.py is copied next to this script
+    import redis_bulk
+
+
+SNAPSHOT_MAGIC = b"RSNAP001"
+SNAPSHOT_FOOTER = struct.Struct("<Q8s")
+INDEX_CHUNK_SIZE = 1 << 16
+
+# Commands reading the value of a key of each type, the key is inserted after the command name
+VALUE_COMMANDS = {
+    "string": ["GET"],
+    "hash": ["HGETALL"],
+    "list": ["LRANGE", 0, -1],
+    "set": ["SMEMBERS"],
+    "zset": ["ZRANGE", 0, -1, "WITHSCORES"],
+}
+
+IndexEntry = namedtuple("IndexEntry", ["key", "hash", "values", "values_excl_volatile", "offset", "length"])
+
+
+def strip_volatile(content, volatile):
+    """Return a copy of content without the volatile fields at any level of nested dicts."""
+    if isinstance(content, dict):
+        return {k: strip_volatile(v, volatile) for k, v in content.items() if k not in volatile}
+    return content
+
+
+def content_hash(content, volatile):
+    """Hash of the content of a key, contents with the same hash have no differences except volatile fields."""
+    data = json.dumps(strip_volatile(content, volatile), sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+def count_values(content, volatile):
+    """Return the number of values of a key, including and excluding the volatile ones."""
+    assert "value" in content, "Unexpected entry: {}".format(content)
+    total = 0
+    total_excl_volatile = 0
+    # Only the fields of hashes are volatile, the items of lists and sorted sets may not be hashable
+    is_hash = isinstance(content["value"], dict)
+    for key in content["value"]:
+        total += 1
+        if not is_hash or key not in volatile:
+            total_excl_volatile += 1
+    return total, total_excl_volatile
+
+
+def index_entry(key, content, volatile, offset=0, length=0):
+    values, values_excl_volatile = count_values(content, volatile)
+    return IndexEntry(key, content_hash(content, volatile), values, values_excl_volatile, offset, length)
+
+
+def write_records(contents, path, volatile):
+    """
+    Write a snapshot file, each record and index entry is written as soon as its key is read.
+
+    Args:
+        contents (iterable): (key, content) tuples in sorted key order, content in the format of "redis-dump",
+            {"type": ..., "value": ...}
+        path (str): Path of the snapshot file
+        volatile (iterable): Fields excluded from the content hashes
+    Returns:
+        int: Number of keys
+    """
+    volatile = set(volatile)
+    keys = 0
+    # The index follows the records in the file, it is compressed to a temporary file meanwhile
+    with open(path, "wb") as f, tempfile.TemporaryFile() as index:
+        compressor = zlib.compressobj()
+        for key, content in contents:
+            record = zlib.compress(json.dumps(content, default=str).encode("utf-8"))
+            entry = index_entry(key, content, volatile, f.tell(), len(record))
+            f.write(record)
+            index.write(compressor.compress((json.dumps(list(entry)) + "\n").encode("utf-8")))
+            keys += 1
+        index.write(compressor.flush())
+        index_offset = f.tell()
+        index.seek(0)
+        shutil.copyfileobj(index, f)
+        f.write(SNAPSHOT_FOOTER.pack(index_offset, SNAPSHOT_MAGIC))
+    return keys
+
+
+def write_snapshot(dump, path, volatile):
+    """
+    Write the snapshot file of a DB dump loaded in memory.
+
+    Args:
+        dump (dict): Content of a DB as loaded from "redis-dump", {key: {"type": ..., "value": ...}}
+        path (str): Path of the snapshot file
+        volatile (iterable): Fields excluded from the content hashes
+    """
+    write_records(((key, dump[key]) for key in sorted(dump)), path, volatile)
+
+
+class SnapshotFile(object):
+    """Reader of a snapshot file, the index is streamed and records are decoded on demand."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._index_end = self._file.seek(-SNAPSHOT_FOOTER.size, 2)
+        self._index_offset, magic = SNAPSHOT_FOOTER.unpack(self._file.read(SNAPSHOT_FOOTER.size))
+        if magic != SNAPSHOT_MAGIC:
+            self._file.close()
+            raise ValueError("Not a snapshot file: {}".format(path))
+
+    def entries(self):
+        """Iterate over the IndexEntry of all keys, in sorted key order."""
+        # A separate file object, records can be read while iterating
+        with open(self.path, "rb") as f:
+            f.seek(self._index_offset)
+            remaining = self._index_end - self._index_offset
+            decompressor = zlib.decompressobj()
+            pending = b""
+            while remaining > 0:
+                chunk = f.read(min(remaining, INDEX_CHUNK_SIZE))
+                if not chunk:
+                    raise ValueError("Truncated snapshot file: {}".format(self.path))
+                remaining -= len(chunk)
+                lines = (pending + decompressor.decompress(chunk)).split(b"\n")
+                pending = lines.pop()
+                for line in lines:
+                    yield IndexEntry(*json.loads(line))
+
+    def record(self, entry):
+        """Return the content of the key of an IndexEntry."""
+        self._file.seek(entry.offset)
+        return json.loads(zlib.decompress(self._file.read(entry.length)))
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class DictSnapshot(object):
+    """Snapshot interface over a DB dump loaded in memory, e.g. a JSON snapshot taken by "redis-dump --pretty"."""
+
+    def __init__(self, dump, volatile):
+        self._dump = dump
+        self._volatile = set(volatile)
+
+    def entries(self):
+        for key in sorted(self._dump):
+            yield index_entry(key, self._dump[key], self._volatile)
+
+    def record(self, entry):
+        return self._dump[entry.key]
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def merge_entries(entries_a, entries_b):
+    """
+    Pair the entries of two snapshots by key, both iterables are in sorted key order.
+    Yields (entry_a, entry_b) tuples, with None for a key missing in a snapshot.
+    """
+    entries_a = iter(entries_a)
+    entries_b = iter(entries_b)
+    entry_a = next(entries_a, None)
+    entry_b = next(entries_b, None)
+    while entry_a is not None or entry_b is not None:
+        if entry_b is None or (entry_a is not None and entry_a.key < entry_b.key):
+            yield entry_a, None
+            entry_a = next(entries_a, None)
+        elif entry_a is None or entry_b.key < entry_a.key:
+            yield None, entry_b
+            entry_b = next(entries_b, None)
+        else:
+            yield entry_a, entry_b
+            entry_a = next(entries_a, None)
+            entry_b = next(entries_b, None)
+
+
+def read_contents(conn, keys, batch_size=redis_bulk.PIPELINE_SIZE):
+    """
+    Read the contents of keys in pipelines of batch_size keys.
+
+    Yields:
+        (key, content) tuples in the order of keys, content in the format of "redis-dump". The keys removed since
+        they were scanned are skipped.
+    """
+    for start in range(0, len(keys), batch_size):
+        batch = keys[start:start + batch_size]
+        replies = conn.execute([command for key in batch for command in (["TYPE", key], ["PTTL", key])])
+        types, ttls = replies[0::2], replies[1::2]
+        values = iter(conn.execute([VALUE_COMMANDS[key_type][:1] + [key] + VALUE_COMMANDS[key_type][1:]
+                                    for key, key_type in zip(batch, types) if key_type in VALUE_COMMANDS]))
+        now = time.time()
+        for key, key_type, ttl in zip(batch, types, ttls):
+            if key_type not in VALUE_COMMANDS:
+                continue
+            value = next(values)
+            if key_type == "hash":
+                value = redis_bulk.hash_fields(value)
+            elif key_type == "set":
+                value = sorted(value)
+            elif key_type == "zset":
+                value = [[member, float(score)] for member, score in zip(value[0::2], value[1::2])]
+            # Like redis-dump, ttl is -1 for the keys without expiration
+            ttl = ttl / 1000.0 if ttl >= 0 else -1
+            yield key, {"type": key_type, "value": value, "ttl": ttl, "expireat": now + ttl}
+
+
+def dump_db(db, path, volatile, namespace="", config_dir=redis_bulk.DB_CONFIG_DIR):
+    """Write the snapshot file of a DB, e.g. dump_db("STATE_DB", "/tmp/STATE.snap", ["ttl"])."""
+    conn, db_id = redis_bulk.connect(db, namespace, config_dir)
+    try:
+        conn.execute([["SELECT", db_id]])
+        keys = sorted(conn.scan(["*"])["*"])
+        return write_records(read_contents(conn, keys), path, volatile)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    namespace = sys.argv[4] if len(sys.argv) > 4 else ""
+    print("{} keys".format(dump_db(sys.argv[1], sys.argv[2], json.loads(sys.argv[3]), namespace)))
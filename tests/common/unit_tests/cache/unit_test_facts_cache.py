@@ -0,0 +1,172 @@
+import importlib.util
+import logging
+import os
+import pickle
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+
+MODULE_PATH = Path(__file__).resolve().parents[2] / "cache/facts_cache.py"
+
+WRITER = """
+import importlib.util, sys
+spec = importlib.util.spec_from_file_location("facts_cache", sys.argv[1])
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+cache = module.FactsCache(sys.argv[2])
+writer = int(sys.argv[3])
+for i in range(int(sys.argv[4])):
+    assert cache.write("dut{}".format(i % 3), "writer{}_{}".format(writer, i), "x" * (writer * 100 + i))
+    assert cache.write("dut0", "shared", "x" * (writer * 1000 + i))
+"""
+
+
+@pytest.fixture()
+def facts_cache():
+    spec = importlib.util.spec_from_file_location("unit_target_facts_cache", MODULE_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    logger = logging.Logger("facts_cache", logging.CRITICAL)
+    logger.addHandler(logging.NullHandler())
+    module.logger = logger
+    return module
+
+
+def new_process_cache(facts_cache, location, **kwargs):
+    """FactsCache instance with no in-memory state, like the one of another process."""
+    facts_cache.Singleton._instances.clear()
+    return facts_cache.FactsCache(location, **kwargs)
+
+
+def synced_index(cache):
+    with cache._locked():
+        cache._sync_index()
+    return dict(cache._index)
+
+
+def test_concurrent_writers(facts_cache, tmp_path):
+    location = str(tmp_path / "cache")
+    writers = [subprocess.Popen([sys.executable, "-c", WRITER, str(MODULE_PATH), location, str(i), "200"],
+                                stderr=subprocess.PIPE) for i in range(1, 5)]
+    for writer in writers:
+        _, stderr = writer.communicate(timeout=120)
+        assert writer.returncode == 0, stderr.decode()
+
+    cache = new_process_cache(facts_cache, location)
+    index = synced_index(cache)
+    # Journals replayed by any process match the cached files
+    assert index == cache._scan_cache_files()
+    assert len(index) == 4 * 200 + 1
+    assert cache._index_size == sum(index.values())
+    for entry in index:
+        with open(os.path.join(location, entry), "rb") as f:
+            pickle.load(f)
+    assert cache.read("dut0", "shared") in ["x" * (writer * 1000 + 199) for writer in range(1, 5)]
+    assert not [f for f in os.listdir(os.path.join(location, "dut0")) if f.endswith(".tmp")]
+
+
+def test_journal_replay(facts_cache, tmp_path):
+    location = str(tmp_path)
+    cache = new_process_cache(facts_cache, location)
+    cache.write("dut0", "a", "x" * 100)
+    cache.write("dut0", "b", "x" * 200)
+
+    other = new_process_cache(facts_cache, location)
+    other.write("dut1", "a", "x" * 300)
+    other.cleanup("dut0", "b")
+
+    # Only the records appended by the other process are replayed
+    offset = cache._journal_offset
+    index = synced_index(cache)
+    assert cache._journal_offset > offset
+    assert index == other._index == cache._scan_cache_files()
+    assert sorted(index) == ["dut0/a.pickle", "dut1/a.pickle"]
+
+
+def test_journal_replay_after_crash_mid_rewrite(facts_cache, tmp_path, monkeypatch):
+    location = str(tmp_path)
+    cache = new_process_cache(facts_cache, location)
+    cache.write("dut0", "a", "x" * 100)
+    cache.write("dut0", "b", "x" * 200)
+
+    # Crash between the write of the compacted journal and its rename
+    def crash(src, dst):
+        raise KeyboardInterrupt()
+
+    monkeypatch.setattr(facts_cache.os, "replace", crash)
+    with pytest.raises(KeyboardInterrupt):
+        with cache._locked():
+            cache._rewrite_journal(dict(cache._index))
+    monkeypatch.undo()
+
+    other = new_process_cache(facts_cache, location)
+    assert synced_index(other) == {"dut0/a.pickle": len(pickle.dumps("x" * 100, pickle.HIGHEST_PROTOCOL)),
+                                   "dut0/b.pickle": len(pickle.dumps("x" * 200, pickle.HIGHEST_PROTOCOL))}
+    assert other.write("dut0", "c", "x" * 300)
+    assert synced_index(other) == other._scan_cache_files()
+
+
+def test_journal_replay_after_crash_mid_append(facts_cache, tmp_path):
+    location = str(tmp_path)
+    cache = new_process_cache(facts_cache, location)
+    cache.write("dut0", "a", "x" * 100)
+    cache.write("dut0", "b", "x" * 200)
+    # Crash while appending a record of a written cache file
+    with open(os.path.join(location, facts_cache.INDEX_FILE), "a") as f:
+        f.write("3")
+
+    other = new_process_cache(facts_cache, location)
+    assert other.write("dut1", "c", "x" * 300)
+    index = synced_index(new_process_cache(facts_cache, location))
+    assert index == other._index == other._scan_cache_files()
+    assert sorted(index) == ["dut0/a.pickle", "dut0/b.pickle", "dut1/c.pickle"]
+
+
+def test_limits_without_eviction(facts_cache, tmp_path, monkeypatch):
+    monkeypatch.setattr(facts_cache, "ENTRY_LIMIT", 2)
+    cache = new_process_cache(facts_cache, str(tmp_path))
+    assert cache.write("dut0", "a", 1)
+    assert cache.write("dut0", "b", 2)
+    # Overwriting an entry doesn't count as a new one
+    assert cache.write("dut0", "a", 3)
+    with pytest.raises(Exception, match="Cache usage exceeds limitations"):
+        cache.write("dut0", "c", 4)
+    assert not os.path.exists(cache._facts_file("dut0", "c"))
+
+
+def test_eviction_order(facts_cache, tmp_path, monkeypatch):
+    monkeypatch.setattr(facts_cache, "ENTRY_LIMIT", 3)
+    cache = new_process_cache(facts_cache, str(tmp_path), lru_eviction=True)
+    for mtime, key in enumerate(["a", "b", "c"], 1000):
+        assert cache.write("dut0", key, key)
+        os.utime(cache._facts_file("dut0", key), (mtime, mtime))
+
+    # Reading a file makes it the most recently used one
+    cache._cache.clear()
+    assert cache.read("dut0", "a") == "a"
+    assert cache.write("dut0", "d", "d")
+    assert sorted(synced_index(cache)) == ["dut0/a.pickle", "dut0/c.pickle", "dut0/d.pickle"]
+    assert cache.read("dut0", "b") is facts_cache.FactsCache.NOTEXIST
+
+    # Overwriting an entry at the limit doesn't evict anything
+    assert cache.write("dut0", "c", "c")
+    assert len(synced_index(cache)) == 3
+
+
+def test_eviction_size_limit(facts_cache, tmp_path, monkeypatch):
+    size = len(pickle.dumps("x" * 1000, pickle.HIGHEST_PROTOCOL))
+    monkeypatch.setattr(facts_cache, "SIZE_LIMIT", 4 * size)
+    cache = new_process_cache(facts_cache, str(tmp_path), lru_eviction=True)
+    for mtime, key in enumerate(["a", "b", "c", "d"], 1000):
+        assert cache.write("dut{}".format(mtime % 2), key, "x" * 1000)
+        os.utime(cache._facts_file("dut{}".format(mtime % 2), key), (mtime, mtime))
+
+    # As many least recently used files as needed are evicted for a larger entry
+    assert cache.write("dut0", "e", "x" * 2500)
+    index = synced_index(cache)
+    assert sorted(index) == ["dut0/e.pickle", "dut1/d.pickle"]
+    assert cache._index_size == sum(index.values()) <= facts_cache.SIZE_LIMIT
+    assert index == cache._scan_cache_files()
@@ -0,0 +1,158 @@
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+
+MODULE_PATH = Path(__file__).resolve().parents[2] / "cache/result_cache.py"
+
+
+@pytest.fixture()
+def result_cache():
+    spec = importlib.util.spec_from_file_location("unit_target_result_cache", MODULE_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture()
+def host_class(result_cache):
+
+    class FakeHost(object):
+        def __init__(self):
+            self.hostname = "dut"
+            self.calls = 0
+
+        def shell(self, cmd):
+            result_cache.invalidate_on_module_run(self, "shell", (cmd,), {})
+
+        @result_cache.ttl_cached()
+        def show(self, cmd):
+            self.calls += 1
+            return {"cmd": cmd, "calls": self.calls}
+
+        @result_cache.ttl_cached(condition=lambda host, cmd: "counters" not in cmd)
+        def show_if_static(self, cmd):
+            self.calls += 1
+            return self.calls
+
+        @result_cache.invalidates_cache
+        def reconfigure(self):
+            pass
+
+    return FakeHost
+
+
+def test_disabled_by_default(result_cache, host_class):
+    host = host_class()
+    host.show("show interfaces status")
+    host.show("show interfaces status")
+    assert host.calls == 2
+    assert "_result_cache" not in host.__dict__
+
+
+def test_hit_returns_copy(result_cache, host_class):
+    result_cache.DEFAULT_TTL = 60
+    host = host_class()
+    first = host.show("show interfaces status")
+    first["calls"] = 100
+    assert host.show("show interfaces status") == {"cmd": "show interfaces status", "calls": 1}
+    host.show("show vlan brief")
+    assert host.calls == 2
+    assert result_cache.get_result_cache(host).stats() == {"hits": 1, "misses": 2, "invalidations": 0, "entries": 2}
+
+
+def test_expired(result_cache, host_class, monkeypatch):
+    result_cache.DEFAULT_TTL = 60
+    host = host_class()
+    now = [1000.0]
+    monkeypatch.setattr(result_cache.time, "time", lambda: now[0])
+    host.show("show interfaces status")
+    now[0] += 61
+    host.show("show interfaces status")
+    assert host.calls == 2
+
+
+def test_condition(result_cache, host_class):
+    result_cache.DEFAULT_TTL = 60
+    host = host_class()
+    assert host.show_if_static("show interfaces counters") == 1
+    assert host.show_if_static("show interfaces counters") == 2
+    assert host.show_if_static("show interfaces status") == 3
+    assert host.show_if_static("show interfaces status") == 3
+
+
+@pytest.mark.parametrize("cmd, invalidated", [
+    ("sudo config interface shutdown Ethernet0", True),
+    ("sudo systemctl restart swss", True),
+    ("docker stop bgp", True),
+    ("sonic-db-cli CONFIG_DB hset 'PORT|Ethernet0' mtu 1500", True),
+    ("redis-cli -n 4 HSET 'PORT|Ethernet0' mtu 1500", True),
+    ("redis-cli -n 4 HDEL 'PORT|Ethernet0' mtu", True),
+    ("redis-cli -n 2 FLUSHDB", True),
+    ('vtysh -c "configure terminal\nrouter bgp 65100\nexit"', True),
+    ("show interfaces status", False),
+    ("docker ps", False),
+    ("sonic-db-cli CONFIG_DB hgetall 'PORT|Ethernet0'", False),
+    ("redis-cli -n 4 HGETALL 'PORT|Ethernet0'", False),
+])
+def test_invalidate_on_command(result_cache, host_class, cmd, invalidated):
+    result_cache.DEFAULT_TTL = 60
+    host = host_class()
+    host.show("show interfaces status")
+    host.shell(cmd)
+    host.show("show interfaces status")
+    assert host.calls == (2 if invalidated else 1)
+
+
+def test_invalidates_cache_decorator(result_cache, host_class):
+    result_cache.DEFAULT_TTL = 60
+    host = host_class()
+    host.show("show interfaces status")
+    host.reconfigure()
+    host.show("show interfaces status")
+    assert host.calls == 2
+    assert result_cache.get_result_cache(host).invalidations == 1
+
+
+def test_invalidates_cache_function(result_cache, host_class):
+    result_cache.DEFAULT_TTL = 60
+
+    class MultiAsicHost(object):
+        def __init__(self, sonichost):
+            self.sonichost = sonichost
+
+    @result_cache.invalidates_cache
+    def reload(sonic_host, config_source="config_db"):
+        pass
+
+    host = host_class()
+    for args, kwargs in [((host,), {}), ((), {"sonic_host": host}), ((MultiAsicHost(host), "minigraph"), {})]:
+        host.show("show interfaces status")
+        reload(*args, **kwargs)
+    assert result_cache.get_result_cache(host).invalidations == 3
+    assert host.calls == 3
+    # The cache is not created by the invalidation
+    reload(host_class())
+
+
+def test_bypassed(result_cache, host_class):
+    result_cache.DEFAULT_TTL = 60
+    host = host_class()
+    host.show("show interfaces status")
+    # Polled calls run the method every time and refresh the cached result
+    with result_cache.bypassed():
+        assert host.show("show interfaces status")["calls"] == 2
+        assert host.show("show interfaces status")["calls"] == 3
+    assert host.show("show interfaces status")["calls"] == 3
+
+
+def test_log_stats(result_cache, host_class, monkeypatch):
+    records = []
+    monkeypatch.setattr(result_cache.logger, "info", lambda msg: records.append(msg))
+    result_cache.DEFAULT_TTL = 60
+    host = host_class()
+    host.show("show interfaces status")
+    host.show("show interfaces status")
+    result_cache.log_stats()
+    assert records == ["[ResultCache] Statistics of dut: {'hits': 1, 'misses': 1, 'invalidations': 0, 'entries': 1}"]
@@ -0,0 +1,224 @@
+import logging
+import os
+import signal
+import socket
+import subprocess
+import sys
+
+import pytest
+
+from tests.common.connections import persistent_channel
+from tests.common.connections.persistent_channel import EXECUTOR, ChannelError, PersistentChannel
+from tests.common.devices.run_overhead_benchmark import create_host
+from tests.common.devices import sonic
+from tests.common.devices.sonic import SonicHost
+from tests.common.errors import RunAnsibleModuleFail
+
+
+class LocalChannel(PersistentChannel):
+    """Stand-in of the SSH channel, runs the executor in a local process."""
+
+    def __init__(self, read_timeout=1800):
+        super(LocalChannel, self).__init__("localhost", "user", "password", become=False, read_timeout=read_timeout)
+        self.opened = 0
+        self._socket = None
+
+    def _open(self):
+        # Output read from a socket like the SSH channel, so that the read timeout applies
+        self._socket, executor_socket = socket.socketpair()
+        self._client = subprocess.Popen([sys.executable, "-u", "-c", EXECUTOR], stdin=subprocess.PIPE,
+                                        stdout=executor_socket, universal_newlines=True)
+        executor_socket.close()
+        self._stdin, self._stdout = self._client.stdin, self._socket.makefile("r")
+        self._pid = os.getpid()
+        self.opened += 1
+
+    def _set_read_timeout(self, timeout):
+        self._socket.settimeout(timeout)
+
+    def _close(self):
+        if self._client is not None:
+            self._client.kill()
+            self._client.wait()
+            self._stdin.close()
+            self._stdout.close()
+            self._socket.close()
+        self._client = self._stdin = self._stdout = self._socket = None
+
+    def _alive(self):
+        return self._client.poll() is None
+
+
+@pytest.fixture
+def channel():
+    channel = LocalChannel()
+    yield channel
+    channel.close()
+
+
+@pytest.fixture
+def duthost(channel, monkeypatch):
+    # Standalone logger, records must not reach the pytest log handlers whose format depends on the conftest
+    logger = logging.Logger("unit_test_persistent_channel")
+    logger.addHandler(logging.NullHandler())
+    monkeypatch.setattr(sonic, "logger", logger)
+    host = create_host()
+    host.__class__ = SonicHost
+    host._persistent_channel = channel
+    return host
+
+
+def test_pipelined_requests(channel, tmp_path):
+    results = channel.execute([
+        {"cmd": "echo hello; echo world >&2", "shell": True},
+        {"cmd": "pwd", "shell": False, "chdir": str(tmp_path)},
+        {"cmd": "echo '$HOME'", "shell": False},
+        {"cmd": "exit 3", "shell": True},
+        {"cmd": "no_such_command_xyz", "shell": False},
+    ])
+    assert [r["rc"] for r in results] == [0, 0, 0, 3, 2]
+    assert results[0]["stdout"] == "hello" and results[0]["stderr"] == "world"
+    assert results[1]["stdout"] == str(tmp_path)
+    assert results[2]["stdout"] == "$HOME"
+    assert channel.opened == 1
+
+
+def test_reopen_after_executor_exit(channel):
+    channel.execute([{"cmd": "true", "shell": True}])
+    channel._client.kill()
+    channel._client.wait()
+    assert channel.execute([{"cmd": "echo again", "shell": True}])[0]["stdout"] == "again"
+    assert channel.opened == 2
+
+
+def test_lost_after_send(channel):
+    with pytest.raises(ChannelError) as e:
+        channel.execute([{"cmd": "kill -9 $PPID", "shell": True}])
+    assert e.value.sent
+    assert not channel.is_open
+
+
+def test_read_timeout(monkeypatch):
+    logger = logging.Logger("unit_test_persistent_channel")
+    logger.addHandler(logging.NullHandler())
+    monkeypatch.setattr(persistent_channel, "logger", logger)
+    channel = LocalChannel(read_timeout=1)
+    try:
+        with pytest.raises(ChannelError) as e:
+            channel.execute([{"cmd": "sleep 30", "shell": True}])
+        assert e.value.sent
+        assert not channel.is_open
+        assert channel.execute([{"cmd": "echo again", "shell": True}])[0]["stdout"] == "again"
+    finally:
+        channel.close()
+
+
+def test_forked_process(channel):
+    channel.execute([{"cmd": "true", "shell": True}])
+    # Lock held by another thread of the parent when it forks
+    channel._lock.acquire()
+    pid = os.fork()
+    if pid == 0:
+        signal.alarm(30)
+        try:
+            result = channel.execute([{"cmd": "echo child", "shell": True}])[0]
+            os._exit(0 if result["stdout"] == "child" and channel.opened == 2 else 1)
+        except BaseException:
+            os._exit(2)
+    channel._lock.release()
+    _, status = os.waitpid(pid, 0)
+    assert os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0
+    # The channel of the parent is not closed by the child
+    assert channel.execute([{"cmd": "echo parent", "shell": True}])[0]["stdout"] == "parent"
+    assert channel.opened == 1
+
+
+def test_sonichost_shell(duthost):
+    result = duthost.shell("printf 'a\\nb\\n'")
+    assert result["stdout_lines"] == ["a", "b"]
+    assert result["failed"] is False and result["changed"] is True
+    with pytest.raises(RunAnsibleModuleFail):
+        duthost.command("false")
+    assert duthost.command("false", module_ignore_errors=True).is_failed
+
+
+def test_sonichost_fallback(duthost, monkeypatch):
+    def broken_open():
+        raise ChannelError("cannot connect")
+    monkeypatch.setattr(duthost._persistent_channel, "_open", broken_open)
+    # Falls back to the fake ansible module of the benchmark
+    assert duthost.shell("echo hello")["stdout"] == "Ethernet0 up"
+    # Arguments not supported by the channel always use ansible
+    assert duthost.shell("echo hello", module_async=False)["stdout"] == "Ethernet0 up"
+
+
+def test_sonichost_fallback_backoff(duthost, monkeypatch):
+    attempts = []
+
+    def broken_open():
+        attempts.append(now[0])
+        raise ChannelError("cannot connect")
+    now = [1000.0]
+    monkeypatch.setattr(sonic.time, "time", lambda: now[0])
+    monkeypatch.setattr(duthost._persistent_channel, "_open", broken_open)
+
+    # The channel is not opened again until the retry interval elapsed
+    for _ in range(3):
+        assert duthost.shell("echo hello")["stdout"] == "Ethernet0 up"
+    duthost.shell_batch(["echo hello"], module_ignore_errors=True)
+    assert attempts == [1000.0]
+
+    now[0] += SonicHost.CHANNEL_RETRY_INTERVAL
+    del duthost._persistent_channel._open
+    assert duthost.shell("echo hello")["stdout"] == "hello"
+    assert duthost.shell_batch(["echo hello"])[0]["stdout"] == "hello"
+
+
+def test_shell_batch(duthost):
+    results = duthost.shell_batch(["echo a", "exit 1", "echo c"], module_ignore_errors=True)
+    assert [(r["cmd"], r["rc"], r["stdout_lines"]) for r in results] == \
+        [("echo a", 0, ["a"]), ("exit 1", 1, []), ("echo c", 0, ["c"])]
+    assert duthost._persistent_channel.opened == 1
+
+    results = duthost.shell_batch(["echo a", "exit 1", "echo c"], continue_on_fail=False, module_ignore_errors=True)
+    assert [r["cmd"] for r in results] == ["echo a", "exit 1"]
+
+    with pytest.raises(RunAnsibleModuleFail) as e:
+        duthost.shell_batch(["true", "false"])
+    assert e.value.results["failed_cmds"] == ["false"]
+
+
+def test_shell_batch_timeout(duthost):
+    results = duthost.shell_batch(["sleep 10", "echo done"], timeout=1, module_ignore_errors=True)
+    assert results[0]["rc"] != 0
+    assert results[1]["stdout"] == "done"
+
+
+def test_shell_batch_fallback(duthost, monkeypatch):
+    def shell_cmds(cmds, continue_on_fail, timeout, module_ignore_errors):
+        # Same output as the shell_cmds module, whose outputs keep the trailing newline
+        results = []
+        for cmd in cmds:
+            proc = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                  universal_newlines=True)
+            results.append({"cmd": cmd, "rc": proc.returncode, "stdout": proc.stdout, "stderr": proc.stderr,
+                            "stdout_lines": proc.stdout.splitlines(), "stderr_lines": proc.stderr.splitlines()})
+            if proc.returncode != 0 and not continue_on_fail:
+                break
+        return {"results": results}
+
+    cmds = ["echo a; echo b >&2", "printf 'c\\n\\n'", "exit 1", "echo d"]
+    channel_results = duthost.shell_batch(cmds, module_ignore_errors=True)
+    duthost._persistent_channel.close()
+    duthost._persistent_channel = None
+    monkeypatch.setattr(duthost, "shell_cmds", shell_cmds, raising=False)
+    fallback_results = duthost.shell_batch(cmds, module_ignore_errors=True)
+    keys = ["cmd", "rc", "stdout", "stderr", "stdout_lines", "stderr_lines", "failed"]
+    assert [[r[key] for key in keys] for r in fallback_results] == [[r[key] for key in keys] for r in channel_results]
+    assert fallback_results[0]["stdout"] == "a" and fallback_results[0]["stderr"] == "b"
+
+    results = duthost.shell_batch(cmds, continue_on_fail=False, module_ignore_errors=True)
+    assert [r["cmd"] for r in results] == cmds[:3]
+    with pytest.raises(RunAnsibleModuleFail) as e:
+        duthost.shell_batch(cmds)
+    assert e.value.results["failed_cmds"] == ["exit 1"]
@@ -0,0 +1,58 @@
+import collections
+import logging
+
+import pytest
+
+from tests.common.devices import base
+from tests.common.devices.base import AnsibleHostBase, is_json_native
+from tests.common.devices.run_overhead_benchmark import create_host
+
+
+@pytest.mark.parametrize("obj, expected", [
+    (("show interfaces status",), True),
+    ({"cmd": "ls", "chdir": None, "opts": [1, 2.5, True, {"a": "b"}]}, True),
+    ({"content": b"bytes"}, False),
+    ({1: "non string key"}, False),
+    ({"data": collections.UserDict({"a": 1})}, False),
+    ([{"nested": ({"set": {1}},)}], False),
+])
+def test_is_json_native(obj, expected):
+    assert is_json_native(obj) == expected
+
+
+@pytest.fixture(params=[logging.INFO, logging.DEBUG])
+def host(request, monkeypatch):
+    # Standalone logger, records must not reach the pytest log handlers whose format depends on the conftest
+    logger = logging.Logger("unit_test_base", request.param)
+    logger.addHandler(logging.NullHandler())
+    monkeypatch.setattr(base, "logger", logger)
+    host = create_host()
+    calls = []
+    original_getattr = type(host.host).__getattr__
+
+    def recording_getattr(adhoc, module_name):
+        module = original_getattr(adhoc, module_name)
+
+        def recording_module(*module_args, **complex_args):
+            calls.append((module_args, complex_args))
+            return module(*module_args, **complex_args)
+        return recording_module
+
+    monkeypatch.setattr(type(host.host), "__getattr__", recording_getattr)
+    host.calls = calls
+    return host
+
+
+def test_run_passes_native_args(host):
+    result = host.shell("show interfaces status", module_ignore_errors=True, chdir="/tmp")
+    assert result["rc"] == 0
+    assert host.calls == [(("show interfaces status",), {"chdir": "/tmp"})]
+
+
+def test_run_converts_non_native_args(host):
+    host.copy(content=b"hello", dest="/tmp/a", extra=collections.UserDict({"k": "v"}))
+    assert host.calls == [((), {"content": "hello", "dest": "/tmp/a", "extra": {"k": "v"}})]
+
+
+def test_custom_encoder_unchanged():
+    assert AnsibleHostBase.CustomEncoder().encode({"a": b"b"}) == '{"a": "b"}'
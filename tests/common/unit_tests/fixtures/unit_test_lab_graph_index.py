@@ -0,0 +1,89 @@
+import importlib.util
+import shutil
+import sys
+from pathlib import Path
+
+import pytest
+
+
+ANSIBLE_PATH = Path(__file__).resolve().parents[4] / "ansible"
+MODULE_PATH = ANSIBLE_PATH / "module_utils/graph_utils.py"
+
+
+@pytest.fixture(scope="module")
+def graph_utils():
+    """Load graph_utils, which imports its dependencies from module_utils like the ansible modules do."""
+    sys.path.insert(0, str(ANSIBLE_PATH))
+    try:
+        spec = importlib.util.spec_from_file_location("unit_target_graph_utils", MODULE_PATH)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(str(ANSIBLE_PATH))
+    return module
+
+
+@pytest.fixture()
+def graph_files(tmp_path):
+    path = tmp_path / "files"
+    path.mkdir()
+    for csv_file in (ANSIBLE_PATH / "files").glob("sonic_lab_*.csv"):
+        shutil.copy(str(csv_file), str(path))
+    return path
+
+
+@pytest.fixture()
+def builds(graph_utils, monkeypatch):
+    """Groups of the lab graphs built from the CSV files."""
+    groups = []
+    read_csv_files = graph_utils.LabGraph.read_csv_files
+
+    def counted_read_csv_files(self):
+        groups.append(self.group)
+        return read_csv_files(self)
+
+    monkeypatch.setattr(graph_utils.LabGraph, "read_csv_files", counted_read_csv_files)
+    return groups
+
+
+def test_build_and_cache_hit(graph_utils, graph_files, builds, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    index = graph_utils.LabGraphIndex(str(graph_files), ["snappi", "lab"], cache_dir=cache_dir)
+    assert index.find_group(["str-msn2700-01", "str-7260-10"]) == "lab"
+    graph_facts = index.graph("lab").graph_facts
+    assert builds == ["lab"]
+    assert graph_facts == graph_utils.LabGraph(str(graph_files), "lab").graph_facts
+    assert "str-msn2700-01" in graph_facts["devices"]
+
+    # Another process loads the hostnames and the graph from the cache
+    del builds[:]
+    index = graph_utils.LabGraphIndex(str(graph_files), ["snappi", "lab"], cache_dir=cache_dir)
+    assert index.find_group(["str-msn2700-01"]) == "lab"
+    assert index.graph("lab").graph_facts == graph_facts
+    assert builds == []
+
+    # Graphs with other management routes are cached separately
+    index.graph("lab", forced_mgmt_routes=["10.0.0.0/8"])
+    assert builds == ["lab"]
+
+
+def test_cache_invalidation(graph_utils, graph_files, builds, tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / "cache")
+    graph_utils.LabGraphIndex(str(graph_files), ["lab"], cache_dir=cache_dir).graph("lab")
+
+    # Change of a CSV file
+    devices_file = graph_files / "sonic_lab_devices.csv"
+    with open(str(devices_file), "a") as f:
+        f.write("str-new-dut,10.251.0.99/24,Force10-S6000,DevSonic,,sonic,\n")
+    index = graph_utils.LabGraphIndex(str(graph_files), ["lab"], cache_dir=cache_dir)
+    assert "str-new-dut" in index.hostnames("lab")
+    assert "str-new-dut" in index.graph("lab").graph_facts["devices"]
+    assert builds == ["lab", "lab"]
+
+    # Change of the version of the cache format
+    monkeypatch.setattr(graph_utils.LabGraphIndex, "CACHE_VERSION", graph_utils.LabGraphIndex.CACHE_VERSION + 1)
+    index = graph_utils.LabGraphIndex(str(graph_files), ["lab"], cache_dir=cache_dir)
+    index.graph("lab")
+    assert builds == ["lab", "lab", "lab"]
+    index.graph("lab")
+    assert builds == ["lab", "lab", "lab"]
@@ -0,0 +1,114 @@
+import gzip
+import logging
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from tests.common.helpers import artifacts, remote_script
+from tests.common.helpers.artifacts import collect_artifacts
+from tests.common.helpers.remote_script import RemoteScript
+
+
+class LocalHost(object):
+    """Stand-in for a PTF host, runs the shell commands and copies the files on the local host."""
+
+    hostname = "localhost"
+
+    def __init__(self):
+        self.commands = []
+        self.copies = 0
+
+    def shell(self, cmd, stdin=None, verbose=True, module_ignore_errors=False):
+        self.commands.append(cmd)
+        proc = subprocess.run(cmd, shell=True, input=(stdin or "").encode(), stdout=subprocess.PIPE,
+                              stderr=subprocess.PIPE)
+        return {"rc": proc.returncode, "stdout": proc.stdout.decode(), "stderr": proc.stderr.decode()}
+
+    def copy(self, src, dest):
+        self.copies += 1
+        shutil.copy(src, dest)
+
+    def fetch(self, src, dest, flat):
+        shutil.copy(src, dest)
+
+    def collector_runs(self):
+        return len([cmd for cmd in self.commands if "artifact_collector" in cmd])
+
+
+@pytest.fixture()
+def remote_dir(tmp_path, monkeypatch):
+    logger = logging.Logger("artifacts", logging.CRITICAL)
+    logger.addHandler(logging.NullHandler())
+    monkeypatch.setattr(artifacts, "logger", logger)
+
+    remote = tmp_path / "remote"
+    remote.mkdir()
+    scripts = tmp_path / "scripts"
+    scripts.mkdir()
+    monkeypatch.setattr(remote_script, "REMOTE_SCRIPT_DIR", str(scripts))
+    monkeypatch.setattr(artifacts, "REMOTE_SCRIPT_DIR", str(scripts))
+    monkeypatch.setattr(artifacts, "_collector_script", None)
+    monkeypatch.setattr(RemoteScript, "_copied", set())
+    (remote / "ptf.log").write_text("".join("line {}\n".format(i) for i in range(1000)))
+    (remote / "ptf.pcap").write_bytes(os.urandom(4096))
+    (remote / "syslog.1").write_text("old\n")
+    (remote / "syslog.2").write_text("older\n")
+    (remote / "big.log").write_bytes(b"x" * 10000)
+    return remote
+
+
+def test_collect_in_one_round_trip(remote_dir, tmp_path):
+    host = LocalHost()
+    local = tmp_path / "local"
+    collected = collect_artifacts(host, [
+        {"path": str(remote_dir / "ptf.log"), "dest": str(local / "test.log"), "tail": 3},
+        {"path": str(remote_dir / "ptf.pcap"), "dest": str(local / "test.pcap.tar.gz"), "gzip": True},
+        {"path": str(remote_dir / "syslog.*")},
+        {"path": str(remote_dir / "big.log"), "max_size": 1000},
+        {"path": str(remote_dir / "missing.log")},
+    ], dest_dir=str(local))
+
+    assert host.collector_runs() == 1
+    # The tar file is removed from the host
+    assert os.listdir(str(tmp_path / "scripts")) == [os.path.basename(artifacts.collector_script().path)]
+    assert (local / "test.log").read_text() == "line 997\nline 998\nline 999\n"
+    with gzip.open(str(local / "test.pcap.tar.gz")) as f:
+        assert f.read() == (remote_dir / "ptf.pcap").read_bytes()
+    # Files without dest are stored at their remote path
+    syslog = local / str(remote_dir / "syslog.1").lstrip("/")
+    assert syslog.read_text() == "old\n"
+    assert collected == {
+        str(remote_dir / "ptf.log"): str(local / "test.log"),
+        str(remote_dir / "ptf.pcap"): str(local / "test.pcap.tar.gz"),
+        str(remote_dir / "syslog.1"): str(syslog),
+        str(remote_dir / "syslog.2"): str(local / str(remote_dir / "syslog.2").lstrip("/")),
+    }
+
+
+def test_collect_uncompressed(remote_dir, tmp_path):
+    dest = str(tmp_path / "ptf.pcap")
+    collected = collect_artifacts(LocalHost(), [{"path": str(remote_dir / "ptf.pcap"), "dest": dest}], compress=False)
+    assert collected == {str(remote_dir / "ptf.pcap"): dest}
+    with open(dest, "rb") as f:
+        assert f.read() == (remote_dir / "ptf.pcap").read_bytes()
+
+
+def test_fail_on_missing(remote_dir, tmp_path):
+    with pytest.raises(IOError):
+        collect_artifacts(LocalHost(), [{"path": str(remote_dir / "missing.log"), "dest": str(tmp_path / "a")}],
+                          fail_on_missing=True)
+
+
+def test_collector_copied_once(remote_dir, tmp_path):
+    host = LocalHost()
+    for _ in range(2):
+        collect_artifacts(host, [{"path": str(remote_dir / "ptf.log"), "dest": str(tmp_path / "ptf.log")}])
+    assert host.copies == 1
+
+    # Copied again when it was removed from the host
+    os.remove(artifacts.collector_script().path)
+    collect_artifacts(host, [{"path": str(remote_dir / "ptf.log"), "dest": str(tmp_path / "ptf.log")}])
+    assert host.copies == 2
+    assert (tmp_path / "ptf.log").read_text() == (remote_dir / "ptf.log").read_text()
@@ -0,0 +1,169 @@
+import logging
+import os
+import socket
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+from tests import ptf_runner
+from tests.common.errors import RunAnsibleModuleFail
+
+pytest.importorskip("ptf")
+
+SAMPLE_TEST = """
+import time
+
+import ptf.testutils as testutils
+from ptf.base_tests import BaseTest
+
+LOADED = time.time()
+
+
+class ParamsTest(BaseTest):
+    def runTest(self):
+        params = testutils.test_params_get()
+        print("params {} loaded {}".format(sorted(params.items()), LOADED))
+        self.assertNotEqual(params["value"], "fail")
+
+
+class SleepTest(BaseTest):
+    def runTest(self):
+        time.sleep(30)
+"""
+
+
+class LocalPtfHost(object):
+    """Stand-in for a PTF host, the server runs on the local host."""
+
+    hostname = "ptf-local"
+    mgmt_ip = "127.0.0.1"
+
+    def __init__(self, root):
+        self.root = root
+        self.shell_commands = 0
+
+    def copy(self, content, dest, mode=None):
+        with open(dest, "w") as f:
+            f.write(content)
+        if mode:
+            os.chmod(dest, int(mode, 8))
+
+    def shell(self, cmd, chdir=None, module_ignore_errors=False):
+        self.shell_commands += 1
+        subprocess.run(cmd, shell=True, cwd=self.root, check=not module_ignore_errors)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture()
+def ptf_server(tmp_path, monkeypatch):
+    logger = logging.Logger("ptf_runner", logging.CRITICAL)
+    logger.addHandler(logging.NullHandler())
+    monkeypatch.setattr(ptf_runner, "logger", logger)
+
+    test_dir = tmp_path / "ptftests"
+    test_dir.mkdir()
+    (test_dir / "sample_test.py").write_text(textwrap.dedent(SAMPLE_TEST))
+    monkeypatch.setattr(ptf_runner, "PTF_SERVER_DEST", str(tmp_path / "ptf_server.py"))
+    monkeypatch.setattr(ptf_runner, "PTF_SERVER_LOG", str(tmp_path / "ptf_server.log"))
+    monkeypatch.setattr(ptf_runner, "PTF_SERVER_PID_FILE", str(tmp_path / "ptf_server.pid"))
+    monkeypatch.setattr(ptf_runner, "PTF_SERVER_SECRET_FILE", str(tmp_path / "ptf_server.secret"))
+    monkeypatch.setattr(ptf_runner, "PTF_SERVER_LOG_DIR", str(tmp_path))
+    monkeypatch.setattr(ptf_runner.PtfServerClient, "_secret", "session-secret")
+
+    client = ptf_runner.PtfServerClient(LocalPtfHost(str(tmp_path)), port=free_port())
+    client._facts = ("Unknown", "Unknown", "py3only")
+    client.python = lambda: sys.executable
+    yield client
+    try:
+        with client._request({"op": "shutdown"}) as reader:
+            reader.readline()
+    except OSError:
+        pass
+
+
+def run_request(test, value, **kwargs):
+    return dict({"test_dir": "ptftests", "test": test, "test_params": "value={!r}".format(value),
+                 "platform": "dummy", "log_file": "ptf.log"}, **kwargs)
+
+
+def test_tests_run_in_one_server(ptf_server):
+    first = ptf_server.run(run_request("sample_test.ParamsTest", ("a", 1)), "ptf sample_test.ParamsTest")
+    assert first["rc"] == 0
+    assert "params [('value', ('a', 1))]" in first["stdout"]
+    assert "ParamsTest ... ok" in first["stderr"]
+    assert os.path.exists(os.path.join(ptf_server.host.root, "ptf.log"))
+
+    # The module is imported once and the server is started once
+    second = ptf_server.run(run_request("sample_test.ParamsTest", "b"), "ptf sample_test.ParamsTest")
+    assert "params [('value', 'b')]" in second["stdout"]
+    assert first["stdout"].split("loaded")[1] == second["stdout"].split("loaded")[1]
+    assert ptf_server.host.shell_commands == 1
+
+
+def test_failed_tests(ptf_server):
+    with pytest.raises(RunAnsibleModuleFail):
+        ptf_server.run(run_request("sample_test.ParamsTest", "fail"), "ptf sample_test.ParamsTest")
+
+    result = ptf_server.run(run_request("sample_test.SleepTest", "", timeout=1), "ptf sample_test.SleepTest",
+                            module_ignore_errors=True)
+    assert result["rc"] == 1
+    assert "The following tests errored because of a timeout:" in result["stdout_lines"]
+
+    result = ptf_server.run(run_request("sample_test.MissingTest", ""), "ptf sample_test.MissingTest",
+                            module_ignore_errors=True)
+    assert result["rc"] == 1
+    assert "did not match any tests" in result["stderr"]
+
+
+def test_server_restarted_for_new_version(ptf_server, monkeypatch):
+    ptf_server.run(run_request("sample_test.ParamsTest", "a"), "ptf sample_test.ParamsTest")
+    monkeypatch.setattr(ptf_runner.PtfServerClient, "_token", "new-version")
+    client = ptf_runner.PtfServerClient(ptf_server.host, port=ptf_server.port)
+    client._facts = ptf_server._facts
+    client.python = ptf_server.python
+
+    assert client.run(run_request("sample_test.ParamsTest", "a"), "ptf sample_test.ParamsTest")["rc"] == 0
+    assert client.ping()["token"] == "new-version"
+    assert ptf_server.host.shell_commands == 2
+
+
+def test_fallback_to_ptf_command(ptf_server, monkeypatch):
+    monkeypatch.setattr(ptf_runner, "PTF_SERVER_START_TIMEOUT", 1)
+    ptf_server.python = lambda: "false"
+    assert ptf_server.run(run_request("sample_test.ParamsTest", "a"), "ptf sample_test.ParamsTest") is None
+    # Not started again
+    assert ptf_server.run(run_request("sample_test.ParamsTest", "a"), "ptf sample_test.ParamsTest") is None
+    assert ptf_server.host.shell_commands == 1
+
+
+def test_requests_of_other_sessions_rejected(ptf_server, monkeypatch, tmp_path):
+    ptf_server.run(run_request("sample_test.ParamsTest", "a"), "ptf sample_test.ParamsTest")
+    assert not os.path.exists(ptf_runner.PTF_SERVER_SECRET_FILE)
+
+    # Another test session can't use nor stop the server, it is replaced
+    monkeypatch.setattr(ptf_runner.PtfServerClient, "_secret", "other-session-secret")
+    assert "error" in ptf_server.ping()
+    client = ptf_runner.PtfServerClient(ptf_server.host, port=ptf_server.port)
+    client._facts = ptf_server._facts
+    client.python = ptf_server.python
+    assert client.run(run_request("sample_test.ParamsTest", "a"), "ptf sample_test.ParamsTest")["rc"] == 0
+    assert client.ping()["token"] == client.token()
+
+
+def test_log_file_outside_log_dir(ptf_server, tmp_path):
+    outside = tmp_path.parent / (tmp_path.name + ".outside.log")
+    outside.write_text("kept")
+    for log_file in [str(outside), os.path.join("..", outside.name)]:
+        result = ptf_server.run(run_request("sample_test.ParamsTest", "a", log_file=log_file),
+                                "ptf sample_test.ParamsTest", module_ignore_errors=True)
+        assert result["rc"] == 1
+        assert "is not in" in result["stderr"]
+    assert outside.read_text() == "kept"
+    outside.unlink()
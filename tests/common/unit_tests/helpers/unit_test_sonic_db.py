@@ -0,0 +1,242 @@
+import fnmatch
+import io
+import json
+import logging
+import os
+import queue
+import socketserver
+import threading
+
+import pytest
+
+from tests.common.helpers import redis_bulk, remote_script, sonic_db
+from tests.common.helpers.remote_script import RemoteScript
+from tests.common.helpers.sonic_db import AsicDbCli, SonicDbCli, SonicDbKeyNotFound
+
+ASIC_DB_ID = 1
+PORTS = ["oid:0x1000000000{:03x}".format(i) for i in range(1, 9)]
+SYSTEM_PORTS = ["oid:0x5d000000000{:03x}".format(i) for i in range(1, 4)]
+LAGS = ["oid:0x2000000000a01"]
+
+
+class RedisHandler(socketserver.StreamRequestHandler):
+    """Stand-in for a redis server, with the commands used by redis_bulk."""
+
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2].decode())
+        return args
+
+    @staticmethod
+    def encode(value):
+        if value is None:
+            return b"$-1\r\n"
+        if isinstance(value, list):
+            return b"*%d\r\n" % len(value) + b"".join(RedisHandler.encode(item) for item in value)
+        value = value.encode()
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+
+    def handle(self):
+        server = self.server
+        server.connections += 1
+        db = 0
+        while True:
+            args = self.read_command()
+            if args is None:
+                return
+            server.commands.append(args[0])
+            data = server.dbs.get(db, {})
+            if args[0] == "SELECT":
+                db = int(args[1])
+                reply = b"+OK\r\n"
+            elif args[0] == "SCAN":
+                # Pages of 3 keys, to check the cursors
+                keys = sorted(data)
+                start = int(args[1])
+                matched = [key for key in keys[start:start + 3] if fnmatch.fnmatchcase(key, args[3])]
+                cursor = start + 3 if start + 3 < len(keys) else 0
+                reply = self.encode([str(cursor), matched])
+            elif args[0] == "HGET":
+                reply = self.encode(data.get(args[1], {}).get(args[2]))
+            elif args[0] == "HGETALL":
+                reply = self.encode([item for field_value in data.get(args[1], {}).items() for item in field_value])
+            elif args[0] == "HSET":
+                server.dbs.setdefault(db, {}).setdefault(args[1], {})[args[2]] = args[3]
+                server.publish("__keyspace@{}__:{}".format(db, args[1]), "hset")
+                reply = b":1\r\n"
+            elif args[0] == "CONFIG":
+                reply = self.encode(["notify-keyspace-events", server.notify_keyspace_events])
+            elif args[0] == "PSUBSCRIBE":
+                reply = b""
+                for index, pattern in enumerate(args[1:]):
+                    server.subscribers.append((pattern, self.wfile))
+                    reply += b"*3\r\n" + self.encode("psubscribe") + self.encode(pattern) + b":%d\r\n" % (index + 1)
+            else:
+                reply = b"-ERR unknown command\r\n"
+            self.wfile.write(reply)
+
+
+class RedisServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, dbs):
+        socketserver.UnixStreamServer.__init__(self, path, RedisHandler)
+        self.dbs = dbs
+        self.connections = 0
+        self.commands = []
+        self.notify_keyspace_events = "AKE"
+        self.subscribers = []
+
+    def publish(self, channel, event):
+        for pattern, wfile in self.subscribers:
+            if fnmatch.fnmatchcase(channel, pattern):
+                wfile.write(RedisHandler.encode(["pmessage", pattern, channel, event]))
+
+
+class LocalHost(object):
+    """Stand-in for a DUT, runs redis_bulk requests in process with the config of the local redis server."""
+
+    hostname = "localhost"
+
+    def __init__(self, config_dir):
+        self.config_dir = config_dir
+        self.executions = 0
+        self.copies = []
+
+    def copy(self, src, dest):
+        self.copies.append(dest)
+
+    def shell(self, cmd, stdin=None, module_ignore_errors=False, verbose=True):
+        # redis_bulk.py is run by path, its source is not logged by ansible
+        assert cmd == "sudo python3 {}".format(SonicDbCli.bulk_script().path)
+        assert self.copies == [SonicDbCli.bulk_script().path]
+        self.executions += 1
+        request = json.loads(stdin)
+        results = redis_bulk.bulk(request["db"], request["requests"], request["namespace"], self.config_dir)
+        return {"rc": 0, "stdout": json.dumps(results), "stderr": ""}
+
+
+@pytest.fixture()
+def redis_server(tmp_path, monkeypatch):
+    logger = logging.Logger("sonic_db", logging.CRITICAL)
+    logger.addHandler(logging.NullHandler())
+    monkeypatch.setattr(sonic_db, "logger", logger)
+    monkeypatch.setattr(remote_script, "REMOTE_SCRIPT_DIR", str(tmp_path))
+    monkeypatch.setattr(RemoteScript, "_copied", set())
+    monkeypatch.setattr(SonicDbCli, "_bulk_script", None)
+
+    asic_db = {}
+    for portid in PORTS:
+        asic_db["ASIC_STATE:SAI_OBJECT_TYPE_PORT:" + portid] = {"SAI_PORT_ATTR_ADMIN_STATE": "true"}
+    # The last port has no hostif, like an inband port
+    for index, portid in enumerate(PORTS[:-1]):
+        asic_db["ASIC_STATE:SAI_OBJECT_TYPE_HOSTIF:oid:0xd00000000{:04x}".format(index)] = {
+            "SAI_HOSTIF_ATTR_OBJ_ID": portid, "SAI_HOSTIF_ATTR_NAME": "Ethernet{}".format(index * 4)}
+    for portid in SYSTEM_PORTS:
+        asic_db["ASIC_STATE:SAI_OBJECT_TYPE_SYSTEM_PORT:" + portid] = {"SAI_SYSTEM_PORT_ATTR_TYPE": "LOCAL"}
+    for portid in LAGS:
+        asic_db["ASIC_STATE:SAI_OBJECT_TYPE_LAG:" + portid] = {"SAI_LAG_ATTR_SYSTEM_PORT_AGGREGATE_ID": "1"}
+    asic_db["ASIC_STATE:SAI_OBJECT_TYPE_SWITCH:oid:0x21000000000000"] = {"SAI_SWITCH_ATTR_TYPE": "SAI_SWITCH_TYPE_VOQ"}
+
+    socket_path = str(tmp_path / "redis.sock")
+    server = RedisServer(socket_path, {ASIC_DB_ID: asic_db})
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    config = {
+        "INSTANCES": {"redis": {"hostname": "127.0.0.1", "port": 6379, "unix_socket_path": socket_path}},
+        "DATABASES": {"APPL_DB": {"id": 0, "separator": ":", "instance": "redis"},
+                      "ASIC_DB": {"id": ASIC_DB_ID, "separator": ":", "instance": "redis"}},
+    }
+    with open(os.path.join(str(tmp_path), redis_bulk.DB_CONFIG_FILE), "w") as f:
+        json.dump(config, f)
+    server.host = LocalHost(str(tmp_path))
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_bulk_requests_in_one_session(redis_server):
+    db = SonicDbCli(redis_server.host, "ASIC_DB")
+    hostif = "ASIC_STATE:SAI_OBJECT_TYPE_HOSTIF:oid:0xd000000000000"
+    results = db.bulk([
+        ("scan", "ASIC_STATE:SAI_OBJECT_TYPE_PORT:*"),
+        ("hget", hostif, "SAI_HOSTIF_ATTR_NAME"),
+        ("hget", hostif, "SAI_HOSTIF_ATTR_OPER_STATUS"),
+        ("hgetall", hostif),
+        ("hgetall", "ASIC_STATE:SAI_OBJECT_TYPE_HOSTIF:oid:0x0"),
+        ("scan_hget", "ASIC_STATE:SAI_OBJECT_TYPE_HOSTIF:*", "SAI_HOSTIF_ATTR_OBJ_ID"),
+        ("scan_hgetall", "ASIC_STATE:SAI_OBJECT_TYPE_LAG:*"),
+    ])
+
+    assert sorted(results[0]) == ["ASIC_STATE:SAI_OBJECT_TYPE_PORT:" + portid for portid in PORTS]
+    assert results[1:5] == ["Ethernet0", None, {"SAI_HOSTIF_ATTR_OBJ_ID": PORTS[0],
+                                                "SAI_HOSTIF_ATTR_NAME": "Ethernet0"}, {}]
+    assert sorted(results[5].values()) == PORTS[:-1]
+    assert results[6] == {"ASIC_STATE:SAI_OBJECT_TYPE_LAG:" + LAGS[0]: {"SAI_LAG_ATTR_SYSTEM_PORT_AGGREGATE_ID": "1"}}
+
+    # One connection and remote execution, the SCAN of the 3 patterns walk the 7 pages of keys together
+    assert redis_server.host.executions == 1
+    assert redis_server.connections == 1
+    assert redis_server.commands.count("SCAN") == 3 * 7
+    assert "KEYS" not in redis_server.commands
+
+
+def test_asic_db_helpers(redis_server):
+    asicdb = AsicDbCli(redis_server.host)
+
+    assert asicdb.get_rif_porttype(PORTS[0]) == "hostif"
+    assert redis_server.host.executions == 1
+    assert asicdb.get_rif_porttype(SYSTEM_PORTS[0]) == "sysport"
+    assert asicdb.get_rif_porttype(LAGS[0]) == "lag"
+    assert asicdb.get_rif_porttype(PORTS[-1]) == "port"
+    assert asicdb.get_rif_porttype("oid:0x0") == "other"
+    assert redis_server.host.executions == 1
+    assert sorted(asicdb.get_hostif_portid_oidlist()) == PORTS[:-1]
+
+    switch_key = asicdb.get_switch_key()
+    assert switch_key == "ASIC_STATE:SAI_OBJECT_TYPE_SWITCH:oid:0x21000000000000"
+    assert asicdb.get_and_check_key_value(switch_key, "SAI_SWITCH_TYPE_VOQ", field="SAI_SWITCH_ATTR_TYPE")
+    assert asicdb.hget_all(switch_key) == {"SAI_SWITCH_ATTR_TYPE": "SAI_SWITCH_TYPE_VOQ"}
+    with pytest.raises(SonicDbKeyNotFound):
+        asicdb.hget_key_value(switch_key, "SAI_SWITCH_ATTR_SWITCH_ID")
+    with pytest.raises(SonicDbKeyNotFound):
+        asicdb.get_keys("ASIC_STATE:SAI_OBJECT_TYPE_ROUTE_ENTRY:*")
+    assert asicdb.get_keys("ASIC_STATE:SAI_OBJECT_TYPE_ROUTE_ENTRY:*", raise_error_when_not_found=False) == []
+
+
+class LineQueue(io.TextIOBase):
+    """Output of redis_bulk.watch, lines are put in a queue."""
+
+    def __init__(self):
+        self.lines = queue.Queue()
+
+    def write(self, data):
+        self.lines.put(json.loads(data))
+        return len(data)
+
+
+def test_watch_keyspace(redis_server, tmp_path):
+    output = LineQueue()
+    args = ("ASIC_DB", ["ASIC_STATE:SAI_OBJECT_TYPE_PORT:*"], output, "", str(tmp_path))
+    threading.Thread(target=redis_bulk.watch, args=args, daemon=True).start()
+    assert output.lines.get(timeout=5) == {"subscribed": 1}
+
+    conn, db_id = redis_bulk.connect("ASIC_DB", config_dir=str(tmp_path))
+    conn.execute([["SELECT", db_id],
+                  ["HSET", "ASIC_STATE:SAI_OBJECT_TYPE_LAG:" + LAGS[0], "SAI_LAG_ATTR_PORT_VLAN_ID", "1"],
+                  ["HSET", "ASIC_STATE:SAI_OBJECT_TYPE_PORT:" + PORTS[0], "SAI_PORT_ATTR_ADMIN_STATE", "false"]])
+    conn.close()
+    # Only the watched keys are notified
+    assert output.lines.get(timeout=5) == {"key": "ASIC_STATE:SAI_OBJECT_TYPE_PORT:" + PORTS[0], "event": "hset"}
+    assert output.lines.empty()
+
+
+def test_watch_keyspace_notifications_disabled(redis_server, tmp_path):
+    redis_server.notify_keyspace_events = ""
+    output = LineQueue()
+    redis_bulk.watch("ASIC_DB", ["ASIC_STATE:*"], output, "", str(tmp_path))
+    assert "error" in output.lines.get(timeout=5)
@@ -0,0 +1,145 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("ptf")
+
+import ptf.testutils as testutils  # noqa: E402
+
+from tests.common.pkt_filter.filter_pkt_in_buffer import FilterPktBuffer, convert_pkt_to_dict  # noqa: E402
+from tests.common.pkt_filter.packet_index import FIELDS, decode_frame, get_packet_index  # noqa: E402
+
+
+class FakeDataplane(object):
+    """Stand-in for the PTF dataplane, packets are queued by the tests."""
+
+    def __init__(self, ports):
+        self.cvar = threading.Condition()
+        self.packet_queues = {(0, port): [] for port in ports}
+
+    def receive(self, port, pkt):
+        with self.cvar:
+            self.packet_queues[(0, port)].append((bytes(pkt), time.time()))
+            self.cvar.notify_all()
+
+    def flush(self):
+        for port_id in self.packet_queues:
+            self.packet_queues[port_id] = []
+
+
+class FakePtfAdapter(object):
+    def __init__(self, ports):
+        self.dataplane = FakeDataplane(ports)
+
+
+def tcp_packet(**kwargs):
+    return testutils.simple_tcp_packet(eth_src="00:90:fb:60:e2:68", eth_dst="50:6b:4b:b6:35:02",
+                                       ip_src="172.16.4.2", **kwargs)
+
+
+@pytest.mark.parametrize("pkt", [
+    tcp_packet(ip_dst="172.16.4.14", tcp_dport=80, dl_vlan_enable=True, vlan_vid=40),
+    testutils.simple_udpv6_packet(ipv6_src="fc00::1", ipv6_dst="fc00::2:0:0:1", udp_sport=1234),
+    testutils.simple_icmp_packet(icmp_type=8, ip_ttl=3),
+])
+def test_decoded_fields_match_scapy(pkt):
+    pkt_dict = convert_pkt_to_dict(pkt.__class__(bytes(pkt)))
+    for (layer, field), value in zip(FIELDS, decode_frame(bytes(pkt))):
+        if layer in pkt_dict:
+            assert str(value) == pkt_dict[layer][field], (layer, field)
+        else:
+            assert value is None, (layer, field)
+
+
+def test_index_follows_queue():
+    ptfadapter = FakePtfAdapter([1])
+    dataplane = ptfadapter.dataplane
+    index = get_packet_index(dataplane)
+    key_fields = (FIELDS.index(("TCP", "dport")),)
+    for dport in [80, 81, 80]:
+        dataplane.receive(1, tcp_packet(tcp_dport=dport))
+
+    assert index.refresh((0, 1)) == 3
+    assert len(index.lookup((0, 1), key_fields, (80,))) == 2
+    # Polled packets are removed, new packets are added
+    dataplane.packet_queues[(0, 1)].pop(0)
+    dataplane.receive(1, tcp_packet(tcp_dport=81))
+    assert index.refresh((0, 1)) == 1
+    assert len(index.lookup((0, 1), key_fields, (80,))) == 1
+    assert len(index.lookup((0, 1), key_fields, (81,))) == 2
+    dataplane.flush()
+    assert index.refresh((0, 1)) == 0
+    assert index.lookup((0, 1), key_fields, (81,)) == []
+    assert get_packet_index(dataplane) is index
+
+
+def test_filter_pkt_in_buffer():
+    ptfadapter = FakePtfAdapter([1, 2])
+    exp_pkt = tcp_packet(ip_dst="172.16.4.14", tcp_dport=80)
+    for port, count in [(1, 3), (2, 2)]:
+        for _ in range(count):
+            ptfadapter.dataplane.receive(port, exp_pkt)
+        ptfadapter.dataplane.receive(port, tcp_packet(ip_dst="172.16.4.15", tcp_dport=80))
+
+    pkt_filter = FilterPktBuffer(ptfadapter, exp_pkt, [1, 2],
+                                 match_fields=[("Ethernet", "src"), ("IP", "dst"), ("TCP", "dport"), ("TCP", "seq")])
+    assert pkt_filter.filter_pkt_in_buffer() is True
+    assert pkt_filter.matched_index == {1: 3, 2: 2}
+
+    pkt_filter = FilterPktBuffer(ptfadapter, tcp_packet(ip_dst="172.16.4.14", ip_ttl=10, tcp_dport=80), 1,
+                                 match_fields=[("IP", "dst"), ("TCP", "dport")])
+    assert "IP ttl=64" in pkt_filter.filter_pkt_in_buffer()
+
+
+def test_wait_for_late_packet():
+    ptfadapter = FakePtfAdapter([1])
+    exp_pkt = tcp_packet(tcp_dport=80)
+    timer = threading.Timer(0.2, ptfadapter.dataplane.receive, (1, exp_pkt))
+    timer.start()
+    start = time.time()
+    pkt_filter = FilterPktBuffer(ptfadapter, exp_pkt, 1, match_fields=[("IP", "src"), ("TCP", "dport")])
+    assert pkt_filter.filter_pkt_in_buffer(timeout=10) is True
+    assert time.time() - start < 2
+
+    pkt_filter = FilterPktBuffer(ptfadapter, tcp_packet(tcp_dport=81), 1, match_fields=[("TCP", "dport")])
+    assert pkt_filter.filter_pkt_in_buffer(timeout=0.2) is False
+
+
+def test_encapsulated_frames():
+    # The inner headers are matched, like convert_pkt_to_dict keeps the innermost layer of each name
+    ptfadapter = FakePtfAdapter([1])
+    exp_pkt = tcp_packet(ip_dst="172.16.4.14", tcp_dport=80)
+    for ip_dst in ["172.16.4.14", "172.16.4.15"]:
+        inner_frame = tcp_packet(ip_dst=ip_dst, tcp_dport=80)["IP"]
+        ptfadapter.dataplane.receive(1, testutils.simple_ipv4ip_packet(ip_dst="10.0.0.1", inner_frame=inner_frame))
+    ptfadapter.dataplane.receive(1, testutils.simple_vxlan_packet(ip_dst="10.0.0.1", inner_frame=exp_pkt))
+    ptfadapter.dataplane.receive(1, exp_pkt)
+    assert decode_frame(bytes(ptfadapter.dataplane.packet_queues[(0, 1)][0][0])) is None
+
+    pkt_filter = FilterPktBuffer(ptfadapter, exp_pkt, 1, match_fields=[("IP", "dst"), ("TCP", "dport")])
+    assert pkt_filter.filter_pkt_in_buffer() is True
+    assert pkt_filter.matched_index == {1: 3}
+
+    pkt_filter = FilterPktBuffer(ptfadapter, tcp_packet(ip_dst="10.0.0.1", tcp_dport=80), 1,
+                                 match_fields=[("IP", "dst"), ("TCP", "dport")])
+    assert pkt_filter.filter_pkt_in_buffer() is False
+
+
+def test_qinq_frames():
+    ptfadapter = FakePtfAdapter([1])
+    for vlan_vid in [10, 30]:
+        ptfadapter.dataplane.receive(1, testutils.simple_qinq_tcp_packet(dl_vlan_outer=20, vlan_vid=vlan_vid))
+    ptfadapter.dataplane.receive(1, testutils.simple_tcp_packet(dl_vlan_enable=True, vlan_vid=10))
+
+    # Single tagged expected packet, the inner tag of the QinQ frames is matched
+    exp_pkt = testutils.simple_tcp_packet(dl_vlan_enable=True, vlan_vid=10)
+    pkt_filter = FilterPktBuffer(ptfadapter, exp_pkt, 1, match_fields=[("802.1Q", "vlan"), ("TCP", "dport")])
+    assert pkt_filter.filter_pkt_in_buffer() is True
+    assert pkt_filter.matched_index == {1: 2}
+
+    # QinQ expected packet, all the frames are matched on the dissected packets
+    exp_pkt = testutils.simple_qinq_tcp_packet(dl_vlan_outer=40, vlan_vid=30)
+    pkt_filter = FilterPktBuffer(ptfadapter, exp_pkt, 1, match_fields=[("802.1Q", "vlan"), ("IP", "dst")])
+    assert pkt_filter.filter_pkt_in_buffer() is not False
+    assert pkt_filter.matched_index == {1: 1}
@@ -0,0 +1,71 @@
+import multiprocessing
+import os
+import time
+
+from tests.common.plugins.dut_monitor import dut_monitor
+from tests.common.plugins.dut_monitor.pytest_dut_monitor import to_measurements
+
+
+def busy_loop(seconds):
+    end = time.time() + seconds
+    while time.time() < end:
+        pass
+
+
+def test_sampler_measures_current_process_cpu():
+    sampler = dut_monitor.Sampler()
+    first = sampler.sample()
+    assert first["cpu"] == 0 and first["processes"] == []
+
+    busy = multiprocessing.Process(target=busy_loop, args=(1,))
+    busy.start()
+    time.sleep(0.8)
+    sample = sampler.sample()
+    busy.join()
+
+    assert 0 < sample["cpu"] <= 100
+    assert 0 < sample["ram"] < 100 and 0 <= sample["hdd"] <= 100
+    processes = {pid: cpu for pid, cpu, _ in sample["processes"]}
+    assert processes.get(busy.pid, 0) > 30
+
+
+def sample(number):
+    return {"timestamp": 1700000000 + 2 * number, "cpu": number, "ram": 50, "hdd": 10,
+            "processes": [(100 + i, 10.0 - i, "process-{}-{}".format(number, i)) for i in range(number % 4)],
+            "containers": [("syncd", 5.0), ("swss" * 20, 1.0)]}
+
+
+def test_ring_window(tmp_path):
+    path = str(tmp_path / "ring")
+    ring = dut_monitor.RingWriter(path, capacity=5, interval=2, processes=2, containers=1)
+    for number in range(3):
+        ring.append(sample(number))
+
+    # Like SFTP files, the reader doesn't keep stale data between reads
+    with open(path, "rb", buffering=0) as fp:
+        window = dut_monitor.read_header(fp)
+        assert window.count == 3
+        for number in range(3, 8):
+            ring.append(sample(number))
+        header = dut_monitor.read_header(fp)
+        assert header.started == window.started and header.count == 8
+        # The oldest slot may be overwritten while being read, it is skipped
+        records = dut_monitor.read_records(fp, header, window.count, header.count)
+        assert [record["seq"] for record in records] == [4, 5, 6, 7]
+        assert records[0]["processes"] == []
+        assert records[3]["processes"] == [(100, 10.0, "process-7-0"), (101, 9.0, "process-7-1")]
+        assert records[2]["containers"] == [("syncd", 5.0)]
+
+        for number in range(8, 12):
+            ring.append(sample(number))
+        # Overwritten records are skipped
+        header = dut_monitor.read_header(fp)
+        records = dut_monitor.read_records(fp, header, window.count, header.count)
+        assert [record["seq"] for record in records] == [8, 9, 10, 11]
+    ring.close()
+
+    measurements = to_measurements(records)
+    assert list(measurements["cpu"].values())[0]["total"] == 8
+    assert list(measurements["cpu"].values())[1]["top_consumer"] == {10.0: "process-9-0"}
+    assert list(measurements["ram"].values()) == [50] * 4
+    assert os.listdir(str(tmp_path)) == ["ring"]
@@ -0,0 +1,97 @@
+import gzip
+import importlib.util
+import json
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+
+MODULE_PATH = Path(__file__).resolve().parents[4] / "common/plugins/loganalyzer/system_msg_handler.py"
+
+RUN_ID = "test_run"
+START_MARKER = "start-LogAnalyzer-test_run.2024-01-01-10:00:00"
+
+
+@pytest.fixture(scope="module")
+def handler_module():
+    """Load the loganalyzer module which is also executed on the DUT."""
+    spec = importlib.util.spec_from_file_location("unit_target_analyze_parallel", MODULE_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    # The workers of the pool find analyze_source by the name of its module
+    sys.modules[spec.name] = module
+    yield module
+    del sys.modules[spec.name]
+
+
+def write_log(path, lines):
+    opener = gzip.open if path.name.endswith(".gz") else open
+    with opener(str(path), "wt") as f:
+        f.write("".join("Jan  1 10:00:{:02d}.000001 sonic {}\n".format(i, line) for i, line in lines))
+
+
+def test_start_marker_in_logged_job(handler_module, tmp_path):
+    job = {"sources": [{"path": "/var/log/syslog"}], "start_marker": START_MARKER, "match": [".*crash.*"]}
+    syslog = tmp_path / "syslog"
+    syslog.write_text("".join([
+        "Jan  1 10:00:00.000001 sonic INFO LogAnalyzer: {}\n".format(START_MARKER),
+        "Jan  1 10:00:01.000001 sonic ERR swss#orchagent: orchagent crash detected\n",
+        # Logged by ansible when the job is passed on the command line or on stdin
+        "Jan  1 10:00:02.000001 sonic INFO python[1]: ansible-ansible.legacy.command Invoked with _raw_params=python "
+        "/tmp/loganalyzer.py --action analyze_parallel --run_id {} --job_file - stdin={}\n".format(
+            RUN_ID, json.dumps(job)),
+        "Jan  1 10:00:03.000001 sonic INFO LogAnalyzer: end-LogAnalyzer-{}\n".format(RUN_ID),
+    ]))
+
+    analyzer = handler_module.AnsibleLogAnalyzer(RUN_ID, False, START_MARKER)
+    result = analyzer.analyze_sources([{"path": str(syslog)}], job["match"], [], [], workers=1)
+
+    matching_lines, _ = result[str(syslog)]
+    assert any("orchagent crash detected" in line for line in matching_lines)
+
+
+def test_list_rotated_files(handler_module, tmp_path):
+    for name in ["syslog", "syslog.1", "syslog.10.gz", "syslog.2.gz", "syslog.old", "syslog.bak", "syslog_other"]:
+        (tmp_path / name).write_text("")
+
+    assert [os.path.basename(path) for path in handler_module.list_rotated_files(str(tmp_path / "syslog"))] == \
+        ["syslog", "syslog.1", "syslog.2.gz", "syslog.10.gz", "syslog.bak", "syslog.old"]
+
+
+def test_rotated_gz_files(handler_module, tmp_path):
+    write_log(tmp_path / "syslog.10.gz", [(0, "ERR orchagent: crash before the test")])
+    write_log(tmp_path / "syslog.2.gz", [(1, "ERR orchagent: crash before the marker"),
+                                         (2, "INFO LogAnalyzer: {}".format(START_MARKER)),
+                                         (3, "ERR orchagent: crash 1")])
+    write_log(tmp_path / "syslog.1", [(4, "ERR orchagent: crash 2")])
+    write_log(tmp_path / "syslog", [(5, "ERR orchagent: crash 3"),
+                                    (6, "INFO LogAnalyzer: end-LogAnalyzer-{}".format(RUN_ID))])
+
+    analyzer = handler_module.AnsibleLogAnalyzer(RUN_ID, False, START_MARKER)
+    result = analyzer.analyze_sources([{"path": str(tmp_path / "syslog")}], [".*crash.*"], [], [], workers=1)
+
+    matching_lines, _ = result[str(tmp_path / "syslog")]
+    assert [line.split(": ", 1)[1].strip() for line in matching_lines] == ["crash 1", "crash 2", "crash 3"]
+
+
+def test_parallel_workers(handler_module, tmp_path):
+    sources = []
+    for name in ["syslog", "swss.rec", "sairedis.rec"]:
+        write_log(tmp_path / "{}.1".format(name), [(0, "INFO LogAnalyzer: {}".format(START_MARKER)),
+                                                   (1, "ERR {}: crash 1".format(name)),
+                                                   (2, "ERR {}: expected error".format(name))])
+        write_log(tmp_path / name, [(3, "ERR {}: crash 2".format(name)),
+                                    (4, "INFO LogAnalyzer: end-LogAnalyzer-{}".format(RUN_ID))])
+        sources.append({"path": str(tmp_path / name)})
+
+    analyzer = handler_module.AnsibleLogAnalyzer(RUN_ID, False, START_MARKER)
+    args = (sources, [".*crash.*", ".*error.*"], [], [".*expected error.*"])
+    result = analyzer.analyze_sources(*args, workers=3)
+
+    assert result == analyzer.analyze_sources(*args, workers=1)
+    for source in sources:
+        matching_lines, expected_lines = result[source["path"]]
+        assert [line.split(": ", 1)[1].strip() for line in matching_lines] == ["crash 1", "crash 2"]
+        assert len(expected_lines) == 1
@@ -0,0 +1,69 @@
+import importlib.util
+import re
+from pathlib import Path
+
+import pytest
+
+
+LOGANALYZER_DIR = Path(__file__).resolve().parents[4] / "common/plugins/loganalyzer"
+MODULE_PATH = LOGANALYZER_DIR / "system_msg_handler.py"
+
+LOG_LINES = [
+    "Jan  1 10:00:00.000001 sonic ERR ntpd[123]: routing socket reports: No buffer space available\n",
+    "Jan  1 10:00:00.000002 sonic ERR syncd#syncd: SDK_LOG|-E-HLD-0- some error\n",
+    "Jan  1 10:00:00.000003 sonic ERR swss#orchagent: :- doTask: unknown error\n",
+    "Jan  1 10:00:00.000004 sonic INFO kernel: [  1.0] eth0: link up\n",
+    "Jan  1 10:00:00.000005 sonic NOTICE kernel: Oops happened\n",
+    "Jan  1 10:00:00.000006 sonic ERR snmp#snmp-subagent [ax_interface] ERROR: timeout\n",
+    "Jan  1 10:00:00.000007 sonic WARNING bgp#bgpd[42]: crash detected\n",
+    "\n",
+]
+
+
+@pytest.fixture(scope="module")
+def handler_module():
+    """Load the loganalyzer module which is also executed on the DUT."""
+    spec = importlib.util.spec_from_file_location("unit_target_system_msg_handler", MODULE_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope="module")
+def common_regexes(handler_module):
+    analyzer = handler_module.AnsibleLogAnalyzer("unit_test", False)
+    match = analyzer.create_msg_regex([str(LOGANALYZER_DIR / "loganalyzer_common_match.txt")])[1]
+    ignore = analyzer.create_msg_regex([str(LOGANALYZER_DIR / "loganalyzer_common_ignore.txt")])[1]
+    return match, ignore
+
+
+@pytest.mark.parametrize("line", LOG_LINES)
+def test_matcher_verdict_equals_combined_regex(handler_module, common_regexes, line):
+    for regexes in common_regexes:
+        matcher = handler_module.MessagesMatcher(regexes)
+        combined = re.compile("|".join(regexes))
+        assert bool(matcher.search(line)) == bool(combined.findall(line))
+
+
+@pytest.mark.parametrize("regexes", [
+    ["(?i)crash", "OOPS"],
+    [r"(\w+) \1", "kernel"],
+])
+def test_matcher_falls_back_to_combined_regex(handler_module, regexes):
+    matcher = handler_module.MessagesMatcher(regexes)
+    assert matcher.generic_regex is matcher.regex
+    assert not matcher.literal_index
+
+
+def test_matcher_prefilters_on_required_literals(handler_module):
+    matcher = handler_module.MessagesMatcher([".* ERR ntpd.*bind.*", "kernel:.*Oops|kernel:.*panic", r"\d+"])
+    assert set(matcher.literal_index) == {" ERR ntpd", "kernel:"}
+    assert matcher.generic_regex.pattern == r"\d+"
+    assert matcher.search("sonic ERR ntpd[1]: bind failed")
+    assert not matcher.search("sonic ERR ntpd: nothing")
+
+
+def test_compile_messages_matcher_is_cached(handler_module):
+    assert handler_module.compile_messages_matcher([]) is None
+    first = handler_module.compile_messages_matcher(["a.*b", "cde"])
+    assert handler_module.compile_messages_matcher(["a.*b", "cde"]) is first
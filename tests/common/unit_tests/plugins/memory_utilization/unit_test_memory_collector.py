@@ -0,0 +1,79 @@
+import logging
+import shlex
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+from tests.common.helpers import remote_script
+from tests.common.helpers.remote_script import RemoteScript
+from tests.common.plugins.memory_utilization.memory_utilization import (
+    MemoryMonitor, parse_free_output, parse_frr_memory_output, parse_monit_validate_output)
+
+# The package exports a fixture with the name of the module
+memory_utilization = sys.modules[MemoryMonitor.__module__]
+
+
+class LocalHost(object):
+    """Stand-in for a DUT, runs commands locally like the ansible command module."""
+
+    hostname = "localhost"
+    facts = {"asic_type": "vs"}
+
+    def __init__(self):
+        self.commands = []
+        self.copies = 0
+
+    def copy(self, src, dest):
+        self.copies += 1
+        shutil.copy(src, dest)
+
+    def command(self, cmd, module_ignore_errors=False):
+        self.commands.append(cmd)
+        args = shlex.split(cmd)
+        if args[0] == "sudo":
+            args = args[1:]
+        proc = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        return {"rc": proc.returncode, "stdout": proc.stdout.rstrip("\n"), "stderr": proc.stderr}
+
+
+@pytest.fixture()
+def monitor(monkeypatch, tmp_path):
+    logger = logging.Logger("memory_utilization", logging.CRITICAL)
+    logger.addHandler(logging.NullHandler())
+    monkeypatch.setattr(memory_utilization, "logger", logger)
+    monkeypatch.setattr(remote_script, "REMOTE_SCRIPT_DIR", str(tmp_path))
+    monkeypatch.setattr(RemoteScript, "_copied", set())
+    return MemoryMonitor(LocalHost())
+
+
+def test_collect_in_one_execution(monitor):
+    monitor.register_command("free", "free -m", {"total": {}}, parse_free_output)
+    monitor.register_command("monit", "sudo monit status", {"memory_usage": {}}, parse_monit_validate_output)
+    monitor.register_command("frr_bgp", "printf 'Used small blocks: 0 bytes\\nUsed ordinary blocks: 2 MiB\\n'",
+                             {"used": {}}, parse_frr_memory_output)
+
+    values = monitor.collect_memory_values()
+
+    assert len(monitor.ansible_host.commands) == 1
+    # The collector is run by path, its source is not in the command logged by ansible
+    assert monitor.collector_script().path in monitor.ansible_host.commands[0]
+    assert len(monitor.ansible_host.commands[0]) < 1000
+
+    monitor.collect_memory_values()
+    assert monitor.ansible_host.copies == 1
+    assert values["free"] == parse_free_output(subprocess.check_output(["free", "-m"], universal_newlines=True),
+                                               {"total": {}})
+    assert 0 < values["monit"]["memory_usage"] < 100
+    assert values["frr_bgp"] == {"used": 2.0}
+
+
+def test_collector_failure_falls_back_to_commands(monitor, monkeypatch):
+    monitor.register_command("free", "free -m", {"total": {}}, parse_free_output)
+    monkeypatch.setattr(memory_utilization, "MEMORY_COLLECTOR_FILE", "/dev/null")
+
+    values = monitor.collect_memory_values()
+
+    assert monitor.ansible_host.commands[1:] == ["sudo monit validate", "free -m"]
+    assert values["free"]["total"] > 0
@@ -0,0 +1,101 @@
+import queue
+import sys
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("ptf")
+pytest.importorskip("SubnetTree")
+
+import ptf.testutils as testutils  # noqa: E402
+from ptf.mask import Mask  # noqa: E402
+
+
+PTFTESTS_PATH = Path(__file__).resolve().parents[4] / "ansible/roles/test/files/ptftests/py3"
+
+
+@pytest.fixture(scope="module")
+def hash_test():
+    """Import the PTF test, which imports its helpers from the ptftests directory."""
+    sys.path.insert(0, str(PTFTESTS_PATH))
+    try:
+        import hash_test
+    finally:
+        sys.path.remove(str(PTFTESTS_PATH))
+    return hash_test
+
+
+class FakeDataplane(object):
+    """Stand-in for the PTF dataplane, packets are queued by the tests."""
+
+    class PollSuccess(object):
+        def __init__(self, port, packet):
+            self.port = port
+            self.packet = packet
+
+    class PollFailure(object):
+        pass
+
+    def __init__(self):
+        self.packets = queue.Queue()
+
+    def receive(self, port, pkt):
+        self.packets.put((port, bytes(pkt)))
+
+    def poll(self, device_number=0, timeout=None):
+        try:
+            return self.PollSuccess(*self.packets.get(timeout=timeout))
+        except queue.Empty:
+            return self.PollFailure()
+
+
+def tagged_packet(hash_test, tag, ip_dst):
+    pkt = testutils.simple_tcp_packet(ip_dst=ip_dst)
+    hash_test.tag_payload(pkt, tag)
+    return pkt
+
+
+def test_tag_payload(hash_test):
+    pkt = testutils.simple_tcp_packet(pktlen=100)
+    length = len(pkt)
+    hash_test.tag_payload(pkt, b"TAG")
+    assert pkt.lastlayer().load.startswith(b"TAG")
+    assert len(pkt) == length
+
+    with pytest.raises(Exception, match="No payload to tag"):
+        hash_test.tag_payload(testutils.simple_tcp_packet(pktlen=54), b"TAG")
+
+
+def test_pipelined_receiver(hash_test):
+    dataplane = FakeDataplane()
+    receiver = hash_test.PipelinedReceiver(dataplane, [1, 2])
+    other_receiver = hash_test.PipelinedReceiver(dataplane, [1, 2])
+    flows = {index: tagged_packet(hash_test, receiver.tag(index), "10.0.0.{}".format(index)) for index in range(4)}
+    receiver.start()
+    try:
+        for index in range(3):
+            receiver.expect(index, Mask(flows[index]))
+
+        dataplane.receive(2, flows[1])
+        dataplane.receive(1, flows[0])
+        # Only the first copy is counted
+        dataplane.receive(2, flows[0])
+        # Packets of another receiver, with another content or on another port are ignored
+        dataplane.receive(1, tagged_packet(hash_test, other_receiver.tag(2), "10.0.0.2"))
+        dataplane.receive(1, tagged_packet(hash_test, receiver.tag(2), "10.0.0.99"))
+        dataplane.receive(3, flows[2])
+        received = receiver.wait([0, 1, 2], 0.5)
+        assert sorted(received) == [0, 1]
+        assert received[0] == (1, bytes(flows[0]))
+        assert received[1] == (2, bytes(flows[1]))
+
+        # Lost packet sent again, with the next batch
+        receiver.expect(3, Mask(flows[3]))
+        dataplane.receive(2, flows[3])
+        dataplane.receive(1, flows[2])
+        received = receiver.wait([2, 3], 5)
+        assert received == {2: (1, bytes(flows[2])), 3: (2, bytes(flows[3]))}
+        assert receiver.expected == {} and receiver.received == {}
+    finally:
+        receiver.stop()
+    assert not receiver.is_alive()
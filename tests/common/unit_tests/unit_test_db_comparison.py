@@ -0,0 +1,209 @@
+import fnmatch
+import json
+import os
+import shutil
+import socketserver
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from tests.common import redis_snapshot
+from tests.common.db_comparison import VOLATILE_VALUES, DBType, SnapshotDiff, SonicRedisDBSnapshotter
+from tests.common.helpers import redis_bulk
+
+STATE_DB_ID = 6
+
+
+def entry(**values):
+    return {"type": "hash", "value": values, "ttl": -1, "expireat": 1700000000.0}
+
+
+DUMP_A = {
+    "PORT_TABLE|Ethernet0": entry(oper_status="up", speed="100000"),
+    "PORT_TABLE|Ethernet4": entry(oper_status="up", update_time="1"),
+    "TEMPERATURE_INFO|ASIC": entry(temperature="40", warning_status="False"),
+    "NEIGH_STATE_TABLE|10.0.0.1": entry(state="Reachable"),
+    "PROCESS_STATS|100": entry(CMD="/usr/bin/orchagent", CPU="1.0"),
+    "PROCESS_STATS|101": entry(CMD="/usr/bin/syncd", CPU="2.0"),
+}
+DUMP_B = {
+    "PORT_TABLE|Ethernet0": entry(oper_status="down", speed="100000"),
+    # Only volatile values differ
+    "PORT_TABLE|Ethernet4": entry(oper_status="up", update_time="2"),
+    "TEMPERATURE_INFO|ASIC": entry(temperature="45", warning_status="False"),
+    "BGP_STATE|10.0.0.2": entry(state="Established", timestamp="3"),
+    "PROCESS_STATS|200": entry(CMD="/usr/bin/orchagent", CPU="3.0"),
+    "PROCESS_STATS|201": entry(CMD="/usr/bin/bgpd", CPU="1.0"),
+}
+EXPECTED_DIFF = {
+    "PROCESS_STATS|*": {"value": {"CMD0": {"a": "/usr/bin/syncd", "b": None},
+                                  "CMD1": {"a": None, "b": "/usr/bin/bgpd"}}},
+    "NEIGH_STATE_TABLE|10.0.0.1": {"a": {"type": "hash", "value": {"state": "Reachable"}}, "b": None},
+    "BGP_STATE|10.0.0.2": {"a": None, "b": {"type": "hash", "value": {"state": "Established"}}},
+    "PORT_TABLE|Ethernet0": {"value": {"oper_status": {"a": "up", "b": "down"}}},
+}
+
+
+@pytest.fixture()
+def snapshots(tmp_path):
+    volatile = VOLATILE_VALUES[DBType.STATE]
+    for name, dump in [("a", DUMP_A), ("b", DUMP_B)]:
+        (tmp_path / name).mkdir()
+        redis_snapshot.write_snapshot(dump, str(tmp_path / name / "STATE.snap"), volatile)
+    return tmp_path
+
+
+def test_diff_dumps():
+    snapshot_diff = SnapshotDiff(DBType.STATE, DUMP_A, DUMP_B)
+
+    assert snapshot_diff.diff == EXPECTED_DIFF
+    metrics = snapshot_diff.metrics
+    assert (metrics.total_a_keys, metrics.total_a_values_incl_volatile, metrics.total_a_values_excl_volatile) == \
+        (6, 11, 6)
+    assert (metrics.num_differing_keys_a, metrics.num_differing_values_a) == (1, 3)
+    assert (metrics.num_differing_keys_b, metrics.num_differing_values_b) == (1, 3)
+    assert (metrics.num_overall_differing_keys, metrics.num_overall_differing_values) == (2, 5)
+
+
+def test_diff_snapshot_files(snapshots, monkeypatch):
+    decoded = []
+    record = redis_snapshot.SnapshotFile.record
+    monkeypatch.setattr(redis_snapshot.SnapshotFile, "record",
+                        lambda self, entry: decoded.append(entry.key) or record(self, entry))
+    # Snapshot files and JSON dumps of the same DB can't be mixed up
+    (snapshots / "a" / "STATE.json").write_text("{}")
+
+    diff = SonicRedisDBSnapshotter(None, str(snapshots)).diff_snapshots("a", "b")[DBType.STATE]
+
+    assert diff.diff == EXPECTED_DIFF
+    assert diff.metrics == SnapshotDiff(DBType.STATE, DUMP_A, DUMP_B, label_a="a", label_b="b").metrics
+    # Keys with the same content hash, excluding volatile values, are not decoded
+    assert "PORT_TABLE|Ethernet4" not in decoded and "TEMPERATURE_INFO|ASIC" not in decoded
+    assert "PORT_TABLE|Ethernet0" in decoded
+
+
+class RedisHandler(socketserver.StreamRequestHandler):
+    """Stand-in for a redis server, with the commands used by redis_snapshot."""
+
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2].decode())
+        return args
+
+    @staticmethod
+    def encode(value):
+        if value is None:
+            return b"$-1\r\n"
+        if isinstance(value, int):
+            return b":%d\r\n" % value
+        if isinstance(value, list):
+            return b"*%d\r\n" % len(value) + b"".join(RedisHandler.encode(item) for item in value)
+        value = value.encode()
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+
+    def handle(self):
+        db = 0
+        while True:
+            args = self.read_command()
+            if args is None:
+                return
+            self.server.commands.append(args[0])
+            data = self.server.dbs.get(db, {})
+            key_type, value, ttl = data.get(args[1], ("none", None, -2)) if len(args) > 1 else (None, None, None)
+            if args[0] == "SELECT":
+                db = int(args[1])
+                reply = b"+OK\r\n"
+            elif args[0] == "SCAN":
+                reply = self.encode(["0", [key for key in data if fnmatch.fnmatchcase(key, args[3])]])
+            elif args[0] == "TYPE":
+                reply = b"+%s\r\n" % key_type.encode()
+            elif args[0] == "PTTL":
+                reply = self.encode(ttl)
+            elif args[0] == "HGETALL":
+                reply = self.encode([item for field_value in value.items() for item in field_value])
+            elif args[0] == "ZRANGE":
+                reply = self.encode([str(item) for member_score in value for item in member_score])
+            else:
+                reply = self.encode(value)
+            self.wfile.write(reply)
+
+
+@pytest.fixture()
+def redis_server(tmp_path):
+    socket_path = str(tmp_path / "redis.sock")
+    server = socketserver.ThreadingUnixStreamServer(socket_path, RedisHandler)
+    server.daemon_threads = True
+    server.commands = []
+    server.dbs = {STATE_DB_ID: {
+        "PORT_TABLE|Ethernet0": ("hash", {"oper_status": "up", "speed": "100000"}, -1),
+        "FDB_TABLE|Vlan1000:00:01": ("hash", {"port": "Ethernet4"}, 2500),
+        "STRING": ("string", "value", -1),
+        "LIST": ("list", ["b", "a"], -1),
+        "SET": ("set", ["b", "a"], -1),
+        "ZSET": ("zset", [["a", 1.0], ["b", 2.5]], -1),
+        "STREAM": ("stream", None, -1),
+    }}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    config = {
+        "INSTANCES": {"redis": {"hostname": "127.0.0.1", "port": 6379, "unix_socket_path": socket_path}},
+        "DATABASES": {"STATE_DB": {"id": STATE_DB_ID, "separator": "|", "instance": "redis"}},
+    }
+    with open(os.path.join(str(tmp_path), redis_bulk.DB_CONFIG_FILE), "w") as f:
+        json.dump(config, f)
+    server.config_dir = str(tmp_path)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_read_contents(redis_server):
+    conn, db_id = redis_bulk.connect("STATE_DB", config_dir=redis_server.config_dir)
+    conn.execute([["SELECT", db_id]])
+    keys = sorted(redis_server.dbs[STATE_DB_ID]) + ["REMOVED"]
+    contents = dict(redis_snapshot.read_contents(conn, keys, batch_size=3))
+    conn.close()
+
+    # The keys removed since the scan and of unsupported types are skipped
+    assert sorted(contents) == ["FDB_TABLE|Vlan1000:00:01", "LIST", "PORT_TABLE|Ethernet0", "SET", "STRING", "ZSET"]
+    assert {key: content["value"] for key, content in contents.items()} == {
+        "FDB_TABLE|Vlan1000:00:01": {"port": "Ethernet4"},
+        "LIST": ["b", "a"],
+        "PORT_TABLE|Ethernet0": {"oper_status": "up", "speed": "100000"},
+        "SET": ["a", "b"],
+        "STRING": "value",
+        "ZSET": [["a", 1.0], ["b", 2.5]],
+    }
+    assert contents["FDB_TABLE|Vlan1000:00:01"]["ttl"] == 2.5
+    assert contents["PORT_TABLE|Ethernet0"]["ttl"] == -1
+    assert contents["STRING"]["type"] == "string"
+    # A pipeline of TYPE and PTTL, then one of the values, per batch of 3 keys
+    assert redis_server.commands.count("TYPE") == 8
+
+
+def test_dump_db_on_dut(redis_server, tmp_path):
+    # Layout of the files copied to the DUT, the tests package is not available there
+    remote_dir = tmp_path / "remote"
+    remote_dir.mkdir()
+    for module in (redis_snapshot, redis_bulk):
+        shutil.copy(module.__file__, str(remote_dir))
+    snapshot_file = str(tmp_path / "STATE.snap")
+    code = "import redis_snapshot; print(redis_snapshot.dump_db('STATE_DB', {!r}, ['ttl', 'expireat'], '', {!r}))" \
+        .format(snapshot_file, redis_server.config_dir)
+    env = dict(os.environ)
+    env.pop("PYTHONPATH", None)
+    output = subprocess.check_output([sys.executable, "-c", code], cwd=str(remote_dir), env=env)
+    assert output.strip() == b"6"
+
+    with redis_snapshot.SnapshotFile(snapshot_file) as snapshot:
+        entries = list(snapshot.entries())
+        assert [entry.key for entry in entries] == \
+            ["FDB_TABLE|Vlan1000:00:01", "LIST", "PORT_TABLE|Ethernet0", "SET", "STRING", "ZSET"]
+        assert snapshot.record(entries[2])["value"] == {"oper_status": "up", "speed": "100000"}
+        assert (entries[2].values, entries[2].values_excl_volatile) == (2, 2)
@@ -0,0 +1,125 @@
+import logging
+import os
+import queue
+import threading
+import time
+
+import pytest
+
+from tests.common import utilities
+from tests.common.cache import facts_cache
+
+
+INVENTORY = """\
+all:
+  children:
+    sonic:
+      vars:
+        ansible_user: admin
+      hosts:
+        dut-1:
+          ansible_host: 10.0.0.1
+          hwsku: Force10-S6000
+{extra}
+"""
+
+
+@pytest.fixture()
+def inventory(tmp_path, monkeypatch):
+    logger = logging.Logger("utilities", logging.CRITICAL)
+    logger.addHandler(logging.NullHandler())
+    monkeypatch.setattr(utilities, "logger", logger)
+    monkeypatch.setattr(facts_cache, "logger", logger)
+
+    class TmpFactsCache(facts_cache.FactsCache):
+        def __init__(self):
+            super(TmpFactsCache, self).__init__(cache_location=str(tmp_path / "_cache"))
+
+    monkeypatch.setattr(utilities, "FactsCache", TmpFactsCache)
+    monkeypatch.setattr(utilities, "_inventory_managers", {})
+
+    inv_file = tmp_path / "lab"
+    inv_file.write_text(INVENTORY.format(extra=""))
+    return str(inv_file)
+
+
+def test_inventory_manager_is_shared(inventory):
+    im = utilities.get_inventory_manager([inventory])
+    assert utilities.get_inventory_manager([inventory]) is im
+    assert utilities.get_variable_manager([inventory])._inventory is im
+    assert im.get_host("dut-1").vars["hwsku"] == "Force10-S6000"
+
+
+def test_inventory_manager_rebuilt_on_change(inventory):
+    im = utilities.get_inventory_manager([inventory])
+    assert im.get_host("dut-2") is None
+
+    with open(inventory, "w") as f:
+        f.write(INVENTORY.format(extra="        dut-2:\n          ansible_host: 10.0.0.2\n"))
+    stat = os.stat(inventory)
+    os.utime(inventory, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000))
+
+    new_im = utilities.get_inventory_manager([inventory])
+    assert new_im is not im
+    assert new_im.get_host("dut-2").vars["ansible_host"] == "10.0.0.2"
+
+
+def test_inventory_loaded_from_snapshot(inventory, monkeypatch):
+    parsed_vars = utilities.get_variable_manager([inventory]).get_vars(
+        host=utilities.get_inventory_manager([inventory]).get_host("dut-1"))
+
+    # Another process, like a xdist worker, loads the inventory stored in FactsCache without parsing
+    monkeypatch.setattr(utilities, "_inventory_managers", {})
+    monkeypatch.setattr(utilities.InventoryManager, "parse_sources",
+                        lambda *args, **kwargs: pytest.fail("Inventory parsed again"))
+
+    im = utilities.get_inventory_manager([inventory])
+    host = im.get_host("dut-1")
+    assert sorted(group.name for group in host.get_groups()) == ["all", "sonic"]
+    assert utilities.get_variable_manager([inventory]).get_vars(host=host) == parsed_vars
+
+
+class Changes(object):
+    """Stand-in for a keyspace watcher."""
+
+    def __init__(self):
+        self.event = threading.Event()
+
+    def wait(self, timeout):
+        changed = self.event.wait(timeout)
+        self.event.clear()
+        return changed
+
+
+@pytest.mark.parametrize("changes", [Changes(), queue.Queue()], ids=["watcher", "queue"])
+def test_wait_until_changed(changes, monkeypatch):
+    logger = logging.Logger("utilities", logging.CRITICAL)
+    logger.addHandler(logging.NullHandler())
+    monkeypatch.setattr(utilities, "logger", logger)
+    state = {"converged": False, "checks": 0}
+
+    def converged():
+        state["checks"] += 1
+        return state["converged"]
+
+    def converge():
+        time.sleep(0.3)
+        state["converged"] = True
+        if isinstance(changes, queue.Queue):
+            # A burst of events is handled by one check
+            for _ in range(3):
+                changes.put({"type": "update"})
+        else:
+            changes.event.set()
+
+    threading.Thread(target=converge).start()
+    start = time.time()
+    assert utilities.wait_until_changed(10, 5, 0, changes, converged)
+    assert time.time() - start < 1
+    assert state["checks"] == 2
+
+    # Without change notifications, the condition is polled
+    state["checks"] = 0
+    state["converged"] = False
+    assert not utilities.wait_until_changed(0.5, 0.1, 0, None, converged)
+    assert 4 <= state["checks"] <= 7
@@ -8,6 +8,7 @@ import ipaddress
 import json
 import logging
 import os
+import queue
 import re
 import random
 import six
@@ -16,6 +17,7 @@ import threading
 import time
 import traceback
 import copy
+import hashlib
 import tempfile
 import uuid
 import paramiko
@@ -34,6 +36,7 @@ from ansible.vars.manager import VariableManager
 from tests.common import constants
 from tests.common.cache import cached
 from tests.common.cache import FactsCache
+from tests.common.cache import result_cache
 from tests.common.helpers.constants import UPSTREAM_NEIGHBOR_MAP, UPSTREAM_ALL_NEIGHBOR_MAP
 from tests.common.helpers.constants import DOWNSTREAM_NEIGHBOR_MAP, DOWNSTREAM_ALL_NEIGHBOR_MAP
 from tests.common.helpers.assertions import pytest_assert
@@ -132,7 +135,8 @@ def wait_until(timeout, interval, delay, condition, *args, **kwargs):
     @param *args: Extra args required by the 'condition' function.
     @param **kwargs: Extra args required by the 'condition' function.
     @return: If the condition function returns True before timeout, return True. If the condition function raises an
-        exception, log the error and keep waiting and polling.
+        exception, log the error and keep waiting and polling. Results of host methods cached by ttl_cached are not
+        used by the condition, it is polled for a state change.
     """
     logger.debug("Wait until %s is True, timeout is %s seconds, checking interval is %s, delay is %s seconds" %
                  (condition.__name__, timeout, interval, delay))
@@ -147,7 +151,8 @@ def wait_until(timeout, interval, delay, condition, *args, **kwargs):
         logger.debug("Time elapsed: %f seconds" % elapsed_time)
 
         try:
-            check_result = condition(*args, **kwargs)
+            with result_cache.bypassed():
+                check_result = condition(*args, **kwargs)
         except Exception as e:
             exc_info = sys.exc_info()
             details = traceback.format_exception(*exc_info)
@@ -171,6 +176,73 @@ def wait_until(timeout, interval, delay, condition, *args, **kwargs):
         return False
 
 
+def _check_condition(condition, *args, **kwargs):
+    """Return the result of condition without cached host results, False if it raises an exception."""
+    try:
+        with result_cache.bypassed():
+            return condition(*args, **kwargs)
+    except Exception as e:
+        details = traceback.format_exception(*sys.exc_info())
+        logger.error("Exception caught while checking {}:{}, error:{}".format(condition.__name__, "".join(details), e))
+        return False
+
+
+def _wait_for_change(changes, timeout):
+    """Wait up to timeout seconds for a change notified by changes, see wait_until_changed."""
+    if changes is None:
+        time.sleep(timeout)
+        return False
+    if isinstance(changes, queue.Queue):
+        try:
+            changes.get(timeout=timeout)
+        except queue.Empty:
+            return False
+        # A burst of events is handled by one check of the condition
+        while True:
+            try:
+                changes.get_nowait()
+            except queue.Empty:
+                return True
+    return changes.wait(timeout)
+
+
+def wait_until_changed(timeout, interval, delay, changes, condition, *args, **kwargs):
+    """
+    @summary: Wait until the specified condition is True or timeout. The condition is checked again as soon as a
+        change of the state it depends on is notified, instead of after a fixed interval.
+    @param timeout: Maximum time to wait
+    @param interval: Maximum time between two checks without notified change, the poll interval if changes is None
+    @param delay: Delay time
+    @param changes: Notifier of the changes: an object with a wait(timeout) method returning True on change, like
+        the keyspace watcher of SonicDbCli.watch(), a queue.Queue of events, like the gNMI subscription queue of
+        sai_validation.sonic_db.start_db_monitor(), or None to poll like wait_until.
+    @param condition: A function that returns False or True
+    @param *args: Extra args required by the 'condition' function.
+    @param **kwargs: Extra args required by the 'condition' function.
+    @return: If the condition function returns True before timeout, return True. If the condition function raises an
+        exception, log the error and keep waiting.
+    """
+    logger.debug("Wait until %s is True on change, timeout is %s seconds, checking interval is %s, delay is %s "
+                 "seconds" % (condition.__name__, timeout, interval, delay))
+
+    if delay > 0:
+        logger.debug("Delay for %s seconds first" % delay)
+        time.sleep(delay)
+
+    start_time = time.time()
+    while True:
+        if _check_condition(condition, *args, **kwargs):
+            logger.debug("%s is True after %f seconds, exit early with True" %
+                         (condition.__name__, time.time() - start_time))
+            return True
+        remaining = timeout - (time.time() - start_time)
+        if remaining <= 0:
+            logger.debug("%s is still False after %d seconds, exit with False" % (condition.__name__, timeout))
+            return False
+        if _wait_for_change(changes, min(interval, remaining)):
+            logger.debug("Change notified, check %s again" % condition.__name__)
+
+
 def ping_ip(host, dst_ip, count=4, cmd_prefix=""):
     """Ping an IP address from a host with an optional command prefix.
 
@@ -252,6 +324,43 @@ async def async_wait_until(timeout, interval, delay, condition, *args, **kwargs)
         return False
 
 
+async def async_wait_until_changed(timeout, interval, delay, changes, condition, *args, **kwargs):
+    """
+    @summary: Same as wait_until_changed but async, the changes are waited for in the default executor
+    @param timeout: Maximum time to wait
+    @param interval: Maximum time between two checks without notified change, the poll interval if changes is None
+    @param delay: Delay time
+    @param changes: Notifier of the changes, see wait_until_changed
+    @param condition: A function that returns False or True
+    @param *args: Extra args required by the 'condition' function.
+    @param **kwargs: Extra args required by the 'condition' function.
+    @return: If the condition function returns True before timeout, return True. If the condition function raises an
+        exception, log the error and keep waiting.
+    """
+    logger.debug("Wait until %s is True on change, timeout is %s seconds, checking interval is %s, delay is %s "
+                 "seconds" % (condition.__name__, timeout, interval, delay))
+
+    if delay > 0:
+        logger.debug("Delay for %s seconds first" % delay)
+        await asyncio.sleep(delay)
+
+    loop = asyncio.get_event_loop()
+    start_time = time.time()
+    while True:
+        if _check_condition(condition, *args, **kwargs):
+            logger.debug("%s is True after %f seconds, exit early with True" %
+                         (condition.__name__, time.time() - start_time))
+            return True
+        remaining = timeout - (time.time() - start_time)
+        if remaining <= 0:
+            logger.debug("%s is still False after %d seconds, exit with False" % (condition.__name__, timeout))
+            return False
+        if changes is None:
+            await asyncio.sleep(min(interval, remaining))
+        elif await loop.run_in_executor(None, _wait_for_change, changes, min(interval, remaining)):
+            logger.debug("Change notified, check %s again" % condition.__name__)
+
+
 def wait_tcp_connection(client, server_hostname, listening_port, timeout_s=30):
     """
     @summary: Wait until tcp connection is ready or timeout
@@ -348,12 +457,71 @@ def join_all(threads, timeout):
                            [repr(thread) for thread in threads])
 
 
+# Zone in FactsCache of the parsed inventories, shared by all the processes like xdist workers
+INVENTORY_CACHE_ZONE = "inventory"
+# Inventory managers shared in the process, key is tuple of inventory files, value is dict with the signature of the
+# inventory files, the InventoryManager and the VariableManager
+_inventory_managers = {}
+_inventory_managers_lock = threading.Lock()
+
+
+def _inventory_signature(inv_files):
+    """Get signature of inventory files, made of their absolute paths and modification times."""
+    signature = []
+    for inv_file in inv_files:
+        if not os.path.exists(inv_file):
+            # Not a file, e.g. a comma separated host list
+            signature.append((inv_file, None))
+        elif os.path.isdir(inv_file):
+            mtimes = [os.stat(os.path.join(root, name)).st_mtime_ns
+                      for root, _, names in os.walk(inv_file) for name in names]
+            signature.append((os.path.abspath(inv_file), max(mtimes + [os.stat(inv_file).st_mtime_ns])))
+        else:
+            signature.append((os.path.abspath(inv_file), os.stat(inv_file).st_mtime_ns))
+    return tuple(signature)
+
+
+def _load_inventory_manager(inv_files, signature):
+    """Load the inventory parsed by another process from FactsCache, or parse the inventory files and store it."""
+    facts_cache = FactsCache()
+    key = hashlib.sha1(repr(signature).encode("utf-8")).hexdigest()
+    inventory = facts_cache.read(INVENTORY_CACHE_ZONE, key)
+    if inventory is not FactsCache.NOTEXIST:
+        im = InventoryManager(loader=DataLoader(), sources=inv_files, parse=False)
+        im._inventory = inventory
+        return im
+
+    im = InventoryManager(loader=DataLoader(), sources=inv_files)
+    facts_cache.write(INVENTORY_CACHE_ZONE, key, im._inventory)
+    return im
+
+
+def _get_inventory_managers(inv_files):
+    inv_files = [inv_files] if isinstance(inv_files, str) else list(inv_files)
+    signature = _inventory_signature(inv_files)
+    with _inventory_managers_lock:
+        entry = _inventory_managers.get(tuple(inv_files))
+        if entry is None or entry["signature"] != signature:
+            entry = {"signature": signature, "im": _load_inventory_manager(inv_files, signature), "vm": None}
+            _inventory_managers[tuple(inv_files)] = entry
+        if entry["vm"] is None:
+            entry["vm"] = VariableManager(loader=DataLoader(), inventory=entry["im"])
+        return entry
+
+
 def get_inventory_manager(inv_files):
-    return InventoryManager(loader=DataLoader(), sources=inv_files)
+    """Get InventoryManager of the inventory files.
+
+    The InventoryManager is shared in the process until any inventory file is modified, callers must not modify it.
+    The parsed inventory is also stored in FactsCache, so other processes load it instead of parsing the inventory
+    files again.
+    """
+    return _get_inventory_managers(inv_files)["im"]
 
 
 def get_variable_manager(inv_files):
-    return VariableManager(loader=DataLoader(), inventory=get_inventory_manager(inv_files))
+    """Get VariableManager of the inventory files, shared like the InventoryManager."""
+    return _get_inventory_managers(inv_files)["vm"]
 
 
 def get_inventory_files(request):
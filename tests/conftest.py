@@ -46,6 +46,7 @@ from tests.common.dualtor.dual_tor_utils import config_active_active_dualtor
 from tests.common.dualtor.dual_tor_common import active_active_ports                        # noqa: F401
 from tests.common.dualtor import mux_simulator_control                                      # noqa: F401
 
+from tests.common.helpers.artifacts import collect_artifacts
 from tests.common.helpers.constants import (
     ASIC_PARAM_TYPE_ALL, ASIC_PARAM_TYPE_FRONTEND, DEFAULT_ASIC_ID, NAMESPACE_PREFIX,
     ASICS_PRESENT, DUT_CHECK_NAMESPACE
@@ -69,6 +70,7 @@ from tests.common.helpers.dut_utils import is_supervisor_node, is_frontend_node,
     is_enabled_nat_for_dpu, get_dpu_names_and_ssh_ports, enable_nat_for_dpus, is_macsec_capable_node, \
     get_supervisor_for_linecard, create_linecard_console
 from tests.common.cache import FactsCache
+from tests.common.cache import result_cache
 from tests.common.config_reload import config_reload
 from tests.common.helpers.assertions import pytest_assert as pt_assert
 from pytest_ansible.errors import AnsibleConnectionFailure
@@ -145,6 +147,10 @@ def pytest_addoption(parser):
     parser.addoption("--npu_dpu_startup", action="store_true", help="Startup NPU and DPUs and install configurations")
     parser.addoption("--l47_trafficgen", action="store_true", help="Enable L47 trafficgen config")
     parser.addoption("--save_l47_trafficgen", action="store_true", help="Save L47 trafficgen config")
+    parser.addoption("--host_result_cache_ttl", action="store", default=0, type=int,
+                     help="Seconds to cache parsed show command outputs of DUTs in memory, 0 to disable")
+    parser.addoption("--dut_persistent_channel", action="store_true", default=False,
+                     help="Run shell and command modules on DUTs through a persistent SSH channel")
 
     # test_vrf options
     parser.addoption("--vrf_capacity", action="store", default=None, type=int, help="vrf capacity of dut (4-1000)")
@@ -412,6 +418,8 @@ def pytest_addoption(parser):
 
 
 def pytest_configure(config):
+    result_cache.DEFAULT_TTL = config.getoption("host_result_cache_ttl")
+    SonicHost.persistent_channel_enabled = config.getoption("dut_persistent_channel")
     if config.getoption("enable_macsec"):
         topo = config.getoption("topology")
         if topo is not None and "t2" in topo:
@@ -687,6 +695,8 @@ def pytest_sessionstart(session):
 
 
 def pytest_sessionfinish(session, exitstatus):
+    result_cache.log_stats()
+
     if (session.config.cache.get("duthosts_fixture_failed", None) or
             session.config.cache.get("ptfhost_exception", None)):
         session.config.cache.set("duthosts_fixture_failed", None)
@@ -1525,7 +1535,9 @@ def collect_techsupport_on_dut(request, a_dut):
     if request.config.getoption("--collect_techsupport") and request.node.rep_call.failed:
         res = a_dut.shell("generate_dump -s \"-2 hours\"")
         fname = res['stdout_lines'][-1]
-        a_dut.fetch(src=fname, dest="logs/{}".format(testname))
+        # Same layout as fetch, the dump is already compressed
+        collect_artifacts(a_dut, [{"path": fname}], dest_dir="logs/{}/{}".format(testname, a_dut.hostname),
+                          compress=False, fail_on_missing=True)
 
         logging.info("########### Collected tech support for test {} ###########".format(testname))
 
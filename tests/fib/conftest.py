@@ -0,0 +1,9 @@
+"""
+    Pytest configuration used by the fib tests.
+"""
+
+
+def pytest_addoption(parser):
+    parser.addoption("--hash_pipeline_batch_size", action="store", default=0, type=int,
+                     help="Number of packets sent back-to-back by the balancing checks of the hash tests, "
+                          "0 to send each packet after the previous one is received")
@@ -589,6 +589,7 @@ def test_hash(add_default_route_to_dut, duthosts, tbinfo, setup_vlan,      # noq
             "topo_name": updated_tbinfo['topo']['name'],
             "topo_type": updated_tbinfo['topo']['type'],
             "is_v6_topo": is_ipv6_only_topology(updated_tbinfo),
+            "pipeline_batch_size": request.config.getoption("--hash_pipeline_batch_size"),
         },
         log_file=log_file,
         qlen=PTF_QLEN,
@@ -641,6 +642,7 @@ def test_ipinip_hash(add_default_route_to_dut, duthost, duthosts,
                        "ipver": ipver,
                        "topo_name": tbinfo['topo']['name'],
                        "is_v6_topo": is_ipv6_only_topology(tbinfo),
+                       "pipeline_batch_size": request.config.getoption("--hash_pipeline_batch_size"),
                        },
                log_file=log_file,
                qlen=PTF_QLEN,
@@ -688,6 +690,7 @@ def test_ipinip_hash_negative(add_default_route_to_dut, duthosts,           # no
                    "topo_name": tbinfo['topo']['name'],
                    "topo_type": tbinfo['topo']['type'],
                    "is_v6_topo": is_ipv6_only_topology(tbinfo),
+                   "pipeline_batch_size": request.config.getoption("--hash_pipeline_batch_size"),
                },
                log_file=log_file,
                qlen=PTF_QLEN,
@@ -749,6 +752,7 @@ def test_vxlan_hash(add_default_route_to_dut, duthost, duthosts,
                        "topo_name": tbinfo['topo']['name'],
                        "topo_type": tbinfo['topo']['type'],
                        "is_v6_topo": is_ipv6_only_topology(tbinfo),
+                       "pipeline_batch_size": request.config.getoption("--hash_pipeline_batch_size"),
                        },
                log_file=log_file,
                qlen=PTF_QLEN,
@@ -815,6 +819,7 @@ def test_nvgre_hash(add_default_route_to_dut, duthost, duthosts,
                        "topo_name": tbinfo['topo']['name'],
                        "topo_type": tbinfo['topo']['type'],
                        "is_v6_topo": is_ipv6_only_topology(tbinfo),
+                       "pipeline_batch_size": request.config.getoption("--hash_pipeline_batch_size"),
                        },
                log_file=log_file,
                qlen=PTF_QLEN,
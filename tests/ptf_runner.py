@@ -1,6 +1,11 @@
 import ast
+import collections
+import hashlib
 import pathlib
 import pipes
+import secrets
+import socket
+import time
 import traceback
 import logging
 import allure
@@ -9,13 +14,31 @@ from datetime import datetime
 import os
 import six
 
+from tests.common.errors import RunAnsibleModuleFail
+from tests.common.helpers.artifacts import collect_artifacts
+
 logger = logging.getLogger(__name__)
 
+PTF_SERVER_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "common", "helpers", "ptf_server.py")
+PTF_SERVER_DEST = "/root/ptf_server.py"
+PTF_SERVER_LOG = "/tmp/ptf_server.log"
+PTF_SERVER_PID_FILE = "/tmp/ptf_server.pid"
+PTF_SERVER_SECRET_FILE = "/root/.ptf_server_secret"
+# The log files of the tests run by the server must be in this directory
+PTF_SERVER_LOG_DIR = "/tmp"
+PTF_SERVER_PORT = 10990
+PTF_SERVER_CONNECT_TIMEOUT = 10
+# Seconds to wait for the server to import ptf and scapy
+PTF_SERVER_START_TIMEOUT = 60
+# Run the tests with the persistent PTF server by default, e.g. PTF_SERVER=1 ./run_tests.sh ...
+PTF_SERVER_ENABLED = os.environ.get("PTF_SERVER", "0") == "1"
+
 
 def ptf_collect(host, log_file, skip_pcap=False, dst_dir='./logs/ptf_collect/'):
     """
-    Collect PTF log and pcap files from PTF container to sonic-mgmt container.
+    Collect PTF log and pcap files from PTF container to sonic-mgmt container, in one round trip.
     Optionally, save the files to a sub-directory in the destination.
+    Returns the local path of the log file, None if it was not found.
     """
     pos = log_file.rfind('.')
     filename_prefix = log_file[0:pos] if pos > -1 else log_file
@@ -24,20 +47,18 @@ def ptf_collect(host, log_file, skip_pcap=False, dst_dir='./logs/ptf_collect/'):
     rename_prefix = filename_prefix[pos:] if pos > 0 else filename_prefix
     suffix = str(datetime.utcnow()).replace(' ', '.')
     filename_log = dst_dir + rename_prefix + '.' + suffix + '.log'
-    host.fetch(src=log_file, dest=filename_log, flat=True, fail_on_missing=False)
+    artifacts = [{"path": log_file, "dest": filename_log}]
+    filename_pcap = dst_dir + rename_prefix + '.' + suffix + '.pcap.tar.gz'
+    if not skip_pcap:
+        # gzip compressed like the archive module did on the PTF host
+        artifacts.append({"path": filename_prefix + '.pcap', "dest": filename_pcap, "gzip": True})
+    collected = collect_artifacts(host, artifacts).values()
+    if filename_log not in collected:
+        return None
     allure.attach.file(filename_log, 'ptf_log: ' + filename_log, allure.attachment_type.TEXT)
-    if skip_pcap:
-        return
-    pcap_file = filename_prefix + '.pcap'
-    output = host.shell("[ -f {} ] && echo exist || echo null".format(pcap_file))['stdout']
-    if output == 'exist':
-        # Compress the file
-        compressed_pcap_file = pcap_file + '.tar.gz'
-        host.archive(path=pcap_file, dest=compressed_pcap_file, format='gz')
-        # Copy compressed file from ptf to sonic-mgmt
-        filename_pcap = dst_dir + rename_prefix + '.' + suffix + '.pcap.tar.gz'
-        host.fetch(src=compressed_pcap_file, dest=filename_pcap, flat=True, fail_on_missing=False)
+    if filename_pcap in collected:
         allure.attach.file(filename_pcap, 'ptf_pcap: ' + filename_pcap, allure.attachment_type.PCAP)
+    return filename_log
 
 
 def get_dut_type(host):
@@ -122,22 +143,244 @@ def is_py3_compat(test_fpath):
     return False
 
 
+class PtfServerError(Exception):
+    """Raised when the PTF server can't be started."""
+    pass
+
+
+class PtfServerClient(object):
+    """Client of the persistent PTF server of a PTF host, see common/helpers/ptf_server.py.
+
+    The server is started on first use, and restarted when it runs another version of ptf_server.py. The tests are run
+    with the ptf CLI when the server can't be started.
+    """
+
+    # Source of ptf_server.py and its hash, read once
+    _source = None
+    _token = None
+    # Secret of the requests of the test session
+    _secret = None
+    # Client of each PTF host
+    _clients = {}
+
+    def __init__(self, host, port=PTF_SERVER_PORT):
+        self.host = host
+        self.port = port
+        self.started = False
+        self.unavailable = False
+        self._facts = None
+
+    @classmethod
+    def get(cls, host):
+        if host.hostname not in cls._clients:
+            cls._clients[host.hostname] = cls(host)
+        return cls._clients[host.hostname]
+
+    @staticmethod
+    def source():
+        """Source of ptf_server.py, copied to the PTF host."""
+        if PtfServerClient._source is None:
+            with open(PTF_SERVER_FILE) as stream:
+                PtfServerClient._source = stream.read()
+            PtfServerClient._token = hashlib.sha1(PtfServerClient._source.encode("utf-8")).hexdigest()
+        return PtfServerClient._source
+
+    @staticmethod
+    def token():
+        """Token of the server started from the current source of ptf_server.py."""
+        PtfServerClient.source()
+        return PtfServerClient._token
+
+    @staticmethod
+    def secret():
+        """
+        Random secret of the test session, sent with every request.
+
+        The xdist workers of a test session share it, as they share the servers of the PTF hosts.
+        """
+        if PtfServerClient._secret is None:
+            run_uid = os.environ.get("PYTEST_XDIST_TESTRUNUID")
+            if run_uid:
+                PtfServerClient._secret = hashlib.sha256("ptf_server:{}".format(run_uid).encode("utf-8")).hexdigest()
+            else:
+                PtfServerClient._secret = secrets.token_hex(32)
+        return PtfServerClient._secret
+
+    def facts(self):
+        """DUT type, ASIC type and image type of the PTF host, read once."""
+        if self._facts is None:
+            self._facts = (get_dut_type(self.host), get_asic_type(self.host), get_ptf_image_type(self.host))
+        return self._facts
+
+    def python(self):
+        """Python 3 interpreter with the ptf package, see the ptf binaries chosen by ptf_runner."""
+        if self.facts()[2] == "mixed":
+            return "/root/env-python3/bin/python3"
+        return "python3"
+
+    def _request(self, request, timeout=PTF_SERVER_CONNECT_TIMEOUT):
+        """Send a request to the server, return a file object reading the JSON lines of the reply."""
+        sock = socket.create_connection((self.host.mgmt_ip, self.port), PTF_SERVER_CONNECT_TIMEOUT)
+        try:
+            sock.sendall((json.dumps(dict(request, secret=self.secret())) + "\n").encode("utf-8"))
+            sock.settimeout(timeout)
+            return sock.makefile("rb")
+        finally:
+            # The file object keeps the connection open
+            sock.close()
+
+    def ping(self):
+        """
+        Reply of the running server, {"token": token, "pid": pid} or {"error": message} if the server of another test
+        session rejected the request. None if the server is not running.
+        """
+        try:
+            with self._request({"op": "ping"}) as reader:
+                return json.loads(reader.readline())
+        except (OSError, ValueError):
+            return None
+
+    def wait(self, token, timeout):
+        """Wait until the token of the running server is token, or until the server is stopped if token is None."""
+        deadline = time.time() + timeout
+        while True:
+            reply = self.ping()
+            if (reply is None) if token is None else (reply or {}).get("token") == token:
+                return True
+            if time.time() > deadline:
+                return False
+            time.sleep(0.5)
+
+    def stop(self, reply):
+        """Stop the running server, reply is the reply of the server to ping."""
+        if "token" in reply:
+            try:
+                with self._request({"op": "shutdown"}) as reader:
+                    reader.readline()
+            except (OSError, ValueError):
+                pass
+        else:
+            # Server of another test session, which only accepts the requests of its session
+            self.host.shell("kill $(cat {0}) && rm -f {0}".format(PTF_SERVER_PID_FILE), module_ignore_errors=True)
+        if not self.wait(None, PTF_SERVER_CONNECT_TIMEOUT):
+            raise PtfServerError("The PTF server running on port {} is not stopped".format(self.port))
+
+    def start(self):
+        """Start the server, or restart it if it runs another version of ptf_server.py."""
+        reply = self.ping()
+        if reply is not None and reply.get("token") == self.token():
+            return
+        if reply is not None:
+            logger.info("Restarting the PTF server of {}, it runs another version or belongs to another test "
+                        "session".format(self.host.hostname))
+            self.stop(reply)
+        self.host.copy(content=self.source(), dest=PTF_SERVER_DEST)
+        # The secret is passed in a file readable by root only, ansible logs the command lines
+        self.host.copy(content=self.secret(), dest=PTF_SERVER_SECRET_FILE, mode="0600")
+        self.host.shell("nohup {} {} --bind {} --port {} --token {} --secret-file {} --log-dir {} --pid-file {} "
+                        ">{} 2>&1 </dev/null &".format(self.python(), PTF_SERVER_DEST, self.host.mgmt_ip, self.port,
+                                                       self.token(), PTF_SERVER_SECRET_FILE, PTF_SERVER_LOG_DIR,
+                                                       PTF_SERVER_PID_FILE, PTF_SERVER_LOG), chdir="/root")
+        if not self.wait(self.token(), PTF_SERVER_START_TIMEOUT):
+            raise PtfServerError("The PTF server is not started, see {}".format(PTF_SERVER_LOG))
+        logger.info("PTF server of {} started on port {}".format(self.host.hostname, self.port))
+
+    def run(self, request, cmd, module_ignore_errors=False):
+        """
+        Run a test with the server, the output of the test is logged while it runs.
+
+        Args:
+            request (dict): Run request, see ptf_server.py
+            cmd (str): Equivalent ptf command, for the result
+            module_ignore_errors (bool): Return the result of a failed test instead of raising
+
+        Returns:
+            Result like the result of host.shell running the ptf command, None if the server is not usable and the test
+            must be run with the ptf command.
+
+        Raises:
+            RunAnsibleModuleFail: If the test failed and module_ignore_errors is False.
+        """
+        if self.unavailable:
+            return None
+        if not self.started:
+            try:
+                self.start()
+                self.started = True
+            except Exception as e:
+                logger.warning("Failed to start the PTF server of {}, the ptf command is used: {}".format(
+                    self.host.hostname, e))
+                self.unavailable = True
+                return None
+        try:
+            reader = self._request(dict(request, op="run"), timeout=None)
+        except OSError as e:
+            # Not sent, the server is started again for the next test
+            logger.warning("Failed to send the test to the PTF server, the ptf command is used: {}".format(e))
+            self.started = False
+            return None
+
+        output = {"stdout": [], "stderr": []}
+        result = None
+        with reader:
+            try:
+                for line in reader:
+                    message = json.loads(line)
+                    for name in ["stdout", "stderr"]:
+                        if name in message:
+                            output[name].append(message[name])
+                            logger.debug("ptf %s: %s", name, message[name].rstrip("\n"))
+                    if "rc" in message:
+                        result = message
+            except (OSError, ValueError) as e:
+                logger.error("Failed to read the result from the PTF server: {}".format(e))
+        if result is None:
+            # The test may have stopped the server, it must not be run again with the ptf command
+            self.started = False
+            result = {"rc": -1, "msg": "Connection to the PTF server lost"}
+
+        result["cmd"] = cmd
+        for name in ["stdout", "stderr"]:
+            result[name] = "".join(output[name]).rstrip("\r\n")
+            result[name + "_lines"] = result[name].splitlines()
+        result["failed"] = result["rc"] != 0
+        if result["failed"] and not module_ignore_errors:
+            raise RunAnsibleModuleFail("run ptf test {} with the PTF server failed".format(request["test"]), result)
+        return result
+
+
 def ptf_runner(host, testdir, testname, platform_dir=None, params={},
                platform="remote", qlen=0, relax=True, debug_level="info",
                socket_recv_size=None, log_file=None,
                ptf_collect_dir="./logs/ptf_collect/",
                device_sockets=[], timeout=0, custom_options="",
                module_ignore_errors=False, is_python3=None, async_mode=False, pdb=False,
-               test_subdir='py3'):
-    dut_type = get_dut_type(host)
-    asic_type = get_asic_type(host)
+               test_subdir='py3', use_ptf_server=None):
+    """
+    Run a PTF test with the ptf command in the PTF container.
+
+    With use_ptf_server, or PTF_SERVER=1 in the environment when it is None, the Python 3 tests are run by the
+    persistent PTF server of the PTF host instead, which keeps ptf, scapy, the test modules and the dataplane loaded
+    between the tests. The ptf command is still used when the server can't be started, and for async_mode, pdb and
+    custom_options.
+    """
+    if use_ptf_server is None:
+        use_ptf_server = PTF_SERVER_ENABLED
+    server = PtfServerClient.get(host) if use_ptf_server else None
+    if server:
+        dut_type, asic_type, ptf_img_type = server.facts()
+    else:
+        dut_type = get_dut_type(host)
+        asic_type = get_asic_type(host)
+        ptf_img_type = None
     kvm_support = params.get("kvm_support", False)
     if dut_type == "kvm" and asic_type != "vpp" and kvm_support is False:
         logger.info("Skip test case {} for not support on KVM DUT".format(testname))
         return True
 
     cmd = ""
-    ptf_img_type = get_ptf_image_type(host)
+    if ptf_img_type is None:
+        ptf_img_type = get_ptf_image_type(host)
     logger.info('PTF image type: {}'.format(ptf_img_type))
     test_fpath, in_subdir = get_test_path(testdir, testname)
     logger.info('Test file path {}, in subdir: {}'.format(test_fpath, in_subdir))
@@ -167,11 +410,8 @@ def ptf_runner(host, testdir, testname, platform_dir=None, params={},
             err_msg = 'cannot run Python 2 test in a Python 3 only {} {}'.format(testdir, testname)
             raise Exception(err_msg)
 
-    if in_subdir:
-        tdir = pathlib.Path(testdir).joinpath(test_subdir)
-        cmd = "{} --test-dir {} {}".format(ptf_cmd, tdir, testname)
-    else:
-        cmd = "{} --test-dir {} {}".format(ptf_cmd, testdir, testname)
+    tdir = pathlib.Path(testdir).joinpath(test_subdir) if in_subdir else testdir
+    cmd = "{} --test-dir {} {}".format(ptf_cmd, tdir, testname)
 
     if platform_dir:
         cmd += " --platform-dir {}".format(platform_dir)
@@ -182,6 +422,7 @@ def ptf_runner(host, testdir, testname, platform_dir=None, params={},
     if platform:
         cmd += " --platform {}".format(platform)
 
+    ptf_test_params = None
     if params:
         ptf_test_params = ";".join(["{}={}".format(k, repr(v)) for k, v in list(params.items())])
         cmd += " -t {}".format(pipes.quote(ptf_test_params))
@@ -213,6 +454,20 @@ def ptf_runner(host, testdir, testname, platform_dir=None, params={},
             raise Exception("MACsec is only available in Python3")
         host.create_macsec_info()
 
+    if server and (not is_python3 or async_mode or pdb or custom_options):
+        server = None
+    if server and log_file and not os.path.normpath(log_file).startswith(PTF_SERVER_LOG_DIR + "/"):
+        # The server only writes the log files in its log directory
+        server = None
+    if server:
+        # Same options as the ptf command
+        request = {
+            "test_dir": str(tdir), "test": testname, "test_params": ptf_test_params, "platform": platform or None,
+            "platform_dir": platform_dir, "qlen": qlen or None, "relax": relax, "debug": debug_level or None,
+            "log_file": log_file, "socket_recv_size": socket_recv_size, "device_sockets": device_sockets,
+            "timeout": int(timeout) if timeout else None,
+        }
+
     try:
         if pdb:
             # Write command to file. Use short test name for simpler launch in ptf container.
@@ -224,13 +479,18 @@ def ptf_runner(host, testdir, testname, platform_dir=None, params={},
             import pdb
             pdb.set_trace()
         logger.info('ptf command: {}'.format(cmd))
-        result = host.shell(cmd, chdir="/root", module_ignore_errors=module_ignore_errors, module_async=async_mode)
+        result = None
+        if server:
+            result = server.run(request, cmd, module_ignore_errors=module_ignore_errors)
+        if result is None:
+            result = host.shell(cmd, chdir="/root", module_ignore_errors=module_ignore_errors,
+                                module_async=async_mode)
         if not async_mode:
             if log_file:
                 ptf_collect(host, log_file, dst_dir=ptf_collect_dir)
             if result:
                 allure.attach(
-                    json.dumps(result, indent=4, cls=result.encoder),
+                    json.dumps(result, indent=4, cls=getattr(result, "encoder", None)),
                     'ptf_console_result',
                     allure.attachment_type.TEXT
                 )
@@ -239,20 +499,24 @@ def ptf_runner(host, testdir, testname, platform_dir=None, params={},
                 return result
     except Exception:
         if log_file:
-            ptf_collect(host, log_file, dst_dir=ptf_collect_dir)
             # Dump the tail of the PTF log so the actual error is visible in CI output.
             # PTF test exceptions are written to the log file but not to stdout/stderr,
             # making failures opaque without this (see issue #22662).
             try:
-                ptf_log_tail = host.shell(
-                    "tail -50 {}".format(pipes.quote(log_file)),
-                    module_ignore_errors=True
-                )
-                if ptf_log_tail and ptf_log_tail.get("rc") == 0 and ptf_log_tail.get("stdout"):
-                    logger.error("PTF log tail for %s:\n%s", testname, ptf_log_tail["stdout"])
-                    allure.attach(ptf_log_tail["stdout"], 'ptf_log_tail', allure.attachment_type.TEXT)
+                filename_log = ptf_collect(host, log_file, dst_dir=ptf_collect_dir)
+            except Exception as e:
+                logger.warning("Failed to collect the PTF log and pcap of %s: %s", testname, e)
+                filename_log = None
+            try:
+                ptf_log_tail = ""
+                if filename_log:
+                    with open(filename_log, errors="replace") as f:
+                        ptf_log_tail = "".join(collections.deque(f, 50)).rstrip("\n")
+                if ptf_log_tail:
+                    logger.error("PTF log tail for %s:\n%s", testname, ptf_log_tail)
+                    allure.attach(ptf_log_tail, 'ptf_log_tail', allure.attachment_type.TEXT)
             except Exception as e:
-                logger.debug("Failed to fetch PTF log tail for diagnostics: %s", e)
+                logger.warning("Failed to read PTF log tail for diagnostics: %s", e)
         traceback_msg = traceback.format_exc()
         allure.attach(traceback_msg, 'ptf_runner_exception_traceback', allure.attachment_type.TEXT)
         logger.error("Exception caught while executing case: {}. Error message: {}".format(testname, traceback_msg))
@@ -1,15 +1,26 @@
+"""
+ARP and NDP responder of the PTF container.
+
+The requests are received on AF_PACKET sockets with a classic BPF filter attached, which only passes ARP and ICMPv6
+neighbor solicitation frames, and are served from an asyncio event loop. The reply frames are built once per
+(interface, IP address) when the configuration is loaded; for each request only the destination fields of the reply
+are patched before it is sent. The script only uses the python standard library, so it starts immediately.
+
+The configuration is reloaded on SIGHUP, e.g. "supervisorctl signal HUP arp_responder", without restarting.
+"""
+import argparse
+import asyncio
 import binascii
+import ctypes
+import functools
+import ipaddress
 import json
-import argparse
 import os.path
+import signal
+import socket
+import struct
+import sys
 from collections import defaultdict
-import logging
-import scapy.all as scapy
-import ipaddress
-scapy.MTU = 1280
-scapy.conf.use_pcap = True
-# Callers: Expect to wait 10-15 seconds here, as scapy reinitializes everything to use libpcap
-logging.getLogger("scapy.runtime").setLevel(logging.ERROR)
 
 
 # Canonical default config path for the arp_responder helper. Kept in lock-step
@@ -18,158 +29,327 @@ logging.getLogger("scapy.runtime").setLevel(logging.ERROR)
 # the PTF container, where the sonic-mgmt test tree is not on sys.path.
 DEFAULT_CONFIG_PATH = '/tmp/from_t1.json'
 
+# As defined in asm/socket.h
+SO_ATTACH_FILTER = 26
+ETH_P_ALL = 3
+PACKET_OUTGOING = 4
 
-class ARPResponder(object):
-    ARP_OP_REQUEST = 1
-    ip_sets = {}
-    sockets = {}
-
-    @staticmethod
-    def action(packet):
-        if "ARP" in packet:  # IPv4
-            return ARPResponder.reply_to_arp(packet)
-        elif "ICMPv6ND_NS" in packet and "ICMPv6NDOptSrcLLAddr" in packet:  # IPv6
-            return ARPResponder.reply_to_ndp(packet)
-        else:
-            # Handle other Ethernet types
-            pass
+ETH_TYPE_VLAN = (0x8100, 0x88a8)
+ETH_TYPE_ARP = 0x0806
+ETH_TYPE_IPV6 = 0x86dd
+IP_PROTO_ICMPV6 = 58
+ICMPV6_ND_NS = 135
+ICMPV6_ND_NA = 136
+ND_OPT_SRC_LLADDR = 1
+ND_OPT_DST_LLADDR = 2
 
-    @staticmethod
-    def reply_to_arp(data):
-        remote_mac = data["ARP"].hwsrc
-        remote_ip = data["ARP"].psrc
-        request_ip = data["ARP"].pdst
-        op_type = data["ARP"].op
+RECV_BUFFER_SIZE = 4 * 1024 * 1024
+# Maximum number of requests handled per socket wakeup, the other sockets are served in between
+RECV_BATCH = 256
 
-        # Don't send ARP response if the ARP op code is not request
-        if op_type != ARPResponder.ARP_OP_REQUEST:
-            return
+# BPF filter "arp or (icmp6 and ip6[40] == 135)", with and without VLAN tag
+arp_ndp_bpf_filter = [
+    [0x28, 0, 0, 0x0000000c],   # ldh [12]
+    [0x15, 6, 0, 0x00008100],   # jeq 0x8100, vlan tagged
+    [0x15, 12, 0, 0x00000806],  # jeq ARP, accept
+    [0x15, 0, 12, 0x000086dd],  # jeq IPv6, else drop
+    [0x30, 0, 0, 0x00000014],   # ldb [20]
+    [0x15, 0, 10, 0x0000003a],  # jeq ICMPv6, else drop
+    [0x30, 0, 0, 0x00000036],   # ldb [54]
+    [0x15, 7, 8, 0x00000087],   # jeq NS, accept, else drop
+    [0x28, 0, 0, 0x00000010],   # ldh [16]
+    [0x15, 5, 0, 0x00000806],   # jeq ARP, accept
+    [0x15, 0, 5, 0x000086dd],   # jeq IPv6, else drop
+    [0x30, 0, 0, 0x00000018],   # ldb [24]
+    [0x15, 0, 3, 0x0000003a],   # jeq ICMPv6, else drop
+    [0x30, 0, 0, 0x0000003a],   # ldb [58]
+    [0x15, 0, 1, 0x00000087],   # jeq NS, accept, else drop
+    [0x6, 0, 0, 0x00040000],    # accept
+    [0x6, 0, 0, 0x00000000]     # drop
+]
 
-        interface = data.sniffed_on
-        if interface not in ARPResponder.ip_sets:
-            return
-        if request_ip not in ARPResponder.ip_sets[interface]:
-            return
+# Offsets of the patched fields in the reply templates, after the Ethernet header and the VLAN tag
+ARP_THA_OFFSET = 18
+ARP_TPA_OFFSET = 24
+IPV6_DST_OFFSET = 24
+ICMPV6_CHECKSUM_OFFSET = 42
 
-        if 'vlan' in ARPResponder.ip_sets[interface]:
-            vlan_list = ARPResponder.ip_sets[interface]['vlan']
-        else:
-            vlan_list = [None]
 
-        for vlan_id in vlan_list:
-            arp_reply = ARPResponder.generate_arp_reply(ARPResponder.ip_sets[interface][request_ip],
-                                                        remote_mac, request_ip, remote_ip, vlan_id)
-            scapy.sendp(arp_reply, socket=ARPResponder.sockets[interface])
+def bpf_stmt(code, jt, jf, k):
+    """Format struct `sock_filter`."""
+    return struct.pack("HBBI", code, jt, jf, k)
 
-    @staticmethod
-    def reply_to_ndp(data):
-        remote_mac = data["ICMPv6NDOptSrcLLAddr"].lladdr
-        remote_ip = data["IPv6"].src
-        request_ip = data["ICMPv6ND_NS"].tgt
 
-        interface = data.sniffed_on
-        if interface not in ARPResponder.ip_sets:
-            return
-        if request_ip not in ARPResponder.ip_sets[interface]:
-            return
+def build_bpfilter(filter):
+    """Build BPF filter buffer."""
+    return ctypes.create_string_buffer(b"".join(bpf_stmt(*_) for _ in filter))
 
-        ndp_reply = ARPResponder.generate_neigh_adv(ARPResponder.ip_sets[interface][request_ip],
-                                                    remote_mac, request_ip, remote_ip)
-        scapy.sendp(ndp_reply, socket=ARPResponder.sockets[interface])
 
-    @staticmethod
-    def generate_arp_reply(local_mac, remote_mac, local_ip, remote_ip, vlan_id):
-        l2 = scapy.Ether(dst=remote_mac, src=local_mac, type=(0x8100 if vlan_id else 0x0806))
-        l3 = scapy.ARP(op=2, hwsrc=local_mac, psrc=local_ip, hwdst=remote_mac, pdst=remote_ip)
-        if vlan_id:
-            l2 /= scapy.Dot1Q(vlan=vlan_id, type=0x0806)
+def create_socket(interface):
+    """Create a packet socket receiving the ARP and NDP requests of an interface."""
 
-        return l2 / l3
+    sock = socket.socket(family=socket.AF_PACKET,
+                         type=socket.SOCK_RAW, proto=0)
 
-    @staticmethod
-    def generate_neigh_adv(local_mac, remote_mac, target_ip, remote_ip):
-        neigh_adv_pkt = scapy.Ether(src=local_mac, dst=remote_mac)
-        neigh_adv_pkt /= scapy.IPv6(src=target_ip, dst=remote_ip)
-        neigh_adv_pkt /= scapy.ICMPv6ND_NA(tgt=target_ip, R=0, S=1, O=1)
-        neigh_adv_pkt /= scapy.ICMPv6NDOptDstLLAddr(lladdr=local_mac)
+    sock.setblocking(False)
+    bpf_filter = build_bpfilter(arp_ndp_bpf_filter)
+    fprog = struct.pack("HL", len(arp_ndp_bpf_filter),
+                        ctypes.addressof(bpf_filter))
+    sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, fprog)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFFER_SIZE)
 
-        return neigh_adv_pkt
+    sock.bind((interface, ETH_P_ALL))
 
+    return sock
 
-def parse_args():
-    parser = argparse.ArgumentParser(description='ARP autoresponder')
-    parser.add_argument('--conf', '-c', type=str, dest='conf',
-                        default=DEFAULT_CONFIG_PATH, help='path to json file with configuration')
-    parser.add_argument('--extended', '-e', action='store_true',
-                        dest='extended', default=False, help='enable extended mode')
-    args = parser.parse_args()
 
-    return args
+def checksum_sum(data):
+    """Sum of the 16 bit words of data, not folded."""
+    if len(data) % 2:
+        data = bytes(data) + b"\x00"
+    return sum(struct.unpack("!%dH" % (len(data) // 2), data))
 
 
-def main():
-    args = parse_args()
+def checksum_fold(total):
+    """Fold a checksum sum into the one's complement checksum."""
+    while total >> 16:
+        total = (total & 0xffff) + (total >> 16)
+    return ~total & 0xffff
 
-    if not os.path.exists(args.conf):
-        print(("Can't find file %s" % args.conf))
-        return
 
-    with open(args.conf) as fp:
-        data = json.load(fp)
+def ethernet_header(dst_mac, src_mac, eth_type, vlan_id=None):
+    if vlan_id:
+        return dst_mac + src_mac + struct.pack("!HHH", 0x8100, vlan_id, eth_type)
+    return dst_mac + src_mac + struct.pack("!H", eth_type)
+
+
+def generate_arp_reply(local_mac, local_ip, vlan_id=None):
+    """
+    Build the template of the ARP replies for an IP address.
+
+    The destination MAC addresses and the target IP address are zero, they are set by patch_arp_reply().
+    """
+    l2 = ethernet_header(b"\x00" * 6, local_mac, ETH_TYPE_ARP, vlan_id)
+    l3 = struct.pack("!HHBBH6s4s6s4s", 1, 0x0800, 6, 4, 2, local_mac, local_ip, b"\x00" * 6, b"\x00" * 4)
+    return bytearray(l2 + l3), len(l2)
+
+
+def patch_arp_reply(template, remote_mac, remote_ip):
+    reply, arp_offset = template
+    reply[0:6] = remote_mac
+    reply[arp_offset + ARP_THA_OFFSET:arp_offset + ARP_THA_OFFSET + 6] = remote_mac
+    reply[arp_offset + ARP_TPA_OFFSET:arp_offset + ARP_TPA_OFFSET + 4] = remote_ip
+    return reply
+
+
+def generate_neigh_adv(local_mac, target_ip):
+    """
+    Build the template of the neighbor advertisements for an IPv6 address.
+
+    The destination MAC and IPv6 addresses are zero, they are set by patch_neigh_adv(). The sum of the ICMPv6 checksum
+    without the destination address is returned with the template, the checksum is updated with the address.
+    """
+    # R=0, S=1, O=1, with the target link-layer address option
+    icmp = struct.pack("!BBHI16sBB6s", ICMPV6_ND_NA, 0, 0, 0x60000000, target_ip, ND_OPT_DST_LLADDR, 1, local_mac)
+    ip6 = struct.pack("!IHBB16s16s", 6 << 28, len(icmp), IP_PROTO_ICMPV6, 255, target_ip, b"\x00" * 16)
+    pseudo_header = target_ip + struct.pack("!II", len(icmp), IP_PROTO_ICMPV6)
+    l2 = ethernet_header(b"\x00" * 6, local_mac, ETH_TYPE_IPV6)
+    return bytearray(l2 + ip6 + icmp), len(l2), checksum_sum(pseudo_header + icmp)
+
+
+def patch_neigh_adv(template, remote_mac, remote_ip):
+    reply, ip_offset, partial_sum = template
+    reply[0:6] = remote_mac
+    reply[ip_offset + IPV6_DST_OFFSET:ip_offset + IPV6_DST_OFFSET + 16] = remote_ip
+    checksum = checksum_fold(partial_sum + sum(struct.unpack("!8H", remote_ip)))
+    struct.pack_into("!H", reply, ip_offset + ICMPV6_CHECKSUM_OFFSET, checksum)
+    return reply
+
 
-    # generate ip_sets. every ip address will have it's own uniq mac address
+def parse_config(data, extended, get_if_hwaddr):
+    """
+    Build the reply templates of a configuration.
+
+    Args:
+        data: {interface or interface@vlan: [ip, ...]} or, in extended mode, {interface[@vlan]: {ip: mac in hex}}
+        extended: Extended mode, the MAC address of every IP address is configured
+        get_if_hwaddr: Function returning the MAC address of an interface, used without extended mode
+
+    Returns:
+        {interface: {"arp": {packed IPv4 address: [ARP reply templates, one per VLAN]},
+                     "ndp": {packed IPv6 address: neighbor advertisement template}}}
+    """
     ip_sets = {}
-    sockets = {}
-    inverse_sockets = {}
     for iface, ip_dict in list(data.items()):
         vlan = None
         iface = str(iface)
         if iface.find('@') != -1:
             iface, vlan = iface.split('@')
-            vlan_tag = int(vlan)
         if iface not in ip_sets:
-            ip_sets[iface] = defaultdict(list)
-        if args.extended:
+            ip_sets[iface] = {"ips": {}, "vlan": []}
+        if extended:
             for ip, mac in list(ip_dict.items()):
-                ip_sets[iface][str(ip)] = binascii.unhexlify(str(mac))
+                ip_sets[iface]["ips"][str(ip)] = binascii.unhexlify(str(mac))
         else:
             for ip in ip_dict:
-                ip_sets[iface][str(ip)] = scapy.get_if_hwaddr(iface)
+                ip_sets[iface]["ips"][str(ip)] = get_if_hwaddr(iface)
         if vlan is not None:
-            ip_sets[iface]['vlan'].append(vlan_tag)
+            ip_sets[iface]["vlan"].append(int(vlan))
 
-    for iface in ip_sets:
-        arp_filter_entries = []
-        icmp_filter_entries = []
-        for ip in ip_sets[iface]:
-            if ip == 'vlan':
-                continue
+    tables = {}
+    for iface, ip_set in list(ip_sets.items()):
+        vlan_list = ip_set["vlan"] or [None]
+        table = tables[iface] = {"arp": {}, "ndp": {}}
+        for ip, mac in list(ip_set["ips"].items()):
             ip_address = ipaddress.ip_address(ip)
             if ip_address.version == 4:
-                arp_filter_entries.append(f'arp[24:4] = 0x{int.from_bytes(ip_address.packed, "big"):0x}')  # noqa: E231
+                table["arp"][ip_address.packed] = [generate_arp_reply(mac, ip_address.packed, vlan_id)
+                                                   for vlan_id in vlan_list]
             else:
-                ipv6_address_integer = int.from_bytes(ip_address.packed, "big")
-                # libpcap on Buster doesn't support looking into ICMPv6 header directly, so look from the IPv6 header
-                # instead. When the PTF container is upgraded to Bullseye or newer, then the commented filter syntax
-                # below can be used instead.
-                #
-                # icmp_filter_entries.append(f'icmp6[20:4] = 0x{ipv6_address_integer & 0xffffffff:0x}')  # noqa: E231
-                icmp_filter_entries.append(f'ip6[60:4] = 0x{ipv6_address_integer & 0xffffffff:0x}')  # noqa: E231
-        if len(arp_filter_entries) > 0 and len(icmp_filter_entries) > 0:
-            pcap_filter = f"(arp and ({' or '.join(arp_filter_entries)})) or " + \
-                f"(icmp6 and ({' or '.join(icmp_filter_entries)}))"
-        elif len(arp_filter_entries) > 0:
-            pcap_filter = f"arp and ({' or '.join(arp_filter_entries)})"
-        elif len(icmp_filter_entries) > 0:
-            pcap_filter = f"icmp6 and ({' or '.join(icmp_filter_entries)})"
-
-        sockets[iface] = scapy.conf.L2socket(iface=iface, filter=pcap_filter)
-        inverse_sockets[sockets[iface]] = iface
-
-    ARPResponder.ip_sets = ip_sets
-    ARPResponder.sockets = sockets
-
-    scapy.sniff(prn=ARPResponder.action, opened_socket=inverse_sockets, store=False)
+                table["ndp"][ip_address.packed] = generate_neigh_adv(mac, ip_address.packed)
+    return tables
+
+
+class ARPResponder(object):
+    ARP_OP_REQUEST = 1
+
+    def __init__(self, conf, extended=False):
+        self.conf = conf
+        self.extended = extended
+        self.tables = {}
+        self.sockets = {}
+        self.stats = defaultdict(int)
+        self.loop = None
+
+    def get_if_hwaddr(self, iface):
+        if iface not in self.sockets:
+            self.sockets[iface] = create_socket(iface)
+        return self.sockets[iface].getsockname()[4]
+
+    def load(self):
+        """Load the configuration, open the sockets of new interfaces and close the others."""
+        with open(self.conf) as fp:
+            data = json.load(fp)
+
+        tables = parse_config(data, self.extended, self.get_if_hwaddr)
+        for iface in list(self.sockets):
+            if iface not in tables:
+                if self.loop is not None:
+                    self.loop.remove_reader(self.sockets[iface].fileno())
+                self.sockets.pop(iface).close()
+        for iface in tables:
+            if iface not in self.sockets:
+                self.sockets[iface] = create_socket(iface)
+            if self.loop is not None:
+                self.loop.add_reader(self.sockets[iface].fileno(), self.receive, iface)
+        self.tables = tables
+        print("Loaded {}: {}".format(self.conf, ", ".join(
+            "{} {} IPv4 {} IPv6".format(iface, len(table["arp"]), len(table["ndp"]))
+            for iface, table in sorted(tables.items()))))
+        sys.stdout.flush()
+
+    def reload(self):
+        try:
+            self.load()
+        except (IOError, OSError, ValueError) as e:
+            print("Failed to reload {}, the previous configuration is kept: {}".format(self.conf, repr(e)))
+            sys.stdout.flush()
+
+    def receive(self, iface):
+        """Reply to the requests queued on the socket of an interface."""
+        sock = self.sockets.get(iface)
+        table = self.tables.get(iface)
+        if sock is None or table is None:
+            return
+        for _ in range(RECV_BATCH):
+            try:
+                data, address = sock.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                return
+            if address[2] == PACKET_OUTGOING:
+                continue
+            self.stats["requests"] += 1
+            for reply in self.reply(table, data):
+                try:
+                    sock.send(reply)
+                    self.stats["replies"] += 1
+                except (BlockingIOError, InterruptedError):
+                    self.stats["dropped"] += 1
+
+    def reply(self, table, data):
+        """Return the replies to a request."""
+        offset = 14
+        eth_type, = struct.unpack_from("!H", data, 12)
+        while eth_type in ETH_TYPE_VLAN and len(data) >= offset + 4:
+            eth_type, = struct.unpack_from("!H", data, offset + 2)
+            offset += 4
+        if eth_type == ETH_TYPE_ARP:
+            return self.reply_to_arp(table, data, offset)
+        elif eth_type == ETH_TYPE_IPV6:
+            return self.reply_to_ndp(table, data, offset)
+        return []
+
+    def reply_to_arp(self, table, data, offset):
+        # Don't send ARP response if the ARP op code is not request
+        if len(data) < offset + 28 or struct.unpack_from("!H", data, offset + 6)[0] != self.ARP_OP_REQUEST:
+            return []
+        templates = table["arp"].get(data[offset + 24:offset + 28])
+        if templates is None:
+            return []
+        remote_mac = data[offset + 8:offset + 14]
+        remote_ip = data[offset + 14:offset + 18]
+        return [patch_arp_reply(template, remote_mac, remote_ip) for template in templates]
+
+    def reply_to_ndp(self, table, data, offset):
+        if len(data) < offset + 64 or data[offset + 6] != IP_PROTO_ICMPV6 or data[offset + 40] != ICMPV6_ND_NS:
+            return []
+        template = table["ndp"].get(data[offset + 48:offset + 64])
+        if template is None:
+            return []
+        # Only the requests with the source link-layer address option are answered
+        option = offset + 64
+        while option + 8 <= len(data) and data[option + 1]:
+            if data[option] == ND_OPT_SRC_LLADDR:
+                remote_ip = data[offset + 8:offset + 24]
+                return [patch_neigh_adv(template, data[option + 2:option + 8], remote_ip)]
+            option += data[option + 1] * 8
+        return []
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        stopped = self.loop.create_future()
+        self.load()
+        self.loop.add_signal_handler(signal.SIGHUP, self.reload)
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            self.loop.add_signal_handler(signum, functools.partial(stopped.set_result, signum))
+        try:
+            await stopped
+        finally:
+            for sock in list(self.sockets.values()):
+                self.loop.remove_reader(sock.fileno())
+                sock.close()
+            print("Exiting, {}".format(dict(self.stats)))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='ARP autoresponder')
+    parser.add_argument('--conf', '-c', type=str, dest='conf',
+                        default=DEFAULT_CONFIG_PATH, help='path to json file with configuration')
+    parser.add_argument('--extended', '-e', action='store_true',
+                        dest='extended', default=False, help='enable extended mode')
+    args = parser.parse_args()
+
+    return args
+
+
+def main():
+    args = parse_args()
+
+    if not os.path.exists(args.conf):
+        print(("Can't find file %s" % args.conf))
+        return
+
+    asyncio.run(ARPResponder(args.conf, args.extended).run())
 
 
 if __name__ == '__main__':
@@ -0,0 +1,139 @@
+"""
+Benchmark of arp_responder.py over a veth pair, in replies per second.
+
+The responder is started on one end of a veth pair with a configuration of --hosts IPv4 addresses, and ARP requests
+for random addresses of the configuration are sent from the other end as fast as possible, like an ARP storm from a
+DUT resolving the hosts of a VLAN. Must be run as root, e.g. in the PTF container:
+
+    python3 arp_responder_bench.py --hosts 4000 --requests 200000
+    python3 arp_responder_bench.py --rate 20000
+    python3 arp_responder_bench.py --responder /tmp/old_arp_responder.py
+"""
+import argparse
+import ipaddress
+import json
+import os
+import random
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ETH_P_ARP = 0x0806
+RECV_BUFFER_SIZE = 4 * 1024 * 1024
+# Requests sent between two checks of the send rate
+SEND_BURST = 64
+
+
+def run(cmd):
+    subprocess.check_call(cmd, shell=True)
+
+
+def arp_request(src_mac, src_ip, dst_ip):
+    return (b"\xff" * 6 + src_mac + struct.pack("!H", ETH_P_ARP) +
+            struct.pack("!HHBBH6s4s6s4s", 1, 0x0800, 6, 4, 1, src_mac, src_ip, b"\x00" * 6, dst_ip))
+
+
+def count_replies(sock, counter, stop):
+    """Count the ARP replies received on a socket until stop is set."""
+    sock.settimeout(0.1)
+    while not stop.is_set():
+        try:
+            data = sock.recv(2048)
+        except socket.timeout:
+            continue
+        if data[20:22] == b"\x00\x02":
+            counter[0] += 1
+            counter[1] = time.time()
+
+
+def wait_for_responder(sock, request, timeout):
+    """Send a request until it is answered, the responder is then ready."""
+    sock.settimeout(0.1)
+    end = time.time() + timeout
+    while time.time() < end:
+        sock.send(request)
+        try:
+            while True:
+                if sock.recv(2048)[20:22] == b"\x00\x02":
+                    return True
+        except socket.timeout:
+            continue
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ARP responder benchmark")
+    parser.add_argument("--responder", default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                            "arp_responder.py"), help="path of arp_responder.py")
+    parser.add_argument("--hosts", type=int, default=4000, help="number of IPv4 addresses of the responder")
+    parser.add_argument("--requests", type=int, default=200000, help="number of ARP requests to send")
+    parser.add_argument("--rate", type=int, default=0, help="requests per second, 0 to send as fast as possible")
+    parser.add_argument("--iface", default="arpbench", help="name prefix of the veth pair")
+    args = parser.parse_args()
+
+    responder_iface, sender_iface = args.iface + "0", args.iface + "1"
+    run("ip link add {} type veth peer name {}".format(responder_iface, sender_iface))
+    conf = tempfile.NamedTemporaryFile("w", suffix=".json", delete=False)
+    proc = None
+    try:
+        run("ip link set {} up && ip link set {} up".format(responder_iface, sender_iface))
+        network = ipaddress.ip_network("10.128.0.0/16")
+        hosts = [network[i + 2] for i in range(args.hosts)]
+        json.dump({responder_iface: {str(ip): "02%010x" % i for i, ip in enumerate(hosts)}}, conf)
+        conf.close()
+
+        sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ARP))
+        sock.bind((sender_iface, 0))
+        src_mac = sock.getsockname()[4]
+        src_ip = network[1].packed
+        requests = [arp_request(src_mac, src_ip, random.choice(hosts).packed) for _ in range(1024)]
+
+        start = time.time()
+        proc = subprocess.Popen([sys.executable, args.responder, "-c", conf.name, "-e"],
+                                stdout=subprocess.DEVNULL)
+        if not wait_for_responder(sock, requests[0], timeout=120):
+            sys.exit("The responder didn't reply")
+        print("Responder ready in {:.2f} s".format(time.time() - start))
+
+        # Separate socket for the receiver thread, the timeout of a socket is shared by the threads
+        rx_sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ARP))
+        rx_sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFFER_SIZE)
+        rx_sock.bind((sender_iface, 0))
+        counter = [0, 0]
+        stop = threading.Event()
+        receiver = threading.Thread(target=count_replies, args=(rx_sock, counter, stop))
+        receiver.start()
+        sock.settimeout(None)
+        start = time.time()
+        for i in range(args.requests):
+            sock.send(requests[i % len(requests)])
+            if args.rate and i % SEND_BURST == 0:
+                delay = start + float(i) / args.rate - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+        sent = time.time()
+        # The replies of the queued requests
+        time.sleep(2)
+        stop.set()
+        receiver.join()
+
+        replies, last_reply = counter
+        duration = max(last_reply, sent) - start
+        print("Sent {} requests in {:.2f} s ({:.0f}/s)".format(
+            args.requests, sent - start, args.requests / (sent - start)))
+        print("Received {} replies ({:.1%}) in {:.2f} s, {:.0f} replies/s".format(
+            replies, float(replies) / args.requests, duration, replies / duration))
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+        os.unlink(conf.name)
+        run("ip link del {}".format(responder_iface))
+
+
+if __name__ == "__main__":
+    main()